@@ -182,6 +182,24 @@ class AgentState(ABC):
         data_dir = self.agent.get_data_dir()
         return os.path.join(data_dir, METADATA_FILE)
 
+    def _write_dict(self, path_key: str, target_dict: Dict[str, Any]) -> None:
+        """
+        Save a dict of this agent's state to the given key, behind the live run's
+        write-behind persister while it has one
+        """
+        persister = self.agent.get_state_persister()
+        if persister is None:
+            self.agent.db.write_dict(path_key, target_dict)
+        else:
+            persister.write_dict(path_key, target_dict)
+
+    def flush_saves(self) -> None:
+        """Ensure saves of this agent still held by the live run's persister are written"""
+        persister = self.agent.get_state_persister()
+        if persister is not None:
+            # Trailing separator, so that agent 1's prefix doesn't match agent 10
+            persister.flush(path_prefix=os.path.join(self.agent.get_data_dir(), ""))
+
     def load_metadata(self) -> None:
         """Write out the metadata for this agent state to file"""
         md_path = self._get_metadata_path()
@@ -195,7 +213,7 @@ class AgentState(ABC):
         """Read in the saved metadata for this agent state from file"""
         metadata_dict = self.metadata.__dict__
         md_path = self._get_metadata_path()
-        self.agent.db.write_dict(md_path, metadata_dict)
+        self._write_dict(md_path, metadata_dict)
 
     @abstractmethod
     def _set_init_state(self, data: Any) -> None:
@@ -234,7 +252,7 @@ class AgentState(ABC):
         """
         Load stored data from a file to this object, including metadata
         """
-
+        self.flush_saves()
         self.load_metadata()
         self._load_data()
 
@@ -293,6 +311,11 @@ class AgentState(ABC):
         self.metadata.task_end = time.time()
         self._update_submit(submit_data)
         self.save_data()
+        # Submits are handled on the event loop, so leave the write to the
+        # persister's thread rather than flushing here
+        persister = self.agent.get_state_persister()
+        if persister is not None:
+            persister.request_flush()
 
     def get_task_start(self) -> Optional[float]:
         """
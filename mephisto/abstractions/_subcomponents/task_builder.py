@@ -7,6 +7,8 @@
 from abc import ABC, abstractmethod
 from typing import (
     Dict,
+    List,
+    Optional,
     TYPE_CHECKING,
 )
 
@@ -48,3 +50,11 @@ class TaskBuilder(ABC):
         Build the server for the given task run into the provided directory
         """
         raise NotImplementedError()
+
+    def get_build_inputs(self) -> Optional[List[str]]:
+        """
+        Return the paths of every file or directory build_in_dir copies from, if
+        its output depends on nothing else, letting routers be cached by their
+        inputs without building. None means the build has to be run to tell.
+        """
+        return None
@@ -6,11 +6,15 @@
 
 from abc import ABC, abstractmethod
 import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from mephisto.utils.qualifications import find_or_create_qualification
 from typing import (
     List,
     Dict,
     Callable,
+    Coroutine,
+    Optional,
     Tuple,
     Awaitable,
     TYPE_CHECKING,
@@ -22,6 +26,7 @@ from prometheus_client.utils import INF  # type: ignore
 
 from dataclasses import dataclass
 from mephisto.data_model.exceptions import (
+    AbsentAgentError,
     AgentReturnedError,
     AgentDisconnectedError,
     AgentTimeoutError,
@@ -38,6 +43,7 @@ if TYPE_CHECKING:
     from mephisto.data_model.unit import Unit
     from mephisto.data_model.worker import Worker
     from mephisto.abstractions.blueprint import SharedTaskState
+    from mephisto.operations.datatypes import LoopWrapper
 
 from mephisto.utils.logger_core import get_logger
 
@@ -48,25 +54,31 @@ logger = get_logger(name=__name__)
 # IO for underlying agents could then take place in the relevant
 # process's update_data call rather than delaying the ClientIOHandler.
 
+DEFAULT_MAX_RUNNER_THREADS = 256
+
 
 @dataclass
 class RunningUnit:
     unit: "Unit"
     agent: "Agent"
-    thread: threading.Thread
+    future: "Future[None]"
+    # Async runs execute on the operator's event loop rather than a thread
+    is_async: bool = False
 
 
 @dataclass
 class RunningAssignment:
     assignment: "Assignment"
     agents: List["Agent"]
-    thread: threading.Thread
+    future: "Future[None]"
+    is_async: bool = False
 
 
 @dataclass
 class RunningOnboarding:
     onboarding_agent: "OnboardingAgent"
-    thread: threading.Thread
+    future: "Future[None]"
+    is_async: bool = False
 
 
 ONGOING_THREAD_COUNT = Gauge(
@@ -108,6 +120,11 @@ class TaskRunner(ABC):
     building the dependencies to a directory to be deployed to
     the server, and spawning threads that manage the process of
     passing agents through a task.
+
+    The run_onboarding, run_unit, and run_assignment methods may be defined
+    as coroutines, in which case they are run on the operator's event loop
+    instead of in a thread from a bounded pool. The blocking bookkeeping around
+    those coroutines still runs in executor threads, to keep it off the loop.
     """
 
     def __init__(self, task_run: "TaskRun", args: "DictConfig", shared_state: "SharedTaskState"):
@@ -119,6 +136,21 @@ class TaskRunner(ABC):
         self.running_onboardings: Dict[str, RunningOnboarding] = {}
         self.is_concurrent = False
 
+        max_runner_threads = args.get("task", {}).get(
+            "max_runner_threads", DEFAULT_MAX_RUNNER_THREADS
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_runner_threads,
+            thread_name_prefix=f"TaskRunner-{task_run.db_id}",
+        )
+        self._max_runner_threads = max_runner_threads
+        # Blocking runs submitted to the pool, incremented and released from different threads
+        self._blocking_runs = 0
+        self._blocking_runs_lock = threading.Lock()
+        self._loop_wrap: Optional["LoopWrapper"] = None
+        # Async runs that shutdown couldn't wait for, as it was called on their loop
+        self._exiting_async_runs: List["Future[None]"] = []
+
         self.block_qualification = args.blueprint.get("block_qualification", None)
         if self.block_qualification is not None:
             find_or_create_qualification(task_run.db, self.block_qualification)
@@ -147,21 +179,84 @@ class TaskRunner(ABC):
             logger.debug(f"Onboarding {onboarding_id} is already running")
             return
 
-        onboard_thread = threading.Thread(
-            target=self._launch_and_run_onboarding,
-            args=(onboarding_agent, cleanup_after),
-            name=f"Onboard-thread-{onboarding_id}",
-        )
-
+        onboarding_agent.update_status(AgentState.STATUS_ONBOARDING)
+        is_async = asyncio.iscoroutinefunction(self.run_onboarding)
+        if is_async:
+            future = self._run_on_loop(
+                onboarding_agent.get_live_run().loop_wrap,
+                self._launch_and_run_onboarding_async(onboarding_agent, cleanup_after),
+            )
+        else:
+            future = self._run_in_pool(
+                self._launch_and_run_onboarding, onboarding_agent, cleanup_after
+            )
         self.running_onboardings[onboarding_id] = RunningOnboarding(
             onboarding_agent=onboarding_agent,
-            thread=onboard_thread,
+            future=future,
+            is_async=is_async,
         )
-
-        onboarding_agent.update_status(AgentState.STATUS_ONBOARDING)
-        onboard_thread.start()
         return
 
+    def _run_in_pool(self, fn: Callable[..., None], *args) -> "Future[None]":
+        """Run a blocking supervisor in the bounded runner thread pool"""
+        with self._blocking_runs_lock:
+            pool_is_full = self._blocking_runs >= self._max_runner_threads
+            self._blocking_runs += 1
+        if pool_is_full:
+            logger.warning(
+                f"All {self._max_runner_threads} runner threads are in use, new work will wait "
+                "for one to free up. Consider raising task.max_runner_threads or making "
+                "this TaskRunner's run methods async."
+            )
+
+        def run_then_release():
+            try:
+                fn(*args)
+            finally:
+                with self._blocking_runs_lock:
+                    self._blocking_runs -= 1
+
+        return self._executor.submit(run_then_release)
+
+    def _run_on_loop(
+        self, loop_wrap: "LoopWrapper", coro: Coroutine[None, None, None]
+    ) -> "Future[None]":
+        """Run an async supervisor on the operator's event loop"""
+        self._loop_wrap = loop_wrap
+        return asyncio.run_coroutine_threadsafe(coro, loop_wrap.loop)
+
+    def _handle_onboarding_error(self, onboarding_agent: "OnboardingAgent") -> None:
+        """Clean up an onboarding that ended on an agent error"""
+        if onboarding_agent.get_status() not in AgentState.complete():
+            # Absent agents at this stage should be disconnected
+            onboarding_agent.update_status(AgentState.STATUS_DISCONNECT)
+        self.cleanup_onboarding(onboarding_agent)
+
+    def _finish_onboarding(
+        self,
+        onboarding_agent: "OnboardingAgent",
+        cleanup_after: Callable[[], Awaitable[None]],
+    ) -> None:
+        """Stop tracking a finished onboarding and move the agent along"""
+        live_run = onboarding_agent.get_live_run()
+        onboarding_id = onboarding_agent.get_agent_id()
+        del self.running_onboardings[onboarding_id]
+
+        # Onboarding now complete
+        if onboarding_agent.get_status() == AgentState.STATUS_WAITING:
+            # The agent completed the onboarding task
+            async def register_then_cleanup():
+                await live_run.worker_pool.register_agent_from_onboarding(onboarding_agent)
+                await cleanup_after()
+
+            live_run.loop_wrap.execute_coro(register_then_cleanup())
+        else:
+            logger.info(
+                f"Onboarding agent {onboarding_id} disconnected or errored, "
+                f"final status {onboarding_agent.get_status()}."
+            )
+            live_run.loop_wrap.execute_coro(cleanup_after())
+
     def _launch_and_run_onboarding(
         self,
         onboarding_agent: "OnboardingAgent",
@@ -171,8 +266,6 @@ class TaskRunner(ABC):
         with ONGOING_THREAD_COUNT.labels(
             thread_type="onboarding"
         ).track_inprogress(), EXECUTION_DURATION_SECONDS.labels(thread_type="onboarding").time():
-            live_run = onboarding_agent.get_live_run()
-            onboarding_id = onboarding_agent.get_agent_id()
             logger.debug(f"Launching onboarding for {onboarding_agent}")
             try:
                 self.run_onboarding(onboarding_agent)
@@ -182,32 +275,48 @@ class TaskRunner(ABC):
                 AgentDisconnectedError,
                 AgentShutdownError,
             ):
-                if onboarding_agent.get_status() not in AgentState.complete():
-                    # Absent agents at this stage should be disconnected
-                    onboarding_agent.update_status(AgentState.STATUS_DISCONNECT)
-                self.cleanup_onboarding(onboarding_agent)
+                self._handle_onboarding_error(onboarding_agent)
             except Exception as e:
                 logger.exception(
                     f"Unhandled exception in onboarding {onboarding_agent}",
                     exc_info=True,
                 )
                 self.cleanup_onboarding(onboarding_agent)
-            del self.running_onboardings[onboarding_id]
+            self._finish_onboarding(onboarding_agent, cleanup_after)
 
-            # Onboarding now complete
-            if onboarding_agent.get_status() == AgentState.STATUS_WAITING:
-                # The agent completed the onboarding task
-                async def register_then_cleanup():
-                    await live_run.worker_pool.register_agent_from_onboarding(onboarding_agent)
-                    await cleanup_after()
-
-                live_run.loop_wrap.execute_coro(register_then_cleanup())
-            else:
-                logger.info(
-                    f"Onboarding agent {onboarding_id} disconnected or errored, "
-                    f"final status {onboarding_agent.get_status()}."
+    async def _launch_and_run_onboarding_async(
+        self,
+        onboarding_agent: "OnboardingAgent",
+        cleanup_after: Callable[[], Awaitable[None]],
+    ) -> None:
+        """Supervise the completion of an onboarding with an async run_onboarding"""
+        loop = asyncio.get_running_loop()
+        async_db = onboarding_agent.get_live_run().worker_pool.async_db
+        with ONGOING_THREAD_COUNT.labels(
+            thread_type="onboarding"
+        ).track_inprogress(), EXECUTION_DURATION_SECONDS.labels(thread_type="onboarding").time():
+            logger.debug(f"Launching async onboarding for {onboarding_agent}")
+            try:
+                await self.run_onboarding(onboarding_agent)  # type: ignore
+            except (
+                AgentReturnedError,
+                AgentTimeoutError,
+                AgentDisconnectedError,
+                AgentShutdownError,
+            ):
+                # Cleanup hooks may block, so run them off of the loop
+                await loop.run_in_executor(
+                    None, partial(self._handle_onboarding_error, onboarding_agent)
+                )
+            except Exception as e:
+                logger.exception(
+                    f"Unhandled exception in onboarding {onboarding_agent}",
+                    exc_info=True,
+                )
+                await loop.run_in_executor(
+                    None, partial(self.cleanup_onboarding, onboarding_agent)
                 )
-                live_run.loop_wrap.execute_coro(cleanup_after())
+            await async_db.run(self._finish_onboarding, onboarding_agent, cleanup_after)
 
     def execute_unit(
         self,
@@ -218,18 +327,21 @@ class TaskRunner(ABC):
         if unit.db_id in self.running_units:
             logger.debug(f"{unit} is already running")
             return
-        unit_thread = threading.Thread(
-            target=self._launch_and_run_unit,
-            args=(unit, agent),
-            name=f"Unit-thread-{unit.db_id}",
-        )
         agent.update_status(AgentState.STATUS_IN_TASK)
+        is_async = asyncio.iscoroutinefunction(self.run_unit)
+        if is_async:
+            future = self._run_on_loop(
+                agent.get_live_run().loop_wrap,
+                self._launch_and_run_unit_async(unit, agent),
+            )
+        else:
+            future = self._run_in_pool(self._launch_and_run_unit, unit, agent)
         self.running_units[unit.db_id] = RunningUnit(
             unit=unit,
             agent=agent,
-            thread=unit_thread,
+            future=future,
+            is_async=is_async,
         )
-        unit_thread.start()
         return
 
     def _cleanup_special_units(self, unit: "Unit", agent: "Agent") -> None:
@@ -270,17 +382,7 @@ class TaskRunner(ABC):
                 AgentDisconnectedError,
                 AgentShutdownError,
             ) as e:
-                # A returned Unit can be worked on again by someone else.
-                logger.exception(f"Handled exception in unit {unit}")
-                if unit.get_status() != AssignmentState.EXPIRED:
-                    unit_agent = unit.get_assigned_agent()
-                    if unit_agent is not None and unit_agent.db_id == agent.db_id:
-                        logger.debug(f"Clearing {agent} from {unit} due to {e}")
-                        unit.clear_assigned_agent()
-                    if agent.get_status() not in AgentState.complete():
-                        # Absent agents at this stage should be disconnected
-                        agent.update_status(AgentState.STATUS_DISCONNECT)
-                self.cleanup_unit(unit)
+                self._handle_unit_error(unit, agent, e)
             except Exception as e:
                 logger.exception(f"Unhandled exception in unit {unit}", exc_info=True)
                 # Exceptions mark as submitted to ensure task closure
@@ -291,21 +393,76 @@ class TaskRunner(ABC):
                 if not agent.await_submit(timeout=None):
                     # Wait for a submit to occur
                     agent.await_submit(timeout=self.args.task.submission_timeout)
-                agent.update_status(AgentState.STATUS_COMPLETED)
-                agent.mark_done()
+                self._mark_agent_completed(agent)
+
+            self._finish_unit(unit, agent)
 
+    async def _launch_and_run_unit_async(
+        self,
+        unit: "Unit",
+        agent: "Agent",
+    ) -> None:
+        """Supervise the completion of a unit with an async run_unit"""
+        loop = asyncio.get_running_loop()
+        async_db = agent.get_live_run().worker_pool.async_db
+        with ONGOING_THREAD_COUNT.labels(
+            thread_type="unit"
+        ).track_inprogress(), EXECUTION_DURATION_SECONDS.labels(thread_type="unit").time():
             try:
-                self.shared_state.on_unit_submitted(unit)
+                await self.run_unit(unit, agent)  # type: ignore
+            except (
+                AgentReturnedError,
+                AgentTimeoutError,
+                AgentDisconnectedError,
+                AgentShutdownError,
+            ) as e:
+                # Cleanup hooks may block, so run them off of the loop
+                await loop.run_in_executor(None, partial(self._handle_unit_error, unit, agent, e))
             except Exception as e:
-                logger.exception(
-                    f"Unhandled exception in on_unit_submitted for {unit}",
-                    exc_info=True,
-                )
-            del self.running_units[unit.db_id]
+                logger.exception(f"Unhandled exception in unit {unit}", exc_info=True)
+                await loop.run_in_executor(None, partial(self.cleanup_unit, unit))
 
-            self._cleanup_special_units(unit, agent)
-            self.task_run.clear_reservation(unit)
-            agent.hide_state()
+            if await async_db.run(agent.get_status) not in AgentState.complete():
+                if not await agent.await_submit_async(timeout=None):
+                    await agent.await_submit_async(timeout=self.args.task.submission_timeout)
+                await async_db.run(self._mark_agent_completed, agent)
+
+            await loop.run_in_executor(None, partial(self._finish_unit, unit, agent))
+
+    @staticmethod
+    def _mark_agent_completed(agent: "Agent") -> None:
+        """Mark an agent whose run ended without reaching a final status as completed"""
+        agent.update_status(AgentState.STATUS_COMPLETED)
+        agent.mark_done()
+
+    def _handle_unit_error(self, unit: "Unit", agent: "Agent", e: Exception) -> None:
+        """Release and clean up a unit that ended on an agent error"""
+        # A returned Unit can be worked on again by someone else.
+        logger.exception(f"Handled exception in unit {unit}")
+        if unit.get_status() != AssignmentState.EXPIRED:
+            unit_agent = unit.get_assigned_agent()
+            if unit_agent is not None and unit_agent.db_id == agent.db_id:
+                logger.debug(f"Clearing {agent} from {unit} due to {e}")
+                unit.clear_assigned_agent()
+            if agent.get_status() not in AgentState.complete():
+                # Absent agents at this stage should be disconnected
+                agent.update_status(AgentState.STATUS_DISCONNECT)
+        self.cleanup_unit(unit)
+
+    def _finish_unit(self, unit: "Unit", agent: "Agent") -> None:
+        """Stop tracking a finished unit and release its resources"""
+        try:
+            self.shared_state.on_unit_submitted(unit)
+        except Exception as e:
+            logger.exception(
+                f"Unhandled exception in on_unit_submitted for {unit}",
+                exc_info=True,
+            )
+        del self.running_units[unit.db_id]
+
+        self._cleanup_special_units(unit, agent)
+        self.task_run.clear_reservation(unit)
+        agent.hide_state()
 
     def execute_assignment(
         self,
@@ -316,20 +473,23 @@ class TaskRunner(ABC):
         if assignment.db_id in self.running_assignments:
             logger.debug(f"Assignment {assignment} is already running")
             return
-        assign_thread = threading.Thread(
-            target=self._launch_and_run_assignment,
-            args=(assignment, agents),
-            name=f"Assignment-thread-{assignment.db_id}",
-        )
         for agent in agents:
             agent.update_status(AgentState.STATUS_IN_TASK)
 
+        is_async = asyncio.iscoroutinefunction(self.run_assignment)
+        if is_async:
+            future = self._run_on_loop(
+                agents[0].get_live_run().loop_wrap,
+                self._launch_and_run_assignment_async(assignment, agents),
+            )
+        else:
+            future = self._run_in_pool(self._launch_and_run_assignment, assignment, agents)
         self.running_assignments[assignment.db_id] = RunningAssignment(
             assignment=assignment,
             agents=agents,
-            thread=assign_thread,
+            future=future,
+            is_async=is_async,
         )
-        assign_thread.start()
         return
 
     def _launch_and_run_assignment(
@@ -349,19 +509,7 @@ class TaskRunner(ABC):
                 AgentDisconnectedError,
                 AgentShutdownError,
             ) as e:
-                # TODO(OWN) implement counting complete tasks, launching a
-                # new assignment copied from the parameters of this one
-                disconnected_agent_id = e.agent_id
-                for agent in agents:
-                    if agent.db_id != e.agent_id:
-                        agent.update_status(AgentState.STATUS_PARTNER_DISCONNECT)
-                    else:
-                        # Must expire the disconnected unit so that
-                        # new workers aren't shown it
-                        agent.get_unit().expire()
-                        if agent.get_status() not in AgentState.complete():
-                            agent.update_status(AgentState.STATUS_DISCONNECT)
-                self.cleanup_assignment(assignment)
+                self._handle_assignment_error(assignment, agents, e)
             except Exception as e:
                 logger.exception(
                     f"Unhandled exception in assignment {assignment}",
@@ -375,26 +523,89 @@ class TaskRunner(ABC):
                     if not agent.await_submit(timeout=None):
                         # Wait for a submit to occur
                         agent.await_submit(timeout=self.args.task.submission_timeout)
-                    agent.update_status(AgentState.STATUS_COMPLETED)
-                    agent.mark_done()
-
-            for unit in assignment.get_units():
-                try:
-                    self.shared_state.on_unit_submitted(unit)
-                except Exception as e:
-                    logger.exception(
-                        f"Unhandled exception in on_unit_submitted for {unit}",
-                        exc_info=True,
-                    )
-            del self.running_assignments[assignment.db_id]
-
-            # Clear reservations
-            task_run = self.task_run
-            for unit in assignment.get_units():
-                task_run.clear_reservation(unit)
+                    self._mark_agent_completed(agent)
+
+            self._finish_assignment(assignment, agents)
+
+    async def _launch_and_run_assignment_async(
+        self,
+        assignment: "Assignment",
+        agents: List["Agent"],
+    ) -> None:
+        """Supervise the completion of an assignment with an async run_assignment"""
+        loop = asyncio.get_running_loop()
+        async_db = agents[0].get_live_run().worker_pool.async_db
+        with ONGOING_THREAD_COUNT.labels(
+            thread_type="assignment"
+        ).track_inprogress(), EXECUTION_DURATION_SECONDS.labels(thread_type="assignment").time():
+            try:
+                await self.run_assignment(assignment, agents)  # type: ignore
+            except (
+                AgentReturnedError,
+                AgentTimeoutError,
+                AgentDisconnectedError,
+                AgentShutdownError,
+            ) as e:
+                # Cleanup hooks may block, so run them off of the loop
+                await loop.run_in_executor(
+                    None, partial(self._handle_assignment_error, assignment, agents, e)
+                )
+            except Exception as e:
+                logger.exception(
+                    f"Unhandled exception in assignment {assignment}",
+                    exc_info=True,
+                )
+                await loop.run_in_executor(None, partial(self.cleanup_assignment, assignment))
 
             for agent in agents:
-                agent.hide_state()
+                if await async_db.run(agent.get_status) not in AgentState.complete():
+                    if not await agent.await_submit_async(timeout=None):
+                        await agent.await_submit_async(
+                            timeout=self.args.task.submission_timeout
+                        )
+                    await async_db.run(self._mark_agent_completed, agent)
+
+            await loop.run_in_executor(None, partial(self._finish_assignment, assignment, agents))
+
+    def _handle_assignment_error(
+        self,
+        assignment: "Assignment",
+        agents: List["Agent"],
+        e: AbsentAgentError,
+    ) -> None:
+        """Mark agents and clean up an assignment that ended on an agent error"""
+        # TODO(OWN) implement counting complete tasks, launching a
+        # new assignment copied from the parameters of this one
+        for agent in agents:
+            if agent.db_id != e.agent_id:
+                agent.update_status(AgentState.STATUS_PARTNER_DISCONNECT)
+            else:
+                # Must expire the disconnected unit so that
+                # new workers aren't shown it
+                agent.get_unit().expire()
+                if agent.get_status() not in AgentState.complete():
+                    agent.update_status(AgentState.STATUS_DISCONNECT)
+        self.cleanup_assignment(assignment)
+
+    def _finish_assignment(self, assignment: "Assignment", agents: List["Agent"]) -> None:
+        """Stop tracking a finished assignment and release its resources"""
+        for unit in assignment.get_units():
+            try:
+                self.shared_state.on_unit_submitted(unit)
+            except Exception as e:
+                logger.exception(
+                    f"Unhandled exception in on_unit_submitted for {unit}",
+                    exc_info=True,
+                )
+        del self.running_assignments[assignment.db_id]
+
+        # Clear reservations
+        task_run = self.task_run
+        for unit in assignment.get_units():
+            task_run.clear_reservation(unit)
+
+        for agent in agents:
+            agent.hide_state()
 
     @staticmethod
     def get_data_for_assignment(assignment: "Assignment") -> "InitializationData":
@@ -439,13 +650,35 @@ class TaskRunner(ABC):
         for running_onboarding in running_onboardings:
             running_onboarding.onboarding_agent.shutdown()
 
-        # Join the threads
-        for running_unit in running_units:
-            running_unit.thread.join()
-        for running_assignment in running_assignments:
-            running_assignment.thread.join()
-        for running_onboarding in running_onboardings:
-            running_onboarding.thread.join()
+        # Wait for the runs to exit
+        for running in [*running_units, *running_assignments, *running_onboardings]:
+            self._wait_for_run_exit(running.future, running.is_async)
+        self._executor.shutdown(wait=True)
+
+    def _wait_for_run_exit(self, future: "Future[None]", is_async: bool) -> None:
+        """Wait for a shut down run to exit, without deadlocking its event loop"""
+        loop_wrap = self._loop_wrap
+        if is_async and loop_wrap is not None and threading.current_thread() == loop_wrap.tid:
+            # Async runs can't progress while we block their loop, they exit
+            # as soon as control returns to it, see wait_for_async_runs_exit
+            self._exiting_async_runs.append(future)
+            return
+        try:
+            future.result()
+        except Exception:
+            pass  # Supervisors already log their own failures
+
+    async def wait_for_async_runs_exit(self) -> None:
+        """
+        Await the exit of async runs that shutdown was called on their event loop
+        for, so that callers can then release what those runs still use
+        """
+        exiting_runs, self._exiting_async_runs = self._exiting_async_runs, []
+        if len(exiting_runs) > 0:
+            await asyncio.gather(
+                *[asyncio.wrap_future(future) for future in exiting_runs],
+                return_exceptions=True,
+            )
 
     # TaskRunners must implement either the unit or assignment versions of the
     # run and cleanup functions, depending on if the task is run at the assignment
@@ -454,8 +687,9 @@ class TaskRunner(ABC):
     def run_onboarding(self, agent: "OnboardingAgent"):
         """
         Handle setup for any resources to run an onboarding task. This
-        will be run in a background thread, and should be tolerant to being
-        interrupted by cleanup_onboarding.
+        will be run in a background thread (or on the event loop if defined
+        as a coroutine), and should be tolerant to being interrupted by
+        cleanup_onboarding.
 
         Only required by tasks that want to implement onboarding
         """
@@ -471,8 +705,9 @@ class TaskRunner(ABC):
     def run_unit(self, unit: "Unit", agent: "Agent"):
         """
         Handle setup for any resources required to get this unit running.
-        This will be run in a background thread, and should be tolerant to
-        being interrupted by cleanup_unit.
+        This will be run in a background thread (or on the event loop if
+        defined as a coroutine), and should be tolerant to being interrupted
+        by cleanup_unit.
 
         Only needs to be implemented by non-concurrent tasks
         """
@@ -491,8 +726,9 @@ class TaskRunner(ABC):
     def run_assignment(self, assignment: "Assignment", agents: List["Agent"]):
         """
         Handle setup for any resources required to get this assignment running.
-        This will be run in a background thread, and should be tolerant to
-        being interrupted by cleanup_assignment.
+        This will be run in a background thread (or on the event loop if
+        defined as a coroutine), and should be tolerant to being interrupted
+        by cleanup_assignment.
 
         Only needs to be implemented by concurrent tasks
         """
@@ -35,6 +35,24 @@ class ArchitectArgs:
             )
         },
     )
+    channel_open_timeout: float = field(
+        default=10,
+        metadata={
+            "help": (
+                "Seconds to wait for each of the architect's channels to connect to "
+                "the server at launch. Channels are opened concurrently."
+            )
+        },
+    )
+    use_router_cache: bool = field(
+        default=True,
+        metadata={
+            "help": (
+                "Reuse previously built routers from the local router cache when "
+                "the router source, provider wrapper, and task bundle are unchanged."
+            )
+        },
+    )
 
 
 class Architect(ABC):
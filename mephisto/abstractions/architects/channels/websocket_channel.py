@@ -5,14 +5,18 @@
 # LICENSE file in the root directory of this source tree.
 
 from typing import Callable, Optional, TYPE_CHECKING
-from mephisto.data_model.packet import Packet
+from mephisto.data_model.packet import (
+    Packet,
+    PACKET_ENCODING_JSON,
+    get_encoding_for_subprotocol,
+    get_wire_subprotocols,
+)
 from mephisto.operations.datatypes import LoopWrapper
 from mephisto.abstractions._subcomponents.channel import Channel, STATUS_CHECK_TIME
 
 import errno
 import websockets
 import threading
-import json
 import time
 import asyncio
 
@@ -58,6 +62,7 @@ class WebsocketChannel(Channel):
         self._is_closed = False
         self._socket_task: Optional[asyncio.Task] = None
         self._retries = MAX_RETRIES
+        self._encoding = PACKET_ENCODING_JSON
 
     def is_closed(self):
         """
@@ -113,11 +118,10 @@ class WebsocketChannel(Channel):
                     # Already closed
                     pass
 
-        def on_message(msg_json):
+        def on_message(message):
             """Incoming message handler defers to the internal handler"""
             try:
-                packet_dict = json.loads(msg_json)
-                packet = Packet.from_dict(packet_dict)
+                packet = Packet.from_wire(message)
                 self.on_message(self.channel_id, packet)
             except Exception as e:
                 # TODO(CLEAN) properly handle only failed from_dict calls
@@ -130,9 +134,14 @@ class WebsocketChannel(Channel):
             # Outer loop allows reconnects
             while not self._is_closed:
                 try:
-                    async with websockets.connect(self.socket_url, open_timeout=30) as websocket:
+                    async with websockets.connect(
+                        self.socket_url,
+                        open_timeout=30,
+                        subprotocols=get_wire_subprotocols(),
+                    ) as websocket:
                         # Inner loop recieves messages until closed
                         self.socket = websocket
+                        self._encoding = get_encoding_for_subprotocol(websocket.subprotocol)
                         on_socket_open()
                         try:
                             while not self._is_closed:
@@ -205,9 +214,9 @@ class WebsocketChannel(Channel):
             return
         # TODO(#651) pop all messages and batch, rather than just one
         packet = self.outgoing_queue.get()
-        send_str = json.dumps(packet.to_sendable_dict())
+        message = packet.to_wire(self._encoding)
         try:
-            await self.socket.send(send_str)
+            await self.socket.send(message)
         except websockets.exceptions.ConnectionClosedOK:
             pass
         except websockets.exceptions.ConnectionClosedError as e:
@@ -262,6 +262,7 @@ class EC2Architect(Architect):
             self.task_run,
             version=self.server_type,
             server_source_path=self.server_source_path,
+            use_cache=self.args.architect.get("use_router_cache", True),
         )
         setup_path = os.path.join(SCRIPTS_DIRECTORY, self.server_type)
         setup_dest = os.path.join(server_build_root, "setup")
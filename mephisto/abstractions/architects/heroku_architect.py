@@ -320,6 +320,7 @@ class HerokuArchitect(Architect):
             self.task_run,
             version=self.server_type,
             server_source_path=self.server_source_path,
+            use_cache=self.args.architect.get("use_router_cache", True),
         )
         return heroku_server_development_path
 
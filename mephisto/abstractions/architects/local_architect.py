@@ -28,6 +28,11 @@ if TYPE_CHECKING:
     from mephisto.abstractions.blueprint import SharedTaskState
 
 from mephisto.abstractions.architects.router.build_router import build_router
+from mephisto.abstractions.architects.router.shared_router import (
+    DEFAULT_ROUTER_HOST_PORT,
+    register_task_run,
+    unregister_task_run,
+)
 from mephisto.abstractions.architects.channels.websocket_channel import WebsocketChannel
 from mephisto.utils.dirs import get_mephisto_tmp_dir
 
@@ -43,6 +48,19 @@ class LocalArchitectArgs(ArchitectArgs):
         default="localhost", metadata={"help": "Addressible location of the server"}
     )
     port: str = field(default="3000", metadata={"help": "Port to launch the server on"})
+    use_shared_router: bool = field(
+        default=False,
+        metadata={
+            "help": (
+                "Load this run's router into a long-lived local router process "
+                "shared between runs, rather than starting a new one. Node only."
+            )
+        },
+    )
+    shared_router_port: str = field(
+        default=DEFAULT_ROUTER_HOST_PORT,
+        metadata={"help": "Local port the shared router process takes registrations on"},
+    )
 
 
 @register_mephisto_abstraction()
@@ -78,6 +96,19 @@ class LocalArchitect(Architect):
         self.cleanup_called = False
         self.server_type = args.architect.server_type
         self.server_source_path = args.architect.get("server_source_path", None)
+        self.use_router_cache = args.architect.get("use_router_cache", True)
+        self.use_shared_router = args.architect.get("use_shared_router", False)
+        self.shared_router_port = args.architect.get(
+            "shared_router_port", DEFAULT_ROUTER_HOST_PORT
+        )
+
+    @classmethod
+    def assert_task_args(cls, args: "DictConfig", shared_state: "SharedTaskState") -> None:
+        """Ensure a shared router is only requested for the node server"""
+        if args.architect.get("use_shared_router", False):
+            assert (
+                args.architect.server_type == "node"
+            ), "The shared router is only available for the node server"
 
     def _get_socket_urls(self) -> List[str]:
         """Return the path to the local server socket"""
@@ -136,6 +167,7 @@ class LocalArchitect(Architect):
             self.task_run,
             version=self.server_type,
             server_source_path=self.server_source_path,
+            use_cache=self.use_router_cache,
         )
         return self.server_dir
 
@@ -147,6 +179,13 @@ class LocalArchitect(Architect):
         )
         shutil.copytree(self.server_dir, self.running_dir, symlinks=True)
 
+        if self.use_shared_router:
+            register_task_run(
+                self.task_run_id, self.running_dir, str(self.port), self.shared_router_port
+            )
+            print(f"Server running locally in the shared router on port {self.port}.")
+            return "{}:{}".format(self.hostname, self.port)
+
         return_dir = os.getcwd()
         os.chdir(self.running_dir)
         if self.server_type == "node":
@@ -186,7 +225,9 @@ class LocalArchitect(Architect):
     def shutdown(self) -> None:
         """Find the server process, shut it down, then remove the build directory"""
         assert self.running_dir is not None, "shutdown called before deploy"
-        if self.server_process is None:
+        if self.use_shared_router:
+            unregister_task_run(self.task_run_id, self.shared_router_port)
+        elif self.server_process is None:
             assert self.server_process_pid is not None, "No server id to kill"
             os.kill(self.server_process_pid, signal.SIGTERM)
         else:
@@ -93,6 +93,8 @@ class SocketHandler(WebSocketHandler):
                 attachment dict structure.
         """
         message = json.loads(message_text)
+        if self.app.on_packet is not None:
+            self.app.on_packet(message)
         if message["packet_type"] == PACKET_TYPE_ALIVE:
             self.app.last_alive_packet = message
         elif message["packet_type"] == PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE:
@@ -126,6 +128,8 @@ class MockServer(tornado.web.Application):
         self.last_alive_packet: Optional[Dict[str, Any]] = None
         self.actions_observed = 0
         self.last_packet: Optional[Dict[str, Any]] = None
+        # Optional hook called on the server thread with every received packet
+        self.on_packet: Optional[Callable[[Dict[str, Any]], None]] = None
         tornado_settings = {
             "autoescape": None,
             "debug": "/dbg/" in __file__,
@@ -173,6 +177,18 @@ class MockServer(tornado.web.Application):
         if last_exception is not None:
             raise last_exception
 
+    def _write_message(self, message):
+        """Write the given message to the subscriber, from the server thread"""
+        self._get_sub().write_message(json.dumps(message))
+
+    def send_message_nowait(self, message):
+        """
+        Queue the given message to be sent from the server thread, without
+        the retries and pacing of _send_message. For driving load from hooks.
+        """
+        assert self.running_instance is not None, "Server not yet launched"
+        self.running_instance.add_callback(self._write_message, message)
+
     def send_agent_act(self, agent_id, act_content):
         """
         Send a packet from the given agent with
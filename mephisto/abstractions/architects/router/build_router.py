@@ -5,24 +5,36 @@
 # LICENSE file in the root directory of this source tree.
 
 import mephisto.abstractions.architects.router as router_module
+import hashlib
 import os
 import sh  # type: ignore
 import shutil
 import shlex
 import subprocess
 import json
+import uuid
 
+from mephisto.utils.dirs import get_mephisto_tmp_dir
 from typing import TYPE_CHECKING, Optional
 
 if TYPE_CHECKING:
     from mephisto.data_model.task_run import TaskRun
 
+from mephisto.utils.logger_core import get_logger
+
+logger = get_logger(name=__name__)
+
 ROUTER_ROOT_DIR = os.path.dirname(router_module.__file__)
 NODE_SERVER_SOURCE_ROOT = os.path.join(ROUTER_ROOT_DIR, "node")
 FLASK_SERVER_SOURCE_ROOT = os.path.join(ROUTER_ROOT_DIR, "flask")
 CROWD_SOURCE_PATH = "static/wrap_crowd_source.js"
 TASK_CONFIG_PATH = "static/task_config.json"
 CURR_MEPHISTO_TASK_VERSION = "2.0.4"
+NODE_MODULES_DIRNAME = "node_modules"
+INSTALL_HASH_FILENAME = ".mephisto_install_hash"
+INSTALL_MANIFEST_FILES = ["package.json", "package-lock.json"]
+ROUTER_CACHE_DIRNAME = "router_cache"
+ROUTER_CACHE_MAX_ENTRIES = 8
 
 
 def can_build(build_dir: str, task_run: "TaskRun") -> bool:
@@ -38,10 +50,77 @@ def can_build(build_dir: str, task_run: "TaskRun") -> bool:
     return True
 
 
+def get_router_cache_dir() -> str:
+    """Return the directory where built router bundles are cached"""
+    return os.path.join(get_mephisto_tmp_dir(), ROUTER_CACHE_DIRNAME)
+
+
+def _hash_path_into(hasher: "hashlib._Hash", path: str) -> None:
+    """Add the contents of a single file (or a symlink's target) to the hasher"""
+    if os.path.islink(path):
+        hasher.update(b"link:" + os.readlink(path).encode("utf-8"))
+        return
+    with open(path, "rb") as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(1 << 16), b""):
+            hasher.update(chunk)
+
+
+def get_install_hash(source_dir: str) -> str:
+    """
+    Return a hash of the package manifests in the given directory, used to
+    determine whether the installed node_modules are still valid
+    """
+    hasher = hashlib.sha256()
+    for manifest_name in INSTALL_MANIFEST_FILES:
+        manifest_path = os.path.join(source_dir, manifest_name)
+        hasher.update(manifest_name.encode("utf-8"))
+        if os.path.exists(manifest_path):
+            _hash_path_into(hasher, manifest_path)
+    return hasher.hexdigest()
+
+
+def get_dir_hash(dir_path: str) -> str:
+    """
+    Return a content hash of everything in the given directory, skipping
+    node_modules (which is instead covered by the package manifests)
+    """
+    hasher = hashlib.sha256()
+    for root, dirs, files in os.walk(dir_path):
+        dirs[:] = sorted(d for d in dirs if d != NODE_MODULES_DIRNAME)
+        # os.walk lists symlinked directories as dirs without following them
+        linked_dirs = [d for d in dirs if os.path.islink(os.path.join(root, d))]
+        for filename in sorted(files + linked_dirs):
+            file_path = os.path.join(root, filename)
+            hasher.update(os.path.relpath(file_path, dir_path).encode("utf-8"))
+            _hash_path_into(hasher, file_path)
+    return hasher.hexdigest()
+
+
+def _link_or_copy(src: str, dst: str) -> str:
+    """Hardlink src to dst, falling back to a copy across filesystems"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
 def install_router_files() -> None:
     """
-    Create a new build including the node_modules
+    Create a new build including the node_modules, skipping the install
+    if the existing node_modules were installed from the same manifests
     """
+    install_hash = get_install_hash(NODE_SERVER_SOURCE_ROOT)
+    # Kept in the cache dir rather than node_modules, so installs don't touch
+    # the source tree beyond what npm writes
+    install_hash_path = os.path.join(get_router_cache_dir(), INSTALL_HASH_FILENAME)
+    node_modules_path = os.path.join(NODE_SERVER_SOURCE_ROOT, NODE_MODULES_DIRNAME)
+    if os.path.exists(install_hash_path) and os.path.isdir(node_modules_path):
+        with open(install_hash_path, "r") as hash_file:
+            if hash_file.read().strip() == install_hash:
+                logger.debug("Router node_modules are up to date, skipping npm install")
+                return
+
     return_dir = os.getcwd()
     os.chdir(NODE_SERVER_SOURCE_ROOT)
 
@@ -52,6 +131,10 @@ def install_router_files() -> None:
         )
     os.chdir(return_dir)
 
+    os.makedirs(os.path.dirname(install_hash_path), exist_ok=True)
+    with open(install_hash_path, "w+") as hash_file:
+        hash_file.write(install_hash)
+
 
 def build_node_router(build_dir: str, task_run: "TaskRun") -> str:
     """Build requirements for the NPM router"""
@@ -64,16 +147,88 @@ def build_flask_router(build_dir: str, task_run: "TaskRun") -> str:
     return FLASK_SERVER_SOURCE_ROOT
 
 
+def _build_task_files(local_server_directory_path: str, task_run: "TaskRun") -> None:
+    """
+    Write the crowd provider wrapper, the task config, and the task's
+    own built files into the given router directory
+    """
+    # Copy the required wrap crowd source path
+    local_crowd_source_path = os.path.join(local_server_directory_path, CROWD_SOURCE_PATH)
+    crowd_provider = task_run.get_provider()
+    shutil.copy2(crowd_provider.get_wrapper_js_path(), local_crowd_source_path)
+
+    # Copy the task_run's json configuration
+    local_task_config_path = os.path.join(local_server_directory_path, TASK_CONFIG_PATH)
+    blueprint = task_run.get_blueprint()
+    with open(local_task_config_path, "w+") as task_fp:
+        frontend_args = blueprint.get_frontend_args()
+        frontend_args["mephisto_task_version"] = CURR_MEPHISTO_TASK_VERSION
+        json.dump(frontend_args, task_fp, sort_keys=True)
+
+    # Consolidate task files as defined by the task
+    TaskBuilderClass = blueprint.TaskBuilderClass
+    task_builder = TaskBuilderClass(task_run, task_run.args)
+
+    task_builder.build_in_dir(local_server_directory_path)
+
+
+def get_build_input_hash(server_source_directory_path: str, task_run: "TaskRun") -> Optional[str]:
+    """
+    Return a hash of everything the router for the given run is built from, or
+    None if its task builder can't list its inputs and the build has to be run
+    """
+    blueprint = task_run.get_blueprint()
+    task_builder = blueprint.TaskBuilderClass(task_run, task_run.args)
+    build_inputs = task_builder.get_build_inputs()
+    if build_inputs is None:
+        return None
+    hasher = hashlib.sha256()
+    hasher.update(get_install_hash(server_source_directory_path).encode("utf-8"))
+    hasher.update(get_dir_hash(server_source_directory_path).encode("utf-8"))
+    _hash_path_into(hasher, task_run.get_provider().get_wrapper_js_path())
+    frontend_args = blueprint.get_frontend_args()
+    frontend_args["mephisto_task_version"] = CURR_MEPHISTO_TASK_VERSION
+    hasher.update(json.dumps(frontend_args, sort_keys=True).encode("utf-8"))
+    builder_class = type(task_builder)
+    hasher.update(f"{builder_class.__module__}.{builder_class.__qualname__}".encode("utf-8"))
+    for input_path in build_inputs:
+        hasher.update(input_path.encode("utf-8"))
+        if os.path.isdir(input_path):
+            hasher.update(get_dir_hash(input_path).encode("utf-8"))
+        elif os.path.exists(input_path):
+            _hash_path_into(hasher, input_path)
+    return hasher.hexdigest()
+
+
+def _prune_router_cache(cache_dir: str) -> None:
+    """Remove the least recently used cached routers beyond the max entry count"""
+    entries = [
+        os.path.join(cache_dir, entry)
+        for entry in os.listdir(cache_dir)
+        if not entry.startswith(".")
+    ]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for stale_entry in entries[ROUTER_CACHE_MAX_ENTRIES:]:
+        shutil.rmtree(stale_entry, ignore_errors=True)
+
+
 def build_router(
     build_dir: str,
     task_run: "TaskRun",
     version: str = "node",
     server_source_path: Optional[str] = None,
+    use_cache: bool = True,
+    cache_dir: Optional[str] = None,
 ) -> str:
     """
     Copy expected files from the router source into the build dir,
     using existing files in the build dir as replacements for the
     defaults if available
+
+    When use_cache is set, the built router is stored in a content-addressed
+    cache keyed by the router source, crowd provider wrapper and task bundle,
+    and unchanged builds are hardlinked into place rather than rebuilt. Tasks
+    whose builders list their inputs skip building entirely on a cache hit.
     """
     if server_source_path is not None:
         # Giving a server source takes precedence over the build
@@ -88,26 +243,90 @@ def build_router(
     # Delete old server files
     sh.rm(shlex.split("-rf " + local_server_directory_path))
 
-    # Copy over a clean copy into the server directory
-    shutil.copytree(server_source_directory_path, local_server_directory_path)
+    if not use_cache:
+        # Copy over a clean copy into the server directory
+        shutil.copytree(server_source_directory_path, local_server_directory_path)
+        _build_task_files(local_server_directory_path, task_run)
+        return local_server_directory_path
 
-    # Copy the required wrap crowd source path
-    local_crowd_source_path = os.path.join(local_server_directory_path, CROWD_SOURCE_PATH)
-    crowd_provider = task_run.get_provider()
-    shutil.copy2(crowd_provider.get_wrapper_js_path(), local_crowd_source_path)
-
-    # Copy the task_run's json configuration
-    local_task_config_path = os.path.join(local_server_directory_path, TASK_CONFIG_PATH)
-    blueprint = task_run.get_blueprint()
-    with open(local_task_config_path, "w+") as task_fp:
-        frontend_args = blueprint.get_frontend_args()
-        frontend_args["mephisto_task_version"] = CURR_MEPHISTO_TASK_VERSION
-        json.dump(frontend_args, task_fp)
+    if cache_dir is None:
+        cache_dir = get_router_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
 
-    # Consolidate task files as defined by the task
-    TaskBuilderClass = blueprint.TaskBuilderClass
-    task_builder = TaskBuilderClass(task_run, task_run.args)
+    # Builds whose inputs are all known are looked up before building anything
+    router_hash = get_build_input_hash(server_source_directory_path, task_run)
+    if router_hash is None or not os.path.exists(os.path.join(cache_dir, router_hash)):
+        router_hash = _build_into_cache(
+            server_source_directory_path, task_run, cache_dir, router_hash
+        )
+    else:
+        logger.debug(f"Reusing cached router build {router_hash}")
+        os.utime(os.path.join(cache_dir, router_hash))
 
-    task_builder.build_in_dir(local_server_directory_path)
+    # Hardlink the cached build into place, so that architects are free to
+    # add or remove files from their copy without affecting the cache
+    shutil.copytree(
+        os.path.join(cache_dir, router_hash),
+        local_server_directory_path,
+        symlinks=True,
+        copy_function=_link_or_copy,
+    )
 
     return local_server_directory_path
+
+
+def _build_into_cache(
+    server_source_directory_path: str,
+    task_run: "TaskRun",
+    cache_dir: str,
+    router_hash: Optional[str],
+) -> str:
+    """
+    Build the router in a staging directory and move it into the cache, under
+    the given hash or, when that's None, a hash of the built router. Returns the
+    hash the build is cached under.
+    """
+    # Assemble everything but node_modules in a staging directory, such that the
+    # fully built router can be hashed and looked up in the cache
+    staging_directory_path = os.path.join(cache_dir, f".staging_{uuid.uuid4().hex}")
+    shutil.copytree(
+        server_source_directory_path,
+        staging_directory_path,
+        symlinks=True,
+        ignore=shutil.ignore_patterns(NODE_MODULES_DIRNAME),
+    )
+    try:
+        _build_task_files(staging_directory_path, task_run)
+    except Exception:
+        shutil.rmtree(staging_directory_path, ignore_errors=True)
+        raise
+
+    if router_hash is None:
+        hasher = hashlib.sha256()
+        hasher.update(get_install_hash(server_source_directory_path).encode("utf-8"))
+        hasher.update(get_dir_hash(staging_directory_path).encode("utf-8"))
+        router_hash = hasher.hexdigest()
+
+    cached_router_path = os.path.join(cache_dir, router_hash)
+    if os.path.exists(cached_router_path):
+        logger.debug(f"Reusing cached router build {router_hash}")
+        shutil.rmtree(staging_directory_path)
+        os.utime(cached_router_path)
+        return router_hash
+
+    logger.debug(f"Caching new router build {router_hash}")
+    source_node_modules = os.path.join(server_source_directory_path, NODE_MODULES_DIRNAME)
+    if os.path.exists(source_node_modules):
+        shutil.copytree(
+            source_node_modules,
+            os.path.join(staging_directory_path, NODE_MODULES_DIRNAME),
+            symlinks=True,
+            copy_function=_link_or_copy,
+        )
+    try:
+        os.rename(staging_directory_path, cached_router_path)
+    except OSError:
+        # Another build populated this entry first, theirs is equivalent
+        shutil.rmtree(staging_directory_path)
+    _prune_router_cache(cache_dir)
+    return router_hash
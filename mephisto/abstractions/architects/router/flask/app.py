@@ -11,11 +11,13 @@ monkey.patch_all()
 try:
     from mephisto.abstractions.architects.router.flask.mephisto_flask_blueprint import (  # type: ignore
         MephistoRouter,
+        MephistoWebSocketHandler,
         mephisto_router,
     )
 except:
     from mephisto_flask_blueprint import (  # type: ignore
         MephistoRouter,
+        MephistoWebSocketHandler,
         mephisto_router,
     )
 from geventwebsocket import WebSocketServer, Resource  # type: ignore
@@ -35,4 +37,5 @@ if __name__ == "__main__":
         ("", port),
         Resource([("^/.*", MephistoRouter), ("^/.*", DebuggedApplication(flask_app))]),
         debug=False,
+        handler_class=MephistoWebSocketHandler,
     ).serve_forever()
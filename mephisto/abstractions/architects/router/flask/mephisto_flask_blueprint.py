@@ -19,7 +19,11 @@ from geventwebsocket import (  # type: ignore
     Resource,
     WebSocketError,
 )
+from geventwebsocket.handler import WebSocketHandler  # type: ignore
 from uuid import uuid4
+import bisect
+import collections
+import hashlib
 import time
 import json
 import os
@@ -27,7 +31,21 @@ from werkzeug.utils import secure_filename  # type: ignore
 
 from threading import Event
 
-from typing import Dict, Tuple, List, Any, Optional, TYPE_CHECKING
+from typing import Deque, Dict, Tuple, List, Any, Optional, Union, TYPE_CHECKING
+
+try:
+    import msgpack  # type: ignore
+
+    MSGPACK_INSTALLED = True
+except ImportError:
+    MSGPACK_INSTALLED = False
+
+try:
+    import orjson  # type: ignore
+
+    ORJSON_INSTALLED = True
+except ImportError:
+    ORJSON_INSTALLED = False
 
 if TYPE_CHECKING:
     from geventwebsocket.handler import Client  # type: ignore
@@ -51,6 +69,14 @@ PACKET_TYPE_ERROR = "log_error"
 
 
 SYSTEM_CHANNEL_ID = "mephisto"
+# Backend id for Mephisto servers that don't identify themselves in their alive
+DEFAULT_BACKEND_ID = "mephisto"
+# Points each backend gets on the hash ring, more spread agents more evenly
+BACKEND_VIRTUAL_NODES = 64
+# Client-bound packets kept per agent for replay after a reconnect
+REPLAY_BUFFER_SIZE = 256
+# Packets that are sequenced and replayed, rather than only sent live
+REPLAYED_PACKET_TYPES = {PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE, PACKET_TYPE_UPDATE_STATUS}
 
 FAILED_RECONNECT_TIME = 10  # seconds
 FAILED_PING_TIME = 15  # seconds
@@ -67,6 +93,10 @@ STATUS_ONBOARDING = "onboarding"
 
 PACKET_TYPE_HEARTBEAT = "heartbeat"
 
+# Websocket subprotocols negotiating the packet encoding, JSON is the default
+SUBPROTOCOL_JSON = "mephisto-json"
+SUBPROTOCOL_MSGPACK = "mephisto-msgpack"
+
 DEBUG = False
 
 
@@ -90,6 +120,43 @@ def debug_log(*args):
         print(*args)
 
 
+def encode_packet(packet: Dict[str, Any], use_msgpack: bool) -> Union[str, bytes]:
+    """Serialize a packet for a socket, as msgpack binary or JSON text"""
+    if use_msgpack:
+        return msgpack.packb(packet, use_bin_type=True)
+    if ORJSON_INSTALLED:
+        return orjson.dumps(packet, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(packet)
+
+
+def decode_packet(message: Union[str, bytes]) -> Dict[str, Any]:
+    """Deserialize a packet received as either msgpack binary or JSON text"""
+    if isinstance(message, (bytes, bytearray)):
+        return msgpack.unpackb(message, raw=False, strict_map_key=False)
+    if ORJSON_INSTALLED:
+        return orjson.loads(message)
+    return json.loads(message)
+
+
+def select_subprotocol(requested_protocols: str) -> Optional[str]:
+    """
+    Choose the subprotocol to accept from a client's Sec-WebSocket-Protocol
+    offer, preferring msgpack when we can speak it
+    """
+    offered = [p.strip() for p in requested_protocols.split(",")]
+    if MSGPACK_INSTALLED and SUBPROTOCOL_MSGPACK in offered:
+        return SUBPROTOCOL_MSGPACK
+    elif SUBPROTOCOL_JSON in offered:
+        return SUBPROTOCOL_JSON
+    return None
+
+
+def socket_uses_msgpack(socket: "WebSocket") -> bool:
+    """Return whether the given socket negotiated the msgpack subprotocol"""
+    requested_protocols = socket.environ.get("HTTP_SEC_WEBSOCKET_PROTOCOL", "")
+    return select_subprotocol(requested_protocols) == SUBPROTOCOL_MSGPACK
+
+
 def js_time(python_time: float) -> int:
     """Convert python time to js time, as the mephisto-task package expects"""
     return int(python_time * 1000)
@@ -108,21 +175,91 @@ class LocalAgentState:
         self.is_alive = False
         self.disconnect_time = 0
         self.last_ping = 0
-        self.unsent_messages: List[Dict[str, Any]] = []
+        # Sequenced client-bound packets the agent hasn't acknowledged yet
+        self.replay_buffer: Deque[Dict[str, Any]] = collections.deque(maxlen=REPLAY_BUFFER_SIZE)
+        self.next_router_seq = 1
+        # Highest sequence number handed to the agent's current socket
+        self.sent_router_seq = 0
+        self.dropped_packets = 0
+        # Router status sequence number as of this agent's last status change
+        self.status_seq = 0
 
     def __str__(self):
         return f"Agent({self.agent_id}): {self.status}"
 
+    def buffer_packet(self, packet: Dict[str, Any]) -> None:
+        """Number the packet and keep it until acked, dropping the oldest when full"""
+        packet["router_seq"] = self.next_router_seq
+        self.next_router_seq += 1
+        if len(self.replay_buffer) == self.replay_buffer.maxlen:
+            self.dropped_packets += 1
+            debug_log("Replay buffer full, dropping oldest packet for", self.agent_id)
+        self.replay_buffer.append(packet)
+
+    def acknowledge(self, router_seq: int) -> None:
+        """Drop packets the agent has confirmed receiving"""
+        while len(self.replay_buffer) > 0 and self.replay_buffer[0]["router_seq"] <= router_seq:
+            self.replay_buffer.popleft()
+
+    def get_unsent_packets(self) -> List[Dict[str, Any]]:
+        """Return the buffered packets not yet sent to the agent's current socket"""
+        return [
+            packet
+            for packet in self.replay_buffer
+            if packet["router_seq"] > self.sent_router_seq
+        ]
+
+
+class BackendHashRing:
+    """
+    Consistent hash ring placing agents (and agent requests) onto connected
+    Mephisto backends, such that a backend joining or leaving only moves the
+    keys that hashed near it.
+    """
+
+    def __init__(self, virtual_nodes: int = BACKEND_VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self._ring: List[Tuple[int, str]] = []
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def add(self, backend_id: str) -> None:
+        if backend_id in self:
+            return
+        for idx in range(self.virtual_nodes):
+            bisect.insort(self._ring, (self._hash(f"{backend_id}#{idx}"), backend_id))
+
+    def remove(self, backend_id: str) -> None:
+        self._ring = [point for point in self._ring if point[1] != backend_id]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the backend the given key falls to, if there are any"""
+        if len(self._ring) == 0:
+            return None
+        idx = bisect.bisect_left(self._ring, (self._hash(key),))
+        return self._ring[idx % len(self._ring)][1]
+
+    def __contains__(self, backend_id: str) -> bool:
+        return any(point[1] == backend_id for point in self._ring)
+
 
 class MephistoRouterState:
     def __init__(self):
         self.agent_id_to_client: Dict[str, "Client"] = {}
         self.client_id_to_agent: Dict[str, LocalAgentState] = {}
-        self.mephisto_socket: Optional["WebSocket"] = None
+        # Mephisto servers connected to this router, by their backend id
+        self.backend_sockets: Dict[str, "WebSocket"] = {}
+        self.backend_ring = BackendHashRing()
+        # Backend that each agent was last heard about from
+        self.agent_id_to_backend: Dict[str, str] = {}
         self.agent_id_to_agent: Dict[str, LocalAgentState] = {}
         self.pending_agent_requests: Dict[str, bool] = {}
         self.received_agent_responses: Dict[str, Dict[str, Any]] = {}
         self.last_mephisto_ping: float = time.time()
+        # Incremented on every agent status change, so Mephisto can request deltas
+        self.status_seq: int = 0
 
 
 mephisto_router_app: Optional["MephistoRouter"] = None
@@ -144,6 +281,22 @@ def register_router_application(router: "MephistoRouter") -> "MephistoRouterStat
     return mephisto_router_state
 
 
+class MephistoWebSocketHandler(WebSocketHandler):
+    """
+    WebSocketHandler that negotiates the subprotocol from the client's offer.
+    geventwebsocket only accepts a single protocol name per application, which
+    would fail the handshake of clients not offering that one.
+    """
+
+    def start_response(self, status, headers, exc_info=None):
+        if status.startswith("101"):
+            headers = [h for h in headers if h[0].lower() != "sec-websocket-protocol"]
+            protocol = select_subprotocol(self.environ.get("HTTP_SEC_WEBSOCKET_PROTOCOL", ""))
+            if protocol is not None:
+                headers.append(("Sec-WebSocket-Protocol", protocol))
+        return super().start_response(status, headers, exc_info=exc_info)
+
+
 class MephistoRouter(WebSocketApplication):
     """
     Base implementation of a websocket server that handles
@@ -167,7 +320,7 @@ class MephistoRouter(WebSocketApplication):
             return
 
         packet["router_outgoing_timestamp"] = time.time()
-        socket.send(json.dumps(packet))
+        socket.send(encode_packet(packet, socket_uses_msgpack(socket)))
 
     def _find_or_create_agent(self, agent_id: str) -> "LocalAgentState":
         """Get or create an agent state for the given id"""
@@ -176,8 +329,19 @@ class MephistoRouter(WebSocketApplication):
         if agent is None:
             agent = LocalAgentState(agent_id)
             state.agent_id_to_agent[agent_id] = agent
+            state.status_seq += 1
+            agent.status_seq = state.status_seq
         return agent
 
+    def _set_agent_status(self, agent: LocalAgentState, status: str) -> None:
+        """Update an agent's status, marking it as changed if it differs"""
+        if agent.status == status:
+            return
+        state = self.mephisto_state
+        state.status_seq += 1
+        agent.status_seq = state.status_seq
+        agent.status = status
+
     def _handle_alive(self, client: "Client", alive_packet: Dict[str, Any]) -> None:
         """
         On alive, find out who the sender is, and register
@@ -185,7 +349,11 @@ class MephistoRouter(WebSocketApplication):
         """
         state = self.mephisto_state
         if alive_packet["subject_id"] == SYSTEM_CHANNEL_ID:
-            state.mephisto_socket = client.ws
+            data = alive_packet.get("data") or {}
+            backend_id = data.get("backend_id", DEFAULT_BACKEND_ID)
+            client.mephisto_backend_id = backend_id
+            state.backend_sockets[backend_id] = client.ws
+            state.backend_ring.add(backend_id)
         else:
             agent_id = alive_packet["subject_id"]
             agent = self._find_or_create_agent(agent_id)
@@ -193,10 +361,22 @@ class MephistoRouter(WebSocketApplication):
             state.agent_id_to_client[agent_id] = client
             state.client_id_to_agent[client.mephisto_id] = agent
 
-            # push out backlog
-            while len(agent.unsent_messages) > 0:
-                packet = agent.unsent_messages.pop(0)
-                self._handle_forward(packet)
+            data = alive_packet.get("data") or {}
+            last_router_seq = data.get("last_router_seq")
+            if last_router_seq is not None:
+                # Replay whatever the agent didn't get, even if sent to an old socket.
+                # Older clients don't ack, so only get what was never sent.
+                agent.acknowledge(last_router_seq)
+                agent.sent_router_seq = last_router_seq
+                # A restarted router continues past what the agent has seen
+                agent.next_router_seq = max(agent.next_router_seq, last_router_seq + 1)
+            self._send_unsent_packets(agent, client)
+
+    def _send_unsent_packets(self, agent: LocalAgentState, client: "Client") -> None:
+        """Push out the agent's backlog to their current socket"""
+        for packet in agent.get_unsent_packets():
+            self._send_message(client.ws, packet)
+            agent.sent_router_seq = packet["router_seq"]
 
     def _ensure_live_connection(self, agent: LocalAgentState) -> None:
         curr_status = agent.status
@@ -206,7 +386,7 @@ class MephistoRouter(WebSocketApplication):
         if curr_status not in [STATUS_ONBOARDING, STATUS_WAITING, STATUS_IN_TASK]:
             return  # not in a live state, no reason to check liveliness
         if time.time() - last_ping > FAILED_PING_TIME:
-            agent.status = STATUS_DISCONNECTED
+            self._set_agent_status(agent, STATUS_DISCONNECTED)
             self._send_status_for_agent(agent.agent_id)
 
     def _handle_get_agent_status(self, agent_status_packet: Dict[str, Any]) -> None:
@@ -214,55 +394,106 @@ class MephistoRouter(WebSocketApplication):
         On a get agent status request, check the status of all agents and
         respond to the core mephisto server with the current status of each.
 
+        If the request includes the last status sequence number Mephisto
+        acknowledged, only agents whose status changed since are included.
+
         May return semi-stale information, but is non-blocking
         """
         state = self.mephisto_state
         state.last_mephisto_ping = time.time()
+        since_seq = agent_status_packet["data"].get("since_seq")
+        if since_seq is not None and since_seq > state.status_seq:
+            since_seq = 0  # Router restarted since this was acknowledged, send everything
+        # With several backends, each only hears about the agents routed to it
+        backend_id = self._get_backend_id_for_socket(self.ws)
+        only_routed = len(state.backend_sockets) > 1
         agent_statuses = {}
-        for agent_id in state.agent_id_to_agent.keys():
-            agent = self._find_or_create_agent(agent_id)
+        for agent in state.agent_id_to_agent.values():
             self._ensure_live_connection(agent)
             if not agent.is_alive and agent.status != STATUS_DISCONNECTED:
                 self._followup_possible_disconnect(agent)
-            agent_statuses[agent_id] = state.agent_id_to_agent[agent_id].status
+            if only_routed and self._get_backend_id(agent.agent_id) != backend_id:
+                continue
+            if since_seq is None or agent.status_seq > since_seq:
+                agent_statuses[agent.agent_id] = agent.status
+        if since_seq is None:
+            status_data: Dict[str, Any] = agent_statuses
+        else:
+            status_data = {"statuses": agent_statuses, "status_seq": state.status_seq}
         packet = {
             "packet_type": PACKET_TYPE_RETURN_STATUSES,
             "subject_id": SYSTEM_CHANNEL_ID,
-            "data": agent_statuses,
+            "data": status_data,
             "client_timestamp": agent_status_packet["server_timestamp"],
             "router_incoming_timestamp": agent_status_packet["router_incoming_timestamp"],
         }
-        self._handle_forward(packet)
+        self._send_message(self.ws, packet)
 
     def _handle_update_local_status(self, status_packet: Dict[str, Any]) -> None:
         """Update the local agent status given a status packet"""
         agent_id = status_packet["subject_id"]
         agent = self._find_or_create_agent(agent_id)
         if status_packet["data"].get("status") is not None:
-            agent.status = status_packet["data"]["status"]
+            self._set_agent_status(agent, status_packet["data"]["status"])
+
+    def _get_backend_id(self, subject_id: str) -> Optional[str]:
+        """
+        Return the id of the backend responsible for the given agent (or
+        agent request). Agents stay with the backend Mephisto last sent their
+        packets from, otherwise they're placed on the hash ring.
+        """
+        state = self.mephisto_state
+        backend_id = state.agent_id_to_backend.get(subject_id)
+        if backend_id is not None and backend_id in state.backend_sockets:
+            return backend_id
+        return state.backend_ring.get(subject_id)
+
+    def _get_backend_socket(self, subject_id: str) -> Optional["WebSocket"]:
+        """Return the socket of the backend responsible for the given agent"""
+        backend_id = self._get_backend_id(subject_id)
+        if backend_id is None:
+            return None
+        return self.mephisto_state.backend_sockets[backend_id]
+
+    def _get_backend_id_for_socket(self, socket: "WebSocket") -> Optional[str]:
+        for backend_id, backend_socket in self.mephisto_state.backend_sockets.items():
+            if backend_socket is socket:
+                return backend_id
+        return None
+
+    def _send_to_backends(self, packet: Dict[str, Any]) -> None:
+        """Send a packet that isn't about any one agent to every backend"""
+        for socket in list(self.mephisto_state.backend_sockets.values()):
+            self._send_message(socket, packet)
 
     def _handle_forward(self, packet: Dict[str, Any]) -> None:
         """Handle forwarding the given packet to the included subject_id"""
         if packet["subject_id"] == SYSTEM_CHANNEL_ID:
             debug_log("Sending message to Mephisto", packet)
-            socket = self.mephisto_state.mephisto_socket
+            self._send_to_backends(packet)
+            return
+        debug_log("Sending message to agent", packet)
+        agent_id = packet["subject_id"]
+        agent = self._find_or_create_agent(agent_id)
+        if packet["packet_type"] in REPLAYED_PACKET_TYPES:
+            agent.buffer_packet(packet)
+        client = self.mephisto_state.agent_id_to_client.get(agent_id)
+        if client is None or client.ws.closed:
+            # Sequenced packets wait in the replay buffer for a reconnect,
+            # anything else (heartbeat replies) is only useful live
+            return
+        if "router_seq" in packet:
+            # Send any backlog first, so the agent gets packets in order
+            self._send_unsent_packets(agent, client)
         else:
-            debug_log("Sending message to agent", packet)
-            agent_id = packet["subject_id"]
-            agent = self._find_or_create_agent(agent_id)
-            client = self.mephisto_state.agent_id_to_client.get(agent_id)
-            if client is None:
-                agent.unsent_messages.append(packet)
-                return
-            socket = client.ws
-        self._send_message(socket, packet)
+            self._send_message(client.ws, packet)
 
     def _followup_possible_disconnect(self, agent: LocalAgentState) -> None:
         """Check to see if the given agent is disconnected"""
         if agent.disconnect_time == 0:
             return  # Agent never disconnected, isn't live
         if time.time() - agent.disconnect_time > FAILED_RECONNECT_TIME:
-            agent.status = STATUS_DISCONNECTED
+            self._set_agent_status(agent, STATUS_DISCONNECTED)
             debug_log("Agent disconnected", agent)
 
     def _send_status_for_agent(self, agent_id: str) -> None:
@@ -288,7 +519,7 @@ class MephistoRouter(WebSocketApplication):
         debug_log("Some client connected!", current_client)
         current_client.mephisto_id = str(uuid4())
 
-    def on_message(self, message: str) -> None:
+    def on_message(self, message: Union[str, bytes]) -> None:
         """
         Determine the type of message, and then handle via the correct handler
         """
@@ -298,8 +529,16 @@ class MephistoRouter(WebSocketApplication):
         state = self.mephisto_state
         current_client = self.ws.handler.active_client
         client = current_client
-        packet = json.loads(message)
+        packet = decode_packet(message)
         packet["router_incoming_timestamp"] = time.time()
+        backend_id = getattr(client, "mephisto_backend_id", None)
+        if backend_id is not None:
+            # Packets about an agent come from the backend handling it
+            agent_id = packet["subject_id"]
+            if packet["packet_type"] == PACKET_TYPE_AGENT_DETAILS:
+                agent_id = packet["data"].get("agent_id")
+            if agent_id is not None and agent_id != SYSTEM_CHANNEL_ID:
+                state.agent_id_to_backend[agent_id] = backend_id
         if packet["packet_type"] == PACKET_TYPE_REQUEST_STATUSES:
             debug_log("Mephisto requesting status")
             self._handle_get_agent_status(packet)
@@ -307,9 +546,9 @@ class MephistoRouter(WebSocketApplication):
             self._handle_forward(packet)
         elif packet["packet_type"] == PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE:
             debug_log("Agent action: ", packet)
-            self._send_message(self.mephisto_state.mephisto_socket, packet)
+            self._send_message(self._get_backend_socket(packet["subject_id"]), packet)
         elif packet["packet_type"] == PACKET_TYPE_ERROR:
-            self._handle_forward(packet)
+            self._send_message(self._get_backend_socket(packet["subject_id"]), packet)
         elif packet["packet_type"] == PACKET_TYPE_ALIVE:
             debug_log("Agent alive: ", packet)
             self._handle_alive(self.ws.handler.active_client, packet)
@@ -326,11 +565,14 @@ class MephistoRouter(WebSocketApplication):
                 state.received_agent_responses[request_id] = packet
                 del state.pending_agent_requests[request_id]
         elif packet["packet_type"] == PACKET_TYPE_HEARTBEAT:
+            last_router_seq = (packet.get("data") or {}).get("last_router_seq")
             packet["data"] = {"last_mephisto_ping": js_time(state.last_mephisto_ping)}
             agent_id = packet["subject_id"]
             agent = state.agent_id_to_agent.get(agent_id)
             if agent is not None:
                 agent.is_alive = True
+                if last_router_seq is not None:
+                    agent.acknowledge(last_router_seq)
                 packet["data"]["status"] = agent.status
                 local_client = state.agent_id_to_client.get(agent.agent_id)
                 if local_client != client and local_client is not None:
@@ -346,6 +588,13 @@ class MephistoRouter(WebSocketApplication):
         """Mark a socket dead for a LocalAgentState, give time to reconnect"""
         client = self.ws.handler.active_client
         debug_log("Some client disconnected!", client.mephisto_id)
+        state = self.mephisto_state
+        backend_id = getattr(client, "mephisto_backend_id", None)
+        if backend_id is not None and state.backend_sockets.get(backend_id) is self.ws:
+            # Agents of a backend that doesn't reconnect move along the ring
+            del state.backend_sockets[backend_id]
+            state.backend_ring.remove(backend_id)
+            return
         agent = self.mephisto_state.client_id_to_agent.get(client.mephisto_id)
         if agent is None:
             return  # Agent not being tracked
@@ -357,7 +606,7 @@ class MephistoRouter(WebSocketApplication):
         request_id = request_packet["data"]["request_id"]
 
         self.mephisto_state.pending_agent_requests[request_id] = True
-        self._send_message(self.mephisto_state.mephisto_socket, request_packet)
+        self._send_message(self._get_backend_socket(request_packet["subject_id"]), request_packet)
         start_time = time.time()
         res = None
         while time.time() - start_time < 30 and res is None:
@@ -461,7 +710,7 @@ def submit_task():
         "client_timestamp": data["client_timestamp"],
         "router_incoming_timestamp": router_incoming_timestamp,
     }
-    mephisto_router_app._handle_forward(packet)
+    mephisto_router_app._send_message(mephisto_router_app._get_backend_socket(agent_id), packet)
     return jsonify({"status": "Error log sent!"})
 
 
@@ -476,7 +725,9 @@ def log_error():
         "client_timestamp": data["client_timestamp"],
         "router_incoming_timestamp": router_incoming_timestamp,
     }
-    mephisto_router_app._handle_forward(packet)
+    mephisto_router_app._send_message(
+        mephisto_router_app._get_backend_socket(packet["subject_id"]), packet
+    )
     return jsonify({"status": "Error log sent!"})
 
 
@@ -511,7 +762,7 @@ def get_task_config(res):
     args = request.args
     mephisto_task_version = args.get("mephisto_task_version")
     if mephisto_task_version != CURR_MEPHISTO_TASK_VERSION:
-        _handle_forward(
+        mephisto_router_app._send_to_backends(
             {
                 "packet_type": PACKET_TYPE_ERROR,
                 "subject_id": SYSTEM_CHANNEL_ID,
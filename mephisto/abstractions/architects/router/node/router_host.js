@@ -0,0 +1,160 @@
+/* Copyright (c) Facebook, Inc. and its affiliates.
+ * This source code is licensed under the MIT license found in the
+ * LICENSE file in the root directory of this source tree.
+ */
+"use strict";
+
+// Long-lived process that task runs register their built node routers with,
+// such that back-to-back runs load their router into an already running
+// process rather than starting a new one. Each registered router keeps its
+// own state and listens on the port its run asked for, so the frontend and
+// the Mephisto server talk to it exactly as they would a standalone router.
+// Only uses node builtins, as it runs from the router source directory.
+
+const http = require("http");
+const path = require("path");
+
+const PORT = process.env.PORT || 3099;
+// Exit after this many milliseconds without any registered runs
+const IDLE_SHUTDOWN_TIME = parseInt(process.env.IDLE_SHUTDOWN_TIME || "1800000");
+
+// Mapping of task run id -> { router_dir, router }
+var task_run_id_to_router = {};
+var idle_timeout = null;
+
+function reset_idle_timeout() {
+  clearTimeout(idle_timeout);
+  idle_timeout = null;
+  if (Object.keys(task_run_id_to_router).length == 0) {
+    idle_timeout = setTimeout(function () {
+      console.log("No task runs registered, shutting down router host");
+      process.exit(0);
+    }, IDLE_SHUTDOWN_TIME);
+  }
+}
+
+// Drop a router's modules from the require cache, so a later run
+// reusing the same directory gets fresh state
+function unload_router_modules(router_dir) {
+  for (const module_path of Object.keys(require.cache)) {
+    if (module_path.startsWith(router_dir + path.sep)) {
+      delete require.cache[module_path];
+    }
+  }
+}
+
+function register_run(data, respond) {
+  const { task_run_id, router_dir, port } = data;
+  if (task_run_id in task_run_id_to_router) {
+    respond(409, { error: "Task run " + task_run_id + " is already registered" });
+    return;
+  }
+  // server.js reads its port from the environment as it is loaded
+  process.env.PORT = port;
+  let router = null;
+  try {
+    router = require(path.join(router_dir, "server.js"));
+  } catch (error) {
+    unload_router_modules(router_dir);
+    respond(500, { error: "Could not load router: " + error });
+    return;
+  }
+  task_run_id_to_router[task_run_id] = { router_dir: router_dir, router: router };
+  reset_idle_timeout();
+
+  function on_error(error) {
+    router.server.removeListener("listening", on_listening);
+    unregister_run(task_run_id, function () {});
+    respond(500, { error: "Router could not listen on " + port + ": " + error.message });
+  }
+  function on_listening() {
+    router.server.removeListener("error", on_error);
+    console.log("Registered task run " + task_run_id + " on port " + port);
+    respond(200, { status: "Registered" });
+  }
+  if (router.server.listening) {
+    on_listening();
+  } else {
+    router.server.once("error", on_error);
+    router.server.once("listening", on_listening);
+  }
+}
+
+function unregister_run(task_run_id, callback) {
+  let registered = task_run_id_to_router[task_run_id];
+  if (registered === undefined) {
+    callback(false);
+    return;
+  }
+  delete task_run_id_to_router[task_run_id];
+  registered.router.shutdown_router(function () {
+    unload_router_modules(registered.router_dir);
+    console.log("Unregistered task run " + task_run_id);
+    reset_idle_timeout();
+    callback(true);
+  });
+}
+
+const control_server = http.createServer(function (req, res) {
+  function respond(status_code, body) {
+    res.writeHead(status_code, { "Content-Type": "application/json" });
+    res.end(JSON.stringify(body));
+  }
+
+  if (req.method == "GET" && req.url == "/is_alive") {
+    respond(200, {
+      status: "Alive!",
+      task_run_ids: Object.keys(task_run_id_to_router),
+    });
+    return;
+  }
+  if (req.method != "POST") {
+    respond(404, { error: "Unknown endpoint" });
+    return;
+  }
+
+  let body = "";
+  req.on("data", function (chunk) {
+    body += chunk;
+  });
+  req.on("end", function () {
+    let data = null;
+    try {
+      data = JSON.parse(body || "{}");
+    } catch (error) {
+      respond(400, { error: "Invalid JSON body" });
+      return;
+    }
+    if (req.url == "/register_run") {
+      register_run(data, respond);
+    } else if (req.url == "/unregister_run") {
+      unregister_run(data.task_run_id, function (was_registered) {
+        respond(was_registered ? 200 : 404, { status: "Unregistered" });
+      });
+    } else if (req.url == "/shutdown") {
+      res.on("finish", function () {
+        process.exit(0);
+      });
+      respond(200, { status: "Shutting down" });
+    } else {
+      respond(404, { error: "Unknown endpoint" });
+    }
+  });
+});
+
+// One run's router failing shouldn't take down every other run
+process.on("uncaughtException", function (error) {
+  console.log("Uncaught error in a hosted router");
+  console.log(error);
+});
+
+control_server.on("error", function (error) {
+  // Most likely another router host already owns the port
+  console.log("Router host could not start: " + error.message);
+  process.exit(1);
+});
+
+control_server.listen(PORT, "127.0.0.1", function () {
+  console.log("Router host listening on %d", control_server.address().port);
+  reset_idle_timeout();
+});
@@ -10,6 +10,7 @@ const CURR_MEPHISTO_TASK_VERSION = "2.0.4";
 // TODO add some testing to launch this server and communicate with it
 
 const bodyParser = require("body-parser");
+const crypto = require("crypto");
 const express = require("express");
 const http = require("http");
 const fs = require("fs");
@@ -18,6 +19,16 @@ const multer = require("multer");
 const path = require("path");
 const task_directory_name = "static";
 
+// msgpack support is optional, sockets fall back to JSON without it
+const SUBPROTOCOL_JSON = "mephisto-json";
+const SUBPROTOCOL_MSGPACK = "mephisto-msgpack";
+var msgpack = null;
+try {
+  msgpack = require("@msgpack/msgpack");
+} catch (e) {
+  msgpack = null;
+}
+
 const PORT = process.env.PORT || 3000;
 
 // Generate a random id
@@ -76,6 +87,10 @@ const STATUS_SOFT_REJECTED = "soft_rejected";
 const STATUS_REJECTED = "rejected";
 
 const SYSTEM_SOCKET_ID = "mephisto"; // TODO pull from somewhere
+// Backend id for Mephisto servers that don't identify themselves in their alive
+const DEFAULT_BACKEND_ID = "mephisto";
+// Points each backend gets on the hash ring, more spread agents more evenly
+const BACKEND_VIRTUAL_NODES = 64;
 
 const PACKET_TYPE_ALIVE = "alive";
 const PACKET_TYPE_SUBMIT_ONBOARDING = "submit_onboarding";
@@ -91,31 +106,154 @@ const PACKET_TYPE_RETURN_STATUSES = "return_statuses";
 const PACKET_TYPE_ERROR = "log_error";
 const PACKET_TYPE_HEARTBEAT = "heartbeat";
 
+// Client-bound packets kept per agent for replay after a reconnect
+const REPLAY_BUFFER_SIZE = 256;
+// Packets that are sequenced and replayed, rather than only sent live
+const REPLAYED_PACKET_TYPES = [
+  PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE,
+  PACKET_TYPE_UPDATE_STATUS,
+];
+
 // State for agents tracked by the server
 class LocalAgentState {
   constructor(agent_id) {
     this.status = STATUS_NONE;
     this.agent_id = agent_id;
-    this.unsent_messages = [];
     this.is_alive = false;
     this.last_ping = 0;
+    // Router status sequence number as of this agent's last status change
+    this.status_seq = 0;
+    // Sequenced client-bound packets the agent hasn't acknowledged yet
+    this.replay_buffer = [];
+    this.next_router_seq = 1;
+    // Highest sequence number handed to the agent's current socket
+    this.sent_router_seq = 0;
+    this.dropped_packets = 0;
+  }
+
+  // Number the packet and keep it until acked, dropping the oldest when full
+  buffer_packet(packet) {
+    packet.router_seq = this.next_router_seq;
+    this.next_router_seq += 1;
+    this.replay_buffer.push(packet);
+    if (this.replay_buffer.length > REPLAY_BUFFER_SIZE) {
+      this.replay_buffer.shift();
+      this.dropped_packets += 1;
+      debug_log("Replay buffer full, dropping oldest packet for", this.agent_id);
+    }
   }
 
+  // Drop packets the agent has confirmed receiving
+  acknowledge(router_seq) {
+    while (
+      this.replay_buffer.length > 0 &&
+      this.replay_buffer[0].router_seq <= router_seq
+    ) {
+      this.replay_buffer.shift();
+    }
+  }
+
+  // Buffered packets not yet sent to the agent's current socket
   get_sendable_messages() {
-    let sendable_messages = this.unsent_messages;
-    this.unsent_messages = [];
-    return sendable_messages;
+    return this.replay_buffer.filter(
+      (packet) => packet.router_seq > this.sent_router_seq
+    );
+  }
+}
+
+// Only accept the msgpack subprotocol when we can speak it, as ws
+// otherwise selects whichever subprotocol the client listed first
+function select_subprotocol(protocols, request) {
+  if (msgpack !== null && protocols.indexOf(SUBPROTOCOL_MSGPACK) !== -1) {
+    return SUBPROTOCOL_MSGPACK;
+  } else if (protocols.indexOf(SUBPROTOCOL_JSON) !== -1) {
+    return SUBPROTOCOL_JSON;
+  }
+  return false;
+}
+
+function encode_packet(socket, packet) {
+  if (msgpack !== null && socket.protocol === SUBPROTOCOL_MSGPACK) {
+    return Buffer.from(msgpack.encode(packet));
+  }
+  return JSON.stringify(packet);
+}
+
+function decode_packet(message) {
+  if (typeof message === "string") {
+    return JSON.parse(message);
+  }
+  return msgpack.decode(message);
+}
+
+function hash_key(key) {
+  return crypto.createHash("md5").update(key).digest().readUIntBE(0, 6);
+}
+
+// Consistent hash ring placing agents (and agent requests) onto connected
+// Mephisto backends, such that a backend joining or leaving only moves the
+// keys that hashed near it
+class BackendHashRing {
+  constructor() {
+    this.points = [];
+  }
+
+  has(backend_id) {
+    return this.points.some((point) => point[1] === backend_id);
+  }
+
+  add(backend_id) {
+    if (this.has(backend_id)) {
+      return;
+    }
+    for (let idx = 0; idx < BACKEND_VIRTUAL_NODES; idx++) {
+      this.points.push([hash_key(backend_id + "#" + idx), backend_id]);
+    }
+    this.points.sort((a, b) => a[0] - b[0] || a[1].localeCompare(b[1]));
+  }
+
+  remove(backend_id) {
+    this.points = this.points.filter((point) => point[1] !== backend_id);
+  }
+
+  // Return the backend the given key falls to, or null if there are none
+  get(key) {
+    if (this.points.length == 0) {
+      return null;
+    }
+    let target = hash_key(key);
+    let low = 0;
+    let high = this.points.length;
+    while (low < high) {
+      let mid = (low + high) >> 1;
+      if (this.points[mid][0] < target) {
+        low = mid + 1;
+      } else {
+        high = mid;
+      }
+    }
+    return this.points[low % this.points.length][1];
   }
 }
 
-const wss = new WebSocket.Server({ server });
+const wss = new WebSocket.Server({
+  server,
+  handleProtocols: select_subprotocol,
+});
 
 // Track connectionss
 var agent_id_to_socket = {};
 var socket_id_to_agent = {};
+// Queue of [socket, packet] pairs for Mephisto, where a null socket routes
+// the packet by its subject
 var mephisto_message_queue = [];
 var main_thread_timeout = null;
-var mephisto_socket = null;
+
+// Mephisto servers connected to this router, by their backend id
+var backend_sockets = {};
+var backend_ring = new BackendHashRing();
+// Backend that each agent was last heard about from
+var agent_id_to_backend = {};
 
 // This is a mapping of connection id -> state
 var agent_id_to_agent = {};
@@ -124,12 +262,36 @@ var pending_agent_requests = {};
 
 var last_mephisto_ping = Date.now();
 
+// Incremented on every agent status change, so Mephisto can request deltas
+var status_seq = 0;
+
 function debug_log() {
   if (DEBUG) {
     console.log.apply(null, arguments);
   }
 }
 
+// Return the id of the backend responsible for the given agent (or agent
+// request). Agents stay with the backend Mephisto last sent their packets
+// from, otherwise they're placed on the hash ring.
+function get_backend_id(subject_id) {
+  let backend_id = agent_id_to_backend[subject_id];
+  if (backend_id !== undefined && backend_id in backend_sockets) {
+    return backend_id;
+  }
+  return backend_ring.get(subject_id);
+}
+
+function get_backend_socket(subject_id) {
+  let backend_id = get_backend_id(subject_id);
+  return backend_id === null ? null : backend_sockets[backend_id];
+}
+
+// Queue a packet for Mephisto, to the given socket or routed by its subject
+function queue_for_mephisto(packet, socket = null) {
+  mephisto_message_queue.push([socket, packet]);
+}
+
 function pythonTime() {
   return Date.now() / 1000;
 }
@@ -148,13 +310,14 @@ function _send_message(socket, packet) {
   }
 
   packet["router_outgoing_timestamp"] = pythonTime();
-  // Send the message through, with one retry a half second later
-  socket.send(JSON.stringify(packet), function ack(error) {
+  // Serialize once, and send through with one retry a half second later
+  let message = encode_packet(socket, packet);
+  socket.send(message, function ack(error) {
     if (error === undefined) {
       return;
     }
     setTimeout(function () {
-      socket.send(JSON.stringify(packet), function ack2(error2) {
+      socket.send(message, function ack2(error2) {
         if (error2 === undefined) {
           return;
         } else {
@@ -171,13 +334,26 @@ function find_or_create_agent(agent_id) {
     debug_log("Am creating agent for " + agent_id);
     var agent = new LocalAgentState(agent_id);
     agent_id_to_agent[agent_id] = agent;
+    status_seq += 1;
+    agent.status_seq = status_seq;
   }
   return agent;
 }
 
+// Update an agent's status, marking it as changed if it differs
+function set_agent_status(agent, status) {
+  if (agent.status == status) {
+    return;
+  }
+  status_seq += 1;
+  agent.status_seq = status_seq;
+  agent.status = status;
+}
+
 function clear_agent(agent_id) {
   debug_log("Clearing agent " + agent_id);
   delete agent_id_to_agent[agent_id];
+  delete agent_id_to_backend[agent_id];
   let socket = agent_id_to_socket[agent_id];
   delete agent_id_to_socket[agent_id];
   if (socket !== undefined) {
@@ -189,8 +365,11 @@ function clear_agent(agent_id) {
 // register them correctly here
 function handle_alive(socket, alive_packet) {
   if (alive_packet.subject_id == SYSTEM_SOCKET_ID) {
-    mephisto_socket = socket;
-    console.log("System socket attached:");
+    let backend_id = (alive_packet.data || {}).backend_id || DEFAULT_BACKEND_ID;
+    socket.mephisto_backend_id = backend_id;
+    backend_sockets[backend_id] = socket;
+    backend_ring.add(backend_id);
+    console.log("System socket attached for backend " + backend_id + ":");
     console.log(socket._socket.remoteAddress);
     if (main_thread_timeout === null) {
       debug_log("launching main thread");
@@ -203,6 +382,15 @@ function handle_alive(socket, alive_packet) {
     agent.is_alive = true;
     agent_id_to_socket[agent_id] = socket;
     socket_id_to_agent[socket.id] = agent;
+    let last_router_seq = (alive_packet.data || {}).last_router_seq;
+    if (last_router_seq !== undefined) {
+      // Replay whatever the agent didn't get, even if sent to an old socket.
+      // Older clients don't ack, so only get what was never sent.
+      agent.acknowledge(last_router_seq);
+      agent.sent_router_seq = last_router_seq;
+      // A restarted router continues past what the agent has seen
+      agent.next_router_seq = Math.max(agent.next_router_seq, last_router_seq + 1);
+    }
     send_status_for_agent(agent_id);
   }
 }
@@ -219,53 +407,87 @@ function ensure_live_connection(agent) {
     return; // Not in a live state, nothing to ensure
   }
   if (Date.now() - last_ping > FAILED_PING_TIME) {
-    agent.status = STATUS_DISCONNECT;
+    set_agent_status(agent, STATUS_DISCONNECT);
     send_status_for_agent(agent.agent_id);
   }
 }
 
 // Return the status of all agents mapped by their agent id
-function handle_get_agent_status(status_packet) {
+// If given the last status sequence number Mephisto acknowledged, only
+// agents whose status changed since then are included. With several
+// backends, each only hears about the agents routed to it.
+function handle_get_agent_status(status_packet, socket) {
   last_mephisto_ping = Date.now();
+  let since_seq = status_packet.data.since_seq;
+  if (since_seq !== undefined && since_seq > status_seq) {
+    since_seq = 0; // Router restarted since this was acknowledged, send everything
+  }
+  let only_routed = Object.keys(backend_sockets).length > 1;
   let agent_statuses = {};
   for (let agent_id in agent_id_to_agent) {
     let agent = agent_id_to_agent[agent_id];
     ensure_live_connection(agent);
-    agent_statuses[agent_id] = agent.status;
+    if (only_routed && get_backend_id(agent_id) !== socket.mephisto_backend_id) {
+      continue;
+    }
+    if (since_seq === undefined || agent.status_seq > since_seq) {
+      agent_statuses[agent_id] = agent.status;
+    }
+  }
+  let status_data = agent_statuses;
+  if (since_seq !== undefined) {
+    status_data = { statuses: agent_statuses, status_seq: status_seq };
   }
   let packet = {
     packet_type: PACKET_TYPE_RETURN_STATUSES,
     subject_id: SYSTEM_SOCKET_ID,
-    data: agent_statuses,
+    data: status_data,
     client_timestamp: status_packet.server_timestamp,
     router_incoming_timestamp: status_packet.router_incoming_timestamp,
   };
-  mephisto_message_queue.push(packet);
+  queue_for_mephisto(packet, socket);
 }
 
 function handle_update_local_status(status_packet) {
   let agent_id = status_packet.subject_id;
   let agent = find_or_create_agent(agent_id);
   if (status_packet.data.status != undefined) {
-    agent.status = status_packet.data.status;
+    set_agent_status(agent, status_packet.data.status);
+  }
+}
+
+// Push out an agent's backlog to their current socket
+function send_unsent_messages(agent, socket) {
+  for (const packet of agent.get_sendable_messages()) {
+    _send_message(socket, packet);
+    agent.sent_router_seq = packet.router_seq;
   }
 }
 
 // Handle a message being sent to a frontend agent
 function forward_to_agent(packet) {
   let agent = find_or_create_agent(packet.subject_id);
+  if (REPLAYED_PACKET_TYPES.includes(packet.packet_type)) {
+    agent.buffer_packet(packet);
+  }
   let socket = agent_id_to_socket[agent.agent_id];
-  if (socket) {
-    _send_message(socket, packet);
+  if (!socket || socket.readyState != WebSocket.OPEN) {
+    // Sequenced packets wait in the replay buffer for a reconnect,
+    // anything else (heartbeat replies) is only useful live
+    debug_log("Socket not open, leaving message for replay", packet);
+    return;
+  }
+  if (packet.router_seq !== undefined) {
+    // Send any backlog first, so the agent gets packets in order
+    send_unsent_messages(agent, socket);
   } else {
-    debug_log("Socket not open yet, adding message to agent queue", packet);
-    agent.unsent_messages.push(packet);
+    _send_message(socket, packet);
   }
 }
 
 function _followup_possible_disconnect(agent) {
   if (!agent.is_alive) {
-    agent.status = STATUS_DISCONNECT;
+    set_agent_status(agent, STATUS_DISCONNECT);
     debug_log("Agent disconnected", agent);
   }
 }
@@ -303,6 +525,15 @@ wss.on("connection", function (socket) {
     }
   });
 
+  socket.on("close", function () {
+    // Agents of a backend that doesn't reconnect move along the ring
+    let backend_id = socket.mephisto_backend_id;
+    if (backend_id !== undefined && backend_sockets[backend_id] === socket) {
+      delete backend_sockets[backend_id];
+      backend_ring.remove(backend_id);
+    }
+  });
+
   socket.on("error", (err) => {
     console.log("Caught socket error, probably closed!");
     console.log(err);
@@ -315,23 +546,34 @@ wss.on("connection", function (socket) {
   // handles routing a packet to the desired recipient
   socket.on("message", function (packet) {
     try {
-      packet = JSON.parse(packet);
+      packet = decode_packet(packet);
       packet["router_incoming_timestamp"] = pythonTime();
+      let backend_id = socket.mephisto_backend_id;
+      if (backend_id !== undefined) {
+        // Packets about an agent come from the backend handling it
+        let agent_id = packet["subject_id"];
+        if (packet["packet_type"] == PACKET_TYPE_AGENT_DETAILS) {
+          agent_id = packet["data"]["agent_id"];
+        }
+        if (agent_id !== undefined && agent_id !== null && agent_id != SYSTEM_SOCKET_ID) {
+          agent_id_to_backend[agent_id] = backend_id;
+        }
+      }
       if (packet["packet_type"] == PACKET_TYPE_REQUEST_STATUSES) {
         debug_log("Mephisto requesting status");
-        handle_get_agent_status(packet);
+        handle_get_agent_status(packet, socket);
       } else if (
         packet["packet_type"] == PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE
       ) {
         debug_log("Mephisto-bound action: ", packet);
-        mephisto_message_queue.push(packet);
+        queue_for_mephisto(packet);
       } else if (
         packet["packet_type"] == PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE
       ) {
         debug_log("Client-bound action: ", packet);
         forward_to_agent(packet);
       } else if (packet["packet_type"] == PACKET_TYPE_ERROR) {
-        mephisto_message_queue.push(packet);
+        queue_for_mephisto(packet);
       } else if (packet["packet_type"] == PACKET_TYPE_ALIVE) {
         debug_log("Agent alive: ", packet);
         handle_alive(socket, packet);
@@ -350,12 +592,16 @@ wss.on("connection", function (socket) {
           delete pending_agent_requests[request_id];
         }
       } else if (packet["packet_type"] == PACKET_TYPE_HEARTBEAT) {
+        let last_router_seq = (packet["data"] || {}).last_router_seq;
         packet["data"] = { last_mephisto_ping: last_mephisto_ping };
         let agent_id = packet["subject_id"];
         let agent = agent_id_to_agent[agent_id];
         if (agent !== undefined) {
           agent.is_alive = true;
           agent.last_ping = Date.now();
+          if (last_router_seq !== undefined) {
+            agent.acknowledge(last_router_seq);
+          }
           packet.data.status = agent.status;
           if (
             agent_id_to_socket[agent.agent_id] != socket &&
@@ -393,13 +639,10 @@ function main_thread() {
       if (!agent_state.is_alive) {
         continue;
       }
-      let sendable_messages = agent_state.get_sendable_messages();
-      if (sendable_messages.length > 0) {
-        let socket = agent_id_to_socket[agent_id];
+      let socket = agent_id_to_socket[agent_id];
+      if (socket.readyState == WebSocket.OPEN) {
         // TODO send all these messages in a batch
-        for (const packet of sendable_messages) {
-          _send_message(socket, packet);
-        }
+        send_unsent_messages(agent_state, socket);
       }
     }
 
@@ -408,9 +651,15 @@ function main_thread() {
     while (mephisto_message_queue.length > 0) {
       mephisto_messages.push(mephisto_message_queue.shift());
     }
-    if (mephisto_messages.length > 0) {
-      for (const packet of mephisto_messages) {
-        _send_message(mephisto_socket, packet);
+    for (const [socket, packet] of mephisto_messages) {
+      if (socket !== null) {
+        _send_message(socket, packet);
+      } else if (packet.subject_id == SYSTEM_SOCKET_ID) {
+        for (const backend_id in backend_sockets) {
+          _send_message(backend_sockets[backend_id], packet);
+        }
+      } else {
+        _send_message(get_backend_socket(packet.subject_id), packet);
       }
     }
   } catch (error) {
@@ -442,7 +691,7 @@ app.post("/request_agent", function (req, res) {
   };
 
   pending_agent_requests[request_id] = res;
-  _send_message(mephisto_socket, request_packet);
+  _send_message(get_backend_socket(request_id), request_packet);
   // TODO set a timeout to expire this request rather than leave the worker hanging
 });
 
@@ -468,7 +717,7 @@ app.post("/submit_onboarding", function (req, res) {
   };
 
   pending_agent_requests[request_id] = res;
-  _send_message(mephisto_socket, submit_packet);
+  _send_message(get_backend_socket(agent_id), submit_packet);
   clear_agent(agent_id);
 });
 
@@ -493,7 +742,7 @@ app.post("/submit_task", upload.any(), function (req, res) {
     client_timestamp: client_timestamp,
     router_incoming_timestamp: pythonTime(),
   };
-  _send_message(mephisto_socket, submit_packet);
+  _send_message(get_backend_socket(agent_id), submit_packet);
   res.json({ status: "Submitted!" });
 
   // Cleanup local state for a task that's already submitted
@@ -521,7 +770,7 @@ app.post("/submit_metadata", function (req, res) {
     client_timestamp: client_timestamp,
     router_incoming_timestamp: pythonTime(),
   };
-  _send_message(mephisto_socket, submit_packet);
+  _send_message(get_backend_socket(agent_id), submit_packet);
   res.json({ status: "Submitted metadata" });
 });
 
@@ -538,14 +787,14 @@ app.post("/log_error", function (req, res) {
     client_timestamp: client_timestamp,
     router_incoming_timestamp: pythonTime(),
   };
-  _send_message(mephisto_socket, log_packet);
+  _send_message(get_backend_socket(agent_id), log_packet);
   res.json({ status: "Error log sent!" });
 });
 
 app.get("/task_config.json", function (req, res) {
   const { mephisto_task_version } = req.query;
   if (mephisto_task_version !== CURR_MEPHISTO_TASK_VERSION) {
-    mephisto_message_queue.push({
+    queue_for_mephisto({
       packet_type: PACKET_TYPE_ERROR,
       subject_id: SYSTEM_SOCKET_ID,
       data: {
@@ -591,7 +840,10 @@ app.get("/download_file/:file", function (req, res) {
     req.connection.remoteAddress ||
     req.socket.remoteAddress ||
     req.connection.socket.remoteAddress;
-  if (ip == mephisto_socket._socket.remoteAddress) {
+  let from_mephisto = Object.values(backend_sockets).some(
+    (socket) => socket._socket.remoteAddress == ip
+  );
+  if (from_mephisto) {
     res.sendFile(path.join("/tmp/", req.params.file), function (err) {
       if (err) {
         console.log(err);
@@ -610,6 +862,23 @@ app.get("/download_file/:file", function (req, res) {
   }
 });
 
-app.use(express.static("static"));
+app.use(express.static(path.join(__dirname, task_directory_name)));
 
 // ======================= </Routing> =======================
+
+// Stop serving this task run. Used by router_host.js, which loads several
+// routers into one long-lived process
+function shutdown_router(callback) {
+  clearTimeout(main_thread_timeout);
+  main_thread_timeout = null;
+  for (const client of wss.clients) {
+    client.terminate();
+  }
+  wss.close();
+  server.close(callback);
+  if (server.closeAllConnections) {
+    server.closeAllConnections(); // Don't wait on idle keep-alive connections
+  }
+}
+
+module.exports = { server: server, shutdown_router: shutdown_router };
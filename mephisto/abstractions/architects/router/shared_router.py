@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Helpers for the shared router host (router/node/router_host.js), a long-lived
+node process that local task runs register their built routers with, rather
+than each starting a router process of their own.
+"""
+
+import os
+import subprocess
+import time
+import requests
+
+from mephisto.abstractions.architects.router.build_router import NODE_SERVER_SOURCE_ROOT
+from mephisto.utils.dirs import get_mephisto_tmp_dir
+from mephisto.utils.logger_core import get_logger
+
+logger = get_logger(name=__name__)
+
+ROUTER_HOST_SCRIPT = os.path.join(NODE_SERVER_SOURCE_ROOT, "router_host.js")
+ROUTER_HOST_LOG_FILE = os.path.join(get_mephisto_tmp_dir(), "router_host.log")
+DEFAULT_ROUTER_HOST_PORT = "3099"
+# Seconds to wait for a newly started router host to accept registrations
+ROUTER_HOST_START_TIMEOUT = 10
+# Seconds to wait on any single request to the router host
+ROUTER_HOST_REQUEST_TIMEOUT = 30
+
+
+class SharedRouterException(Exception):
+    pass
+
+
+def _get_router_host_url(host_port: str) -> str:
+    return f"http://127.0.0.1:{host_port}"
+
+
+def router_host_is_alive(host_port: str = DEFAULT_ROUTER_HOST_PORT) -> bool:
+    """Check whether a router host is accepting registrations on the given port"""
+    try:
+        response = requests.get(f"{_get_router_host_url(host_port)}/is_alive", timeout=1)
+    except requests.RequestException:
+        return False
+    return response.status_code == 200
+
+
+def ensure_router_host(host_port: str = DEFAULT_ROUTER_HOST_PORT) -> None:
+    """
+    Start a router host on the given port if one isn't already running. The
+    host is detached from this process, so that later runs can reuse it. It
+    exits by itself once no runs have been registered for a while.
+    """
+    if router_host_is_alive(host_port):
+        return
+    logger.info(f"Starting shared router host on port {host_port}")
+    with open(ROUTER_HOST_LOG_FILE, "a") as log_file:
+        subprocess.Popen(
+            ["node", ROUTER_HOST_SCRIPT],
+            cwd=NODE_SERVER_SOURCE_ROOT,
+            preexec_fn=os.setpgrp,
+            env=dict(os.environ, PORT=f"{host_port}"),
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+        )
+    start_time = time.monotonic()
+    while time.monotonic() - start_time < ROUTER_HOST_START_TIMEOUT:
+        # If another run started a host at the same time, ours exits and theirs answers
+        if router_host_is_alive(host_port):
+            return
+        time.sleep(0.05)
+    raise SharedRouterException(
+        f"Router host did not come up on port {host_port}, see {ROUTER_HOST_LOG_FILE}"
+    )
+
+
+def _post_to_router_host(host_port: str, endpoint: str, data: dict) -> requests.Response:
+    return requests.post(
+        f"{_get_router_host_url(host_port)}/{endpoint}",
+        json=data,
+        timeout=ROUTER_HOST_REQUEST_TIMEOUT,
+    )
+
+
+def register_task_run(
+    task_run_id: str, router_dir: str, port: str, host_port: str = DEFAULT_ROUTER_HOST_PORT
+) -> None:
+    """
+    Load the built router in router_dir into the router host, serving the given
+    task run on the given port. Returns once the router is listening.
+    """
+    ensure_router_host(host_port)
+    response = _post_to_router_host(
+        host_port,
+        "register_run",
+        {"task_run_id": task_run_id, "router_dir": os.path.abspath(router_dir), "port": port},
+    )
+    if response.status_code != 200:
+        raise SharedRouterException(
+            f"Could not register task run {task_run_id} with the router host: "
+            f"{response.json().get('error')}"
+        )
+
+
+def unregister_task_run(task_run_id: str, host_port: str = DEFAULT_ROUTER_HOST_PORT) -> bool:
+    """Stop serving the given task run, returning whether it was registered"""
+    try:
+        response = _post_to_router_host(host_port, "unregister_run", {"task_run_id": task_run_id})
+    except requests.RequestException:
+        return False  # The host is already gone
+    return response.status_code == 200
+
+
+def shutdown_router_host(host_port: str = DEFAULT_ROUTER_HOST_PORT) -> None:
+    """Stop the router host, and every task run still registered with it"""
+    try:
+        _post_to_router_host(host_port, "shutdown", {})
+    except requests.RequestException:
+        pass  # Already gone
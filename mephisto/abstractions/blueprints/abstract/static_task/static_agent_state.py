@@ -67,7 +67,7 @@ class StaticAgentState(AgentState):
         """Save static agent data to disk"""
         data_dir = self.agent.get_data_dir()
         out_filename = os.path.join(data_dir, DATA_FILE)
-        self.agent.db.write_dict(out_filename, self.state)
+        self._write_dict(out_filename, self.state)
         logger.info(f"SAVED_DATA_TO_DISC at {out_filename}")
 
     def update_data(self, live_update: Dict[str, Any]) -> None:
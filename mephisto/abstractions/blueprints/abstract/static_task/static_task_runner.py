@@ -50,23 +50,24 @@ class StaticTaskRunner(TaskRunner):
             agent.state.set_init_state(assignment_data.shared)
             return assignment_data.shared
 
-    def run_onboarding(self, agent: "OnboardingAgent"):
+    async def run_onboarding(self, agent: "OnboardingAgent"):
         """
         Static onboarding flows exactly like a regular task, waiting for
         the submit to come through
         """
-        agent.await_submit(self.assignment_duration_in_seconds)
+        await agent.await_submit_async(self.assignment_duration_in_seconds)
 
     def cleanup_onboarding(self, agent: "OnboardingAgent"):
         """Nothing to clean up in a static onboarding"""
         return
 
-    def run_unit(self, unit: "Unit", agent: "Agent") -> None:
+    async def run_unit(self, unit: "Unit", agent: "Agent") -> None:
         """
         Static runners will get the task data, send it to the user, then
-        wait for the agent to act (the data to be completed)
+        wait for the agent to act (the data to be completed). This only
+        awaits the submission, so it runs on the event loop without a thread.
         """
-        agent.await_submit(self.assignment_duration_in_seconds)
+        await agent.await_submit_async(self.assignment_duration_in_seconds)
 
     def cleanup_unit(self, unit: "Unit") -> None:
         """There is currently no cleanup associated with killing an incomplete task"""
@@ -18,9 +18,12 @@ from typing import (
 )
 
 import types
-import random
+import hashlib
 import math
+import random
+import threading
 import traceback
+from weakref import WeakKeyDictionary
 from mephisto.abstractions.blueprint import BlueprintMixin, AgentState
 from dataclasses import dataclass, field
 from omegaconf import MISSING, DictConfig
@@ -33,6 +36,7 @@ from mephisto.operations.task_launcher import GOLD_UNIT_INDEX
 
 
 if TYPE_CHECKING:
+    from mephisto.abstractions.database import MephistoDB
     from mephisto.data_model.task_run import TaskRun
     from mephisto.data_model.unit import Unit
     from mephisto.data_model.packet import Packet
@@ -79,26 +83,82 @@ class UseGoldUnitArgs:
 
 GoldFactory = Callable[["Worker"], Dict[str, Any]]
 
+# Feistel rounds used to shuffle gold indices, enough to look well mixed
+GOLD_PERMUTATION_ROUNDS = 4
+
 
-def get_gold_factory(golds: List[Dict[str, Any]]) -> GoldFactory:
+def permute_gold_index(position: int, num_golds: int, key: str) -> int:
+    """
+    Return the gold index at the given position of a pseudorandom ordering
+    of range(num_golds) determined by key. Each position is computed on its
+    own (with a small Feistel network and cycle walking), so walking an
+    ordering needs no more state than the current position.
+    """
+    assert 0 <= position < num_golds, f"Position {position} out of range for {num_golds} golds"
+    half_bits = max(1, ((num_golds - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    key_bytes = key.encode()
+    value = position
+    while True:
+        left, right = value >> half_bits, value & mask
+        for round_idx in range(GOLD_PERMUTATION_ROUNDS):
+            digest = hashlib.blake2b(
+                key_bytes + bytes([round_idx]) + right.to_bytes(8, "big"),
+                digest_size=8,
+            ).digest()
+            left, right = right, left ^ (int.from_bytes(digest, "big") & mask)
+        value = (left << half_bits) | right
+        # Walk the cycle until landing back inside the range of golds
+        if value < num_golds:
+            return value
+
+
+def get_gold_factory(
+    golds: List[Dict[str, Any]],
+    seed: Optional[Union[int, str]] = None,
+    cursor_qualification: Optional[str] = None,
+) -> GoldFactory:
     """
     Returns a gold factory that can be used to distribute golds to workers
-    Usage of golds only persists within a single TaskRun, so golds may repeat
-    on future task runs.
+
+    Each worker draws golds without replacement along their own shuffled
+    ordering, reshuffled each time they exhaust all golds. Orderings are
+    derived from the seed and worker id, so only a count of golds drawn is
+    kept per worker. By default these counts live in memory, and each factory
+    gets a random seed so orderings differ between task runs. If a
+    cursor_qualification name is given the counts are stored as that
+    qualification instead, and workers continue where they left off across
+    restarts and task runs, so the default seed is then fixed to that name to
+    keep orderings stable. Pass a seed for reproducible orderings.
     """
-    worker_gold_maps: Dict[str, List[int]] = {}
+    if seed is None:
+        seed = random.getrandbits(64) if cursor_qualification is None else cursor_qualification
+    worker_gold_cursors: Dict[str, int] = {}
     num_golds = len(golds)
     assert num_golds != 0, "Must provide at least one gold to get_gold_factory"
+    cursor_qualification_ready = False
+
+    def get_cursor(worker: "Worker") -> int:
+        nonlocal cursor_qualification_ready
+        if cursor_qualification is None:
+            return worker_gold_cursors.get(worker.db_id, 0)
+        if not cursor_qualification_ready:
+            find_or_create_qualification(worker.db, cursor_qualification)
+            cursor_qualification_ready = True
+        found_qual = worker.get_granted_qualification(cursor_qualification)
+        return 0 if found_qual is None else found_qual.value
+
+    def set_cursor(worker: "Worker", cursor: int) -> None:
+        if cursor_qualification is None:
+            worker_gold_cursors[worker.db_id] = cursor
+        else:
+            worker.grant_qualification(cursor_qualification, value=cursor, skip_crowd=True)
 
     def get_gold_for_worker(worker: "Worker"):
-        if worker.db_id not in worker_gold_maps or len(worker_gold_maps[worker.db_id]) == 0:
-            # create a list of gold indices a worker hasn't done
-            worker_gold_maps[worker.db_id] = [x for x in range(num_golds)]
-        # select a random gold index from what remains
-        rg = worker_gold_maps[worker.db_id]
-        selected_idx = random.randint(0, len(rg) - 1)
-        rg[selected_idx], rg[-1] = rg[-1], rg[selected_idx]
-        gold_idx = rg.pop()
+        cursor = get_cursor(worker)
+        cycle, position = divmod(cursor, num_golds)
+        gold_idx = permute_gold_index(position, num_golds, f"{seed}:{worker.db_id}:{cycle}")
+        set_cursor(worker, cursor + 1)
         return golds[gold_idx]
 
     return get_gold_for_worker
@@ -138,6 +198,113 @@ def worker_qualifies(
     return num_incorrect <= max_incorrect_golds
 
 
+# Seconds that updated gold counters are held in memory before being written back
+GOLD_COUNTER_FLUSH_INTERVAL = 1.0
+
+
+class GoldQualificationCounters:
+    """
+    In-memory completed unit, correct gold, and incorrect gold counts for the
+    workers of a gold qualification base. Each worker's counts are read from
+    their qualifications once, then served and updated from memory, with the
+    increments added to the qualifications table shortly afterwards. As only
+    increments are written, processes sharing a qualification base never undo
+    each other's updates, and pick up each other's counts as they write theirs.
+    """
+
+    def __init__(
+        self,
+        db: "MephistoDB",
+        base_qual_name: str,
+        flush_interval: float = GOLD_COUNTER_FLUSH_INTERVAL,
+    ):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.qual_names = (
+            f"{base_qual_name}-completed-count",
+            f"{base_qual_name}-correct-golds",
+            f"{base_qual_name}-wrong-golds",
+        )
+        self._qual_ids = [find_or_create_qualification(db, name) for name in self.qual_names]
+        self._counts: Dict[str, List[int]] = {}
+        # Increments not yet written back, by worker
+        self._pending: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+
+    def _get_counts(self, worker: "Worker") -> List[int]:
+        counts = self._counts.get(worker.db_id)
+        if counts is None:
+            loaded = [
+                UseGoldUnit.get_current_qual_or_default(worker, qual_name)
+                for qual_name in self.qual_names
+            ]
+            with self._lock:
+                counts = self._counts.setdefault(worker.db_id, loaded)
+        return counts
+
+    def get(self, worker: "Worker") -> Tuple[int, int, int]:
+        """Return the completed, correct, and incorrect counts for the worker"""
+        completed, correct, incorrect = self._get_counts(worker)
+        return completed, correct, incorrect
+
+    def increment(
+        self, worker: "Worker", completed: int = 0, correct: int = 0, incorrect: int = 0
+    ) -> None:
+        """Add to the worker's counts, scheduling the increments to be written back"""
+        counts = self._get_counts(worker)
+        with self._lock:
+            pending = self._pending.setdefault(worker.db_id, [0, 0, 0])
+            for idx, delta in enumerate((completed, correct, incorrect)):
+                counts[idx] += delta
+                pending[idx] += delta
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self) -> None:
+        """Add any pending increments to the qualifications table"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            updates, self._pending = self._pending, {}
+        for worker_id, deltas in updates.items():
+            for idx, (qual_id, delta) in enumerate(zip(self._qual_ids, deltas)):
+                if delta == 0:
+                    continue
+                try:
+                    value = self.db.increment_qualification(qual_id, worker_id, delta)
+                except Exception as e:
+                    logger.warning(f"Could not write back gold counts for {worker_id} due to {e}")
+                    with self._lock:
+                        self._pending.setdefault(worker_id, [0, 0, 0])[idx] += delta
+                    continue
+                with self._lock:
+                    # Take in increments from other processes, keeping any made since
+                    still_pending = self._pending.get(worker_id, [0, 0, 0])[idx]
+                    self._counts[worker_id][idx] = value + still_pending
+
+
+_GOLD_COUNTERS: "WeakKeyDictionary[MephistoDB, Dict[str, GoldQualificationCounters]]" = (
+    WeakKeyDictionary()
+)
+_GOLD_COUNTERS_LOCK = threading.Lock()
+
+
+def get_gold_counters(db: "MephistoDB", base_qual_name: str) -> GoldQualificationCounters:
+    """
+    Return the shared counters for the given database and gold qualification
+    base, so that the blueprint and validation function see the same counts
+    """
+    with _GOLD_COUNTERS_LOCK:
+        db_counters = _GOLD_COUNTERS.setdefault(db, {})
+        if base_qual_name not in db_counters:
+            db_counters[base_qual_name] = GoldQualificationCounters(db, base_qual_name)
+        return db_counters[base_qual_name]
+
+
 @dataclass
 class GoldUnitSharedState:
     get_gold_for_worker: GoldFactory = field(default_factory=lambda: get_gold_factory([{}]))
@@ -198,10 +365,8 @@ class UseGoldUnit(BlueprintMixin):
         self.gold_units_launched = 0
         self.gold_unit_cap = args.blueprint.max_gold_units
 
-        find_or_create_qualification(task_run.db, self.golds_correct_qual_name)
-        find_or_create_qualification(task_run.db, self.golds_failed_qual_name)
         find_or_create_qualification(task_run.db, self.disqualified_qual_name)
-        find_or_create_qualification(task_run.db, self.task_count_qual_name)
+        self.gold_counters = get_gold_counters(task_run.db, self.base_qual_name)
 
     @classmethod
     def assert_mixin_args(cls, args: "DictConfig", shared_state: "SharedTaskState"):
@@ -241,14 +406,7 @@ class UseGoldUnit(BlueprintMixin):
 
     def get_completion_stats_for_worker(self, worker: "Worker") -> Tuple[int, int, int]:
         """Return the correct and incorrect gold counts, as well as the total count for a worker"""
-        completed_units = UseGoldUnit.get_current_qual_or_default(worker, self.task_count_qual_name)
-        correct_golds = UseGoldUnit.get_current_qual_or_default(
-            worker, self.golds_correct_qual_name
-        )
-        incorrect_golds = UseGoldUnit.get_current_qual_or_default(
-            worker, self.golds_failed_qual_name
-        )
-        return completed_units, correct_golds, incorrect_golds
+        return self.gold_counters.get(worker)
 
     def should_produce_gold_for_worker(self, worker: "Worker") -> bool:
         """Workers that can access the task should be evaluated to do a gold"""
@@ -301,24 +459,13 @@ class UseGoldUnit(BlueprintMixin):
         in the SharedTaskState
         """
         base_qual_name = args.blueprint.gold_qualification_base
-        golds_correct_qual_name = f"{base_qual_name}-correct-golds"
-        golds_failed_qual_name = f"{base_qual_name}-wrong-golds"
-        disqualified_qual_name = f"{base_qual_name}-disqualified"
-        task_count_qual_name = f"{base_qual_name}-completed-count"
 
         def _wrapped_validate(unit):
             agent = unit.get_assigned_agent()
             if unit.unit_index != GOLD_UNIT_INDEX:
                 if agent is not None and agent.get_status() == AgentState.STATUS_COMPLETED:
                     worker = agent.get_worker()
-                    completed_units = UseGoldUnit.get_current_qual_or_default(
-                        worker, task_count_qual_name
-                    )
-                    worker.grant_qualification(
-                        task_count_qual_name,
-                        value=completed_units + 1,
-                        skip_crowd=True,
-                    )
+                    get_gold_counters(worker.db, base_qual_name).increment(worker, completed=1)
                 return  # We only run validation on the validatable units
 
             if agent is None:
@@ -329,19 +476,9 @@ class UseGoldUnit(BlueprintMixin):
             worker = agent.get_worker()
 
             if validation_result is True:
-                correct_units = UseGoldUnit.get_current_qual_or_default(
-                    worker, golds_correct_qual_name
-                )
-                worker.grant_qualification(
-                    golds_correct_qual_name, correct_units + 1, skip_crowd=True
-                )
+                get_gold_counters(worker.db, base_qual_name).increment(worker, correct=1)
             elif validation_result is False:
-                incorrect_units = UseGoldUnit.get_current_qual_or_default(
-                    worker, golds_failed_qual_name
-                )
-                worker.grant_qualification(
-                    golds_failed_qual_name, incorrect_units + 1, skip_crowd=True
-                )
+                get_gold_counters(worker.db, base_qual_name).increment(worker, incorrect=1)
 
         return _wrapped_validate
 
@@ -64,6 +64,10 @@ class MockBlueprintArgs(BlueprintArgs, OnboardingRequiredArgs, ScreenTaskRequire
         default=True,
         metadata={"help": "Whether to run this mock task as a concurrent task or not"},
     )
+    num_live_updates: int = field(
+        default=1,
+        metadata={"help": "How many live updates to read from and echo back to each agent"},
+    )
 
 
 # Mock tasks right now inherit all mixins, this way we can test them.
@@ -29,6 +29,7 @@ class MockTaskRunner(TaskRunner):
         self.timeout = args.blueprint.timeout_time
         self.tracked_tasks: Dict[str, Union["Assignment", "Unit"]] = {}
         self.is_concurrent = args.blueprint.get("is_concurrent", True)
+        self.num_live_updates = args.blueprint.get("num_live_updates", 1)
 
     @staticmethod
     def get_mock_assignment_data() -> InitializationData:
@@ -65,9 +66,10 @@ class MockTaskRunner(TaskRunner):
         assigned_agent = unit.get_assigned_agent()
         assert assigned_agent is not None, "No agent was assigned"
         assert assigned_agent.db_id == agent.db_id, "Task was not given to assigned agent"
-        packet = agent.get_live_update(timeout=self.timeout)
-        if packet is not None:
-            agent.observe(packet)
+        for _ in range(self.num_live_updates):
+            packet = agent.get_live_update(timeout=self.timeout)
+            if packet is not None:
+                agent.observe(packet)
         agent.await_submit(self.args.task.submission_timeout)
         del self.tracked_tasks[unit.db_id]
 
@@ -86,10 +88,11 @@ class MockTaskRunner(TaskRunner):
             agent = agent_dict.get(assigned_agent.db_id)
             assert agent is not None, "Task was not launched with assigned agents"
             agents.append(agent)
-        for agent in agents:
-            packet = agent.get_live_update(timeout=self.timeout)
-            if packet is not None:
-                agent.observe(packet)
+        for _ in range(self.num_live_updates):
+            for agent in agents:
+                packet = agent.get_live_update(timeout=self.timeout)
+                if packet is not None:
+                    agent.observe(packet)
         for agent in agents:
             agent.await_submit(self.args.task.submission_timeout)
         del self.tracked_tasks[assignment.db_id]
@@ -118,7 +118,7 @@ class ParlAIChatAgentState(AgentState):
     def _save_data(self) -> None:
         """Save all messages from this agent to"""
         agent_file = self._get_expected_data_file()
-        self.agent.db.write_dict(agent_file, self.get_data())
+        self._write_dict(agent_file, self.get_data())
 
     def update_data(self, live_update: Dict[str, Any]) -> None:
         """
@@ -5,8 +5,7 @@
 # LICENSE file in the root directory of this source tree.
 
 from mephisto.abstractions.blueprint import TaskRunner, SharedTaskState
-from mephisto.data_model.agent import Agent, OnboardingAgent
-import time
+from mephisto.data_model.agent import Agent, OnboardingAgent, select_live_updates
 
 try:
     from parlai.core.agents import Agent as ParlAIAgent  # type: ignore
@@ -27,7 +26,7 @@ import sys
 from mephisto.abstractions.blueprint import AgentState
 from uuid import uuid4
 
-from typing import ClassVar, List, Type, Any, Dict, Union, cast, TYPE_CHECKING
+from typing import ClassVar, List, Type, Any, Dict, Optional, Union, cast, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from mephisto.abstractions.blueprints.parlai_chat.parlai_chat_blueprint import (
@@ -83,9 +82,7 @@ class MephistoAgentWrapper(ParlAIAgent):
         gotten_act = self.mephisto_agent.get_live_update()
         if gotten_act is None:
             # No act received, see that one is requested:
-            if not self.__act_requested:
-                self.mephisto_agent.observe({"task_data": {"live_update_requested": True}})
-                self.__act_requested = True
+            self.request_act()
             if timeout is not None:
                 gotten_act = self.mephisto_agent.get_live_update(timeout=timeout)
         if gotten_act is None:
@@ -94,6 +91,12 @@ class MephistoAgentWrapper(ParlAIAgent):
         gotten_act["id"] = self.__agent_id
         return Message(gotten_act)
 
+    def request_act(self) -> None:
+        """Let the frontend know we're waiting on an act, if not already told"""
+        if not self.__act_requested:
+            self.mephisto_agent.observe({"task_data": {"live_update_requested": True}})
+            self.__act_requested = True
+
     def observe(self, act):
         """We can simply add a message id if not already provided to these"""
         if act.get("update_id") is None:
@@ -101,6 +104,23 @@ class MephistoAgentWrapper(ParlAIAgent):
         self.mephisto_agent.observe(dict(act))
 
 
+def select_acting_agents(
+    agents: List[MephistoAgentWrapper], timeout: Optional[float] = None
+) -> List[MephistoAgentWrapper]:
+    """
+    Request an act from each of the given agents, then block until at least
+    one has acted, or until the timeout passes. Returns the agents whose
+    act(timeout) is now ready, so multi-agent worlds can respond to whoever
+    speaks first rather than waiting on each agent in turn. An agent that
+    disconnected is also returned, and raises from its act.
+    """
+    for agent in agents:
+        if agent.mephisto_agent.pending_actions.empty():
+            agent.request_act()
+    ready = select_live_updates([agent.mephisto_agent for agent in agents], timeout)
+    return [agent for agent in agents if agent.mephisto_agent in ready]
+
+
 class ParlAIChatTaskRunner(TaskRunner):
     """
     Task runner for a parlai chat task
@@ -191,8 +211,7 @@ class ParlAIChatTaskRunner(TaskRunner):
         )
 
         # Mark the agent as done, then wait for the incoming submit action
-        while not agent.await_submit(timeout=None):
-            time.sleep(0.3)
+        agent.did_submit.wait()
 
     def cleanup_onboarding(self, agent: "OnboardingAgent") -> None:
         """Shutdown the world"""
@@ -226,8 +245,7 @@ class ParlAIChatTaskRunner(TaskRunner):
             world.parley()
 
         # Ensure agents can submit after completion
-        for idx in range(len(parlai_agents)):
-            agents[idx].observe({"task_data": {"task_done": True}})
+        Agent.observe_all(agents, {"task_data": {"task_done": True}})
 
         # TODO(WISH) it would be nice to have individual agents be able to submit their
         # final things without needing to wait for their partner, such
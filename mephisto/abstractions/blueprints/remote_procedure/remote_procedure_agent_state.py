@@ -53,7 +53,6 @@ class RemoteProcedureAgentState(AgentState):
     def _get_expected_data_file(self) -> str:
         """Return the place we would expect to find data for this agent state"""
         agent_dir = self.agent.get_data_dir()
-        os.makedirs(agent_dir, exist_ok=True)
         return os.path.join(agent_dir, "state.json")
 
     def _load_data(self) -> None:
@@ -90,7 +89,7 @@ class RemoteProcedureAgentState(AgentState):
     def _save_data(self) -> None:
         """Save all messages from this agent to"""
         agent_file = self._get_expected_data_file()
-        self.agent.db.write_dict(agent_file, self.get_data())
+        self._write_dict(agent_file, self.get_data())
 
     def update_data(self, live_update: Dict[str, Any]) -> None:
         """
@@ -9,6 +9,7 @@ from mephisto.abstractions.blueprints.remote_procedure.remote_procedure_agent_st
     RemoteProcedureAgentState,
 )
 from mephisto.data_model.agent import Agent, OnboardingAgent
+from mephisto.operations.datatypes import wait_for_any
 import time
 import json
 
@@ -27,7 +28,8 @@ if TYPE_CHECKING:
     )
 
 
-THREAD_SHORT_SLEEP = 0.3
+# Longest to wait for a request before rechecking if the agent is still running
+REQUEST_WAIT_TIMEOUT = 1.0
 
 
 class RemoteProcedureTaskRunner(TaskRunner):
@@ -105,8 +107,8 @@ class RemoteProcedureTaskRunner(TaskRunner):
                 }
             )
 
-        # sleep to avoid tight loop
-        time.sleep(THREAD_SHORT_SLEEP)
+        # Wait for the next request or the submission, rather than polling
+        wait_for_any([agent.has_live_update, agent.did_submit], timeout=REQUEST_WAIT_TIMEOUT)
 
     def run_onboarding(self, agent: "OnboardingAgent") -> None:
         """
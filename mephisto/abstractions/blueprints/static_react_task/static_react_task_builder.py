@@ -10,6 +10,8 @@ from distutils.dir_util import copy_tree
 import os
 import shutil
 
+from typing import List
+
 
 class StaticReactTaskBuilder(TaskBuilder):
     """
@@ -43,3 +45,11 @@ class StaticReactTaskBuilder(TaskBuilder):
         # Write a built file confirmation
         with open(os.path.join(build_dir, self.BUILT_FILE), "w+") as built_file:
             built_file.write(self.BUILT_MESSAGE)
+
+    def get_build_inputs(self) -> List[str]:
+        """The task bundle and any extra source dir are all that's copied"""
+        build_inputs = [os.path.expanduser(self.args.blueprint.task_source)]
+        extra_dir_path = self.args.blueprint.get("extra_source_dir", None)
+        if extra_dir_path is not None:
+            build_inputs.append(os.path.expanduser(extra_dir_path))
+        return build_inputs
@@ -5,8 +5,10 @@
 # LICENSE file in the root directory of this source tree.
 
 
+import calendar
 import os
 import sqlite3
+import time
 import warnings
 from prometheus_client import Histogram  # type: ignore
 
@@ -16,7 +18,7 @@ from mephisto.operations.registry import (
     get_crowd_provider_from_type,
     get_valid_provider_types,
 )
-from typing import Mapping, Optional, Any, List, Dict
+from typing import Mapping, Optional, Any, List, Dict, Sequence
 import enum
 from mephisto.data_model.agent import Agent, OnboardingAgent
 from mephisto.data_model.unit import Unit
@@ -65,6 +67,7 @@ FIND_ASSIGNMENTS_LATENCY = DATABASE_LATENCY.labels(method="find_assignments")
 NEW_UNIT_LATENCY = DATABASE_LATENCY.labels(method="new_unit")
 GET_UNIT_LATENCY = DATABASE_LATENCY.labels(method="get_unit")
 FIND_UNITS_LATENCY = DATABASE_LATENCY.labels(method="find_units")
+FIND_UNIT_FIELDS_LATENCY = DATABASE_LATENCY.labels(method="find_unit_fields")
 UPDATE_UNIT_LATENCY = DATABASE_LATENCY.labels(method="update_unit")
 NEW_REQUESTER_LATENCY = DATABASE_LATENCY.labels(method="new_requester")
 GET_REQUESTER_LATENCY = DATABASE_LATENCY.labels(method="get_requester")
@@ -580,6 +583,82 @@ class MephistoDB(ABC):
             status=status,
         )
 
+    def _find_unit_fields(
+        self,
+        fields: Sequence[str],
+        task_id: Optional[str] = None,
+        task_run_id: Optional[str] = None,
+        requester_id: Optional[str] = None,
+        assignment_id: Optional[str] = None,
+        unit_index: Optional[int] = None,
+        provider_type: Optional[str] = None,
+        task_type: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        worker_id: Optional[str] = None,
+        sandbox: Optional[bool] = None,
+        status: Optional[str] = None,
+    ) -> List[Mapping[str, Any]]:
+        """
+        find_unit_fields implementation. This default projects the fields out of
+        the Units found by _find_units, so databases that can select only the
+        given columns should override it.
+        """
+        units = self._find_units(
+            task_id=task_id,
+            task_run_id=task_run_id,
+            requester_id=requester_id,
+            assignment_id=assignment_id,
+            unit_index=unit_index,
+            provider_type=provider_type,
+            task_type=task_type,
+            agent_id=agent_id,
+            worker_id=worker_id,
+            sandbox=sandbox,
+            status=status,
+        )
+        # Columns stored on Units under a different attribute name
+        unit_attributes = {"unit_id": "db_id", "status": "db_status"}
+        return [
+            {field: getattr(unit, unit_attributes.get(field, field)) for field in fields}
+            for unit in units
+        ]
+
+    @FIND_UNIT_FIELDS_LATENCY.time()
+    def find_unit_fields(
+        self,
+        fields: Sequence[str],
+        task_id: Optional[str] = None,
+        task_run_id: Optional[str] = None,
+        requester_id: Optional[str] = None,
+        assignment_id: Optional[str] = None,
+        unit_index: Optional[int] = None,
+        provider_type: Optional[str] = None,
+        task_type: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        worker_id: Optional[str] = None,
+        sandbox: Optional[bool] = None,
+        status: Optional[str] = None,
+    ) -> List[Mapping[str, Any]]:
+        """
+        Find the units matching the above as in find_units, but only return
+        the given fields (such as unit_id or status) of each, without
+        loading full Unit objects
+        """
+        return self._find_unit_fields(
+            fields,
+            task_id=task_id,
+            task_run_id=task_run_id,
+            requester_id=requester_id,
+            assignment_id=assignment_id,
+            unit_index=unit_index,
+            provider_type=provider_type,
+            task_type=task_type,
+            agent_id=agent_id,
+            worker_id=worker_id,
+            sandbox=sandbox,
+            status=status,
+        )
+
     @abstractmethod
     def _clear_unit_agent_assignment(self, unit_id: str) -> None:
         """clear_unit_agent_assignment implementation"""
@@ -1014,6 +1093,28 @@ class MephistoDB(ABC):
             qualification_id=qualification_id, worker_id=worker_id, value=value
         )
 
+    def _increment_qualification(self, qualification_id: str, worker_id: str, delta: int) -> int:
+        """
+        increment_qualification implementation. This default reads then writes the
+        value, so databases shared between processes should override it to do so
+        atomically.
+        """
+        try:
+            value = self.get_granted_qualification(qualification_id, worker_id)["value"]
+        except EntryDoesNotExistException:
+            value = 0
+        self.grant_qualification(qualification_id, worker_id, value=value + delta)
+        return value + delta
+
+    def increment_qualification(self, qualification_id: str, worker_id: str, delta: int) -> int:
+        """
+        Add delta to the value of the given worker's qualification, granting it
+        with a value of delta if they don't have it, and return the new value
+        """
+        return self._increment_qualification(
+            qualification_id=qualification_id, worker_id=worker_id, delta=delta
+        )
+
     @abstractmethod
     def _get_granted_qualification(
         self, qualification_id: str, worker_id: str
@@ -1071,3 +1172,33 @@ class MephistoDB(ABC):
     def key_exists(self, path_key: str) -> bool:
         """See if the given path refers to a known file"""
         raise NotImplementedError()
+
+    # Archiving of completed runs
+
+    def archive_task_run(self, task_run_id: str) -> None:
+        """
+        Move the rows of the given completed run out of the tables queried by live
+        runs, while keeping them readable through this database
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} doesn't support archiving runs")
+
+    def is_task_run_archived(self, task_run_id: str) -> bool:
+        return False
+
+    def archive_completed_task_runs(self, min_age_days: float = 0) -> List[str]:
+        """
+        Archive every completed run started at least min_age_days ago that isn't
+        archived yet, returning the ids of the runs archived
+        """
+        cutoff = time.time() - min_age_days * 24 * 60 * 60
+        archived = []
+        for task_run in self.find_task_runs(is_completed=True):
+            if self.is_task_run_archived(task_run.db_id):
+                continue
+            # Creation dates are stored as UTC timestamps by the database
+            start_time = calendar.timegm(time.strptime(task_run.start_time, "%Y-%m-%d %H:%M:%S"))
+            if start_time > cutoff:
+                continue
+            self.archive_task_run(task_run.db_id)
+            archived.append(task_run.db_id)
+        return archived
@@ -10,7 +10,23 @@ from mephisto.abstractions.database import (
     EntryAlreadyExistsException,
     EntryDoesNotExistException,
 )
-from typing import Mapping, Optional, Any, List, Dict, Tuple, Union
+from mephisto.abstractions.databases.migrations import (
+    Migration,
+    run_migrations,
+    split_statements,
+)
+from typing import (
+    Mapping,
+    Optional,
+    Any,
+    List,
+    Dict,
+    Tuple,
+    Union,
+    Sequence,
+    Callable,
+    Iterator,
+)
 from mephisto.operations.registry import get_valid_provider_types
 from mephisto.data_model.agent import Agent, AgentState, OnboardingAgent
 from mephisto.data_model.unit import Unit
@@ -25,14 +41,39 @@ from mephisto.data_model.qualification import Qualification, GrantedQualificatio
 
 import sqlite3
 from sqlite3 import Connection
+import functools
+from contextlib import contextmanager
+import time
+from collections import OrderedDict
 import threading
 import os
 import json
 
+from mephisto.abstractions.databases.run_archive import (
+    ARCHIVED_RUNS_REFRESH_INTERVAL,
+    ARCHIVED_TABLES,
+    CREATE_ARCHIVED_ID_RANGES_TABLE,
+    CREATE_ARCHIVED_TASK_RUNS_TABLE,
+    MAX_OPEN_ARCHIVES,
+    RUN_ARCHIVE_FILE,
+    ArchivedRun,
+    RunArchive,
+    filter_archived_runs,
+    get_archive_indexes,
+)
+from mephisto.abstractions.databases.packed_run_store import (
+    PackedRunStore,
+    pack_run_dir,
+    unpack_run_dir,
+)
+from mephisto.utils.dirs import get_data_dir
 from mephisto.utils.logger_core import get_logger
 
 logger = get_logger(name=__name__)
 
+# Prepared statements kept per connection, one per distinct query text
+STATEMENT_CACHE_SIZE = 512
+
 
 def nonesafe_int(in_string: Optional[str]) -> Optional[int]:
     """Cast input to an int or None"""
@@ -224,14 +265,105 @@ CREATE INDEX IF NOT EXISTS task_run_by_requester_index ON task_runs(requester_id
 CREATE INDEX IF NOT EXISTS task_run_by_task_index ON task_runs(task_id);
 """
 
+# Composite and covering indices for the find queries on live run hot paths
+CREATE_HOT_PATH_INDEXES = """
+CREATE INDEX IF NOT EXISTS unit_by_task_run_by_status_index ON units(task_run_id, status);
+CREATE INDEX IF NOT EXISTS unit_by_task_by_worker_by_status_index
+    ON units(task_id, worker_id, status);
+CREATE INDEX IF NOT EXISTS agent_by_unit_index ON agents(unit_id);
+CREATE INDEX IF NOT EXISTS onboarding_agent_by_worker_by_task_run_index
+    ON onboarding_agents(worker_id, task_run_id);
+CREATE INDEX IF NOT EXISTS onboarding_agent_by_task_run_index
+    ON onboarding_agents(task_run_id);
+CREATE INDEX IF NOT EXISTS granted_qualification_by_qualification_by_value_index
+    ON granted_qualifications(qualification_id, value, worker_id);
+"""
 
-class StringIDRow(sqlite3.Row):
-    def __getitem__(self, key: str) -> Any:
-        val = super().__getitem__(key)
-        if key.endswith("_id") and val is not None:
-            return str(val)
-        else:
-            return val
+# Every change to the schema after the initial tables, in order. Never edit a
+# released migration, add a new one instead so existing databases receive it.
+MIGRATIONS = [
+    Migration(
+        version=1,
+        description="Create the core tables and indices",
+        statements=[
+            CREATE_PROJECTS_TABLE,
+            CREATE_TASKS_TABLE,
+            CREATE_REQUESTERS_TABLE,
+            CREATE_TASK_RUNS_TABLE,
+            CREATE_ASSIGNMENTS_TABLE,
+            CREATE_UNITS_TABLE,
+            CREATE_WORKERS_TABLE,
+            CREATE_AGENTS_TABLE,
+            CREATE_QUALIFICATIONS_TABLE,
+            CREATE_GRANTED_QUALIFICATIONS_TABLE,
+            CREATE_ONBOARDING_AGENTS_TABLE,
+        ]
+        + split_statements(CREATE_CORE_INDEXES),
+    ),
+    Migration(
+        version=2,
+        description="Add composite and covering indices for hot find queries",
+        # Superseded by unit_by_task_by_worker_by_status_index
+        statements=["DROP INDEX IF EXISTS unit_by_task_by_worker_index"],
+        indexes=split_statements(CREATE_HOT_PATH_INDEXES),
+    ),
+    Migration(
+        version=3,
+        description="Track task runs archived into per-run databases",
+        statements=[
+            CREATE_ARCHIVED_TASK_RUNS_TABLE,
+            CREATE_ARCHIVED_ID_RANGES_TABLE,
+            "CREATE INDEX IF NOT EXISTS archived_task_run_by_task_index "
+            "ON archived_task_runs(task_id)",
+        ],
+    ),
+]
+
+
+def make_string_id_row_factory() -> Callable[[sqlite3.Cursor, tuple], Dict[str, Any]]:
+    """
+    Return a row factory producing dicts, with any *_id column converted to a
+    string once as the row is created. Column names and id positions are only
+    worked out once per query, as every row of a query shares its description.
+    """
+    last_description = None
+    names: Tuple[str, ...] = ()
+    id_indices: Tuple[int, ...] = ()
+
+    def string_id_row_factory(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+        nonlocal last_description, names, id_indices
+        description = cursor.description
+        if description is not last_description:
+            names = tuple(column[0] for column in description)
+            id_indices = tuple(idx for idx, name in enumerate(names) if name.endswith("_id"))
+            last_description = description
+        if id_indices:
+            values = list(row)
+            for idx in id_indices:
+                if values[idx] is not None:
+                    values[idx] = str(values[idx])
+            return dict(zip(names, values))
+        return dict(zip(names, row))
+
+    return string_id_row_factory
+
+
+@functools.lru_cache(maxsize=None)
+def build_select_query(
+    table_name: str, columns: Tuple[str, ...], filter_names: Tuple[str, ...]
+) -> str:
+    """
+    Build the SELECT for the given table, columns, and equality filters. Each
+    shape of query always yields the same SQL text, so SQLite can reuse the
+    statement it prepared from its per-connection statement cache.
+    """
+    assert all(
+        column == "*" or column.isidentifier() for column in columns
+    ), f"Invalid columns {columns} requested from {table_name}"
+    query = f"SELECT {', '.join(columns)} FROM {table_name}"
+    if len(filter_names) > 0:
+        query += " WHERE " + " AND ".join(f"{name} = ?" for name in filter_names)
+    return query
 
 
 class LocalMephistoDB(MephistoDB):
@@ -245,6 +377,15 @@ class LocalMephistoDB(MephistoDB):
         logger.debug(f"database path: {database_path}")
         self.conn: Dict[int, Connection] = {}
         self.table_access_condition = threading.Condition()
+        # Packed stores of runs whose data files were read, by run directory
+        self._packed_stores: Dict[str, PackedRunStore] = {}
+        self._packed_stores_lock = threading.Lock()
+        # Runs archived out of the live tables, refreshed periodically, and the
+        # archives currently open, most recently used last
+        self._archived_runs: Dict[str, ArchivedRun] = {}
+        self._archived_runs_loaded_at: Optional[float] = None
+        self._open_archives: "OrderedDict[str, RunArchive]" = OrderedDict()
+        self._archive_lock = threading.RLock()
         super().__init__(database_path)
 
     def _get_connection(self) -> Connection:
@@ -254,8 +395,12 @@ class LocalMephistoDB(MephistoDB):
         curr_thread = threading.get_ident()
         if curr_thread not in self.conn or self.conn[curr_thread] is None:
             try:
-                conn = sqlite3.connect(self.db_path, check_same_thread=False)
-                conn.row_factory = StringIDRow
+                conn = sqlite3.connect(
+                    self.db_path,
+                    check_same_thread=False,
+                    cached_statements=STATEMENT_CACHE_SIZE,
+                )
+                conn.row_factory = make_string_id_row_factory()
                 self.conn[curr_thread] = conn
             except sqlite3.Error as e:
                 raise MephistoDBException(e)
@@ -270,25 +415,16 @@ class LocalMephistoDB(MephistoDB):
 
     def init_tables(self) -> None:
         """
-        Run all the table creation SQL queries to ensure the expected tables exist
+        Bring the database up to the latest schema, applying any migrations it
+        hasn't had yet
         """
         with self.table_access_condition:
             conn = self._get_connection()
             conn.execute("PRAGMA foreign_keys = 1")
-            with conn:
-                c = conn.cursor()
-                c.execute(CREATE_PROJECTS_TABLE)
-                c.execute(CREATE_TASKS_TABLE)
-                c.execute(CREATE_REQUESTERS_TABLE)
-                c.execute(CREATE_TASK_RUNS_TABLE)
-                c.execute(CREATE_ASSIGNMENTS_TABLE)
-                c.execute(CREATE_UNITS_TABLE)
-                c.execute(CREATE_WORKERS_TABLE)
-                c.execute(CREATE_AGENTS_TABLE)
-                c.execute(CREATE_QUALIFICATIONS_TABLE)
-                c.execute(CREATE_GRANTED_QUALIFICATIONS_TABLE)
-                c.execute(CREATE_ONBOARDING_AGENTS_TABLE)
-                c.executescript(CREATE_CORE_INDEXES)
+            try:
+                run_migrations(conn, MIGRATIONS)
+            except sqlite3.Error as e:
+                raise MephistoDBException(e)
 
     def __get_one_by_id(self, table_name: str, id_name: str, db_id: str) -> Mapping[str, Any]:
         """
@@ -306,36 +442,76 @@ class LocalMephistoDB(MephistoDB):
                 (int(db_id),),
             )
             results = c.fetchall()
+            if len(results) == 0 and table_name in ARCHIVED_TABLES:
+                results = self.__get_archived_by_id(table_name, id_name, db_id)
             if len(results) != 1:
                 raise EntryDoesNotExistException(f"Table {table_name} has no {id_name} {db_id}")
             return results[0]
 
-    def __create_query_and_tuple(
-        self,
-        arg_list: List[str],
-        arg_vals: List[Optional[Union[str, int, bool]]],
-    ) -> Tuple[str, tuple]:
-        """
-        Given a list of the possible filtering args and valid values,
-        construct the WHERE part of a query with these and
-        a tuple containing the elements
-        """
-        fin_args = []
-        fin_vals = []
-        for arg, val in zip(arg_list, arg_vals):
-            if val is None:
-                continue
-            fin_args.append(arg)
-            fin_vals.append(val)
-        if len(fin_args) == 0:
-            return "", ()
-
-        query_lines = [
-            f"WHERE {arg_name} = ?{idx+1}\n" if idx == 0 else f"AND {arg_name} = ?{idx+1}\n"
-            for idx, arg_name in enumerate(fin_args)
-        ]
+    def __get_archived_by_id(
+        self, table_name: str, id_name: str, db_id: str
+    ) -> List[Mapping[str, Any]]:
+        """Look for the given row in the archives of any runs whose ids cover it"""
+        query = build_select_query(table_name, ("*",), (id_name,))
+        for archived_run in self.__find_archived_runs_covering(table_name, db_id):
+            with self._use_archive(archived_run) as archive:
+                results = archive.select(query, (int(db_id),))
+            if len(results) > 0:
+                return results
+        return []
+
+    def __find_archived_runs_covering(self, table_name: str, db_id: str) -> List[ArchivedRun]:
+        """
+        Return the archived runs whose id ranges cover the given row, checking for
+        newly archived runs if none of those already known do
+        """
+        for force_refresh in (False, True):
+            archived_runs = [
+                archived_run
+                for archived_run in self._get_archived_runs(force_refresh).values()
+                if archived_run.may_contain(table_name, int(db_id))
+            ]
+            if len(archived_runs) > 0:
+                return archived_runs
+        return []
 
-        return "".join(query_lines), tuple(fin_vals)
+    def __find_rows(
+        self,
+        table_name: str,
+        filters: Dict[str, Optional[Union[str, int, bool]]],
+        columns: Sequence[str] = ("*",),
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the given columns of the rows in the table matching every
+        filter that isn't None
+        """
+        filter_names = tuple(name for name, val in filters.items() if val is not None)
+        query = build_select_query(table_name, tuple(columns), filter_names)
+        params = tuple(filters[name] for name in filter_names)
+        with self.table_access_condition:
+            conn = self._get_connection()
+            c = conn.cursor()
+            c.execute(query, params)
+            rows = c.fetchall()
+        if table_name in ARCHIVED_TABLES:
+            archived_runs = filter_archived_runs(self._get_archived_runs(), table_name, filters)
+            for archived_run in archived_runs:
+                with self._use_archive(archived_run) as archive:
+                    rows += archive.select(query, params)
+        return rows
+
+    def __update_archived_row(
+        self,
+        table_name: str,
+        id_name: str,
+        db_id: str,
+        statements: Sequence[Tuple[str, Tuple[Any, ...]]],
+    ) -> None:
+        """Apply an update that changed no live rows to the archive holding the row, if any"""
+        for archived_run in self.__find_archived_runs_covering(table_name, db_id):
+            with self._use_archive(archived_run) as archive:
+                if archive.execute(statements) > 0:
+                    return
 
     def _new_project(self, project_name: str) -> str:
         """
@@ -371,21 +547,13 @@ class LocalMephistoDB(MephistoDB):
         Try to find any project that matches the above. When called with no arguments,
         return all projects.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                ["project_name"], [project_name]
-            )
-            c.execute(
-                """
-                SELECT * from projects
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [Project(self, str(r["project_id"]), row=r, _used_new_call=True) for r in rows]
+        rows = self.__find_rows(
+            "projects",
+            {
+                "project_name": project_name,
+            },
+        )
+        return [Project(self, str(r["project_id"]), row=r, _used_new_call=True) for r in rows]
 
     def _new_task(
         self,
@@ -443,22 +611,14 @@ class LocalMephistoDB(MephistoDB):
         Try to find any task that matches the above. When called with no arguments,
         return all tasks.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                ["task_name", "project_id", "parent_task_id"],
-                [task_name, nonesafe_int(project_id), None],
-            )
-            c.execute(
-                """
-                SELECT * from tasks
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [Task(self, str(r["task_id"]), row=r, _used_new_call=True) for r in rows]
+        rows = self.__find_rows(
+            "tasks",
+            {
+                "task_name": task_name,
+                "project_id": nonesafe_int(project_id),
+            },
+        )
+        return [Task(self, str(r["task_id"]), row=r, _used_new_call=True) for r in rows]
 
     def _update_task(
         self,
@@ -568,22 +728,15 @@ class LocalMephistoDB(MephistoDB):
         Try to find any task_run that matches the above. When called with no arguments,
         return all task_runs.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                ["task_id", "requester_id", "is_completed"],
-                [nonesafe_int(task_id), nonesafe_int(requester_id), is_completed],
-            )
-            c.execute(
-                """
-                SELECT * from task_runs
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [TaskRun(self, str(r["task_run_id"]), row=r, _used_new_call=True) for r in rows]
+        rows = self.__find_rows(
+            "task_runs",
+            {
+                "task_id": nonesafe_int(task_id),
+                "requester_id": nonesafe_int(requester_id),
+                "is_completed": is_completed,
+            },
+        )
+        return [TaskRun(self, str(r["task_run_id"]), row=r, _used_new_call=True) for r in rows]
 
     def _update_task_run(self, task_run_id: str, is_completed: bool):
         """
@@ -663,38 +816,20 @@ class LocalMephistoDB(MephistoDB):
         Try to find any task that matches the above. When called with no arguments,
         return all tasks.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                [
-                    "task_run_id",
-                    "task_id",
-                    "requester_id",
-                    "task_type",
-                    "provider_type",
-                    "sandbox",
-                ],
-                [
-                    nonesafe_int(task_run_id),
-                    nonesafe_int(task_id),
-                    nonesafe_int(requester_id),
-                    task_type,
-                    provider_type,
-                    sandbox,
-                ],
-            )
-            c.execute(
-                """
-                SELECT * from assignments
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [
-                Assignment(self, str(r["assignment_id"]), row=r, _used_new_call=True) for r in rows
-            ]
+        rows = self.__find_rows(
+            "assignments",
+            {
+                "task_run_id": nonesafe_int(task_run_id),
+                "task_id": nonesafe_int(task_id),
+                "requester_id": nonesafe_int(requester_id),
+                "task_type": task_type,
+                "provider_type": provider_type,
+                "sandbox": sandbox,
+            },
+        )
+        return [
+            Assignment(self, str(r["assignment_id"]), row=r, _used_new_call=True) for r in rows
+        ]
 
     def _new_unit(
         self,
@@ -777,46 +912,58 @@ class LocalMephistoDB(MephistoDB):
         Try to find any unit that matches the above. When called with no arguments,
         return all units.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                [
-                    "task_id",
-                    "task_run_id",
-                    "requester_id",
-                    "assignment_id",
-                    "unit_index",
-                    "provider_type",
-                    "task_type",
-                    "agent_id",
-                    "worker_id",
-                    "sandbox",
-                    "status",
-                ],
-                [
-                    nonesafe_int(task_id),
-                    nonesafe_int(task_run_id),
-                    nonesafe_int(requester_id),
-                    nonesafe_int(assignment_id),
-                    unit_index,
-                    provider_type,
-                    task_type,
-                    nonesafe_int(agent_id),
-                    nonesafe_int(worker_id),
-                    sandbox,
-                    status,
-                ],
-            )
-            c.execute(
-                """
-                SELECT * from units
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [Unit(self, str(r["unit_id"]), row=r, _used_new_call=True) for r in rows]
+        rows = self._find_unit_fields(
+            ["*"],
+            task_id=task_id,
+            task_run_id=task_run_id,
+            requester_id=requester_id,
+            assignment_id=assignment_id,
+            unit_index=unit_index,
+            provider_type=provider_type,
+            task_type=task_type,
+            agent_id=agent_id,
+            worker_id=worker_id,
+            sandbox=sandbox,
+            status=status,
+        )
+        return [Unit(self, str(r["unit_id"]), row=r, _used_new_call=True) for r in rows]
+
+    def _find_unit_fields(
+        self,
+        fields: Sequence[str],
+        task_id: Optional[str] = None,
+        task_run_id: Optional[str] = None,
+        requester_id: Optional[str] = None,
+        assignment_id: Optional[str] = None,
+        unit_index: Optional[int] = None,
+        provider_type: Optional[str] = None,
+        task_type: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        worker_id: Optional[str] = None,
+        sandbox: Optional[bool] = None,
+        status: Optional[str] = None,
+    ) -> List[Mapping[str, Any]]:
+        """
+        Return the given fields of any unit that matches the above, selecting
+        only those columns
+        """
+        return self.__find_rows(
+            "units",
+            {
+                "task_id": nonesafe_int(task_id),
+                "task_run_id": nonesafe_int(task_run_id),
+                "requester_id": nonesafe_int(requester_id),
+                "assignment_id": nonesafe_int(assignment_id),
+                "unit_index": unit_index,
+                "provider_type": provider_type,
+                "task_type": task_type,
+                "agent_id": nonesafe_int(agent_id),
+                "worker_id": nonesafe_int(worker_id),
+                "sandbox": sandbox,
+                "status": status,
+            },
+            columns=fields,
+        )
 
     def _clear_unit_agent_assignment(self, unit_id: str) -> None:
         """
@@ -826,14 +973,15 @@ class LocalMephistoDB(MephistoDB):
         with self.table_access_condition, self._get_connection() as conn:
             c = conn.cursor()
             try:
-                c.execute(
-                    """
+                query = """
                     UPDATE units
                     SET agent_id = ?, worker_id = ?, status = ?
                     WHERE unit_id = ?;
-                    """,
-                    (None, None, AssignmentState.LAUNCHED, int(unit_id)),
-                )
+                    """
+                params = (None, None, AssignmentState.LAUNCHED, int(unit_id))
+                c.execute(query, params)
+                if c.rowcount == 0:
+                    self.__update_archived_row("units", "unit_id", unit_id, [(query, params)])
             except sqlite3.IntegrityError as e:
                 if is_key_failure(e):
                     raise EntryDoesNotExistException(
@@ -852,24 +1000,19 @@ class LocalMephistoDB(MephistoDB):
         with self.table_access_condition, self._get_connection() as conn:
             c = conn.cursor()
             try:
+                statements: List[Tuple[str, Tuple[Any, ...]]] = []
                 if agent_id is not None:
-                    c.execute(
-                        """
-                        UPDATE units
-                        SET agent_id = ?
-                        WHERE unit_id = ?;
-                        """,
-                        (int(agent_id), int(unit_id)),
-                    )
+                    query = "UPDATE units SET agent_id = ? WHERE unit_id = ?;"
+                    statements.append((query, (int(agent_id), int(unit_id))))
                 if status is not None:
-                    c.execute(
-                        """
-                        UPDATE units
-                        SET status = ?
-                        WHERE unit_id = ?;
-                        """,
-                        (status, int(unit_id)),
-                    )
+                    query = "UPDATE units SET status = ? WHERE unit_id = ?;"
+                    statements.append((query, (status, int(unit_id))))
+                changed = 0
+                for query, params in statements:
+                    c.execute(query, params)
+                    changed += c.rowcount
+                if changed == 0 and len(statements) > 0:
+                    self.__update_archived_row("units", "unit_id", unit_id, statements)
             except sqlite3.IntegrityError as e:
                 if is_key_failure(e):
                     raise EntryDoesNotExistException(
@@ -916,23 +1059,16 @@ class LocalMephistoDB(MephistoDB):
         Try to find any requester that matches the above. When called with no arguments,
         return all requesters.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                ["requester_name", "provider_type"], [requester_name, provider_type]
-            )
-            c.execute(
-                """
-                SELECT * from requesters
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [
-                Requester(self, str(r["requester_id"]), row=r, _used_new_call=True) for r in rows
-            ]
+        rows = self.__find_rows(
+            "requesters",
+            {
+                "requester_name": requester_name,
+                "provider_type": provider_type,
+            },
+        )
+        return [
+            Requester(self, str(r["requester_id"]), row=r, _used_new_call=True) for r in rows
+        ]
 
     def _new_worker(self, worker_name: str, provider_type: str) -> str:
         """
@@ -976,21 +1112,14 @@ class LocalMephistoDB(MephistoDB):
         Try to find any worker that matches the above. When called with no arguments,
         return all workers.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                ["worker_name", "provider_type"], [worker_name, provider_type]
-            )
-            c.execute(
-                """
-                SELECT * from workers
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [Worker(self, str(r["worker_id"]), row=r, _used_new_call=True) for r in rows]
+        rows = self.__find_rows(
+            "workers",
+            {
+                "worker_name": worker_name,
+                "provider_type": provider_type,
+            },
+        )
+        return [Worker(self, str(r["worker_id"]), row=r, _used_new_call=True) for r in rows]
 
     def _new_agent(
         self,
@@ -1071,14 +1200,15 @@ class LocalMephistoDB(MephistoDB):
 
         with self.table_access_condition, self._get_connection() as conn:
             c = conn.cursor()
-            c.execute(
-                """
+            query = """
                 UPDATE agents
                 SET status = ?
                 WHERE agent_id = ?;
-                """,
-                (status, int(agent_id)),
-            )
+                """
+            params = (status, int(agent_id))
+            c.execute(query, params)
+            if c.rowcount == 0:
+                self.__update_archived_row("agents", "agent_id", agent_id, [(query, params)])
 
     def _find_agents(
         self,
@@ -1095,40 +1225,20 @@ class LocalMephistoDB(MephistoDB):
         Try to find any agent that matches the above. When called with no arguments,
         return all agents.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                [
-                    "status",
-                    "unit_id",
-                    "worker_id",
-                    "task_id",
-                    "task_run_id",
-                    "assignment_id",
-                    "task_type",
-                    "provider_type",
-                ],
-                [
-                    status,
-                    nonesafe_int(unit_id),
-                    nonesafe_int(worker_id),
-                    nonesafe_int(task_id),
-                    nonesafe_int(task_run_id),
-                    nonesafe_int(assignment_id),
-                    task_type,
-                    provider_type,
-                ],
-            )
-            c.execute(
-                """
-                SELECT * from agents
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [Agent(self, str(r["agent_id"]), row=r, _used_new_call=True) for r in rows]
+        rows = self.__find_rows(
+            "agents",
+            {
+                "status": status,
+                "unit_id": nonesafe_int(unit_id),
+                "worker_id": nonesafe_int(worker_id),
+                "task_id": nonesafe_int(task_id),
+                "task_run_id": nonesafe_int(task_run_id),
+                "assignment_id": nonesafe_int(assignment_id),
+                "task_type": task_type,
+                "provider_type": provider_type,
+            },
+        )
+        return [Agent(self, str(r["agent_id"]), row=r, _used_new_call=True) for r in rows]
 
     def _make_qualification(self, qualification_name: str) -> str:
         """
@@ -1155,24 +1265,16 @@ class LocalMephistoDB(MephistoDB):
         """
         Find a qualification. If no name is supplied, returns all qualifications.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                ["qualification_name"], [qualification_name]
-            )
-            c.execute(
-                """
-                SELECT * from qualifications
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [
-                Qualification(self, str(r["qualification_id"]), row=r, _used_new_call=True)
-                for r in rows
-            ]
+        rows = self.__find_rows(
+            "qualifications",
+            {
+                "qualification_name": qualification_name,
+            },
+        )
+        return [
+            Qualification(self, str(r["qualification_id"]), row=r, _used_new_call=True)
+            for r in rows
+        ]
 
     def _get_qualification(self, qualification_id: str) -> Mapping[str, Any]:
         """
@@ -1247,6 +1349,58 @@ class LocalMephistoDB(MephistoDB):
                         raise EntryAlreadyExistsException()
                     raise MephistoDBException(e)
 
+    def _increment_qualification(self, qualification_id: str, worker_id: str, delta: int) -> int:
+        """
+        Add delta to the given granted qualification within a single write
+        transaction, so increments from other processes are never lost
+        """
+        with self.table_access_condition:
+            conn = self._get_connection()
+            c = conn.cursor()
+            c.row_factory = None
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                params = (int(qualification_id), int(worker_id))
+                c.execute(
+                    """
+                    UPDATE granted_qualifications
+                    SET value = value + ?
+                    WHERE (qualification_id = ?)
+                    AND (worker_id = ?);
+                    """,
+                    (delta,) + params,
+                )
+                if c.rowcount == 0:
+                    c.execute(
+                        """
+                        INSERT INTO granted_qualifications(
+                            qualification_id,
+                            worker_id,
+                            value
+                        ) VALUES (?, ?, ?);
+                        """,
+                        params + (delta,),
+                    )
+                c.execute(
+                    """
+                    SELECT value FROM granted_qualifications
+                    WHERE (qualification_id = ?)
+                    AND (worker_id = ?);
+                    """,
+                    params,
+                )
+                value = c.fetchone()[0]
+            except sqlite3.IntegrityError as e:
+                conn.rollback()
+                if is_key_failure(e):
+                    raise EntryDoesNotExistException(e)
+                raise MephistoDBException(e)
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            return value
+
     def _check_granted_qualifications(
         self,
         qualification_id: Optional[str] = None,
@@ -1256,28 +1410,23 @@ class LocalMephistoDB(MephistoDB):
         """
         Find granted qualifications that match the given specifications
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute(
-                """
-                SELECT * from granted_qualifications
-                WHERE (?1 IS NULL OR qualification_id = ?1)
-                AND (?2 IS NULL OR worker_id = ?2)
-                AND (?3 IS NULL OR value = ?3)
-                """,
-                (qualification_id, worker_id, value),
+        rows = self.__find_rows(
+            "granted_qualifications",
+            {
+                "qualification_id": nonesafe_int(qualification_id),
+                "worker_id": nonesafe_int(worker_id),
+                "value": value,
+            },
+        )
+        return [
+            GrantedQualification(
+                self,
+                r["qualification_id"],
+                r["worker_id"],
+                row=r,
             )
-            rows = c.fetchall()
-            return [
-                GrantedQualification(
-                    self,
-                    str(r["qualification_id"]),
-                    str(r["worker_id"]),
-                    row=r,
-                )
-                for r in rows
-            ]
+            for r in rows
+        ]
 
     def _get_granted_qualification(
         self, qualification_id: str, worker_id: str
@@ -1373,14 +1522,20 @@ class LocalMephistoDB(MephistoDB):
         with self.table_access_condition, self._get_connection() as conn:
             c = conn.cursor()
             if status is not None:
-                c.execute(
-                    """
+                query = """
                     UPDATE onboarding_agents
                     SET status = ?
                     WHERE onboarding_agent_id = ?;
-                    """,
-                    (status, int(onboarding_agent_id)),
-                )
+                    """
+                params = (status, int(onboarding_agent_id))
+                c.execute(query, params)
+                if c.rowcount == 0:
+                    self.__update_archived_row(
+                        "onboarding_agents",
+                        "onboarding_agent_id",
+                        onboarding_agent_id,
+                        [(query, params)],
+                    )
 
     def _find_onboarding_agents(
         self,
@@ -1394,37 +1549,20 @@ class LocalMephistoDB(MephistoDB):
         Try to find any onboarding agent that matches the above. When called with no arguments,
         return all onboarding agents.
         """
-        with self.table_access_condition:
-            conn = self._get_connection()
-            c = conn.cursor()
-            additional_query, arg_tuple = self.__create_query_and_tuple(
-                [
-                    "status",
-                    "worker_id",
-                    "task_id",
-                    "task_run_id",
-                    "task_type",
-                ],
-                [
-                    status,
-                    nonesafe_int(worker_id),
-                    nonesafe_int(task_id),
-                    nonesafe_int(task_run_id),
-                    task_type,
-                ],
-            )
-            c.execute(
-                """
-                SELECT * from onboarding_agents
-                """
-                + additional_query,
-                arg_tuple,
-            )
-            rows = c.fetchall()
-            return [
-                OnboardingAgent(self, str(r["onboarding_agent_id"]), row=r, _used_new_call=True)
-                for r in rows
-            ]
+        rows = self.__find_rows(
+            "onboarding_agents",
+            {
+                "status": status,
+                "worker_id": nonesafe_int(worker_id),
+                "task_id": nonesafe_int(task_id),
+                "task_run_id": nonesafe_int(task_run_id),
+                "task_type": task_type,
+            },
+        )
+        return [
+            OnboardingAgent(self, str(r["onboarding_agent_id"]), row=r, _used_new_call=True)
+            for r in rows
+        ]
 
     # File/blob manipulation methods
 
@@ -1434,33 +1572,272 @@ class LocalMephistoDB(MephistoDB):
             self.db_root
         ), f"Accessing invalid key {path_key} for root {self.db_root}"
 
-    def write_dict(self, path_key: str, target_dict: Dict[str, Any]):
-        """Write an object to the given key"""
+    def _get_packed_store(self, path_key: str) -> Optional[PackedRunStore]:
+        """Return the packed store of the run the given key is in, if it's been packed"""
+        runs_dir = os.path.join(get_data_dir(self.db_root), "runs")
+        rel_parts = os.path.relpath(path_key, runs_dir).split(os.sep)
+        if len(rel_parts) < 3 or rel_parts[0] == os.pardir:
+            return None  # Not a file within a run directory
+        run_dir = os.path.join(runs_dir, rel_parts[0], rel_parts[1])
+        with self._packed_stores_lock:
+            store = self._packed_stores.get(run_dir)
+            if store is None and PackedRunStore.exists(run_dir):
+                store = PackedRunStore(run_dir)
+                self._packed_stores[run_dir] = store
+        return store
+
+    def _write_file(self, path_key: str, data_string: str) -> None:
+        """
+        Write the given string to the given key through a temporary file, so
+        that readers never find a partially written file
+        """
         self._assert_path_in_domain(path_key)
+        if not os.path.isdir(os.path.dirname(path_key)):
+            store = self._get_packed_store(path_key)
+            if store is not None:
+                store.write(path_key, data_string.encode())
+                return
         os.makedirs(os.path.dirname(path_key), exist_ok=True)
-        with open(path_key, "w+") as data_file:
-            json.dump(target_dict, data_file)
+        tmp_path = f"{path_key}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as data_file:
+                data_file.write(data_string)
+            os.replace(tmp_path, path_key)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _read_file(self, path_key: str) -> str:
+        """Read the given key from disk, or from its run's packed store"""
+        self._assert_path_in_domain(path_key)
+        try:
+            with open(path_key, "r") as data_file:
+                return data_file.read()
+        except FileNotFoundError:
+            store = self._get_packed_store(path_key)
+            data = None if store is None else store.read(path_key)
+            if data is None:
+                raise
+            return data.decode()
+
+    def write_dict(self, path_key: str, target_dict: Dict[str, Any]):
+        """Write an object to the given key"""
+        self._write_file(path_key, json.dumps(target_dict))
 
     def read_dict(self, path_key: str) -> Dict[str, Any]:
         """Return the dict loaded from the given path key"""
-        self._assert_path_in_domain(path_key)
-        with open(path_key, "r") as data_file:
-            return json.load(data_file)
+        return json.loads(self._read_file(path_key))
 
     def write_text(self, path_key: str, data_string: str):
         """Write the given text to the given key"""
-        self._assert_path_in_domain(path_key)
-        os.makedirs(os.path.dirname(path_key), exist_ok=True)
-        with open(path_key, "w+") as data_file:
-            data_file.write(data_string)
+        self._write_file(path_key, data_string)
 
     def read_text(self, path_key: str) -> str:
         """Get text data stored at the given key"""
-        self._assert_path_in_domain(path_key)
-        with open(path_key, "r") as data_file:
-            return data_file.read()
+        return self._read_file(path_key)
 
     def key_exists(self, path_key: str) -> bool:
         """See if the given path refers to a known file"""
         self._assert_path_in_domain(path_key)
-        return os.path.exists(path_key)
+        if os.path.exists(path_key):
+            return True
+        store = self._get_packed_store(path_key)
+        return store is not None and store.contains(path_key)
+
+    def _close_packed_store(self, run_dir: str) -> None:
+        with self._packed_stores_lock:
+            store = self._packed_stores.pop(run_dir, None)
+        if store is not None:
+            store.close()
+
+    def pack_task_run(self, task_run_id: str) -> int:
+        """
+        Move the data files of the given run into a single packed store in its run
+        directory, which read_dict, read_text and key_exists continue to read from.
+        Returns the number of files packed.
+        """
+        run_dir = TaskRun.get(self, task_run_id).get_run_dir()
+        self._close_packed_store(run_dir)
+        return pack_run_dir(run_dir)
+
+    def unpack_task_run(self, task_run_id: str) -> int:
+        """Write the packed data files of the given run back out to their directories"""
+        run_dir = TaskRun.get(self, task_run_id).get_run_dir()
+        self._close_packed_store(run_dir)
+        return unpack_run_dir(run_dir)
+
+    def _get_archived_runs(self, force_refresh: bool = False) -> Dict[str, ArchivedRun]:
+        """
+        Return the runs archived out of the live tables, rereading them if asked
+        to or if they haven't been read recently, as other processes may archive runs
+        """
+        loaded_at = self._archived_runs_loaded_at
+        if (
+            not force_refresh
+            and loaded_at is not None
+            and time.monotonic() - loaded_at < ARCHIVED_RUNS_REFRESH_INTERVAL
+        ):
+            return self._archived_runs
+        # Always take the table lock before the archive lock, as lookups reach
+        # into archives while holding the former
+        with self.table_access_condition, self._archive_lock:
+            c = self._get_connection().cursor()
+            c.row_factory = None
+            c.execute("SELECT task_run_id, task_id, archive_path FROM archived_task_runs")
+            archived_runs = {
+                str(task_run_id): ArchivedRun(
+                    str(task_run_id), str(task_id), os.path.join(self.db_root, archive_path)
+                )
+                for task_run_id, task_id, archive_path in c.fetchall()
+            }
+            c.execute("SELECT task_run_id, table_name, min_id, max_id FROM archived_id_ranges")
+            for task_run_id, table_name, min_id, max_id in c.fetchall():
+                archived_runs[str(task_run_id)].id_ranges[table_name] = (min_id, max_id)
+            for task_run_id in list(self._open_archives.keys()):
+                if task_run_id not in archived_runs:
+                    self._open_archives.pop(task_run_id).close()
+            self._archived_runs = archived_runs
+            self._archived_runs_loaded_at = time.monotonic()
+            return archived_runs
+
+    @contextmanager
+    def _use_archive(self, archived_run: ArchivedRun) -> Iterator[RunArchive]:
+        """
+        Hold a connection to the given run's archive, opening it if need be. Archives
+        evicted while held are only closed once released.
+        """
+        with self._archive_lock:
+            archive = self._open_archives.pop(archived_run.task_run_id, None)
+            if archive is None:
+                archive = RunArchive(archived_run.archive_path, make_string_id_row_factory())
+            archive.acquire()
+            self._open_archives[archived_run.task_run_id] = archive
+            while len(self._open_archives) > MAX_OPEN_ARCHIVES:
+                _, oldest = self._open_archives.popitem(last=False)
+                oldest.close()
+        try:
+            yield archive
+        finally:
+            archive.release()
+
+    def _close_archive(self, task_run_id: str) -> None:
+        with self._archive_lock:
+            archive = self._open_archives.pop(task_run_id, None)
+        if archive is not None:
+            archive.close()
+
+    def is_task_run_archived(self, task_run_id: str) -> bool:
+        return str(task_run_id) in self._get_archived_runs(force_refresh=True)
+
+    def archive_task_run(self, task_run_id: str) -> None:
+        """
+        Move the assignments, units and agents of the given completed run out of the
+        live tables and into an archive database in its run directory. Lookups and
+        updates of those rows continue to work, reaching into the archive.
+        """
+        task_run = TaskRun.get(self, task_run_id)
+        if not task_run.get_is_completed():
+            raise MephistoDBException(f"Task run {task_run_id} isn't completed, can't archive it")
+        if self.is_task_run_archived(task_run_id):
+            return
+        archive_path = os.path.join(task_run.get_run_dir(), RUN_ARCHIVE_FILE)
+        if os.path.exists(archive_path):
+            os.unlink(archive_path)  # Left behind by an archive that didn't complete
+        with self.table_access_condition:
+            conn = self._get_connection()
+            conn.execute("ATTACH DATABASE ? AS run_archive", (archive_path,))
+            try:
+                c = conn.cursor()
+                c.row_factory = None
+                c.execute("BEGIN IMMEDIATE")
+                try:
+                    # Units and agents refer to one another, so only check keys on commit
+                    c.execute("PRAGMA defer_foreign_keys = ON")
+                    c.execute(
+                        """INSERT INTO archived_task_runs(task_run_id, task_id, archive_path)
+                        VALUES (?, ?, ?);""",
+                        (
+                            int(task_run_id),
+                            int(task_run.task_id),
+                            os.path.relpath(archive_path, self.db_root),
+                        ),
+                    )
+                    for table_name, id_name in ARCHIVED_TABLES.items():
+                        c.execute(
+                            f"CREATE TABLE run_archive.{table_name} AS "
+                            f"SELECT * FROM main.{table_name} WHERE 0"
+                        )
+                        c.execute(
+                            f"INSERT INTO run_archive.{table_name} "
+                            f"SELECT * FROM main.{table_name} WHERE task_run_id = ?",
+                            (int(task_run_id),),
+                        )
+                        c.execute(
+                            f"CREATE UNIQUE INDEX run_archive.{table_name}_by_id_index "
+                            f"ON {table_name}({id_name})"
+                        )
+                        c.execute(
+                            f"SELECT MIN({id_name}), MAX({id_name}) FROM run_archive.{table_name}"
+                        )
+                        min_id, max_id = c.fetchone()
+                        if min_id is not None:
+                            c.execute(
+                                """INSERT INTO archived_id_ranges(
+                                    task_run_id, table_name, min_id, max_id
+                                ) VALUES (?, ?, ?, ?);""",
+                                (int(task_run_id), table_name, min_id, max_id),
+                            )
+                        c.execute(
+                            f"DELETE FROM main.{table_name} WHERE task_run_id = ?",
+                            (int(task_run_id),),
+                        )
+                    for index in get_archive_indexes("run_archive"):
+                        c.execute(index)
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+            except sqlite3.Error as e:
+                raise MephistoDBException(e)
+            finally:
+                conn.execute("DETACH DATABASE run_archive")
+        self._get_archived_runs(force_refresh=True)
+        logger.info(f"Archived the rows of task run {task_run_id} into {archive_path}")
+
+    def unarchive_task_run(self, task_run_id: str) -> None:
+        """Move the rows of the given archived run back into the live tables"""
+        archived_run = self._get_archived_runs(force_refresh=True).get(str(task_run_id))
+        if archived_run is None:
+            return
+        self._close_archive(archived_run.task_run_id)
+        with self.table_access_condition:
+            conn = self._get_connection()
+            conn.execute("ATTACH DATABASE ? AS run_archive", (archived_run.archive_path,))
+            try:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                try:
+                    c.execute("PRAGMA defer_foreign_keys = ON")
+                    for table_name in ARCHIVED_TABLES:
+                        c.execute(
+                            f"INSERT INTO main.{table_name} "
+                            f"SELECT * FROM run_archive.{table_name}"
+                        )
+                    c.execute(
+                        "DELETE FROM archived_id_ranges WHERE task_run_id = ?",
+                        (int(task_run_id),),
+                    )
+                    c.execute(
+                        "DELETE FROM archived_task_runs WHERE task_run_id = ?",
+                        (int(task_run_id),),
+                    )
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+            except sqlite3.Error as e:
+                raise MephistoDBException(e)
+            finally:
+                conn.execute("DETACH DATABASE run_archive")
+        os.unlink(archived_run.archive_path)
+        self._get_archived_runs(force_refresh=True)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Versioned schema migrations for SQLite-backed MephistoDBs. The schema version
+of a database is kept in its `PRAGMA user_version`, and each migration moves
+it up by one.
+"""
+
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from mephisto.abstractions.database import MephistoDBException
+from mephisto.utils.logger_core import get_logger
+
+logger = get_logger(name=__name__)
+
+# Seconds to leave the database unlocked between index builds, long enough
+# for connections waiting on the lock (which poll with backoff) to get in
+INDEX_BUILD_PAUSE = 0.1
+
+
+@dataclass
+class Migration:
+    """
+    A single schema change. Any index builds run first, each committed on
+    its own so that other connections only wait on one index at a time
+    rather than the whole migration. The statements then run together with
+    the version bump in one transaction, and are rolled back together if any
+    fail. Index builds should use IF NOT EXISTS, as an interrupted migration
+    re-runs them.
+    """
+
+    version: int
+    description: str
+    statements: List[str] = field(default_factory=list)
+    indexes: List[str] = field(default_factory=list)
+
+
+def split_statements(script: str) -> List[str]:
+    """Split a script of semicolon-terminated statements into single statements"""
+    return [statement.strip() for statement in script.split(";") if statement.strip() != ""]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    cursor = conn.cursor()
+    cursor.row_factory = None  # Read a plain tuple, whatever the connection's row type
+    return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _run_in_transaction(conn: sqlite3.Connection, run: Callable[[], None]) -> None:
+    """Run the given function inside an immediate transaction, rolling back on failure"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        run()
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def run_migrations(
+    conn: sqlite3.Connection,
+    migrations: List[Migration],
+    target_version: Optional[int] = None,
+) -> List[int]:
+    """
+    Apply, in order, every migration newer than the database's current schema
+    version and no newer than target_version (default the latest). Safe to
+    call from several processes at once. Returns the versions applied.
+    """
+    assert [m.version for m in migrations] == list(
+        range(1, len(migrations) + 1)
+    ), "Migrations must be numbered consecutively from 1"
+    if target_version is None:
+        target_version = len(migrations)
+
+    current_version = get_schema_version(conn)
+    if current_version > len(migrations):
+        logger.warning(
+            f"Database schema version {current_version} is newer than the latest "
+            f"known version {len(migrations)}, it may have been used by a newer Mephisto"
+        )
+        return []
+
+    applied = []
+    for migration in migrations[current_version:target_version]:
+        start_time = time.monotonic()
+        for idx, index_statement in enumerate(migration.indexes):
+            if idx > 0:
+                time.sleep(INDEX_BUILD_PAUSE)
+            _run_in_transaction(conn, lambda: conn.execute(index_statement))
+
+        def apply_statements():
+            # Another process may have applied this migration while we built indexes
+            if get_schema_version(conn) >= migration.version:
+                return
+            for statement in migration.statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+            applied.append(migration.version)
+
+        try:
+            _run_in_transaction(conn, apply_statements)
+        except sqlite3.Error as e:
+            raise MephistoDBException(
+                f"Failed to apply migration {migration.version} ({migration.description}): {e}"
+            )
+        logger.debug(
+            f"Applied migration {migration.version} ({migration.description}) "
+            f"in {time.monotonic() - start_time:.2f}s"
+        )
+    return applied
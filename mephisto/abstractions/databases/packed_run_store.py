@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Packed storage for the data files of a finished run. A run leaves a directory per
+assignment and agent, each with a few small json files, which is slow to back up
+and to read back for review. Packing moves them into a single SQLite blob store
+in the run's directory, which LocalMephistoDB reads from whenever a key isn't
+found on disk.
+"""
+
+import os
+import sqlite3
+import threading
+
+from typing import List, Optional
+
+from mephisto.utils.logger_core import get_logger
+
+logger = get_logger(name=__name__)
+
+PACKED_RUN_FILE = "run_data.pack.db"
+# Only files read through MephistoDB.read_dict/read_text are packed, leaving
+# anything else (like uploaded files) in place
+PACKED_FILE_SUFFIXES = (".json",)
+# Top-level run directories that never hold agent or assignment data
+UNPACKED_RUN_DIRS = ("build",)
+
+CREATE_BLOBS_TABLE = """
+    CREATE TABLE IF NOT EXISTS blobs (
+        path TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    );
+"""
+
+
+class PackedRunStore:
+    """
+    SQLite blob store holding the packed data files of one run, keyed by
+    their path relative to the run directory
+    """
+
+    def __init__(self, run_dir: str):
+        self.run_dir = run_dir
+        self.pack_path = os.path.join(run_dir, PACKED_RUN_FILE)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def exists(run_dir: str) -> bool:
+        return os.path.exists(os.path.join(run_dir, PACKED_RUN_FILE))
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.pack_path, check_same_thread=False)
+            self._conn.execute(CREATE_BLOBS_TABLE)
+        return self._conn
+
+    def _get_key(self, path_key: str) -> str:
+        return os.path.relpath(path_key, self.run_dir).replace(os.sep, "/")
+
+    def read(self, path_key: str) -> Optional[bytes]:
+        """Return the contents stored for the given path, or None if not packed"""
+        with self._lock:
+            row = (
+                self._get_connection()
+                .execute("SELECT data FROM blobs WHERE path = ?", (self._get_key(path_key),))
+                .fetchone()
+            )
+        return None if row is None else bytes(row[0])
+
+    def contains(self, path_key: str) -> bool:
+        with self._lock:
+            row = (
+                self._get_connection()
+                .execute("SELECT 1 FROM blobs WHERE path = ?", (self._get_key(path_key),))
+                .fetchone()
+            )
+        return row is not None
+
+    def write(self, path_key: str, data: bytes) -> None:
+        with self._lock:
+            conn = self._get_connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO blobs(path, data) VALUES (?, ?)",
+                    (self._get_key(path_key), sqlite3.Binary(data)),
+                )
+
+    def list_paths(self) -> List[str]:
+        """Return the full paths of every packed file"""
+        with self._lock:
+            rows = self._get_connection().execute("SELECT path FROM blobs").fetchall()
+        return [os.path.join(self.run_dir, *row[0].split("/")) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _find_packable_files(run_dir: str) -> List[str]:
+    packable = []
+    for dir_path, dir_names, file_names in os.walk(run_dir):
+        if dir_path == run_dir:
+            dir_names[:] = [name for name in dir_names if name not in UNPACKED_RUN_DIRS]
+        for file_name in file_names:
+            if file_name.endswith(PACKED_FILE_SUFFIXES):
+                packable.append(os.path.join(dir_path, file_name))
+    return packable
+
+
+def pack_run_dir(run_dir: str) -> int:
+    """
+    Move the data files of the given run directory into its packed store, removing
+    the files and any directories left empty. Runs can be packed again to take in
+    files written since. Returns the number of files packed.
+    """
+    paths = _find_packable_files(run_dir)
+    if len(paths) == 0:
+        return 0
+    store = PackedRunStore(run_dir)
+    try:
+        conn = store._get_connection()
+        with conn:
+            for path in paths:
+                with open(path, "rb") as data_file:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO blobs(path, data) VALUES (?, ?)",
+                        (store._get_key(path), sqlite3.Binary(data_file.read())),
+                    )
+    finally:
+        store.close()
+
+    # Only remove files once they're all committed to the store
+    emptied_dirs = set()
+    for path in paths:
+        os.unlink(path)
+        dir_path = os.path.dirname(path)
+        while dir_path != run_dir and dir_path not in emptied_dirs:
+            emptied_dirs.add(dir_path)
+            dir_path = os.path.dirname(dir_path)
+    for dir_path in sorted(emptied_dirs, key=len, reverse=True):
+        if len(os.listdir(dir_path)) == 0:
+            os.rmdir(dir_path)
+    logger.info(f"Packed {len(paths)} files of {run_dir} into {store.pack_path}")
+    return len(paths)
+
+
+def unpack_run_dir(run_dir: str) -> int:
+    """Write the packed files of the given run back out, and remove its packed store"""
+    if not PackedRunStore.exists(run_dir):
+        return 0
+    store = PackedRunStore(run_dir)
+    try:
+        paths = store.list_paths()
+        for path in paths:
+            if os.path.exists(path):
+                continue  # Written since packing, so newer than the packed copy
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as data_file:
+                data_file.write(store.read(path) or b"")
+    finally:
+        store.close()
+    os.unlink(store.pack_path)
+    return len(paths)
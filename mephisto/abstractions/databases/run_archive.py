@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Per-run archive databases for the LocalMephistoDB. Archiving a completed run
+moves its assignments, units and agents out of the live tables in database.db
+and into a SQLite database of their own in the run's directory, which is only
+opened when a query reaches one of the run's rows.
+"""
+
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+RUN_ARCHIVE_FILE = "run_archive.db"
+# Tables whose rows are moved into a run's archive, with their id columns
+ARCHIVED_TABLES = {
+    "assignments": "assignment_id",
+    "units": "unit_id",
+    "agents": "agent_id",
+    "onboarding_agents": "onboarding_agent_id",
+}
+ARCHIVED_ID_COLUMNS = {id_name: table_name for table_name, id_name in ARCHIVED_TABLES.items()}
+# Indices built in each archive, besides those on the id columns, for the
+# lookups that fan out into archives
+ARCHIVE_INDEXES = [
+    "CREATE INDEX {schema}.unit_by_worker_index ON units(worker_id)",
+    "CREATE INDEX {schema}.unit_by_assignment_id_index ON units(assignment_id)",
+    "CREATE INDEX {schema}.agent_by_worker_index ON agents(worker_id)",
+    "CREATE INDEX {schema}.agent_by_unit_index ON agents(unit_id)",
+    "CREATE INDEX {schema}.onboarding_agent_by_worker_index ON onboarding_agents(worker_id)",
+]
+# Most archives kept open at once, closing the least recently used beyond that
+MAX_OPEN_ARCHIVES = 32
+# Seconds between checks for runs archived by other processes
+ARCHIVED_RUNS_REFRESH_INTERVAL = 10
+
+CREATE_ARCHIVED_TASK_RUNS_TABLE = """CREATE TABLE IF NOT EXISTS archived_task_runs (
+    task_run_id INTEGER PRIMARY KEY,
+    task_id INTEGER NOT NULL,
+    archive_path TEXT NOT NULL,
+    creation_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (task_run_id) REFERENCES task_runs (task_run_id)
+);
+"""
+
+CREATE_ARCHIVED_ID_RANGES_TABLE = """CREATE TABLE IF NOT EXISTS archived_id_ranges (
+    task_run_id INTEGER NOT NULL,
+    table_name TEXT NOT NULL,
+    min_id INTEGER NOT NULL,
+    max_id INTEGER NOT NULL,
+    PRIMARY KEY (task_run_id, table_name),
+    FOREIGN KEY (task_run_id) REFERENCES archived_task_runs (task_run_id)
+);
+"""
+
+
+@dataclass
+class ArchivedRun:
+    """Where an archived run's rows went, and the range of ids of each table"""
+
+    task_run_id: str
+    task_id: str
+    archive_path: str
+    id_ranges: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+
+    def may_contain(self, table_name: str, db_id: int) -> bool:
+        id_range = self.id_ranges.get(table_name)
+        return id_range is not None and id_range[0] <= db_id <= id_range[1]
+
+
+class RunArchive:
+    """
+    Connection to the archive database of a single run. Users acquire it before
+    querying and release it after, so that closing it once it's evicted waits
+    for any queries still to be made.
+    """
+
+    def __init__(self, archive_path: str, row_factory: Callable[[sqlite3.Cursor, tuple], Any]):
+        self.archive_path = archive_path
+        self._conn = sqlite3.connect(archive_path, check_same_thread=False)
+        self._conn.row_factory = row_factory
+        self._lock = threading.Lock()
+        self._users = 0
+        self._closing = False
+        self._users_lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._users_lock:
+            assert not self._closing, f"Archive {self.archive_path} has already been closed"
+            self._users += 1
+
+    def release(self) -> None:
+        with self._users_lock:
+            self._users -= 1
+            should_close = self._closing and self._users == 0
+        if should_close:
+            self._close_connection()
+
+    def select(self, query: str, params: Sequence[Any]) -> List[Mapping[str, Any]]:
+        with self._lock:
+            return self._conn.execute(query, tuple(params)).fetchall()
+
+    def execute(self, statements: Sequence[Tuple[str, Sequence[Any]]]) -> int:
+        """Run the given statements in one transaction, returning the rows changed"""
+        changed = 0
+        with self._lock, self._conn:
+            for query, params in statements:
+                changed += self._conn.execute(query, tuple(params)).rowcount
+        return changed
+
+    def close(self) -> None:
+        """Close the connection, as soon as no users hold it"""
+        with self._users_lock:
+            self._closing = True
+            should_close = self._users == 0
+        if should_close:
+            self._close_connection()
+
+    def _close_connection(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def get_archive_indexes(schema: str) -> List[str]:
+    return [index.format(schema=schema) for index in ARCHIVE_INDEXES]
+
+
+def filter_archived_runs(
+    archived_runs: Dict[str, ArchivedRun],
+    table_name: str,
+    filters: Mapping[str, Optional[Any]],
+) -> List[ArchivedRun]:
+    """
+    Return the archived runs that could hold rows of the given table matching
+    the given filters, narrowing by run, by any id filtered on, then by task
+    """
+    if table_name not in ARCHIVED_TABLES or len(archived_runs) == 0:
+        return []
+    task_run_id = filters.get("task_run_id")
+    if task_run_id is not None:
+        archived_run = archived_runs.get(str(task_run_id))
+        return [] if archived_run is None else [archived_run]
+    candidates = list(archived_runs.values())
+    for id_name, id_table in ARCHIVED_ID_COLUMNS.items():
+        db_id = filters.get(id_name)
+        if db_id is not None:
+            candidates = [run for run in candidates if run.may_contain(id_table, int(db_id))]
+    task_id = filters.get("task_id")
+    if task_id is not None:
+        candidates = [run for run in candidates if run.task_id == str(task_id)]
+    return candidates
@@ -42,10 +42,10 @@ class MockAgent(Agent):
                 "pending_submit": None,
             }
 
-    def observe(self, live_update: Dict[str, Any]) -> None:
+    def _record_observation(self, live_update: Dict[str, Any]) -> None:
         """Put observations into this mock agent's observation list"""
         self.datastore.agent_data[self.db_id]["observed"].append(live_update)
-        super().observe(live_update)
+        super()._record_observation(live_update)
 
     def enqueue_mock_live_update(self, data: Dict[str, Any]) -> None:
         """Add a fake observation to pull off on the next act call"""
@@ -73,6 +73,17 @@ class MockAgent(Agent):
             self.datastore.agent_data[self.db_id]["acts"].append(act)
         return act
 
+    async def get_live_update_async(self, timeout=None) -> Optional[Dict[str, Any]]:
+        """Awaitable version of get_live_update, using mock acts the same way"""
+        if len(self.datastore.agent_data[self.db_id]["pending_acts"]) > 0:
+            act = self.datastore.agent_data[self.db_id]["pending_acts"].pop(0)
+        else:
+            act = await super().get_live_update_async(timeout=timeout)
+
+        if act is not None:
+            self.datastore.agent_data[self.db_id]["acts"].append(act)
+        return act
+
     def approve_work(self) -> None:
         """
         Approve the work done on this specific Unit
@@ -95,6 +106,12 @@ class MockAgent(Agent):
         """Mark this mock agent as having disconnected"""
         self.update_status(AgentState.STATUS_DISCONNECT)
 
+    def _trigger_pending_submit(self) -> None:
+        """Trigger the local submit for this agent, if there is one"""
+        local_submit = self.datastore.agent_data[self.db_id]["pending_submit"]
+        if local_submit is not None:
+            self.handle_submit(local_submit)
+
     def await_submit(self, timeout: Optional[int] = None) -> bool:
         """
         Check the submission status of this agent, first popping off
@@ -103,11 +120,17 @@ class MockAgent(Agent):
         if self.did_submit.is_set():
             return True
         if timeout is not None:
-            local_submit = self.datastore.agent_data[self.db_id]["pending_submit"]
-            if local_submit is not None:
-                self.handle_submit(local_submit)
+            self._trigger_pending_submit()
         return super().await_submit(timeout)
 
+    async def await_submit_async(self, timeout: Optional[int] = None) -> bool:
+        """Awaitable version of await_submit, triggering local submits the same way"""
+        if self.did_submit.is_set():
+            return True
+        if timeout is not None:
+            self._trigger_pending_submit()
+        return await super().await_submit_async(timeout)
+
     @staticmethod
     def new(db: "MephistoDB", worker: "Worker", unit: "Unit") -> "Agent":
         """Create an agent for this worker to be used for work on the given Unit."""
@@ -629,6 +629,14 @@ class BaseDatabaseTests(unittest.TestCase):
         units = db.find_units(assignment_id=self.get_fake_id("Assignment"))
         self.assertEqual(len(units), 0)
 
+        # Check finding only some fields of units
+        unit_fields = db.find_unit_fields(["unit_id", "status"], assignment_id=assignment_id)
+        self.assertEqual(len(unit_fields), 1)
+        self.assertEqual(unit_fields[0]["unit_id"], unit_id)
+        self.assertEqual(unit_fields[0]["status"], AssignmentState.CREATED)
+        unit_fields = db.find_unit_fields(["unit_id"], status=AssignmentState.COMPLETED)
+        self.assertEqual(len(unit_fields), 0)
+
     def test_unit_fails(self) -> None:
         """Ensure units fail to be created or loaded under failure conditions"""
         assert self.db is not None, "No db initialized"
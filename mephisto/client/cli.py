@@ -397,5 +397,137 @@ def metrics_cli(args):
         shutdown_grafana_server()
 
 
+@cli.command("benchmark", cls=RichCommand)
+@click.option("-w", "--workers", type=(int), default=20, help="Number of simulated workers")
+@click.option("-c", "--concurrency", type=(int), default=10, help="Workers in flight at once")
+@click.option("-u", "--live-updates", type=(int), default=3, help="Live updates per worker")
+@click.option("--onboarding/--no-onboarding", default=False)
+@click.option("--concurrent-units/--single-units", "is_concurrent", default=False)
+@click.option("-p", "--port", type=(int), default=3000)
+@click.option("-t", "--timeout", type=(float), default=120)
+@click.option("-b", "--baseline", "baseline_path", type=(str), default=None)
+@click.option("--save-baseline", is_flag=True, default=False)
+def benchmark(
+    workers,
+    concurrency,
+    live_updates,
+    onboarding,
+    is_concurrent,
+    port,
+    timeout,
+    baseline_path,
+    save_baseline,
+):
+    """Run a synthetic load test against a mock task, comparing to a saved baseline"""
+    from mephisto.scripts.benchmarks.load_test import (
+        LoadTestConfig,
+        run_load_test,
+        load_baseline,
+        is_same_load,
+        save_baseline as store_baseline,
+        print_results,
+    )
+    from mephisto.utils.dirs import get_data_dir
+
+    if baseline_path is None:
+        baseline_path = os.path.join(get_data_dir(), "benchmarks", "load_test_baseline.json")
+    config = LoadTestConfig(
+        num_workers=workers,
+        concurrency=concurrency,
+        live_updates=live_updates,
+        use_onboarding=onboarding,
+        is_concurrent=is_concurrent,
+        port=port,
+        timeout=timeout,
+    )
+    results = run_load_test(config)
+    baseline = load_baseline(baseline_path)
+    if baseline is not None and not is_same_load(results, baseline):
+        click.echo(f"Baseline at {baseline_path} used a different load, not comparing")
+        baseline = None
+    print_results(results, baseline)
+    if save_baseline:
+        store_baseline(results, baseline_path)
+        click.echo(f"Saved results as the baseline at {baseline_path}")
+
+
+@cli.command("profile", cls=RichCommand)
+@click.argument("pid", type=(int))
+@click.option("-d", "--duration", type=(float), default=30, help="Seconds to profile for")
+def profile(pid, duration):
+    """Sample the stacks of a running operator, writing a flamegraph-compatible profile"""
+    from mephisto.operations.profiler import request_profile, get_default_profile_dir
+
+    try:
+        request_profile(pid, duration)
+    except ProcessLookupError:
+        raise click.BadParameter(f"No operator accepting profile requests has pid {pid}")
+    click.echo(
+        f"Profiling operator {pid} for {duration} seconds. The profile is written next to "
+        f"the run's logs, or to {get_default_profile_dir()}, and its path is logged."
+    )
+
+
+@cli.command("pack", cls=RichCommand)
+@click.argument("task_run_ids", nargs=-1)
+@click.option("--all-completed", is_flag=True, default=False, help="Pack every completed run")
+@click.option("--unpack", is_flag=True, default=False, help="Write packed files back out")
+def pack(task_run_ids, all_completed, unpack):
+    """Pack the agent and assignment data files of finished runs into one file per run"""
+    from mephisto.abstractions.databases.local_database import LocalMephistoDB
+    from mephisto.data_model.task_run import TaskRun
+
+    db = LocalMephistoDB()
+    task_run_ids = list(task_run_ids)
+    if all_completed:
+        task_run_ids += [run.db_id for run in db.find_task_runs(is_completed=True)]
+    if len(task_run_ids) == 0:
+        raise click.UsageError("Provide task run ids to pack, or use --all-completed")
+    for task_run_id in task_run_ids:
+        if unpack:
+            count = db.unpack_task_run(task_run_id)
+            click.echo(f"Unpacked {count} files of task run {task_run_id}")
+            continue
+        if not TaskRun.get(db, task_run_id).get_is_completed():
+            click.echo(f"Skipping task run {task_run_id}, which is still running")
+            continue
+        count = db.pack_task_run(task_run_id)
+        click.echo(f"Packed {count} files of task run {task_run_id}")
+
+
+@cli.command("archive", cls=RichCommand)
+@click.argument("task_run_ids", nargs=-1)
+@click.option("--all-completed", is_flag=True, default=False, help="Archive every completed run")
+@click.option(
+    "--older-than-days",
+    type=float,
+    default=0,
+    help="With --all-completed, only archive runs started at least this many days ago",
+)
+@click.option("--unarchive", is_flag=True, default=False, help="Move archived rows back")
+def archive(task_run_ids, all_completed, older_than_days, unarchive):
+    """Move the assignments, units and agents of finished runs out of the live tables"""
+    from mephisto.abstractions.databases.local_database import LocalMephistoDB
+    from mephisto.data_model.task_run import TaskRun
+
+    db = LocalMephistoDB()
+    task_run_ids = list(task_run_ids)
+    if all_completed and not unarchive:
+        for task_run_id in db.archive_completed_task_runs(min_age_days=older_than_days):
+            click.echo(f"Archived task run {task_run_id}")
+    elif len(task_run_ids) == 0:
+        raise click.UsageError("Provide task run ids to archive, or use --all-completed")
+    for task_run_id in task_run_ids:
+        if unarchive:
+            db.unarchive_task_run(task_run_id)
+            click.echo(f"Unarchived task run {task_run_id}")
+            continue
+        if not TaskRun.get(db, task_run_id).get_is_completed():
+            click.echo(f"Skipping task run {task_run_id}, which is still running")
+            continue
+        db.archive_task_run(task_run_id)
+        click.echo(f"Archived task run {task_run_id}")
+
+
 if __name__ == "__main__":
     cli()
@@ -5,13 +5,12 @@
 # LICENSE file in the root directory of this source tree.
 
 from __future__ import annotations
+import asyncio
 import csv
 from genericpath import exists
 
 import os
 from pathlib import Path
-import threading
-from queue import Queue
 from uuid import uuid4
 from prometheus_client import Gauge  # type: ignore
 
@@ -28,8 +27,16 @@ from mephisto.data_model.exceptions import (
     AgentTimeoutError,
     AgentShutdownError,
 )
+from mephisto.operations.datatypes import (
+    AwaitableEvent,
+    LiveUpdateBuffer,
+    DEFAULT_LIVE_UPDATE_BUFFER_SIZE,
+    LIVE_UPDATE_OVERFLOW_DROP_OLDEST,
+    wait_for_any,
+    wait_for_any_async,
+)
 
-from typing import Optional, Mapping, Dict, Any, cast, TYPE_CHECKING
+from typing import Optional, Mapping, Dict, Any, List, Sequence, cast, TYPE_CHECKING
 
 try:
     from detoxify import Detoxify
@@ -46,6 +53,8 @@ if TYPE_CHECKING:
     from mephisto.data_model.task import Task
     from mephisto.data_model.task_run import TaskRun
     from mephisto.operations.datatypes import LiveTaskRun
+    from mephisto.operations.client_io_handler import ClientIOHandler
+    from mephisto.operations.agent_state_persister import AgentStatePersister
 
 from mephisto.utils.logger_core import get_logger, warn_once
 
@@ -106,10 +115,9 @@ class _AgentBase(ABC):
         self._associated_live_run: Optional["LiveTaskRun"] = None
 
         # Local state for live agents
-        self.pending_actions: "Queue[Dict[str, Any]]" = Queue()
-        self.has_live_update = threading.Event()
-        self.has_live_update.clear()
-        self.did_submit = threading.Event()
+        self.pending_actions = LiveUpdateBuffer()
+        self.has_live_update = self.pending_actions.has_items
+        self.did_submit = AwaitableEvent()
         self.is_shutdown = False
 
         # Follow-up initialization is deferred
@@ -128,6 +136,11 @@ class _AgentBase(ABC):
     def set_live_run(self, live_run: "LiveTaskRun") -> None:
         """Set an associated live run for this agent"""
         self._associated_live_run = live_run
+        task_args = live_run.task_run.args.get("task", {})
+        self.pending_actions.set_limits(
+            task_args.get("live_update_buffer_size", DEFAULT_LIVE_UPDATE_BUFFER_SIZE),
+            task_args.get("live_update_overflow", LIVE_UPDATE_OVERFLOW_DROP_OLDEST),
+        )
 
     def get_live_run(self) -> "LiveTaskRun":
         """Return the associated live run for this agent. Throw if not set"""
@@ -135,6 +148,12 @@ class _AgentBase(ABC):
             raise AssertionError("Should not be getting the live run, not set for given agent")
         return self._associated_live_run
 
+    def get_state_persister(self) -> Optional["AgentStatePersister"]:
+        """Return the write-behind persister for this agent's state, if it's in a live run"""
+        if self._associated_live_run is None:
+            return None
+        return self._associated_live_run.state_persister
+
     def agent_in_active_run(self) -> bool:
         """
         Returns whether the given agent is in an active LiveTaskRun
@@ -173,6 +192,10 @@ class _AgentBase(ABC):
                 self._task = Task.get(self.db, self.task_id)
         return self._task
 
+    def _record_observation(self, live_update: "Dict[str, Any]") -> None:
+        """Pass the observed information to the AgentState"""
+        self.state.update_data(live_update)
+
     def observe(self, live_update: "Dict[str, Any]") -> None:
         """
         Pass the observed information to the AgentState, then
@@ -180,12 +203,32 @@ class _AgentBase(ABC):
         """
         if live_update.get("update_id") is None:
             live_update["update_id"] = str(uuid4())
-        self.state.update_data(live_update)
+        self._record_observation(live_update)
 
         if self.agent_in_active_run():
             live_run = self.get_live_run()
             live_run.client_io.send_live_update(self.get_agent_id(), live_update)
 
+    @staticmethod
+    def observe_all(agents: Sequence["_AgentBase"], live_update: "Dict[str, Any]") -> None:
+        """
+        Have each of the given agents observe the same update, as with observe,
+        serializing it to be pushed once for all of them rather than once each
+        """
+        if live_update.get("update_id") is None:
+            live_update["update_id"] = str(uuid4())
+        agent_ids_by_client_io: Dict[int, List[str]] = {}
+        client_ios: Dict[int, "ClientIOHandler"] = {}
+        for agent in agents:
+            # Agent states may annotate the updates they're given
+            agent._record_observation(dict(live_update))
+            if agent.agent_in_active_run():
+                client_io = agent.get_live_run().client_io
+                client_ios[id(client_io)] = client_io
+                agent_ids_by_client_io.setdefault(id(client_io), []).append(agent.get_agent_id())
+        for client_io_id, agent_ids in agent_ids_by_client_io.items():
+            client_ios[client_io_id].broadcast_live_update(agent_ids, live_update)
+
     def get_live_update(self, timeout: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """
         Request information from the Agent's frontend. If non-blocking,
@@ -196,8 +239,28 @@ class _AgentBase(ABC):
             if timeout is None or timeout == 0:
                 return None
             self.has_live_update.wait(timeout)
+        return self._pop_live_update(timeout)
 
+    async def get_live_update_async(
+        self, timeout: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Version of get_live_update that waits on the calling event loop
+        rather than blocking a thread
+        """
         if self.pending_actions.empty():
+            if timeout is None or timeout == 0:
+                return None
+            await self.has_live_update.wait_async(timeout)
+        return self._pop_live_update(timeout)
+
+    def _pop_live_update(self, timeout: Optional[int]) -> Dict[str, Any]:
+        """
+        Take the next pending live update after a wait, raising the relevant
+        error if the wait was released without one
+        """
+        act = self.pending_actions.get_nowait()
+        if act is None:
             if self.is_shutdown:
                 raise AgentShutdownError(self.db_id)
             # various disconnect cases
@@ -209,12 +272,6 @@ class _AgentBase(ABC):
                 raise AgentReturnedError(self.db_id)
             self.update_status(AgentState.STATUS_TIMEOUT)
             raise AgentTimeoutError(timeout, self.db_id)
-        assert not self.pending_actions.empty(), "has_live_update released without an action!"
-
-        act = self.pending_actions.get()
-
-        if self.pending_actions.empty():
-            self.has_live_update.clear()
         self.state.update_data(act)
         return act
 
@@ -230,32 +287,61 @@ class _AgentBase(ABC):
         )
         return self.get_live_update(timeout)
 
+    def _raise_if_disconnected(self, timeout: Optional[int]) -> None:
+        """Raise the relevant error if this agent can no longer submit"""
+        self._raise_for_status(self.get_status(), timeout)
+
+    async def _raise_if_disconnected_async(self, timeout: Optional[int]) -> None:
+        """
+        Version of _raise_if_disconnected for the event loop, reading the status
+        in an executor as it may hit the db
+        """
+        live_run = self._associated_live_run
+        if live_run is not None:
+            status = await live_run.worker_pool.async_db.run(self.get_status)
+        else:
+            status = await asyncio.get_running_loop().run_in_executor(None, self.get_status)
+        self._raise_for_status(status, timeout)
+
+    def _raise_for_status(self, status: str, timeout: Optional[int]) -> None:
+        """Raise the relevant error if the given status means this agent can't submit"""
+        logger.debug(f"Handling Agent status (await_submit) - have `{status}`")
+        if status == AgentState.STATUS_DISCONNECT:
+            raise AgentDisconnectedError(self.db_id)
+        elif status == AgentState.STATUS_RETURNED:
+            raise AgentReturnedError(self.db_id)
+        elif status == AgentState.STATUS_TIMEOUT:
+            raise AgentTimeoutError(timeout, self.db_id)
+
     def await_submit(self, timeout: Optional[int] = None) -> bool:
         """
         Blocking wait for this agent to submit their task
         If timeout is provided and exceeded, raises AgentTimeoutError
         """
-
-        def _raise_if_disconnected():
-            status = self.get_status()
-            logger.debug(f"Handling Agent status (await_submit) - have `{status}`")
-            if status == AgentState.STATUS_DISCONNECT:
-                raise AgentDisconnectedError(self.db_id)
-            elif status == AgentState.STATUS_RETURNED:
-                raise AgentReturnedError(self.db_id)
-            elif status == AgentState.STATUS_TIMEOUT:
-                raise AgentTimeoutError(timeout, self.db_id)
-
         if timeout is not None:
             # Handle disconnect possibilities first
-            _raise_if_disconnected()
+            self._raise_if_disconnected(timeout)
             # Wait for the status change
             self.did_submit.wait(timeout=timeout)
             if not self.did_submit.is_set():
                 # If released without submit, raise timeout
                 raise AgentTimeoutError(timeout, self.db_id)
             # Check disconnect possibilities again
-            _raise_if_disconnected()
+            self._raise_if_disconnected(timeout)
+        return self.did_submit.is_set()
+
+    async def await_submit_async(self, timeout: Optional[int] = None) -> bool:
+        """
+        Version of await_submit that waits on the calling event loop rather
+        than blocking a thread. If timeout is provided and exceeded, raises
+        AgentTimeoutError
+        """
+        if timeout is not None:
+            await self._raise_if_disconnected_async(timeout)
+            await self.did_submit.wait_async(timeout=timeout)
+            if not self.did_submit.is_set():
+                raise AgentTimeoutError(timeout, self.db_id)
+            await self._raise_if_disconnected_async(timeout)
         return self.did_submit.is_set()
 
     def handle_submit(self, submit_data: Dict[str, Any]) -> None:
@@ -373,6 +459,27 @@ class _AgentBase(ABC):
         raise NotImplementedError
 
 
+def select_live_updates(
+    agents: Sequence["_AgentBase"], timeout: Optional[float] = None
+) -> List["_AgentBase"]:
+    """
+    Block until at least one of the given agents has a live update ready,
+    or until the timeout passes, returning the agents that are ready. Agents
+    released by a disconnect or shutdown are also returned, so that their
+    next get_live_update(timeout) raises the relevant error.
+    """
+    wait_for_any([agent.has_live_update for agent in agents], timeout)
+    return [agent for agent in agents if agent.has_live_update.is_set()]
+
+
+async def select_live_updates_async(
+    agents: Sequence["_AgentBase"], timeout: Optional[float] = None
+) -> List["_AgentBase"]:
+    """Version of select_live_updates that waits on the calling event loop"""
+    await wait_for_any_async([agent.has_live_update for agent in agents], timeout)
+    return [agent for agent in agents if agent.has_live_update.is_set()]
+
+
 class Agent(_AgentBase, MephistoDataModelComponentMixin, metaclass=MephistoDBBackedABCMeta):
     """
     This class encompasses a worker as they are working on an individual assignment.
@@ -487,6 +594,8 @@ class Agent(_AgentBase, MephistoDataModelComponentMixin, metaclass=MephistoDBBac
         if self.agent_in_active_run():
             live_run = self.get_live_run()
             live_run.loop_wrap.execute_coro(live_run.worker_pool.push_status_update(self))
+            if new_status in AgentState.complete():
+                live_run.client_io.release_agent(self.get_agent_id())
         if new_status in [
             AgentState.STATUS_RETURNED,
             AgentState.STATUS_DISCONNECT,
@@ -684,12 +793,14 @@ class OnboardingAgent(
         self.db.update_onboarding_agent(self.db_id, status=new_status)
         self.db_status = new_status
         if self.agent_in_active_run():
+            live_run = self.get_live_run()
             if new_status not in [
                 AgentState.STATUS_APPROVED,
                 AgentState.STATUS_REJECTED,
             ]:
-                live_run = self.get_live_run()
                 live_run.loop_wrap.execute_coro(live_run.worker_pool.push_status_update(self))
+            if new_status in AgentState.complete():
+                live_run.client_io.release_agent(self.get_agent_id())
         if new_status in [AgentState.STATUS_RETURNED, AgentState.STATUS_DISCONNECT]:
             # Disconnect statuses should free any pending acts
             self.has_live_update.set()
@@ -90,16 +90,16 @@ class Assignment(MephistoDataModelComponentMixin, metaclass=MephistoDBBackedMeta
     def get_assignment_data(self) -> InitializationData:
         """Return the specific assignment data for this assignment"""
         assign_data_filename = os.path.join(self.get_data_dir(), ASSIGNMENT_DATA_FILE)
-        assert os.path.exists(assign_data_filename), "No data exists for assignment"
-        with open(assign_data_filename, "r") as json_file:
-            return InitializationData.loadFromJSON(json_file)
+        assert self.db.key_exists(assign_data_filename), "No data exists for assignment"
+        as_dict = self.db.read_dict(assign_data_filename)
+        return InitializationData(shared=as_dict["shared"], unit_data=as_dict["unit_data"])
 
     def write_assignment_data(self, data: InitializationData) -> None:
         """Set the assignment data for this assignment"""
         assign_data_filename = os.path.join(self.get_data_dir(), ASSIGNMENT_DATA_FILE)
-        os.makedirs(self.get_data_dir(), exist_ok=True)
-        with open(assign_data_filename, "w+") as json_file:
-            data.dumpJSON(json_file)
+        self.db.write_dict(
+            assign_data_filename, {"shared": data.shared, "unit_data": data.unit_data}
+        )
 
     def get_agents(self) -> List[Optional["Agent"]]:
         """
@@ -229,8 +229,7 @@ class Assignment(MephistoDataModelComponentMixin, metaclass=MephistoDBBackedMeta
         assign_dir = os.path.join(run_dir, db_id)
         os.makedirs(assign_dir)
         if assignment_data is not None:
-            with open(os.path.join(assign_dir, ASSIGNMENT_DATA_FILE), "w+") as json_file:
-                json.dump(assignment_data, json_file)
+            db.write_dict(os.path.join(assign_dir, ASSIGNMENT_DATA_FILE), assignment_data)
         assignment = Assignment.get(db, db_id)
         logger.debug(f"{assignment} created for {task_run}")
         return assignment
@@ -4,9 +4,24 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Union
+import json
 import time
 
+try:
+    import msgpack  # type: ignore
+
+    MSGPACK_INSTALLED = True
+except ImportError:
+    MSGPACK_INSTALLED = False
+
+try:
+    import orjson  # type: ignore
+
+    ORJSON_INSTALLED = True
+except ImportError:
+    ORJSON_INSTALLED = False
+
 PACKET_TYPE_ALIVE = "alive"
 PACKET_TYPE_SUBMIT_ONBOARDING = "submit_onboarding"
 PACKET_TYPE_SUBMIT_UNIT = "submit_unit"
@@ -20,6 +35,44 @@ PACKET_TYPE_REQUEST_STATUSES = "request_statuses"
 PACKET_TYPE_RETURN_STATUSES = "return_statuses"
 PACKET_TYPE_ERROR = "log_error"
 
+PACKET_ENCODING_JSON = "json"
+PACKET_ENCODING_MSGPACK = "msgpack"
+
+# Websocket subprotocols used to negotiate the packet encoding with the router
+SUBPROTOCOL_JSON = "mephisto-json"
+SUBPROTOCOL_MSGPACK = "mephisto-msgpack"
+
+
+def get_wire_subprotocols() -> List[str]:
+    """Return the subprotocols that this install can speak, most preferred first"""
+    if MSGPACK_INSTALLED:
+        return [SUBPROTOCOL_MSGPACK, SUBPROTOCOL_JSON]
+    return [SUBPROTOCOL_JSON]
+
+
+def get_encoding_for_subprotocol(subprotocol: Optional[str]) -> str:
+    """Return the packet encoding for a negotiated subprotocol, falling back to JSON"""
+    if subprotocol == SUBPROTOCOL_MSGPACK and MSGPACK_INSTALLED:
+        return PACKET_ENCODING_MSGPACK
+    return PACKET_ENCODING_JSON
+
+
+def _json_dumps(obj: Any) -> str:
+    """Serialize to a JSON string, using orjson when it is available"""
+    if ORJSON_INSTALLED:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass  # orjson is stricter than json (i.e. big ints), fall back
+    return json.dumps(obj)
+
+
+def _json_loads(message: Union[str, bytes]) -> Any:
+    """Deserialize a JSON string, using orjson when it is available"""
+    if ORJSON_INSTALLED:
+        return orjson.loads(message)
+    return json.loads(message)
+
 
 class Packet:
     """
@@ -39,6 +92,7 @@ class Packet:
         router_incoming_timestamp: Optional[float] = None,
         router_outgoing_timestamp: Optional[float] = None,
         server_timestamp: Optional[float] = None,
+        trace_id: Optional[str] = None,
     ):
         self.type = packet_type
         self.subject_id = subject_id
@@ -49,6 +103,11 @@ class Packet:
         self.client_timestamp = client_timestamp
         self.router_incoming_timestamp = router_incoming_timestamp
         self.router_outgoing_timestamp = router_outgoing_timestamp
+        # Id of the trace (see mephisto.utils.tracing) this packet is part of
+        self.trace_id = trace_id
+        # Serialized data payload by encoding, shared by copies of this
+        # packet that fan the same payload out to other subjects
+        self._encoded_data: Dict[str, Union[str, bytes]] = {}
 
     @staticmethod
     def from_dict(input_dict: Dict[str, Any]) -> "Packet":
@@ -65,10 +124,77 @@ class Packet:
             router_incoming_timestamp=input_dict.get("router_incoming_timestamp"),
             router_outgoing_timestamp=input_dict.get("router_outgoing_timestamp"),
             server_timestamp=input_dict.get("server_timestamp"),
+            trace_id=input_dict.get("trace_id"),
+        )
+
+    @staticmethod
+    def from_wire(message: Union[str, bytes]) -> "Packet":
+        """Decode a packet as received over a socket, either JSON text or msgpack binary"""
+        if isinstance(message, (bytes, bytearray)):
+            assert MSGPACK_INSTALLED, "Received a binary packet, but msgpack is not installed"
+            packet_dict = msgpack.unpackb(message, raw=False, strict_map_key=False)
+        else:
+            packet_dict = _json_loads(message)
+        return Packet.from_dict(packet_dict)
+
+    def to_wire(self, encoding: str = PACKET_ENCODING_JSON) -> Union[str, bytes]:
+        """
+        Serialize this packet for sending over a socket in the given encoding.
+
+        The data payload is only serialized once per encoding and reused for
+        any copies made with copy_for_subject, so it shouldn't be modified
+        after the packet is first sent.
+        """
+        header = {
+            "packet_type": self.type,
+            "subject_id": self.subject_id,
+            "client_timestamp": self.client_timestamp,
+            "router_incoming_timestamp": self.router_incoming_timestamp,
+            "router_outgoing_timestamp": self.router_outgoing_timestamp,
+            "server_timestamp": self.server_timestamp,
+        }
+        if self.trace_id is not None:
+            header["trace_id"] = self.trace_id
+        if encoding == PACKET_ENCODING_MSGPACK:
+            encoded_data = self._encoded_data.get(encoding)
+            if encoded_data is None:
+                encoded_data = msgpack.packb(self.data, use_bin_type=True)
+                self._encoded_data[encoding] = encoded_data
+            # msgpack maps are a header followed by their keys and values, so
+            # the pre-serialized data can be appended as the final value
+            packer = msgpack.Packer(use_bin_type=True)
+            return b"".join(
+                [packer.pack_map_header(len(header) + 1)]
+                + [packer.pack(key) + packer.pack(value) for key, value in header.items()]
+                + [packer.pack("data"), encoded_data]
+            )
+        assert encoding == PACKET_ENCODING_JSON, f"Unsupported packet encoding {encoding}"
+        encoded_data = self._encoded_data.get(encoding)
+        if encoded_data is None:
+            encoded_data = _json_dumps(self.data)
+            self._encoded_data[encoding] = encoded_data
+        return f'{_json_dumps(header)[:-1]}, "data": {encoded_data}}}'
+
+    def copy_for_subject(self, subject_id: str) -> "Packet":
+        """
+        Return a copy of this packet addressed to another subject, sharing
+        the data payload and its serialized forms with this one
+        """
+        packet = Packet(
+            packet_type=self.type,
+            subject_id=subject_id,
+            data=self.data,
+            client_timestamp=self.client_timestamp,
+            router_incoming_timestamp=self.router_incoming_timestamp,
+            router_outgoing_timestamp=self.router_outgoing_timestamp,
+            server_timestamp=self.server_timestamp,
+            trace_id=self.trace_id,
         )
+        packet._encoded_data = self._encoded_data
+        return packet
 
     def to_sendable_dict(self) -> Dict[str, Any]:
-        return {
+        sendable = {
             "packet_type": self.type,
             "subject_id": self.subject_id,
             "data": self.data,
@@ -77,6 +203,9 @@ class Packet:
             "router_outgoing_timestamp": self.router_outgoing_timestamp,
             "server_timestamp": self.server_timestamp,
         }
+        if self.trace_id is not None:
+            sendable["trace_id"] = self.trace_id
+        return sendable
 
     def copy(self):
         return Packet.from_dict(self.to_sendable_dict())
@@ -7,6 +7,8 @@
 
 import os
 import json
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass, field
 
 from mephisto.data_model.requester import Requester
@@ -35,6 +37,14 @@ from mephisto.utils.logger_core import get_logger
 
 logger = get_logger(name=__name__)
 
+# Maximum compiled configs kept, evicting the least recently used beyond it
+MAX_COMPILED_CONFIGS = 256
+
+# Compiled configs by task run id, shared by every TaskRun loaded for that run,
+# most recently used last
+_compiled_configs: "OrderedDict[str, TaskRunConfig]" = OrderedDict()
+_compiled_configs_lock = threading.Lock()
+
 
 @dataclass
 class TaskRunArgs:
@@ -125,6 +135,46 @@ class TaskRunArgs:
             )
         },
     )
+    max_runner_threads: int = field(
+        default=256,
+        metadata={
+            "help": (
+                "Maximum threads used at once to run blocking TaskRunner units, "
+                "assignments, and onboardings. Runners with async run methods execute "
+                "on the event loop instead. Further blocking runs wait for a free thread."
+            )
+        },
+    )
+    live_update_buffer_size: int = field(
+        default=1024,
+        metadata={
+            "help": (
+                "Maximum number of live updates held for an agent that the TaskRunner "
+                "has not yet read. Further updates are handled by live_update_overflow."
+            )
+        },
+    )
+    live_update_overflow: str = field(
+        default="drop_oldest",
+        metadata={
+            "help": (
+                "What to do with a live update that arrives when an agent's buffer is full. "
+                "drop_oldest discards the oldest unread update, drop_newest discards the "
+                "incoming one, and block holds it back until the TaskRunner catches up."
+            ),
+            "choices": ["drop_oldest", "drop_newest", "block"],
+        },
+    )
+    agent_state_write_window: float = field(
+        default=0.2,
+        metadata={
+            "help": (
+                "Seconds that saves of an agent's state are held so repeated saves can be "
+                "written to disk together, off the thread handling the agent. Saves are "
+                "always written out on submit and shutdown. Set to 0 to save synchronously."
+            )
+        },
+    )
 
     post_install_script: str = field(
         default="",
@@ -164,6 +214,65 @@ class TaskRunArgs:
         )
 
 
+@dataclass(frozen=True)
+class TaskRunConfig:
+    """
+    Immutable snapshot of a task run's parsed init_params. The scheduling parameters
+    read in hot loops are compiled to plain values, as OmegaConf access is slow.
+    params is shared by every TaskRun for the run, and must not be modified.
+    """
+
+    param_string: str
+    params: Dict[str, Any]
+    allowed_concurrent: int
+    maximum_units_per_worker: int
+    no_submission_patience: int
+    submission_timeout: int
+
+    @staticmethod
+    def compile(param_string: str) -> "TaskRunConfig":
+        """Parse the given init_params, compiling the scheduling parameters"""
+        try:
+            params = json.loads(param_string)
+        except Exception as e:
+            params = {}
+            print(e)
+        if isinstance(params, str):
+            # Some params are stored as a yaml string
+            params = OmegaConf.to_container(OmegaConf.create(params))
+        task_args = params.get("task") or {}
+
+        def get_task_arg(name: str) -> int:
+            value = task_args.get(name, MISSING)
+            return int(getattr(TaskRunArgs, name) if value == MISSING else value)
+
+        return TaskRunConfig(
+            param_string=param_string,
+            params=params,
+            allowed_concurrent=get_task_arg("allowed_concurrent"),
+            maximum_units_per_worker=get_task_arg("maximum_units_per_worker"),
+            no_submission_patience=get_task_arg("no_submission_patience"),
+            submission_timeout=get_task_arg("submission_timeout"),
+        )
+
+    @staticmethod
+    def get(task_run_id: str, param_string: str) -> "TaskRunConfig":
+        """Return the compiled config for the given run, compiling it on first use"""
+        with _compiled_configs_lock:
+            config = _compiled_configs.get(task_run_id)
+            if config is not None:
+                _compiled_configs.move_to_end(task_run_id)
+        if config is None or config.param_string != param_string:
+            # Runs in different databases may share ids, so check the params match
+            config = TaskRunConfig.compile(param_string)
+            with _compiled_configs_lock:
+                _compiled_configs[task_run_id] = config
+                _compiled_configs.move_to_end(task_run_id)
+                while len(_compiled_configs) > MAX_COMPILED_CONFIGS:
+                    _compiled_configs.popitem(last=False)
+        return config
+
+
 class TaskRun(MephistoDataModelComponentMixin, metaclass=MephistoDBBackedMeta):
     """
     This class tracks an individual run of a specific task, and handles state management
@@ -192,11 +301,7 @@ class TaskRun(MephistoDataModelComponentMixin, metaclass=MephistoDBBackedMeta):
         self.task_id: str = row["task_id"]
         self.requester_id: str = row["requester_id"]
         self.param_string: str = row["init_params"]
-        try:
-            self.args: "DictConfig" = OmegaConf.create(json.loads(self.param_string))
-        except Exception as e:
-            self.args = OmegaConf.create({})
-            print(e)
+        self.config: TaskRunConfig = TaskRunConfig.get(self.db_id, self.param_string)
         self.start_time = row["creation_date"]
         self.provider_type: str = row["provider_type"]
         self.task_type: str = row["task_type"]
@@ -209,9 +314,26 @@ class TaskRun(MephistoDataModelComponentMixin, metaclass=MephistoDBBackedMeta):
         self.__task: Optional["Task"] = None
         self.__requester: Optional["Requester"] = None
         self.__run_dir: Optional[str] = None
+        self.__args: Optional["DictConfig"] = None
         self.__blueprint: Optional["Blueprint"] = None
         self.__crowd_provider: Optional["CrowdProvider"] = None
 
+    @property
+    def args(self) -> "DictConfig":
+        """
+        The full run configuration, only built on first use as creating OmegaConf
+        containers is slow. Each TaskRun gets its own copy, so it may be modified.
+
+        Modifications don't change self.config, which get_valid_units_for_worker
+        and the operator read the scheduling parameters from (allowed_concurrent,
+        maximum_units_per_worker, no_submission_patience, submission_timeout).
+        Those are always read from the run's stored init_params, so set them when
+        launching the run rather than through args.
+        """
+        if self.__args is None:
+            self.__args = OmegaConf.create(self.config.params)
+        return self.__args
+
     def get_units(self) -> List["Unit"]:
         """
         Return the units associated with this task run.
@@ -223,13 +345,14 @@ class TaskRun(MephistoDataModelComponentMixin, metaclass=MephistoDBBackedMeta):
         Get any units that the given worker could work on in this
         task run
         """
-        config = self.get_task_args()
+        config = self.config
 
         # TODO(#773) handle with temporary local qualifications to allow
         # pushing real exclusionary qualifications after exceeding
         # maximum_units_per_worker
         if config.allowed_concurrent != 0 or config.maximum_units_per_worker:
-            current_units = self.db.find_units(
+            current_units = self.db.find_unit_fields(
+                ["unit_id"],
                 task_run_id=self.db_id,
                 worker_id=worker.db_id,
                 status=AssignmentState.ASSIGNED,
@@ -241,12 +364,13 @@ class TaskRun(MephistoDataModelComponentMixin, metaclass=MephistoDBBackedMeta):
                     return []  # currently at the maximum number of concurrent units
             if config.maximum_units_per_worker != 0:
                 completed_types = AssignmentState.completed()
-                related_units = self.db.find_units(
+                related_units = self.db.find_unit_fields(
+                    ["status"],
                     task_id=self.task_id,
                     worker_id=worker.db_id,
                 )
                 currently_completed = len(
-                    [u for u in related_units if u.db_status in completed_types]
+                    [u for u in related_units if u["status"] in completed_types]
                 )
                 if currently_active + currently_completed >= config.maximum_units_per_worker:
                     logger.debug(
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Write-behind persistence of AgentState files for a live run, so that saving an
+agent's data on every live update doesn't put a file write on the hot path.
+"""
+
+import copy
+import threading
+from prometheus_client import Counter, Histogram  # type: ignore
+
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mephisto.abstractions.database import MephistoDB
+
+from mephisto.utils.logger_core import get_logger
+
+logger = get_logger(name=__name__)
+
+# Seconds that repeated saves of the same file are held to be written together
+DEFAULT_AGENT_STATE_WRITE_WINDOW = 0.2
+
+AGENT_STATE_WRITES_COALESCED = Counter(
+    "agent_state_writes_coalesced",
+    "Number of AgentState file writes replaced by a newer write before reaching disk",
+)
+AGENT_STATE_FLUSH_LATENCY = Histogram(
+    "agent_state_flush_latency_seconds",
+    "Time spent writing out a batch of pending AgentState files",
+)
+
+
+class AgentStatePersister:
+    """
+    Holds the latest contents of each AgentState file saved during a run, and
+    writes them out through the MephistoDB from a background thread once per
+    window. Saves of the same file within a window are coalesced into a single
+    write. flush writes pending saves from the calling thread, request_flush has
+    the background thread write them without waiting out the window, and once
+    shut down saves are written through synchronously.
+    """
+
+    def __init__(self, db: "MephistoDB", window: float = DEFAULT_AGENT_STATE_WRITE_WINDOW):
+        self.db = db
+        self.window = window
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Guards _pending, only held for as long as it takes to swap entries
+        self._lock = threading.Lock()
+        # Held while writing a batch, so that writes of a file land in save order
+        self._write_lock = threading.Lock()
+        self._has_pending = threading.Event()
+        # Set to cut the background thread's wait for the window short
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self.is_shutdown = False
+        self._thread = threading.Thread(
+            target=self._run, name="agent-state-persister", daemon=True
+        )
+        self._thread.start()
+
+    def write_dict(self, path_key: str, target_dict: Dict[str, Any]) -> None:
+        """
+        Save the given dict to the given key, replacing any pending save of it.
+        The dict is copied before returning, so callers may keep mutating it.
+        """
+        with self._lock:
+            if not self.is_shutdown:
+                if path_key in self._pending:
+                    AGENT_STATE_WRITES_COALESCED.inc()
+                # Snapshot on the caller's thread, as the agent state keeps
+                # changing while the background thread serializes it
+                self._pending[path_key] = copy.deepcopy(target_dict)
+                self._has_pending.set()
+                return
+        with self._write_lock:
+            self._write_pending()
+            self._write(path_key, target_dict)
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def flush(self, path_prefix: Optional[str] = None) -> None:
+        """
+        Write out pending saves before returning, only those of keys under the
+        given prefix (such as an agent's data dir) if one is given
+        """
+        with self._write_lock:
+            self._write_pending(path_prefix)
+
+    def request_flush(self) -> None:
+        """Have the background thread write out pending saves now, without waiting"""
+        self._wake.set()
+
+    def _write_pending(self, path_prefix: Optional[str] = None) -> None:
+        with self._lock:
+            if path_prefix is None:
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {
+                    path_key: self._pending.pop(path_key)
+                    for path_key in list(self._pending.keys())
+                    if path_key.startswith(path_prefix)
+                }
+            if len(self._pending) == 0:
+                self._has_pending.clear()
+        if len(pending) == 0:
+            return
+        with AGENT_STATE_FLUSH_LATENCY.time():
+            for path_key, target_dict in pending.items():
+                self._write(path_key, target_dict)
+
+    def _write(self, path_key: str, target_dict: Dict[str, Any]) -> None:
+        try:
+            self.db.write_dict(path_key, target_dict)
+        except Exception:
+            logger.exception(f"Could not save agent state to {path_key}")
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._has_pending.wait()
+            # Give further saves of the same files a chance to land in this batch
+            self._wake.wait(self.window)
+            self._wake.clear()
+            self.flush()
+
+    def shutdown(self) -> None:
+        """Write out all pending saves, and write any later saves synchronously"""
+        with self._lock:
+            self.is_shutdown = True
+        self._stopped.set()
+        self._has_pending.set()
+        self._wake.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Async access to a MephistoDB for code running on the operator's event loop,
+through a dedicated executor rather than the loop's default one.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from prometheus_client import Histogram, Gauge  # type: ignore
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mephisto.abstractions.database import MephistoDB
+
+from mephisto.utils.logger_core import get_logger
+from mephisto.utils.tracing import Span, get_current_span, record_span
+
+logger = get_logger(name=__name__)
+
+# Threads running DB calls. SQLite serializes access anyway, so more threads
+# only add contention on the DB's lock.
+DEFAULT_DB_EXECUTOR_THREADS = 1
+# MephistoDB methods that only read, whose identical calls in a batch can share a result
+COALESCABLE_PREFIXES = ("find_", "get_", "check_")
+
+DB_EXECUTOR_QUEUE_DEPTH = Gauge(
+    "db_executor_queue_depth",
+    "Number of DB calls waiting for or running on the async DB executor",
+)
+DB_EXECUTOR_BATCH_SIZE = Histogram(
+    "db_executor_batch_size",
+    "Number of DB calls run together in one trip to the async DB executor",
+    buckets=[1, 2, 4, 8, 16, 32, 64, 128, float("inf")],
+)
+
+
+def _resolve_future(
+    future: "asyncio.Future[Any]", result: Any, error: Optional[BaseException]
+) -> None:
+    if future.done():
+        return  # The caller was cancelled
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+@dataclass
+class _PendingCall:
+    func: Callable[..., Any]
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    futures: List["asyncio.Future[Any]"] = field(default_factory=list)
+    category: str = "db"
+    # Span of the first caller, and when it was queued, for tracing
+    parent_span: Optional[Span] = None
+    queued_time: float = 0
+
+
+class AsyncMephistoDB:
+    """
+    Awaitable facade over a MephistoDB. DB calls made in the same event loop
+    tick are collected and sent to a dedicated executor as a single batch,
+    saving a thread hop per call and keeping DB work from queueing in front
+    of (or behind) unrelated work on the loop's default executor. Identical
+    read calls within a batch are only run once.
+
+    Methods of the underlying db are available directly, such as
+    `await async_db.find_workers(worker_name=name)`, and any other callable
+    that mostly touches the db can be run with `await async_db.run(...)`.
+    """
+
+    def __init__(self, db: "MephistoDB", max_threads: int = DEFAULT_DB_EXECUTOR_THREADS):
+        self.db = db
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_threads, thread_name_prefix="MephistoDB-async"
+        )
+        self._pending: Dict[Any, _PendingCall] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_scheduled = False
+        self._queue_depth = 0
+        self._is_shutdown = False
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        db_method = getattr(self.db, name)
+        coalesce = name.startswith(COALESCABLE_PREFIXES)
+
+        async def call_db_method(*args, **kwargs):
+            return await self._submit(db_method, args, kwargs, coalesce, "db")
+
+        return call_db_method
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run the given callable on the DB executor, returning its result"""
+        return await self._submit(func, args, kwargs, coalesce=False, category="executor")
+
+    def queue_depth(self) -> int:
+        """Return the number of calls waiting for or running on the executor"""
+        return self._queue_depth
+
+    async def _submit(
+        self,
+        func: Callable[..., Any],
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+        coalesce: bool,
+        category: str,
+    ) -> Any:
+        assert not self._is_shutdown, "Cannot make DB calls after AsyncMephistoDB shutdown"
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Any]" = loop.create_future()
+        key: Any = object()
+        if coalesce:
+            try:
+                key = (func, args, tuple(sorted(kwargs.items())))
+                hash(key)
+            except TypeError:
+                key = object()  # Unhashable arguments are never coalesced
+        with self._pending_lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = _PendingCall(func, args, kwargs, category=category)
+                parent_span = get_current_span()
+                if parent_span is not None:
+                    pending.parent_span = parent_span
+                    pending.queued_time = time.time()
+                self._pending[key] = pending
+                self._queue_depth += 1
+                DB_EXECUTOR_QUEUE_DEPTH.inc()
+            pending.futures.append(future)
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                loop.call_soon(self._flush)
+        result = await future
+        if isinstance(result, list) and len(pending.futures) > 1:
+            return list(result)  # Callers sharing a result each get their own list
+        return result
+
+    def _flush(self) -> None:
+        """Send every call collected this tick to the executor as one batch"""
+        with self._pending_lock:
+            batch = list(self._pending.values())
+            self._pending = {}
+            self._flush_scheduled = False
+        if len(batch) == 0:
+            return
+        DB_EXECUTOR_BATCH_SIZE.observe(len(batch))
+        try:
+            self._executor.submit(self._run_batch, batch)
+        except RuntimeError as e:
+            # The executor was shut down with calls still pending
+            for pending in batch:
+                self._mark_done()
+                for future in pending.futures:
+                    _resolve_future(future, None, e)
+
+    def _run_batch(self, batch: List[_PendingCall]) -> None:
+        for pending in batch:
+            result, error = None, None
+            start_time = time.time()
+            try:
+                result = pending.func(*pending.args, **pending.kwargs)
+            except BaseException as e:
+                error = e
+            if pending.parent_span is not None:
+                self._trace_call(pending, start_time, time.time())
+            self._mark_done()
+            for future in pending.futures:
+                try:
+                    future.get_loop().call_soon_threadsafe(_resolve_future, future, result, error)
+                except RuntimeError:
+                    logger.warning(f"Event loop closed before DB call {pending.func} returned")
+
+    def _trace_call(self, pending: _PendingCall, start_time: float, end_time: float) -> None:
+        """Record spans for the time a traced call waited on, then ran on, the executor"""
+        name = getattr(pending.func, "__qualname__", repr(pending.func))
+        record_span(
+            "db_queue",
+            pending.queued_time,
+            start_time,
+            category=pending.category,
+            parent=pending.parent_span,
+        )
+        record_span(
+            name,
+            start_time,
+            end_time,
+            category=pending.category,
+            parent=pending.parent_span,
+            callers=len(pending.futures),
+        )
+
+    def _mark_done(self) -> None:
+        with self._pending_lock:
+            self._queue_depth -= 1
+        DB_EXECUTOR_QUEUE_DEPTH.dec()
+
+    def shutdown(self) -> None:
+        """Stop the executor once any calls already sent to it finish"""
+        self._is_shutdown = True
+        self._executor.shutdown(wait=False)
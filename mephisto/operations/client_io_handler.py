@@ -7,7 +7,8 @@
 import time
 import asyncio
 from queue import Queue
-from prometheus_client import Histogram  # type: ignore
+from uuid import uuid4
+from prometheus_client import Histogram, Counter  # type: ignore
 
 from mephisto.data_model.packet import (
     Packet,
@@ -26,19 +27,32 @@ from mephisto.data_model.packet import (
 )
 from mephisto.abstractions.blueprint import AgentState
 from mephisto.data_model.agent import _AgentBase
-from mephisto.operations.datatypes import LiveTaskRun
+from mephisto.operations.datatypes import (
+    LiveTaskRun,
+    RecentIdSet,
+    LIVE_UPDATE_OVERFLOW_BLOCK,
+)
 from mephisto.abstractions._subcomponents.channel import Channel, STATUS_CHECK_TIME
-from typing import Dict, Tuple, Optional, Any, Set, TYPE_CHECKING
+from typing import Dict, List, Tuple, Optional, Any, Awaitable, TypeVar, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from mephisto.abstractions.database import MephistoDB
 
 from mephisto.utils.logger_core import get_logger, format_loud
+from mephisto.utils.tracing import new_trace_id, record_span, span, tracing_enabled
 
 logger = get_logger(name=__name__)
 
 SYSTEM_CHANNEL_ID = "mephisto"
 START_DEATH_TIME = 10
+# Number of recent live update ids remembered per agent for deduplication
+MAX_SEEN_UPDATE_IDS_PER_AGENT = 512
+# Every this many status pings, request all statuses rather than only changes
+FULL_STATUS_SYNC_INTERVAL = 10
+# Seconds a live update waits for room in a full buffer under the block policy
+LIVE_UPDATE_BACKPRESSURE_TIMEOUT = 10
+
+T = TypeVar("T")
 
 # Initialize monitoring metrics
 PACKET_PROCESSING_LATENCY = Histogram(
@@ -51,6 +65,16 @@ E2E_PACKET_LATENCY = Histogram(
     "Time spent processing packets across request lifecycle",
     ["packet_type", "stage"],
 )
+LIVE_UPDATE_QUEUE_DEPTH = Histogram(
+    "live_update_queue_depth",
+    "Number of live updates pending for an agent after each arrives",
+    buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, float("inf")],
+)
+LIVE_UPDATES_DROPPED = Counter(
+    "live_updates_dropped",
+    "Live updates dropped because an agent's buffer was full",
+    ["overflow"],
+)
 for packet_type in [
     PACKET_TYPE_SUBMIT_ONBOARDING,
     PACKET_TYPE_SUBMIT_UNIT,
@@ -78,10 +102,15 @@ class ClientIOHandler:
     messages, but operates on the level of message parsing and distribution logic.
     """
 
-    def __init__(self, db: "MephistoDB"):
+    def __init__(self, db: "MephistoDB", channel_open_timeout: float = START_DEATH_TIME):
         self.db = db
         # Tracked IO state
         self.channels: Dict[str, Channel] = {}
+        self.channel_open_timeout = channel_open_timeout
+        # Map from channel id to the loop and event awaiting that channel to open
+        self._channel_open_waiters: Dict[
+            str, Tuple[asyncio.AbstractEventLoop, asyncio.Event]
+        ] = {}
         # Map from onboarding id to agent request packet
         self.onboarding_packets: Dict[str, Tuple[Dict[str, Any], str]] = {}
         # Dict from registration id to agent id
@@ -98,7 +127,19 @@ class ClientIOHandler:
         self.is_shutdown = False
         self.last_submission_time = time.time()  # For patience tracking
 
-        self.seen_update_ids: Set[str] = set()
+        # Map from agent id to the ids of the most recent live updates from that agent
+        self.seen_update_ids: Dict[str, RecentIdSet] = {}
+        # Map from agent id to a future set once the last of that agent's packets
+        # held back by live update backpressure has been handled
+        self._held_agent_packets: Dict[str, "asyncio.Future[None]"] = {}
+
+        # Map from channel id to the last agent status sequence number its router sent
+        self.status_seqs: Dict[str, int] = {}
+        self._status_pings_sent = 0
+
+        # Identifies this handler to routers shared by several Mephisto backends,
+        # which route each agent's packets to the backend that handles it
+        self.backend_id = str(uuid4())
 
         # Deferred initializiation
         self._live_run: Optional["LiveTaskRun"] = None
@@ -151,8 +192,18 @@ class ClientIOHandler:
         return live_run
 
     def _on_channel_open(self, channel_id: str) -> None:
-        """Handler for what to do when a socket opens, we send an alive"""
+        """
+        Handler for what to do when a socket opens, we send an alive and
+        release anything waiting on this channel to open
+        """
         self._send_alive(channel_id)
+        waiter = self._channel_open_waiters.get(channel_id)
+        if waiter is not None:
+            loop, alive_event = waiter
+            try:
+                loop.call_soon_threadsafe(alive_event.set)
+            except RuntimeError:
+                pass  # Registration already gave up and closed its loop
 
     def _on_catastrophic_disconnect(self, channel_id: str) -> None:
         """On a catastrophic (unable to reconnect) disconnect event, cleanup this task"""
@@ -161,10 +212,44 @@ class ClientIOHandler:
         live_run = self.get_live_run()
         live_run.force_shutdown = True
 
+    def _trace_packet_arrival(self, packet: Packet) -> None:
+        """Start a trace for the packet, recording the hops it took to get here"""
+        if packet.trace_id is None:
+            packet.trace_id = new_trace_id()
+        hops = [
+            ("client_to_router", packet.client_timestamp, packet.router_incoming_timestamp),
+            (
+                "router_processing",
+                packet.router_incoming_timestamp,
+                packet.router_outgoing_timestamp,
+            ),
+            ("router_to_server", packet.router_outgoing_timestamp, packet.server_timestamp),
+            ("queued", packet.server_timestamp, time.time()),
+        ]
+        for name, start_time, end_time in hops:
+            if start_time is not None and end_time is not None:
+                record_span(
+                    name,
+                    start_time,
+                    end_time,
+                    category="transport",
+                    trace_id=packet.trace_id,
+                    root=True,
+                    packet_type=packet.type,
+                )
+
     async def __on_channel_message_internal(self, channel_id: str, packet: Packet) -> None:
         """Incoming message handler defers to the internal handler"""
+        if tracing_enabled():
+            self._trace_packet_arrival(packet)
         try:
-            self._on_message(packet, channel_id)
+            with span(
+                f"handle_{packet.type}",
+                category="client_io",
+                trace_id=packet.trace_id,
+                subject_id=packet.subject_id,
+            ):
+                await self._handle_in_agent_order(packet, channel_id)
         except Exception as e:
             logger.exception(
                 f"Channel {channel_id} encountered error on packet {packet}",
@@ -172,41 +257,131 @@ class ClientIOHandler:
             )
             raise
 
+    async def _handle_in_agent_order(self, packet: Packet, channel_id: str) -> None:
+        """
+        Handle a packet after any earlier packets from its agent that are held
+        back by live update backpressure, so that a submit can't overtake the
+        agent's live updates. Status responses wait on every agent they cover.
+        """
+        if packet.type == PACKET_TYPE_RETURN_STATUSES:
+            held = [
+                asyncio.shield(self._held_agent_packets[agent_id])
+                for agent_id in self._get_status_agent_ids(packet)
+                if agent_id in self._held_agent_packets
+            ]
+            if len(held) > 0:
+                await asyncio.gather(*held)
+            self._on_message(packet, channel_id)
+            return
+
+        agent_id = packet.subject_id
+        previous = self._held_agent_packets.get(agent_id)
+        if previous is None and not self._live_update_must_wait(packet):
+            self._on_message(packet, channel_id)
+            return
+        handled: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._held_agent_packets[agent_id] = handled
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            if packet.type == PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE:
+                await self._wait_for_live_update_space(packet)
+            self._on_message(packet, channel_id)
+        finally:
+            handled.set_result(None)
+            if self._held_agent_packets.get(agent_id) is handled:
+                del self._held_agent_packets[agent_id]
+
+    def _get_status_agent_ids(self, packet: Packet) -> List[str]:
+        """Return the ids of the agents a status response covers"""
+        statuses = packet.data.get("statuses", packet.data)
+        return list(statuses.keys())
+
+    def _live_update_must_wait(self, packet: Packet) -> bool:
+        """Whether this is a live update that backpressure would hold back"""
+        if packet.type != PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE:
+            return False
+        agent = self.get_live_run().worker_pool.get_agent_for_id(packet.subject_id)
+        if agent is None or agent.pending_actions.overflow != LIVE_UPDATE_OVERFLOW_BLOCK:
+            return False
+        return agent.pending_actions.full()
+
+    async def _wait_for_live_update_space(self, packet: Packet) -> None:
+        """
+        Hold back a live update until its agent's buffer has room, if the
+        run applies backpressure rather than dropping updates
+        """
+        agent = self.get_live_run().worker_pool.get_agent_for_id(packet.subject_id)
+        if agent is None or agent.pending_actions.overflow != LIVE_UPDATE_OVERFLOW_BLOCK:
+            return
+        if not await agent.pending_actions.wait_for_space_async(LIVE_UPDATE_BACKPRESSURE_TIMEOUT):
+            logger.warning(
+                f"{agent} has not read live updates in {LIVE_UPDATE_BACKPRESSURE_TIMEOUT} seconds, "
+                "dropping incoming update"
+            )
+
     def _on_channel_message(self, channel_id: str, packet: Packet) -> None:
         """Channel handler wrapper that passes handling to the local loop"""
         self.get_live_run().loop_wrap.execute_coro(
             self.__on_channel_message_internal(channel_id, packet)
         )
 
-    def _register_channel(self, channel: Channel) -> str:
-        """Register this channel"""
+    def _run_until_complete(self, coro: Awaitable[T]) -> T:
+        """
+        Run the given coroutine to completion on a private event loop, for
+        synchronous callers that aren't running inside of an event loop
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    async def _register_channel_async(
+        self, channel: Channel, timeout: Optional[float] = None
+    ) -> str:
+        """
+        Open and register this channel, resolving once the channel reports
+        that it's alive. Raises ConnectionRefusedError after the timeout.
+        """
         channel_id = channel.channel_id
+        if timeout is None:
+            timeout = self.channel_open_timeout
 
         self.channels[channel_id] = channel
 
-        channel.open()
-        self._send_alive(channel_id)
-        start_time = time.time()
-        while not channel.is_alive():
-            if time.time() - start_time > START_DEATH_TIME:
-                # TODO(OWN) Ask channel why it might have failed to connect?
-                self.channels[channel_id].close()
-                raise ConnectionRefusedError(  # noqa F821 we only support py3
-                    "Was not able to establish a connection with the server, "
-                    "please try to run again. If that fails,"
-                    "please launch with mephisto.log_level=debug and watch for "
-                    "clear errors. If this doesn't help, feel free to open an issue "
-                    "with your debug logs on the Mephisto github."
-                )
-            try:
-                self._send_alive(channel_id)
-            except Exception:
-                pass
-            time.sleep(0.3)
+        # Register the waiter before opening, as the channel may open from its
+        # own thread before we get a chance to check on it
+        alive_event = asyncio.Event()
+        self._channel_open_waiters[channel_id] = (asyncio.get_running_loop(), alive_event)
+        try:
+            channel.open()
+            if channel.is_alive():
+                alive_event.set()
+            await asyncio.wait_for(alive_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            # TODO(OWN) Ask channel why it might have failed to connect?
+            self.channels[channel_id].close()
+            raise ConnectionRefusedError(  # noqa F821 we only support py3
+                "Was not able to establish a connection with the server, "
+                "please try to run again. If that fails,"
+                "please launch with mephisto.log_level=debug and watch for "
+                "clear errors. If this doesn't help, feel free to open an issue "
+                "with your debug logs on the Mephisto github."
+            )
+        finally:
+            self._channel_open_waiters.pop(channel_id, None)
         return channel_id
 
-    def launch_channels(self) -> None:
-        """Launch and register all of the channels for this live run to this IO handler"""
+    def _register_channel(self, channel: Channel) -> str:
+        """Register this channel, blocking until it is alive"""
+        return self._run_until_complete(self._register_channel_async(channel))
+
+    async def launch_channels_async(self) -> None:
+        """
+        Launch and register all of the channels for this live run to this IO handler,
+        opening them concurrently and resolving once all of them are alive
+        """
         live_run = self.get_live_run()
 
         channels = live_run.architect.get_channels(
@@ -214,14 +389,31 @@ class ClientIOHandler:
             self._on_catastrophic_disconnect,
             self._on_channel_message,
         )
-        for channel in channels:
-            self._register_channel(channel)
+        results = await asyncio.gather(
+            *[self._register_channel_async(channel) for channel in channels],
+            return_exceptions=True,
+        )
+        failures = [r for r in results if isinstance(r, BaseException)]
+        if len(failures) > 0:
+            # Don't leave the channels that did open running without a live run
+            for channel in channels:
+                if not channel.is_closed():
+                    channel.close()
+                self.channels.pop(channel.channel_id, None)
+            raise failures[0]
 
         async def launch_status_task():
             self._status_task = asyncio.create_task(self._ping_statuses_while_alive())
 
         live_run.loop_wrap.execute_coro(launch_status_task())
 
+    def launch_channels(self) -> None:
+        """
+        Launch and register all of the channels for this live run to this IO handler.
+        Blocks until all channels are alive, which takes as long as the slowest one.
+        """
+        self._run_until_complete(self.launch_channels_async())
+
     def associate_agent_with_registration(
         self, agent_id: str, request_id: str, registration_id: str
     ) -> None:
@@ -233,12 +425,20 @@ class ClientIOHandler:
         self.agent_id_to_channel_id[agent_id] = channel_id
         self.agents_by_registration_id[registration_id] = agent_id
 
+    def release_agent(self, agent_id: str) -> None:
+        """
+        Drop the per-agent state tracked for an agent that has finished,
+        as no further live updates will be processed for it
+        """
+        self.seen_update_ids.pop(agent_id, None)
+
     def _send_alive(self, channel_id: str) -> bool:
         logger.info("Sending alive")
         return self.channels[channel_id].enqueue_send(
             Packet(
                 packet_type=PACKET_TYPE_ALIVE,
                 subject_id=SYSTEM_CHANNEL_ID,
+                data={"backend_id": self.backend_id},
             )
         )
 
@@ -256,8 +456,15 @@ class ClientIOHandler:
         agent = live_run.worker_pool.get_agent_for_id(packet.subject_id)
         assert agent is not None, f"Could not find given agent: {packet.subject_id}"
 
-        agent.pending_actions.put(packet.data)
-        agent.has_live_update.set()
+        pending_actions = agent.pending_actions
+        if not pending_actions.put(packet.data):
+            LIVE_UPDATES_DROPPED.labels(overflow=pending_actions.overflow).inc()
+            if pending_actions.dropped == 1:
+                logger.warning(
+                    f"Live update buffer for {agent} is full at {pending_actions.capacity} "
+                    f"updates, dropping updates under the {pending_actions.overflow} policy"
+                )
+        LIVE_UPDATE_QUEUE_DEPTH.observe(len(pending_actions))
 
     def _on_submit_unit(self, packet: Packet, _channel_id: str):
         """Handle an action as sent from an agent, enqueuing to the agent"""
@@ -354,15 +561,28 @@ class ClientIOHandler:
         base_data = {"request_id": request_id}
         for key, val in additional_data.items():
             base_data[key] = val
+        request_packet = self.request_id_to_packet[request_id]
         self.message_queue.put(
             Packet(
                 packet_type=PACKET_TYPE_AGENT_DETAILS,
                 subject_id=self.request_id_to_channel_id[request_id],
                 data=base_data,
+                trace_id=request_packet.trace_id,
             )
         )
         self.process_outgoing_queue(self.message_queue)
-        self.log_metrics_for_packet(self.request_id_to_packet[request_id])
+        self.log_metrics_for_packet(request_packet)
+        if request_packet.trace_id is not None:
+            # Covers the whole registration, which may span several tasks
+            record_span(
+                "register_agent",
+                request_packet.server_timestamp,
+                time.time(),
+                category="client_io",
+                trace_id=request_packet.trace_id,
+                root=True,
+                failure_reason=base_data.get("failure_reason"),
+            )
         # TODO Sometimes this request ID is lost, and we don't quite know why
         del self.request_id_to_channel_id[request_id]
         del self.request_id_to_packet[request_id]
@@ -384,16 +604,22 @@ class ClientIOHandler:
                 self._on_submit_metadata(packet)
             elif packet.type == PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE:
                 update_id = packet.data.get("update_id")
-                if update_id is not None and update_id in self.seen_update_ids:
+                seen_ids = self.seen_update_ids.get(packet.subject_id)
+                if update_id is not None and seen_ids is not None and update_id in seen_ids:
                     return  # Processing duplicated packet
                 self._on_live_update(packet, channel_id)
                 self.log_metrics_for_packet(packet)
-                self.seen_update_ids.add(update_id)
+                if update_id is not None:
+                    if seen_ids is None:
+                        seen_ids = RecentIdSet(MAX_SEEN_UPDATE_IDS_PER_AGENT)
+                        self.seen_update_ids[packet.subject_id] = seen_ids
+                    seen_ids.add(update_id)
             elif packet.type == PACKET_TYPE_REGISTER_AGENT:
                 self._register_agent(packet, channel_id)
             elif packet.type == PACKET_TYPE_RETURN_STATUSES:
                 # Record this status response
-                live_run.worker_pool.handle_updated_agent_status(packet.data)
+                status_map = self._get_status_updates(packet, channel_id)
+                live_run.worker_pool.handle_updated_agent_status(status_map)
                 self.log_metrics_for_packet(packet)
             elif packet.type == PACKET_TYPE_ERROR:
                 self._log_frontend_error(packet)
@@ -403,16 +629,32 @@ class ClientIOHandler:
                 # PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE, PACKET_TYPE_AGENT_DETAILS
                 raise Exception(f"Unexpected packet type {packet.type}")
 
+    def _get_status_updates(self, packet: Packet, channel_id: str) -> Dict[str, str]:
+        """
+        Extract the agent status map from a status response, recording the
+        sequence number it is current as of. Routers that don't support
+        deltas respond with the full status map directly.
+        """
+        if "status_seq" not in packet.data:
+            return packet.data
+        self.status_seqs[channel_id] = packet.data["status_seq"]
+        return packet.data["statuses"]
+
     def _request_status_update(self) -> None:
         """
-        Check last round of statuses, then request
-        an update from the server on all agent's current status
+        Check last round of statuses, then request an update from the server
+        on the agents whose status changed since its last response. Every
+        FULL_STATUS_SYNC_INTERVAL requests ask for all agents instead, to
+        reconcile any status pushes that were lost.
         """
+        full_sync = self._status_pings_sent % FULL_STATUS_SYNC_INTERVAL == 0
+        self._status_pings_sent += 1
         for channel_id, channel in self.channels.items():
+            since_seq = 0 if full_sync else self.status_seqs.get(channel_id, 0)
             send_packet = Packet(
                 packet_type=PACKET_TYPE_REQUEST_STATUSES,
                 subject_id=SYSTEM_CHANNEL_ID,
-                data={},
+                data={"since_seq": since_seq},
             )
             channel.enqueue_send(send_packet)
 
@@ -430,6 +672,22 @@ class ClientIOHandler:
         )
         self._get_channel_for_agent(agent_id).enqueue_send(data_packet)
 
+    def broadcast_live_update(self, agent_ids: List[str], data: Dict[str, Any]):
+        """
+        Send the same live data packet to each of the given agent ids, only
+        serializing the payload once for all of them
+        """
+        if len(agent_ids) == 0:
+            return
+        data_packet = Packet(
+            packet_type=PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE,
+            subject_id=agent_ids[0],
+            data=data,
+        )
+        for agent_id in agent_ids:
+            agent_packet = data_packet.copy_for_subject(agent_id)
+            self._get_channel_for_agent(agent_id).enqueue_send(agent_packet)
+
     def send_status_update(self, agent_id: str, status: str):
         """Update the status for the given agent"""
         status_packet = Packet(
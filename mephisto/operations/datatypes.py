@@ -11,8 +11,20 @@ to facilitate executing task runs.
 
 from dataclasses import dataclass
 import asyncio
+from collections import deque
 from functools import partial
-from typing import Dict, Set, Optional, List, Any, Union, TYPE_CHECKING
+from typing import (
+    Deque,
+    Dict,
+    Set,
+    Optional,
+    List,
+    Any,
+    Sequence,
+    Tuple,
+    Union,
+    TYPE_CHECKING,
+)
 import threading
 
 if TYPE_CHECKING:
@@ -25,6 +37,8 @@ if TYPE_CHECKING:
     from mephisto.data_model.agent import Agent, OnboardingAgent
     from mephisto.operations.client_io_handler import ClientIOHandler
     from mephisto.operations.worker_pool import WorkerPool
+    from mephisto.operations.agent_state_persister import AgentStatePersister
+    from mephisto.abstractions.blueprints.mixins.use_gold_unit import GoldQualificationCounters
 
 
 class LoopWrapper:
@@ -51,6 +65,259 @@ class LoopWrapper:
             self.loop.call_soon_threadsafe(_async_execute, f)
 
 
+class RecentIdSet:
+    """
+    Set that only remembers the most recently added ids, evicting the
+    oldest once more than max_size have been added. Used to deduplicate
+    retransmitted packets, which only ever repeat recent ids.
+    """
+
+    def __init__(self, max_size: int):
+        assert max_size > 0, "RecentIdSet must be able to hold at least one id"
+        self.max_size = max_size
+        self._ids: Set[str] = set()
+        self._order: Deque[str] = deque()
+
+    def add(self, item_id: str) -> None:
+        """Add the given id, evicting the oldest id if at capacity"""
+        if item_id in self._ids:
+            return
+        if len(self._order) >= self.max_size:
+            self._ids.discard(self._order.popleft())
+        self._order.append(item_id)
+        self._ids.add(item_id)
+
+    def __contains__(self, item_id: object) -> bool:
+        return item_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+class AwaitableEvent:
+    """
+    Drop-in for threading.Event that can also be awaited from an event loop.
+    Setting it from any thread wakes both blocked threads and any coroutines
+    awaiting it, on whichever loops they are waiting in.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = []
+        self._thread_waiters: List[threading.Event] = []
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def set(self) -> None:
+        with self._lock:
+            self._event.set()
+            waiters, self._waiters = self._waiters, []
+            thread_waiters, self._thread_waiters = self._thread_waiters, []
+        for thread_waiter in thread_waiters:
+            thread_waiter.set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve_future, future)
+            except RuntimeError:
+                pass  # The waiting loop has already been closed
+
+    def clear(self) -> None:
+        self._event.clear()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block the calling thread until set, or until the timeout passes"""
+        return self._event.wait(timeout)
+
+    async def wait_async(self, timeout: Optional[float] = None) -> bool:
+        """Await being set on the running loop, or until the timeout passes"""
+        return await wait_for_any_async([self], timeout)
+
+    def _add_waiter(self, waiter: Union[threading.Event, Tuple[Any, Any]]) -> bool:
+        """Register a waiter to release on set, returning False if already set"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            if isinstance(waiter, threading.Event):
+                self._thread_waiters.append(waiter)
+            else:
+                self._waiters.append(waiter)
+            return True
+
+    def _remove_waiter(self, waiter: Union[threading.Event, Tuple[Any, Any]]) -> None:
+        with self._lock:
+            waiters: List[Any] = (
+                self._thread_waiters if isinstance(waiter, threading.Event) else self._waiters
+            )
+            if waiter in waiters:
+                waiters.remove(waiter)
+
+
+def _resolve_future(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def wait_for_any(events: Sequence[AwaitableEvent], timeout: Optional[float] = None) -> bool:
+    """
+    Block the calling thread until any of the given events is set, or until
+    the timeout passes. Returns whether any of them are set.
+    """
+    waiter = threading.Event()
+    registered = []
+    try:
+        for event in events:
+            if not event._add_waiter(waiter):
+                return True
+            registered.append(event)
+        waiter.wait(timeout)
+    finally:
+        for event in registered:
+            event._remove_waiter(waiter)
+    return any(event.is_set() for event in events)
+
+
+async def wait_for_any_async(
+    events: Sequence[AwaitableEvent], timeout: Optional[float] = None
+) -> bool:
+    """
+    Await any of the given events being set on the running loop, or until
+    the timeout passes. Returns whether any of them are set.
+    """
+    loop = asyncio.get_running_loop()
+    future: "asyncio.Future[None]" = loop.create_future()
+    waiter = (loop, future)
+    registered = []
+    try:
+        for event in events:
+            if not event._add_waiter(waiter):
+                return True
+            registered.append(event)
+        await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for event in registered:
+            event._remove_waiter(waiter)
+    return any(event.is_set() for event in events)
+
+
+LIVE_UPDATE_OVERFLOW_DROP_OLDEST = "drop_oldest"
+LIVE_UPDATE_OVERFLOW_DROP_NEWEST = "drop_newest"
+LIVE_UPDATE_OVERFLOW_BLOCK = "block"
+LIVE_UPDATE_OVERFLOW_POLICIES = [
+    LIVE_UPDATE_OVERFLOW_DROP_OLDEST,
+    LIVE_UPDATE_OVERFLOW_DROP_NEWEST,
+    LIVE_UPDATE_OVERFLOW_BLOCK,
+]
+DEFAULT_LIVE_UPDATE_BUFFER_SIZE = 1024
+
+
+class LiveUpdateBuffer:
+    """
+    Bounded single-producer/single-consumer buffer of an agent's incoming
+    live updates. The producer only appends and the consumer only pops, both
+    atomic deque operations, so neither side takes a lock per message. The
+    has_items event wakes a waiting consumer, and is only ever cleared by the
+    consumer, re-checking afterwards so a concurrent put is never missed.
+
+    When full, put applies the overflow policy: drop the oldest pending
+    update, or drop the new one. Under the block policy producers should
+    first await wait_for_space_async, which holds them back in arrival
+    order until the consumer catches up (or a timeout, when the new update
+    is dropped).
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_LIVE_UPDATE_BUFFER_SIZE,
+        overflow: str = LIVE_UPDATE_OVERFLOW_DROP_OLDEST,
+    ):
+        self._items: Deque[Any] = deque()
+        self.has_items = AwaitableEvent()
+        self._has_space = AwaitableEvent()
+        self._has_space.set()
+        self._space_lock: Optional[asyncio.Lock] = None
+        self.dropped = 0
+        self.max_depth = 0
+        self.set_limits(capacity, overflow)
+
+    def set_limits(self, capacity: int, overflow: str) -> None:
+        """Update the capacity and overflow policy of this buffer"""
+        assert capacity > 0, "LiveUpdateBuffer must be able to hold at least one update"
+        assert (
+            overflow in LIVE_UPDATE_OVERFLOW_POLICIES
+        ), f"Overflow policy {overflow} not one of {LIVE_UPDATE_OVERFLOW_POLICIES}"
+        self.capacity = capacity
+        self.overflow = overflow
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def empty(self) -> bool:
+        return len(self._items) == 0
+
+    def full(self) -> bool:
+        return len(self._items) >= self.capacity
+
+    def put(self, item: Any) -> bool:
+        """
+        Add an update from the producer side, returning False if the
+        overflow policy had to drop an update to do so
+        """
+        dropped = False
+        if self.full():
+            dropped = True
+            self.dropped += 1
+            if self.overflow != LIVE_UPDATE_OVERFLOW_DROP_OLDEST:
+                return False
+            try:
+                self._items.popleft()
+            except IndexError:
+                pass  # The consumer took it first
+        self._items.append(item)
+        self.max_depth = max(self.max_depth, len(self._items))
+        self.has_items.set()
+        return not dropped
+
+    def get_nowait(self) -> Optional[Any]:
+        """Take the oldest update from the consumer side, or None if empty"""
+        try:
+            item = self._items.popleft()
+        except IndexError:
+            # Leave has_items alone, as it may have been set to release the
+            # consumer for another reason (such as a disconnect)
+            return None
+        if len(self._items) == 0:
+            self.has_items.clear()
+            if len(self._items) > 0:
+                self.has_items.set()  # A put raced with the clear
+        if not self._has_space.is_set():
+            self._has_space.set()
+        return item
+
+    async def wait_for_space_async(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait on the running loop until there is room for another update, in
+        the order producers started waiting. Returns False on timeout.
+        """
+        if self._space_lock is None:
+            self._space_lock = asyncio.Lock()
+        async with self._space_lock:
+            loop = asyncio.get_running_loop()
+            deadline = None if timeout is None else loop.time() + timeout
+            while self.full():
+                self._has_space.clear()
+                if not self.full():
+                    break  # The consumer took an update before the clear
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                await self._has_space.wait_async(remaining)
+            return True
+
+
 @dataclass
 class LiveTaskRun:
     task_run: "TaskRun"
@@ -68,6 +335,11 @@ class LiveTaskRun:
 
     loop_wrap: LoopWrapper
 
+    # Write-behind saving of agent states, if enabled for the run
+    state_persister: Optional["AgentStatePersister"] = None
+    # In-memory gold counts of the run's blueprint, if it uses golds
+    gold_counters: Optional["GoldQualificationCounters"] = None
+
     # Toggle used to tell operator to force shutdown
     # of this task run in error conditions
     force_shutdown: bool = False
@@ -76,6 +348,10 @@ class LiveTaskRun:
         self.task_runner.shutdown()
         self.worker_pool.shutdown()
         self.client_io.shutdown()
+        if self.state_persister is not None:
+            self.state_persister.shutdown()
+        if self.gold_counters is not None:
+            self.gold_counters.flush()
 
 
 class WorkerFailureReasons:
@@ -13,7 +13,7 @@ from mephisto.utils.logger_core import get_logger, warn_once
 from mephisto.utils.dirs import get_run_file_dir
 from dataclasses import dataclass, field, fields, Field
 from omegaconf import OmegaConf, MISSING, DictConfig
-from typing import List, Type, Dict, Any, TYPE_CHECKING
+from typing import List, Type, Dict, Any, Optional, TYPE_CHECKING
 
 
 if TYPE_CHECKING:
@@ -28,6 +28,16 @@ config = ConfigStoreWithProvider("mephisto")
 @dataclass
 class DatabaseArgs:
     _database_type: str = "singleton"  # default DB is performant singleton
+    archive_after_days: Optional[float] = field(
+        default=None,
+        metadata={
+            "help": (
+                "When set, the Operator archives completed runs started at least this many "
+                "days ago on shutdown, moving their rows out of the live tables. Archived "
+                "runs remain readable for review."
+            )
+        },
+    )
 
 
 @dataclass
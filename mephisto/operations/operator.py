@@ -31,8 +31,20 @@ from mephisto.abstractions.database import MephistoDB, EntryDoesNotExistExceptio
 from mephisto.data_model.qualification import QUAL_NOT_EXIST
 from mephisto.utils.qualifications import make_qualification_dict
 from mephisto.operations.task_launcher import TaskLauncher
-from mephisto.operations.client_io_handler import ClientIOHandler
+from mephisto.operations.client_io_handler import ClientIOHandler, START_DEATH_TIME
 from mephisto.operations.worker_pool import WorkerPool
+from mephisto.operations.agent_state_persister import (
+    AgentStatePersister,
+    DEFAULT_AGENT_STATE_WRITE_WINDOW,
+)
+from mephisto.operations.profiler import (
+    DEFAULT_PROFILE_DURATION,
+    PROFILE_SIGNAL,
+    SamplingProfiler,
+    clear_profile_ready,
+    mark_profile_ready,
+    pop_profile_request,
+)
 from mephisto.operations.registry import (
     get_blueprint_from_type,
     get_crowd_provider_from_type,
@@ -75,7 +87,7 @@ class Operator:
     architecture works in order to build custom jobs or workflows.
     """
 
-    def __init__(self, db: "MephistoDB"):
+    def __init__(self, db: "MephistoDB", launch_metrics: bool = True):
         self.db = db
         self._task_runs_tracked: Dict[str, LiveTaskRun] = {}
         self.is_shutdown = False
@@ -96,8 +108,43 @@ class Operator:
             self._track_and_kill_runs(),
         )
         self._stop_task: Optional[asyncio.Task] = None
-        self._using_prometheus = launch_prometheus_server()
-        start_metrics_server()
+        # Age past which completed runs are archived on shutdown, if launched with one
+        self._archive_after_days: Optional[float] = None
+        self._using_prometheus = False
+        if launch_metrics:
+            self._using_prometheus = launch_prometheus_server()
+            start_metrics_server()
+
+        # Allow profiling a running operator with `mephisto profile <pid>`
+        self._profiler = SamplingProfiler(self._event_loop)
+        self._old_profile_handler = None
+        self._profile_handler_installed = False
+        if PROFILE_SIGNAL is not None and threading.current_thread() is threading.main_thread():
+            self._old_profile_handler = signal.signal(PROFILE_SIGNAL, self._on_profile_signal)
+            self._profile_handler_installed = True
+            mark_profile_ready()
+
+    def _on_profile_signal(self, sig, frame) -> None:
+        request = pop_profile_request()
+        if not self.start_profiling(duration=request.get("duration", DEFAULT_PROFILE_DURATION)):
+            logger.warning("Ignoring profile request, a profile is already running")
+
+    def start_profiling(self, duration: float = DEFAULT_PROFILE_DURATION) -> bool:
+        """
+        Sample the stacks of this operator's threads for the given number of seconds,
+        writing a flamegraph-compatible profile next to the run's logs. Returns False
+        if a profile is already running.
+        """
+        return self._profiler.start(duration)
+
+    def _remove_profile_handler(self) -> None:
+        if not self._profile_handler_installed:
+            return
+        if threading.current_thread() is not threading.main_thread():
+            return  # Signal handlers can only be changed from the main thread
+        clear_profile_ready()
+        signal.signal(PROFILE_SIGNAL, self._old_profile_handler or signal.SIG_DFL)
+        self._profile_handler_installed = False
 
     def get_running_task_runs(self) -> Dict[str, LiveTaskRun]:
         """Return the currently running task runs and their handlers"""
@@ -182,7 +229,18 @@ class Operator:
         )
 
         worker_pool = WorkerPool(self.db)
-        client_io = ClientIOHandler(self.db)
+        client_io = ClientIOHandler(
+            self.db,
+            channel_open_timeout=run_config.architect.get(
+                "channel_open_timeout", START_DEATH_TIME
+            ),
+        )
+        write_window = run_config.task.get(
+            "agent_state_write_window", DEFAULT_AGENT_STATE_WRITE_WINDOW
+        )
+        state_persister = (
+            AgentStatePersister(self.db, window=write_window) if write_window > 0 else None
+        )
         live_run = LiveTaskRun(
             task_run=task_run,
             architect=architect,
@@ -194,6 +252,8 @@ class Operator:
             client_io=client_io,
             worker_pool=worker_pool,
             loop_wrap=self._loop_wrapper,
+            state_persister=state_persister,
+            gold_counters=getattr(blueprint, "gold_counters", None),
         )
         worker_pool.register_run(live_run)
         client_io.register_run(live_run)
@@ -216,6 +276,9 @@ class Operator:
         Parse the given arguments and launch a job.
         """
         set_mephisto_log_level(level=run_config.get("log_level", "info"))
+        archive_after_days = run_config.get("database", {}).get("archive_after_days", None)
+        if archive_after_days is not None:
+            self._archive_after_days = archive_after_days
 
         requester, provider_type = self._get_requester_and_provider_from_config(run_config)
 
@@ -319,7 +382,7 @@ class Operator:
             runs_to_check = list(self._task_runs_tracked.values())
             for tracked_run in runs_to_check:
                 await asyncio.sleep(0.01)  # Low pri, allow to be interrupted
-                patience = tracked_run.task_run.get_task_args().no_submission_patience
+                patience = tracked_run.task_run.config.no_submission_patience
                 if patience < time.time() - tracked_run.client_io.last_submission_time:
                     logger.warn(
                         f"It has been greater than the set no_submission_patience of {patience} "
@@ -337,8 +400,15 @@ class Operator:
                         continue
 
                 tracked_run.client_io.shutdown()
-                tracked_run.worker_pool.shutdown()
+                # Async supervisors still finishing use the worker pool's db
+                # executor, so they must exit before the pool shuts down
                 tracked_run.task_runner.shutdown()
+                await tracked_run.task_runner.wait_for_async_runs_exit()
+                tracked_run.worker_pool.shutdown()
+                if tracked_run.state_persister is not None:
+                    tracked_run.state_persister.shutdown()
+                if tracked_run.gold_counters is not None:
+                    tracked_run.gold_counters.flush()
                 tracked_run.task_launcher.shutdown()
                 tracked_run.task_launcher.expire_units()
                 tracked_run.architect.shutdown()
@@ -482,6 +552,24 @@ class Operator:
                 self._event_loop.create_task(self.shutdown_async())
             if self._using_prometheus:
                 shutdown_prometheus_server()
+            self._profiler.stop()
+            self._remove_profile_handler()
+            self._archive_completed_runs()
+
+    def _archive_completed_runs(self) -> None:
+        """Archive completed runs older than the configured age, if one was set"""
+        if self._archive_after_days is None:
+            return
+        try:
+            archived = self.db.archive_completed_task_runs(min_age_days=self._archive_after_days)
+        except NotImplementedError:
+            logger.warning(f"{self.db.__class__.__name__} can't archive runs, skipping")
+            return
+        except Exception:
+            logger.exception("Failed to archive completed task runs")
+            return
+        if len(archived) > 0:
+            logger.info(f"Archived completed task runs {', '.join(archived)}")
 
     def validate_and_run_config(
         self, run_config: DictConfig, shared_state: Optional[SharedTaskState] = None
@@ -526,10 +614,11 @@ class Operator:
         if not self.is_shutdown:
             self.shutdown()
 
-    def _run_loop_until(self, condition_met: Callable[[], bool], timeout) -> bool:
+    def run_loop_until(self, condition_met: Callable[[], bool], timeout: float) -> bool:
         """
-        Function to run the event loop until a specific condition is met, or
-        a timeout elapses
+        Run the event loop from the calling thread until the given condition is
+        met, returning False if the timeout elapses first. For driving the
+        operator from scripts and tests that don't use wait_for_runs_then_shutdown.
         """
         asyncio.set_event_loop(self._event_loop)
 
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+On-demand sampling profiler for a running operator, started with
+`mephisto profile <pid>` (or by sending the operator SIGUSR1).
+"""
+
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from mephisto.utils.dirs import get_mephisto_tmp_dir
+from mephisto.utils.logger_core import get_logger
+
+from typing import Dict, List, Optional
+
+logger = get_logger(name=__name__)
+
+# Signal that starts a profile on a running operator, where the platform has one
+PROFILE_SIGNAL = getattr(signal, "SIGUSR1", None)
+DEFAULT_PROFILE_DURATION = 30  # seconds
+# Seconds between stack samples
+DEFAULT_SAMPLE_INTERVAL = 0.01
+# Seconds the event loop can go without running callbacks before it's flagged as blocked
+DEFAULT_SLOW_CALLBACK_THRESHOLD = 0.1
+
+
+def get_profile_request_file(pid: int) -> str:
+    """File the CLI leaves options in for the operator with the given pid"""
+    return os.path.join(get_mephisto_tmp_dir(), f"profile_request_{pid}.json")
+
+
+def get_profile_ready_file(pid: int) -> str:
+    """File an operator keeps while its process has a profile signal handler"""
+    return os.path.join(get_mephisto_tmp_dir(), f"profile_ready_{pid}")
+
+
+def mark_profile_ready() -> None:
+    """Show request_profile that this process handles the profile signal"""
+    os.makedirs(get_mephisto_tmp_dir(), exist_ok=True)
+    with open(get_profile_ready_file(os.getpid()), "w") as ready_file:
+        ready_file.write(str(time.time()))
+
+
+def clear_profile_ready() -> None:
+    """Stop request_profile from signaling this process"""
+    try:
+        os.unlink(get_profile_ready_file(os.getpid()))
+    except FileNotFoundError:
+        pass
+
+
+def request_profile(pid: int, duration: float = DEFAULT_PROFILE_DURATION) -> None:
+    """
+    Ask the operator running in the given process to profile itself. Raises
+    ProcessLookupError rather than signaling a process that isn't an operator
+    accepting profile requests, as the signal's default action kills it.
+    """
+    assert PROFILE_SIGNAL is not None, "Profiling a running operator requires SIGUSR1"
+    if not os.path.exists(get_profile_ready_file(pid)):
+        raise ProcessLookupError(f"No operator accepting profile requests has pid {pid}")
+    request_path = get_profile_request_file(pid)
+    with open(request_path, "w") as request_file:
+        json.dump({"duration": duration}, request_file)
+    try:
+        os.kill(pid, PROFILE_SIGNAL)
+    except ProcessLookupError:
+        # No process will ever pop this request, and the marker was left by one that died
+        os.unlink(request_path)
+        os.unlink(get_profile_ready_file(pid))
+        raise
+
+
+def pop_profile_request() -> Dict[str, float]:
+    """Read and clear the options left for this process by request_profile"""
+    request_file = get_profile_request_file(os.getpid())
+    try:
+        with open(request_file) as request_fp:
+            request = json.load(request_fp)
+        os.unlink(request_file)
+    except (OSError, ValueError):
+        return {}
+    return request
+
+
+def get_default_profile_dir() -> str:
+    """Profiles go next to the run's logs in the hydra output dir, if there is one"""
+    try:
+        from hydra.core.hydra_config import HydraConfig
+
+        if HydraConfig.initialized():
+            return os.path.join(HydraConfig.get().runtime.output_dir, "profiles")
+    except ImportError:
+        pass
+    return os.path.join(get_mephisto_tmp_dir(), "profiles")
+
+
+def _format_frame(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread (the event loop, channel threads, TaskRunner
+    threads and so on) from a background thread for a set window, then writes them
+    out in the folded format read by flamegraph.pl and speedscope. While running,
+    it also watches the given event loop, logging the stack of any callback that
+    blocks it for longer than slow_callback_threshold.
+    """
+
+    def __init__(
+        self,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        output_dir: Optional[str] = None,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+        slow_callback_threshold: float = DEFAULT_SLOW_CALLBACK_THRESHOLD,
+    ):
+        self.loop = loop
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.slow_callback_threshold = slow_callback_threshold
+        self.slow_callbacks: List[str] = []
+        self.last_profile_path: Optional[str] = None
+        self._samples: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._start_time = 0.0
+        # Event loop watchdog state, for the tick the sampler is waiting on
+        self._loop_thread_id: Optional[int] = None
+        self._tick_sent_at: Optional[float] = None
+        self._tick_flagged = False
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float = DEFAULT_PROFILE_DURATION) -> bool:
+        """Start a profile for the given number of seconds, unless one is running"""
+        with self._lock:
+            if self.is_running():
+                return False
+            self._samples = Counter()
+            self.slow_callbacks = []
+            self._tick_sent_at = None
+            self._tick_flagged = False
+            self._stop_event.clear()
+            self._start_time = time.time()
+            self._thread = threading.Thread(
+                target=self._run, args=(duration,), name="mephisto-profiler", daemon=True
+            )
+            self._thread.start()
+        logger.info(f"Profiling for {duration} seconds")
+        return True
+
+    def stop(self) -> None:
+        """End a running profile early, still writing out what it collected"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self, duration: float) -> None:
+        end_time = time.monotonic() + duration
+        own_id = threading.get_ident()
+        while not self._stop_event.is_set() and time.monotonic() < end_time:
+            self._check_loop()
+            self._sample(own_id)
+            self._stop_event.wait(self.sample_interval)
+        try:
+            self.write_profile()
+        except OSError:
+            logger.exception("Could not write out profile")
+
+    def _sample(self, own_id: int) -> None:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_format_frame(frame))
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, str(thread_id)))
+            self._samples[";".join(reversed(stack))] += 1
+
+    def _on_loop_tick(self) -> None:
+        """Runs on the event loop, showing it's still getting to callbacks"""
+        self._loop_thread_id = threading.get_ident()
+        sent_at = self._tick_sent_at
+        if sent_at is not None and self._tick_flagged:
+            logger.warning(f"Event loop was blocked for {time.monotonic() - sent_at:.2f} seconds")
+        self._tick_sent_at = None
+
+    def _check_loop(self) -> None:
+        """Post a tick to the loop, flagging it if the last one hasn't run in time"""
+        loop = self.loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            return
+        sent_at = self._tick_sent_at
+        if sent_at is None:
+            self._tick_flagged = False
+            self._tick_sent_at = time.monotonic()
+            try:
+                loop.call_soon_threadsafe(self._on_loop_tick)
+            except RuntimeError:
+                self._tick_sent_at = None  # Loop closed under us
+            return
+        blocked_for = time.monotonic() - sent_at
+        if self._tick_flagged or blocked_for < self.slow_callback_threshold:
+            return
+        self._tick_flagged = True
+        frame = sys._current_frames().get(self._loop_thread_id or -1)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "(unknown)\n"
+        report = f"Event loop blocked for over {blocked_for:.2f} seconds in:\n{stack}"
+        self.slow_callbacks.append(report)
+        logger.warning(report)
+
+    def write_profile(self) -> Optional[str]:
+        """Write the collected stacks out, returning the path to the folded stack file"""
+        if len(self._samples) == 0 and len(self.slow_callbacks) == 0:
+            logger.info("Profile collected no samples")
+            return None
+        output_dir = self.output_dir or get_default_profile_dir()
+        os.makedirs(output_dir, exist_ok=True)
+        start_time = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._start_time))
+        base_name = f"profile-{os.getpid()}-{start_time}"
+        profile_path = os.path.join(output_dir, f"{base_name}.folded")
+        with open(profile_path, "w") as profile_file:
+            for stack, count in self._samples.most_common():
+                profile_file.write(f"{stack} {count}\n")
+        if len(self.slow_callbacks) > 0:
+            slow_path = os.path.join(output_dir, f"{base_name}-slow_callbacks.txt")
+            with open(slow_path, "w") as slow_file:
+                slow_file.write("\n".join(self.slow_callbacks))
+        logger.info(f"Wrote profile to {profile_path}")
+        self.last_profile_path = profile_path
+        return profile_path
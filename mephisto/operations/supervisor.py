@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Supervisor that spreads task runs across several operator processes, so that
+runs don't share a single event loop and GIL.
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from dataclasses import dataclass, field
+
+from mephisto.abstractions.blueprint import SharedTaskState
+from mephisto.utils.metrics import (
+    launch_prometheus_server,
+    start_metrics_server,
+    shutdown_prometheus_server,
+)
+from mephisto.utils.logger_core import get_logger, format_loud
+from omegaconf import DictConfig
+
+from typing import Dict, List, Optional, Tuple, Type, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mephisto.abstractions.database import MephistoDB
+
+logger = get_logger(name=__name__)
+
+# Seconds between checks on the worker processes while waiting on them
+SUPERVISOR_POLL_TIME = 1
+# Seconds to wait for a worker to exit after asking it to shut down
+WORKER_SHUTDOWN_TIMEOUT = 60
+
+# Messages sent from operator workers to the supervisor
+RUN_LAUNCHED = "launched"
+RUN_LAUNCH_FAILED = "launch_failed"
+WORKER_FINISHED = "finished"
+
+
+@dataclass
+class OperatorWorker:
+    """Bookkeeping for one operator process and the runs assigned to it"""
+
+    worker_idx: int
+    launches: List[Tuple[int, DictConfig, Optional[SharedTaskState]]] = field(
+        default_factory=list
+    )
+    task_run_ids: List[str] = field(default_factory=list)
+    process: Optional[multiprocessing.process.BaseProcess] = None
+
+
+def _run_operator_worker(
+    worker: OperatorWorker,
+    db_class: Type["MephistoDB"],
+    database_path: str,
+    status_queue: "multiprocessing.Queue",
+    log_rate: Optional[int],
+) -> None:
+    """Entry point of an operator process, running its assigned launches to completion"""
+    from mephisto.operations.operator import Operator
+
+    # The parent's connections can't be shared across the fork, so open our own
+    db = db_class(database_path=database_path)
+    operator = Operator(db, launch_metrics=False)
+    try:
+        for run_idx, run_config, shared_state in worker.launches:
+            task_run_id = operator.launch_task_run(run_config, shared_state=shared_state)
+            status = RUN_LAUNCH_FAILED if task_run_id is None else RUN_LAUNCHED
+            status_queue.put((status, worker.worker_idx, run_idx, task_run_id))
+        operator.wait_for_runs_then_shutdown(skip_input=True, log_rate=log_rate)
+    finally:
+        if not operator.is_shutdown:
+            operator.shutdown()
+        db.shutdown()
+        status_queue.put((WORKER_FINISHED, worker.worker_idx, None, None))
+
+
+class OperatorSupervisor:
+    """
+    Drop-in alternative to the Operator for jobs with several (or very busy)
+    task runs. Runs passed to `launch_task_run` are assigned to one of
+    num_workers operator processes, each running a regular Operator with its
+    own event loop, channels and DB connections. The workers are started by
+    `wait_for_runs_then_shutdown`, and report launches back over a queue,
+    while the runs themselves coordinate through the shared MephistoDB.
+
+    Workers are forked, so configs and SharedTaskStates (which often hold
+    callables that couldn't be pickled) are handed over as they are. Create
+    the supervisor and launch runs before starting any threads of your own.
+    """
+
+    def __init__(self, db: "MephistoDB", num_workers: Optional[int] = None):
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        assert num_workers > 0, "Need at least one operator worker"
+        assert (
+            "fork" in multiprocessing.get_all_start_methods()
+        ), "OperatorSupervisor requires a platform that supports fork, use an Operator instead"
+        self.db = db
+        self.num_workers = num_workers
+        self.workers = [OperatorWorker(worker_idx=idx) for idx in range(num_workers)]
+        self.is_shutdown = False
+        self._num_launches = 0
+        self._context = multiprocessing.get_context("fork")
+        self._status_queue = self._context.Queue()
+        self._failed_launches: List[int] = []
+        self._using_prometheus = False
+
+    def _assign_worker(self) -> OperatorWorker:
+        """Pick the worker with the fewest runs assigned so far"""
+        return min(self.workers, key=lambda worker: len(worker.launches))
+
+    def launch_task_run(
+        self, run_config: DictConfig, shared_state: Optional[SharedTaskState] = None
+    ) -> int:
+        """
+        Queue a run to be launched by one of the operator workers, returning the
+        index of the worker it was assigned to. Unlike the Operator, the run is
+        only created once the workers start.
+        """
+        assert not self.is_shutdown, "Cannot launch runs on a shutdown supervisor."
+        assert not self._workers_started(), "Runs must be launched before the workers start."
+        worker = self._assign_worker()
+        worker.launches.append((self._num_launches, run_config, shared_state))
+        self._num_launches += 1
+        return worker.worker_idx
+
+    def _workers_started(self) -> bool:
+        return any(worker.process is not None for worker in self.workers)
+
+    def start_workers(self, log_rate: Optional[int] = None) -> None:
+        """Start an operator process for every worker with runs assigned"""
+        assert not self._workers_started(), "Workers have already been started"
+        self._using_prometheus = launch_prometheus_server()
+        for worker in self.workers:
+            if len(worker.launches) == 0:
+                continue
+            worker.process = self._context.Process(
+                target=_run_operator_worker,
+                args=(worker, type(self.db), self.db.db_path, self._status_queue, log_rate),
+                name=f"mephisto-operator-{worker.worker_idx}",
+            )
+            worker.process.start()
+            logger.info(
+                f"Started operator worker {worker.worker_idx} (pid {worker.process.pid}) "
+                f"for {len(worker.launches)} runs"
+            )
+        # Only the supervisor serves metrics, the workers would compete for the port
+        start_metrics_server()
+
+    def _get_live_workers(self) -> List[OperatorWorker]:
+        return [
+            worker
+            for worker in self.workers
+            if worker.process is not None and worker.process.is_alive()
+        ]
+
+    def _process_status_updates(self, timeout: float = 0) -> None:
+        """Record any launch results reported by the workers"""
+        try:
+            while True:
+                status, worker_idx, run_idx, task_run_id = self._status_queue.get(
+                    timeout=timeout
+                )
+                timeout = 0
+                if status == RUN_LAUNCHED:
+                    self.workers[worker_idx].task_run_ids.append(task_run_id)
+                elif status == RUN_LAUNCH_FAILED:
+                    logger.warning(f"Run {run_idx} failed to launch on worker {worker_idx}")
+                    self._failed_launches.append(run_idx)
+                elif status == WORKER_FINISHED:
+                    logger.info(f"Operator worker {worker_idx} finished its runs")
+        except queue.Empty:
+            pass
+
+    def get_running_task_runs(self) -> Dict[str, int]:
+        """Return the task runs launched on still-running workers, and their worker index"""
+        self._process_status_updates()
+        return {
+            task_run_id: worker.worker_idx
+            for worker in self._get_live_workers()
+            for task_run_id in worker.task_run_ids
+        }
+
+    def get_failed_launches(self) -> List[int]:
+        """Return the indices (in launch order) of runs that failed to launch"""
+        self._process_status_updates()
+        return list(self._failed_launches)
+
+    def print_run_details(self):
+        """Print details about running tasks"""
+        for task_run_id, worker_idx in self.get_running_task_runs().items():
+            logger.info(f"Operator worker {worker_idx} running task ID = {task_run_id}")
+
+    def wait_for_runs_then_shutdown(self, skip_input=False, log_rate: Optional[int] = None) -> None:
+        """
+        Start the workers if needed, then wait for all of them to finish their
+        runs. A Ctrl-C reaches the workers directly, which go through the usual
+        Operator shutdown, so the supervisor keeps waiting on them.
+        """
+        if not self._workers_started():
+            self.start_workers(log_rate=log_rate)
+        interrupted = False
+        last_log = 0.0
+        while True:
+            try:
+                while len(self._get_live_workers()) > 0:
+                    self._process_status_updates(timeout=SUPERVISOR_POLL_TIME)
+                    if log_rate is not None and time.time() - last_log > log_rate:
+                        last_log = time.time()
+                        self.print_run_details()
+                break
+            except (KeyboardInterrupt, SystemExit):
+                if interrupted:
+                    logger.warning("Supervisor interrupted again, forcing the workers to exit")
+                    self.shutdown()
+                    return
+                interrupted = True
+                logger.warning(
+                    f"Waiting on operator workers to clean up, {format_loud('Ctrl-C again')} "
+                    "if they don't finish."
+                )
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        """Ask any running workers to shut down, and wait for them to exit"""
+        if self.is_shutdown:
+            return
+        self.is_shutdown = True
+        for worker in self._get_live_workers():
+            os.kill(worker.process.pid, signal.SIGINT)  # type: ignore
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(WORKER_SHUTDOWN_TIMEOUT)
+            if worker.process.is_alive():
+                logger.warning(
+                    f"Operator worker {worker.worker_idx} didn't exit in time, terminating it"
+                )
+                worker.process.terminate()
+                worker.process.join()
+            if worker.process.exitcode != 0:
+                logger.warning(
+                    f"Operator worker {worker.worker_idx} exited with code "
+                    f"{worker.process.exitcode}"
+                )
+        self._process_status_updates()
+        if self._using_prometheus:
+            shutdown_prometheus_server()
@@ -5,6 +5,7 @@
 # LICENSE file in the root directory of this source tree.
 
 import time
+from contextlib import contextmanager
 from functools import partial
 from dataclasses import dataclass, fields
 from prometheus_client import Histogram, Gauge, Counter  # type: ignore
@@ -24,8 +25,9 @@ from mephisto.operations.task_launcher import (
     GOLD_UNIT_INDEX,
 )
 from mephisto.operations.datatypes import LiveTaskRun, WorkerFailureReasons
+from mephisto.operations.async_db import AsyncMephistoDB
 
-from typing import Sequence, Dict, Union, Optional, List, Any, TYPE_CHECKING
+from typing import Sequence, Dict, Union, Optional, List, Any, Iterator, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from mephisto.data_model.unit import Unit
@@ -33,6 +35,7 @@ if TYPE_CHECKING:
     from mephisto.data_model.task_run import TaskRun
 
 from mephisto.utils.logger_core import get_logger
+from mephisto.utils.tracing import span
 
 logger = get_logger(name=__name__)
 
@@ -70,6 +73,14 @@ EXTERNAL_FUNCTION_LATENCY.labels(function="launch_screening_unit")
 EXTERNAL_FUNCTION_LATENCY.labels(function="get_gold_unit_data_for_worker")
 
 
+@contextmanager
+def _time_external_function(function: str) -> Iterator[None]:
+    """Time a blueprint or runner hook, both as a metric and a trace span"""
+    with EXTERNAL_FUNCTION_LATENCY.labels(function=function).time():
+        with span(function, category="blueprint"):
+            yield
+
+
 @dataclass
 class OnboardingInfo:
     crowd_data: Dict[str, Any]
@@ -99,6 +110,8 @@ class WorkerPool:
 
     def __init__(self, db: "MephistoDB"):
         self.db = db
+        # DB calls from the event loop go through their own executor
+        self.async_db = AsyncMephistoDB(db)
         # Tracked agents
         self.agents: Dict[str, "Agent"] = {}
         self.onboarding_agents: Dict[str, "OnboardingAgent"] = {}
@@ -142,31 +155,23 @@ class WorkerPool:
         registering an agent
         """
         live_run = self.get_live_run()
-        loop = live_run.loop_wrap.loop
         crowd_provider = live_run.provider
         is_sandbox = crowd_provider.is_sandbox()
         worker_name = crowd_data["worker_name"]
         if crowd_provider.is_sandbox():
             # TODO(WISH) there are better ways to get rid of this designation
             worker_name += "_sandbox"
-        workers = await loop.run_in_executor(
-            None, partial(self.db.find_workers, worker_name=worker_name)
-        )
+        workers = await self.async_db.find_workers(worker_name=worker_name)
         if len(workers) == 0:
-            worker = await loop.run_in_executor(
-                None,
-                partial(
-                    crowd_provider.WorkerClass.new_from_provider_data,
-                    self.db,
-                    crowd_data,
-                ),
+            worker = await self.async_db.run(
+                crowd_provider.WorkerClass.new_from_provider_data,
+                self.db,
+                crowd_data,
             )
         else:
             worker = workers[0]
 
-        is_qualified = await loop.run_in_executor(
-            None, partial(worker_is_qualified, worker, live_run.qualifications)
-        )
+        is_qualified = await self.async_db.run(worker_is_qualified, worker, live_run.qualifications)
         if not is_qualified:
             AGENT_DETAILS_COUNT.labels(response="not_qualified").inc()
             live_run.client_io.enqueue_agent_details(
@@ -205,15 +210,12 @@ class WorkerPool:
                 ).to_dict(),
             )
         else:
-            agent = await loop.run_in_executor(
-                None,
-                partial(
-                    crowd_provider.AgentClass.new_from_provider_data,
-                    self.db,
-                    worker,
-                    unit,
-                    crowd_data,
-                ),
+            agent = await self.async_db.run(
+                crowd_provider.AgentClass.new_from_provider_data,
+                self.db,
+                worker,
+                unit,
+                crowd_data,
             )
             agent.set_live_run(live_run)
             live_run.client_io.associate_agent_with_registration(
@@ -224,7 +226,7 @@ class WorkerPool:
             logger.debug(f"Created agent {agent}, {agent.db_id}.")
 
             # TODO(#649) this is IO bound
-            with EXTERNAL_FUNCTION_LATENCY.labels(function="get_init_data_for_agent").time():
+            with _time_external_function("get_init_data_for_agent"):
                 init_task_data = await loop.run_in_executor(
                     None,
                     partial(
@@ -253,14 +255,14 @@ class WorkerPool:
                     agent,
                 )
             else:
-                assignment = await loop.run_in_executor(None, unit.get_assignment)
+                assignment = await self.async_db.run(unit.get_assignment)
 
                 # Set status to waiting
                 agent.update_status(AgentState.STATUS_WAITING)
 
                 # See if the concurrent assignment is ready to launch
                 logger.debug(f"Attempting to launch {assignment}.")
-                agents = await loop.run_in_executor(None, assignment.get_agents)
+                agents = await self.async_db.run(assignment.get_agents)
                 if None in agents:
                     return  # need to wait for all agents to be here to launch
 
@@ -303,7 +305,7 @@ class WorkerPool:
         ), "Should only be registering from onboarding if onboarding is required and set"
 
         # Onboarding validation is run in thread, as we don't know execution time
-        with EXTERNAL_FUNCTION_LATENCY.labels(function="validate_onboarding").time():
+        with _time_external_function("validate_onboarding"):
             worker_passed = await loop.run_in_executor(
                 None, partial(blueprint.validate_onboarding, worker, onboarding_agent)
             )
@@ -321,11 +323,9 @@ class WorkerPool:
             logger.info(f"Onboarding agent {onboarding_id} registered out from onboarding")
 
         # get the list of tentatively valid units
-        with EXTERNAL_FUNCTION_LATENCY.labels(function="get_valid_units_for_worker").time():
-            units = await loop.run_in_executor(
-                None, partial(live_run.task_run.get_valid_units_for_worker, worker)
-            )
-        with EXTERNAL_FUNCTION_LATENCY.labels(function="filter_units_for_worker").time():
+        with _time_external_function("get_valid_units_for_worker"):
+            units = await self.async_db.run(live_run.task_run.get_valid_units_for_worker, worker)
+        with _time_external_function("filter_units_for_worker"):
             usable_units = await loop.run_in_executor(
                 None,
                 partial(live_run.task_runner.filter_units_for_worker, units, worker),
@@ -412,7 +412,7 @@ class WorkerPool:
                 )
         else:
             # TODO(#649) this is IO bound
-            with EXTERNAL_FUNCTION_LATENCY.labels(function="get_init_data_for_agent").time():
+            with _time_external_function("get_init_data_for_agent"):
                 init_task_data = await loop.run_in_executor(
                     None,
                     partial(
@@ -444,7 +444,7 @@ class WorkerPool:
         # Check screening
         if isinstance(blueprint, ScreenTaskRequired) and blueprint.use_screening_task:
             if blueprint.worker_needs_screening(worker) and blueprint.should_generate_unit():
-                with EXTERNAL_FUNCTION_LATENCY.labels(function="get_screening_unit_data").time():
+                with _time_external_function("get_screening_unit_data"):
                     screening_data = await loop.run_in_executor(
                         None, blueprint.get_screening_unit_data
                     )
@@ -453,7 +453,7 @@ class WorkerPool:
                     assert (
                         launcher is not None
                     ), "LiveTaskRun must have launcher to use screening tasks"
-                    with EXTERNAL_FUNCTION_LATENCY.labels(function="launch_screening_unit").time():
+                    with _time_external_function("launch_screening_unit"):
                         screen_unit = await loop.run_in_executor(
                             None,
                             partial(
@@ -476,9 +476,7 @@ class WorkerPool:
         # Check golds
         if isinstance(blueprint, UseGoldUnit) and blueprint.use_golds:
             if blueprint.should_produce_gold_for_worker(worker):
-                with EXTERNAL_FUNCTION_LATENCY.labels(
-                    function="get_gold_unit_data_for_worker"
-                ).time():
+                with _time_external_function("get_gold_unit_data_for_worker"):
                     gold_data = await loop.run_in_executor(
                         None, partial(blueprint.get_gold_unit_data_for_worker, worker)
                     )
@@ -517,8 +515,8 @@ class WorkerPool:
         agent_registration_id = crowd_data["agent_registration_id"]
 
         # get the list of tentatively valid units
-        with EXTERNAL_FUNCTION_LATENCY.labels(function="get_valid_units_for_worker").time():
-            units = task_run.get_valid_units_for_worker(worker)
+        with _time_external_function("get_valid_units_for_worker"):
+            units = await self.async_db.run(task_run.get_valid_units_for_worker, worker)
 
         if len(units) == 0:
             AGENT_DETAILS_COUNT.labels(response="no_available_units").inc()
@@ -531,7 +529,7 @@ class WorkerPool:
             )
             logger.debug(f"agent_registration_id {agent_registration_id}, had no valid units.")
             return
-        with EXTERNAL_FUNCTION_LATENCY.labels(function="filter_units_for_worker").time():
+        with _time_external_function("filter_units_for_worker"):
             units = await loop.run_in_executor(
                 None,
                 partial(live_run.task_runner.filter_units_for_worker, units, worker),
@@ -666,3 +664,4 @@ class WorkerPool:
     def shutdown(self) -> None:
         """Mark shut down. Handle resource cleanup if necessary"""
         self.is_shutdown = True
+        self.async_db.shutdown()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Synthetic load test for the Mephisto operations layer.
+
+Launches a MockBlueprint task run on a MockArchitect server in a temporary
+database, then drives a number of simulated workers through registration,
+onboarding, live updates and submission over the architect's socket. Each
+request is timed until Mephisto's response arrives back at the server, and
+the results (p50/p99 latency per packet type, agents per second and DB calls
+per unit) can be saved as a baseline to compare later changes against.
+
+Usage:
+    mephisto benchmark --workers 100 --concurrency 20 --save-baseline
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from uuid import uuid4
+
+from omegaconf import MISSING, OmegaConf
+
+from mephisto.abstractions.architects.mock_architect import MockArchitect, MockArchitectArgs
+from mephisto.abstractions.blueprint import AgentState
+from mephisto.abstractions.blueprints.mock.mock_blueprint import MockBlueprintArgs
+from mephisto.abstractions.blueprints.mock.mock_task_runner import MockTaskRunner
+from mephisto.abstractions.database import DATABASE_LATENCY
+from mephisto.abstractions.databases.local_database import LocalMephistoDB
+from mephisto.abstractions.providers.mock.mock_provider import MockProviderArgs
+from mephisto.data_model.agent import OnboardingAgent
+from mephisto.data_model.packet import (
+    PACKET_TYPE_AGENT_DETAILS,
+    PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE,
+    PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE,
+    PACKET_TYPE_REGISTER_AGENT,
+    PACKET_TYPE_SUBMIT_ONBOARDING,
+    PACKET_TYPE_SUBMIT_UNIT,
+    PACKET_TYPE_UPDATE_STATUS,
+)
+from mephisto.data_model.task_run import TaskRunArgs
+from mephisto.operations.hydra_config import MephistoConfig
+from mephisto.operations.operator import Operator
+from mephisto.utils.rich import console, create_table
+
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mephisto.abstractions.architects.mock_architect import MockServer
+
+LOAD_TEST_REQUESTER = "load_test_requester"
+UNITS_PER_ASSIGNMENT = len(MockTaskRunner.get_mock_assignment_data().unit_data)
+TIMED_PACKET_TYPES = [
+    PACKET_TYPE_REGISTER_AGENT,
+    PACKET_TYPE_SUBMIT_ONBOARDING,
+    PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE,
+    PACKET_TYPE_SUBMIT_UNIT,
+]
+
+
+@dataclass
+class LoadTestConfig:
+    """Shape of the synthetic load, and of the MockBlueprint run it targets"""
+
+    num_workers: int = 20
+    concurrency: int = 10
+    live_updates: int = 3
+    use_onboarding: bool = False
+    is_concurrent: bool = False
+    port: int = 3000
+    timeout: float = 120
+
+
+class SimulatedWorker:
+    """
+    A single worker stepping through the frontend protocol. Every step sends
+    one packet and waits for the response to it before sending the next.
+    """
+
+    def __init__(self, generator: "LoadGenerator", idx: int):
+        self.generator = generator
+        self.worker_name = f"load_worker_{idx}"
+        self.agent_id: Optional[str] = None
+        self.updates_sent = 0
+        # (packet type being timed, send time, key identifying the response)
+        self.pending: Optional[Tuple[str, float, str]] = None
+
+    def _send(self, packet_type: str, subject_id: str, data: Dict[str, Any], key: str) -> None:
+        self.pending = (packet_type, time.perf_counter(), key)
+        self.generator.expect(key, self)
+        self.generator.server.send_message_nowait(
+            {"packet_type": packet_type, "subject_id": subject_id, "data": data}
+        )
+
+    def start(self) -> None:
+        request_id = str(uuid4())
+        self._send(
+            PACKET_TYPE_REGISTER_AGENT,
+            "MockServer",
+            {
+                "request_id": request_id,
+                "provider_data": {
+                    "worker_name": self.worker_name,
+                    "agent_registration_id": request_id,
+                },
+            },
+            request_id,
+        )
+
+    def on_response(self, message: Dict[str, Any]) -> None:
+        """Record the latency of the pending request, then take the next step"""
+        assert self.pending is not None, "Response arrived with no request pending"
+        packet_type, sent_time, _key = self.pending
+        self.pending = None
+        self.generator.record_latency(packet_type, time.perf_counter() - sent_time)
+
+        if packet_type in [PACKET_TYPE_REGISTER_AGENT, PACKET_TYPE_SUBMIT_ONBOARDING]:
+            details = message["data"]
+            if details.get("agent_id") is None:
+                self.generator.finish(self, failure_reason=details.get("failure_reason"))
+                return
+            self.agent_id = details["agent_id"]
+            if self.agent_id.startswith(OnboardingAgent.DISPLAY_PREFIX):
+                request_id = str(uuid4())
+                self._send(
+                    PACKET_TYPE_SUBMIT_ONBOARDING,
+                    self.agent_id,
+                    {"request_id": request_id, "onboarding_data": {"should_pass": True}},
+                    request_id,
+                )
+                return
+        if self.updates_sent < self.generator.config.live_updates:
+            self.updates_sent += 1
+            update_id = str(uuid4())
+            self._send(
+                PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE,
+                self.agent_id,
+                {"text": f"update {self.updates_sent}", "update_id": update_id},
+                update_id,
+            )
+        elif packet_type != PACKET_TYPE_SUBMIT_UNIT:
+            self._send(
+                PACKET_TYPE_SUBMIT_UNIT,
+                self.agent_id,
+                {"completed": True},
+                f"{self.agent_id}-{AgentState.STATUS_COMPLETED}",
+            )
+        else:
+            self.generator.finish(self)
+
+
+class LoadGenerator:
+    """
+    Drives simulated workers against a MockServer, keeping at most
+    config.concurrency of them in flight. All stepping happens on the
+    server thread, from the server's on_packet hook.
+    """
+
+    def __init__(self, server: "MockServer", config: LoadTestConfig):
+        self.server = server
+        self.config = config
+        self.latencies: Dict[str, List[float]] = {t: [] for t in TIMED_PACKET_TYPES}
+        self.failures: Dict[str, int] = {}
+        self.completed = 0
+        self.next_worker_idx = 0
+        self.awaiting: Dict[str, SimulatedWorker] = {}
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self.done = threading.Event()
+
+    def start(self) -> None:
+        self.server.on_packet = self._on_packet
+        self.start_time = time.perf_counter()
+        self.server.running_instance.add_callback(self._fill_slots)
+
+    def _fill_slots(self) -> None:
+        in_flight = self.next_worker_idx - self.completed - sum(self.failures.values())
+        while (
+            in_flight < self.config.concurrency
+            and self.next_worker_idx < self.config.num_workers
+        ):
+            worker = SimulatedWorker(self, self.next_worker_idx)
+            self.next_worker_idx += 1
+            in_flight += 1
+            worker.start()
+
+    def expect(self, key: str, worker: SimulatedWorker) -> None:
+        self.awaiting[key] = worker
+
+    def record_latency(self, packet_type: str, latency: float) -> None:
+        self.latencies[packet_type].append(latency)
+
+    def finish(self, worker: SimulatedWorker, failure_reason: Optional[str] = None) -> None:
+        if failure_reason is None:
+            self.completed += 1
+        else:
+            self.failures[failure_reason] = self.failures.get(failure_reason, 0) + 1
+        if self.completed + sum(self.failures.values()) == self.config.num_workers:
+            self.end_time = time.perf_counter()
+            self.done.set()
+        else:
+            self._fill_slots()
+
+    def _on_packet(self, message: Dict[str, Any]) -> None:
+        """Route responses from Mephisto to the worker awaiting them"""
+        packet_type = message["packet_type"]
+        data = message.get("data") or {}
+        if packet_type == PACKET_TYPE_AGENT_DETAILS:
+            key = data.get("request_id")
+        elif packet_type == PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE:
+            key = data.get("update_id")
+        elif packet_type == PACKET_TYPE_UPDATE_STATUS:
+            key = f"{message['subject_id']}-{data.get('status')}"
+        else:
+            return
+        worker = self.awaiting.pop(key, None)
+        if worker is not None:
+            worker.on_response(message)
+
+
+def _get_db_call_counts() -> Dict[str, int]:
+    """Read the number of calls made so far to each MephistoDB method"""
+    counts = {}
+    for metric in DATABASE_LATENCY.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count"):
+                counts[sample.labels["method"]] = int(sample.value)
+    return counts
+
+
+def _percentile(samples: List[float], percent: float) -> Optional[float]:
+    """Nearest-rank percentile of the given samples"""
+    if len(samples) == 0:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, int(round(percent / 100 * len(ordered) + 0.5)) - 1)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def run_load_test(config: LoadTestConfig) -> Dict[str, Any]:
+    """
+    Run a load test in a fresh temporary database, returning a
+    json-serializable summary of the results
+    """
+    if config.is_concurrent:
+        assert (
+            config.num_workers % UNITS_PER_ASSIGNMENT == 0
+            and config.concurrency >= UNITS_PER_ASSIGNMENT
+        ), f"Concurrent units need workers in groups of {UNITS_PER_ASSIGNMENT}"
+    data_dir = tempfile.mkdtemp()
+    db = LocalMephistoDB(os.path.join(data_dir, "mephisto.db"))
+    db.new_requester(LOAD_TEST_REQUESTER, "mock")
+    operator = Operator(db)
+    try:
+        run_config = MephistoConfig(
+            blueprint=MockBlueprintArgs(
+                num_assignments=-(-config.num_workers // UNITS_PER_ASSIGNMENT),
+                is_concurrent=config.is_concurrent,
+                num_live_updates=config.live_updates,
+                timeout_time=int(config.timeout),
+                onboarding_qualification=(
+                    "load-test-onboarding" if config.use_onboarding else MISSING
+                ),
+            ),
+            provider=MockProviderArgs(requester_name=LOAD_TEST_REQUESTER),
+            architect=MockArchitectArgs(should_run_server=True, port=str(config.port)),
+            task=TaskRunArgs(
+                task_name="load-test",
+                task_title="Load test",
+                task_description="Synthetic load test",
+                task_reward=0.3,
+                task_tags="load-test",
+                submission_timeout=int(config.timeout),
+            ),
+        )
+        task_run_id = operator.launch_task_run_or_die(OmegaConf.structured(run_config))
+        architect = operator.get_running_task_runs()[task_run_id].architect
+        assert isinstance(architect, MockArchitect) and architect.server is not None
+        server = architect.server
+        assert operator.run_loop_until(
+            lambda: len(server.subs) > 0, 10
+        ), "Mock server was not connected to in time"
+
+        generator = LoadGenerator(server, config)
+        calls_before = _get_db_call_counts()
+        generator.start()
+        operator.run_loop_until(generator.done.is_set, config.timeout)
+        calls_after = _get_db_call_counts()
+    finally:
+        operator.force_shutdown()
+        db.shutdown()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    end_time = generator.end_time if generator.end_time is not None else time.perf_counter()
+    duration = end_time - generator.start_time
+    db_calls = {
+        method: count - calls_before.get(method, 0)
+        for method, count in calls_after.items()
+        if count - calls_before.get(method, 0) > 0
+    }
+    total_db_calls = sum(db_calls.values())
+    return {
+        "config": asdict(config),
+        "timed_out": not generator.done.is_set(),
+        "agents_completed": generator.completed,
+        "agents_failed": generator.failures,
+        "duration_s": duration,
+        "agents_per_second": generator.completed / duration if duration > 0 else 0.0,
+        "db_calls": db_calls,
+        "db_calls_per_unit": (
+            total_db_calls / generator.completed if generator.completed > 0 else None
+        ),
+        "latency_ms": {
+            packet_type: {
+                "count": len(samples),
+                "p50": _ms(_percentile(samples, 50)),
+                "p99": _ms(_percentile(samples, 99)),
+            }
+            for packet_type, samples in generator.latencies.items()
+            if len(samples) > 0
+        },
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else seconds * 1000
+
+
+def save_baseline(results: Dict[str, Any], baseline_path: str) -> None:
+    """Store the given results as the baseline for later comparisons"""
+    baseline_dir = os.path.dirname(baseline_path)
+    if len(baseline_dir) > 0:
+        os.makedirs(baseline_dir, exist_ok=True)
+    with open(baseline_path, "w") as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+
+def load_baseline(baseline_path: str) -> Optional[Dict[str, Any]]:
+    """Load previously stored results, if there are any"""
+    if not os.path.exists(baseline_path):
+        return None
+    with open(baseline_path, "r") as baseline_file:
+        return json.load(baseline_file)
+
+
+def is_same_load(results: Dict[str, Any], baseline: Dict[str, Any]) -> bool:
+    """Whether two sets of results came from the same shape of load"""
+    ignored_keys = ["port", "timeout"]
+    current = {k: v for k, v in results["config"].items() if k not in ignored_keys}
+    previous = {k: v for k, v in baseline["config"].items() if k not in ignored_keys}
+    return current == previous
+
+
+def compare_to_baseline(
+    results: Dict[str, Any], baseline: Dict[str, Any]
+) -> Dict[str, Optional[float]]:
+    """
+    Return the relative change of each headline number from the baseline,
+    where positive means larger than before
+    """
+
+    def change(current: Optional[float], previous: Optional[float]) -> Optional[float]:
+        if current is None or previous is None or previous == 0:
+            return None
+        return (current - previous) / previous
+
+    changes = {
+        "agents_per_second": change(results["agents_per_second"], baseline["agents_per_second"]),
+        "db_calls_per_unit": change(results["db_calls_per_unit"], baseline["db_calls_per_unit"]),
+    }
+    for packet_type, latency in results["latency_ms"].items():
+        previous = baseline["latency_ms"].get(packet_type, {})
+        for stat in ["p50", "p99"]:
+            changes[f"{packet_type} {stat}"] = change(latency[stat], previous.get(stat))
+    return changes
+
+
+def print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    """Render the results, and the change from the baseline if given"""
+    changes = compare_to_baseline(results, baseline) if baseline is not None else {}
+
+    def fmt_change(key: str) -> str:
+        value = changes.get(key)
+        return "" if value is None else f"{value:+.1%}"
+
+    latency_table = create_table(
+        ["Packet type", "Count", "p50 (ms)", "p99 (ms)", "p50 change", "p99 change"],
+        "Request latency",
+    )
+    for packet_type, latency in results["latency_ms"].items():
+        latency_table.add_row(
+            packet_type,
+            str(latency["count"]),
+            f"{latency['p50']:.1f}",
+            f"{latency['p99']:.1f}",
+            fmt_change(f"{packet_type} p50"),
+            fmt_change(f"{packet_type} p99"),
+        )
+    console.print(latency_table)
+
+    summary_table = create_table(["Metric", "Value", "Change"], "Throughput")
+    summary_table.add_row("Agents completed", str(results["agents_completed"]), "")
+    summary_table.add_row(
+        "Agents per second",
+        f"{results['agents_per_second']:.2f}",
+        fmt_change("agents_per_second"),
+    )
+    db_calls_per_unit = results["db_calls_per_unit"]
+    summary_table.add_row(
+        "DB calls per unit",
+        "-" if db_calls_per_unit is None else f"{db_calls_per_unit:.1f}",
+        fmt_change("db_calls_per_unit"),
+    )
+    console.print(summary_table)
+
+    if results["timed_out"]:
+        console.print("[red]Load test timed out before every worker finished[/red]")
+    for reason, count in results["agents_failed"].items():
+        console.print(f"[yellow]{count} workers failed: {reason}[/yellow]")
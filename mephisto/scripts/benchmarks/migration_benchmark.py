@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Benchmark for applying LocalMephistoDB schema migrations to a large database.
+
+Builds a synthetic database at an older schema version, filled with units,
+agents and granted qualifications, then applies the remaining migrations
+while a separate connection keeps updating unit statuses, as a running
+operator would. Reports how long each migration took and the longest time
+the concurrent writer had to wait.
+
+Usage:
+    python mephisto/scripts/benchmarks/migration_benchmark.py --units 1000000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from typing import Dict, List
+
+from mephisto.abstractions.databases.local_database import MIGRATIONS
+from mephisto.abstractions.databases.migrations import get_schema_version, run_migrations
+
+STATUSES = ["created", "launched", "assigned", "completed", "accepted"]
+INSERT_BATCH_SIZE = 10000
+
+
+def build_synthetic_database(
+    database_path: str, num_units: int, num_workers: int, from_version: int, seed: int = 0
+) -> None:
+    """Create a database at from_version with num_units units and their agents"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(database_path)
+    run_migrations(conn, MIGRATIONS, target_version=from_version)
+    with conn:
+        conn.execute("INSERT INTO projects (project_name) VALUES ('benchmark')")
+        conn.execute(
+            "INSERT INTO tasks (task_name, task_type, project_id) VALUES ('benchmark', 'mock', 1)"
+        )
+        conn.execute(
+            "INSERT INTO requesters (requester_name, provider_type) VALUES ('benchmark', 'mock')"
+        )
+        conn.execute(
+            "INSERT INTO task_runs (task_id, requester_id, init_params, is_completed, "
+            "provider_type, task_type, sandbox) VALUES (1, 1, '{}', 0, 'mock', 'mock', 1)"
+        )
+        conn.execute("INSERT INTO qualifications (qualification_name) VALUES ('benchmark')")
+        conn.executemany(
+            "INSERT INTO workers (worker_name, provider_type) VALUES (?, 'mock')",
+            [(f"worker_{idx}",) for idx in range(num_workers)],
+        )
+        conn.executemany(
+            "INSERT INTO granted_qualifications (worker_id, qualification_id, value) "
+            "VALUES (?, 1, ?)",
+            [(idx + 1, rng.randint(0, 1)) for idx in range(num_workers)],
+        )
+    for batch_start in range(0, num_units, INSERT_BATCH_SIZE):
+        batch = range(batch_start, min(batch_start + INSERT_BATCH_SIZE, num_units))
+        with conn:
+            conn.executemany(
+                "INSERT INTO assignments (assignment_id, task_id, task_run_id, requester_id, "
+                "task_type, provider_type, sandbox) VALUES (?, 1, 1, 1, 'mock', 'mock', 1)",
+                [(idx + 1,) for idx in batch],
+            )
+            conn.executemany(
+                "INSERT INTO units (unit_id, assignment_id, unit_index, pay_amount, "
+                "provider_type, status, agent_id, worker_id, task_type, task_id, task_run_id, "
+                "sandbox, requester_id) VALUES (?, ?, 0, 1.0, 'mock', ?, ?, ?, 'mock', 1, 1, 1, 1)",
+                [
+                    (idx + 1, idx + 1, rng.choice(STATUSES), idx + 1, rng.randint(1, num_workers))
+                    for idx in batch
+                ],
+            )
+            conn.executemany(
+                "INSERT INTO agents (agent_id, worker_id, unit_id, task_id, task_run_id, "
+                "assignment_id, task_type, provider_type, status) "
+                "VALUES (?, ?, ?, 1, 1, ?, 'mock', 'mock', 'completed')",
+                [(idx + 1, rng.randint(1, num_workers), idx + 1, idx + 1) for idx in batch],
+            )
+    conn.close()
+
+
+def run_concurrent_writer(
+    database_path: str, num_units: int, stop_event: threading.Event, stalls: List[float]
+) -> None:
+    """Keep updating random unit statuses, recording how long each write took"""
+    conn = sqlite3.connect(database_path, timeout=600)
+    rng = random.Random(1)
+    while not stop_event.is_set():
+        start_time = time.monotonic()
+        with conn:
+            conn.execute(
+                "UPDATE units SET status = ? WHERE unit_id = ?",
+                (rng.choice(STATUSES), rng.randint(1, num_units)),
+            )
+        stalls.append(time.monotonic() - start_time)
+        time.sleep(0.001)
+    conn.close()
+
+
+def benchmark_migrations(database_path: str, num_units: int) -> Dict[str, float]:
+    """Apply the remaining migrations alongside a concurrent writer"""
+    stop_event = threading.Event()
+    stalls: List[float] = []
+    writer = threading.Thread(
+        target=run_concurrent_writer,
+        args=(database_path, num_units, stop_event, stalls),
+        name="concurrent-writer",
+    )
+    writer.start()
+    while len(stalls) == 0:
+        time.sleep(0.01)  # Let the writer get going first
+    conn = sqlite3.connect(database_path, timeout=600)
+    results = {}
+    try:
+        for migration in MIGRATIONS[get_schema_version(conn) :]:
+            start_time = time.monotonic()
+            run_migrations(conn, MIGRATIONS, target_version=migration.version)
+            results[f"migration {migration.version}"] = time.monotonic() - start_time
+    finally:
+        stop_event.set()
+        writer.join()
+        conn.close()
+    results["writes during migration"] = len(stalls) - 1
+    results["longest write wait"] = max(stalls, default=0)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--units", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=10000)
+    parser.add_argument("--from-version", type=int, default=1)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp()
+    try:
+        database_path = os.path.join(data_dir, "database.db")
+        start_time = time.monotonic()
+        build_synthetic_database(database_path, args.units, args.workers, args.from_version)
+        print(
+            f"Built {args.units} unit database at version {args.from_version} "
+            f"({os.path.getsize(database_path) / 1024 / 1024:.1f} MiB) "
+            f"in {time.monotonic() - start_time:.1f}s"
+        )
+        for name, value in benchmark_migrations(database_path, args.units).items():
+            if isinstance(value, float):
+                print(f"{name:>24}: {value:.3f}s")
+            else:
+                print(f"{name:>24}: {value}")
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == "__main__":
+    main()
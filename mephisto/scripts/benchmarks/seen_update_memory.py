@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Memory benchmark for live update deduplication in the ClientIOHandler.
+
+Simulates a long-running chat task where agents arrive in waves, each sends
+a number of live updates (some of which are retransmitted duplicates), and
+then finishes. Compares the legacy run-wide set of every update id against
+the per-agent RecentIdSet that is released once the agent completes.
+
+Usage:
+    python mephisto/scripts/benchmarks/seen_update_memory.py --agents 5000 --messages 400
+"""
+
+import argparse
+import random
+import tracemalloc
+from uuid import uuid4
+
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from mephisto.operations.client_io_handler import MAX_SEEN_UPDATE_IDS_PER_AGENT
+from mephisto.operations.datatypes import RecentIdSet
+
+# A batch is a list of (agent_id, update_id) messages, followed by the agents that finished
+Workload = List[Tuple[List[Tuple[str, str]], List[str]]]
+
+
+def make_chat_workload(
+    num_agents: int,
+    messages_per_agent: int,
+    concurrent_agents: int,
+    duplicate_rate: float,
+    seed: int = 0,
+) -> Workload:
+    """
+    Build batches of interleaved live updates for groups of concurrently
+    active agents, with a fraction of messages resent as duplicates
+    """
+    rng = random.Random(seed)
+    workload: Workload = []
+    for wave_start in range(0, num_agents, concurrent_agents):
+        wave_agents = [
+            f"agent_{idx}"
+            for idx in range(wave_start, min(wave_start + concurrent_agents, num_agents))
+        ]
+        messages: List[Tuple[str, str]] = []
+        for agent_id in wave_agents:
+            for _ in range(messages_per_agent):
+                update_id = str(uuid4())
+                messages.append((agent_id, update_id))
+                if rng.random() < duplicate_rate:
+                    messages.append((agent_id, update_id))
+        rng.shuffle(messages)
+        workload.append((messages, wave_agents))
+    return workload
+
+
+def run_unbounded(workload: Workload) -> Tuple[int, Any]:
+    """Legacy behavior: one set holding every update id seen during the run"""
+    seen_update_ids: Set[str] = set()
+    processed = 0
+    for messages, _finished_agents in workload:
+        for _agent_id, update_id in messages:
+            if update_id in seen_update_ids:
+                continue
+            processed += 1
+            seen_update_ids.add(update_id)
+    return processed, seen_update_ids
+
+
+def run_bounded(workload: Workload) -> Tuple[int, Any]:
+    """Per-agent RecentIdSets, released as each agent finishes"""
+    seen_update_ids: Dict[str, RecentIdSet] = {}
+    processed = 0
+    for messages, finished_agents in workload:
+        for agent_id, update_id in messages:
+            seen_ids = seen_update_ids.get(agent_id)
+            if seen_ids is not None and update_id in seen_ids:
+                continue
+            processed += 1
+            if seen_ids is None:
+                seen_ids = RecentIdSet(MAX_SEEN_UPDATE_IDS_PER_AGENT)
+                seen_update_ids[agent_id] = seen_ids
+            seen_ids.add(update_id)
+        for agent_id in finished_agents:
+            seen_update_ids.pop(agent_id, None)
+    return processed, seen_update_ids
+
+
+def measure(run_fn: Callable[[Workload], Tuple[int, Any]], workload: Workload) -> Dict[str, int]:
+    """
+    Run the given strategy under tracemalloc, returning processed counts and
+    the memory still held by its dedup state at the end of the run
+    """
+    tracemalloc.start()
+    processed, seen_state = run_fn(workload)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if isinstance(seen_state, dict):
+        retained = sum(len(ids) for ids in seen_state.values())
+    else:
+        retained = len(seen_state)
+    return {
+        "processed": processed,
+        "retained_ids": retained,
+        "final_bytes": current,
+        "peak_bytes": peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--agents", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--concurrent", type=int, default=50)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    workload = make_chat_workload(
+        args.agents, args.messages, args.concurrent, args.duplicate_rate
+    )
+    print(
+        f"Workload: {args.agents} agents, {args.messages} updates each, "
+        f"{args.concurrent} concurrent, {args.duplicate_rate:.0%} duplicates"
+    )
+    for name, run_fn in [("unbounded set", run_unbounded), ("per-agent bounded", run_bounded)]:
+        results = measure(run_fn, workload)
+        print(
+            f"{name:>18}: processed {results['processed']}, "
+            f"retained {results['retained_ids']} ids, "
+            f"final {results['final_bytes'] / 1024 / 1024:.2f} MiB, "
+            f"peak {results['peak_bytes'] / 1024 / 1024:.2f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
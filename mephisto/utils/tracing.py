@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Lightweight span tracing, for following a single request (like a register_agent
+packet) through the router, the channel, the worker pool and the DB.
+
+Tracing is off unless a trace file is configured, either with the
+MEPHISTO_TRACE_FILE environment variable or with configure_tracing. Spans are
+written in the Chrome trace event format, which can be opened directly in
+Perfetto (ui.perfetto.dev) or chrome://tracing. Every span carries the
+trace_id of the request it belongs to, as well as its own and its parent's
+span ids, in its args.
+"""
+
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from uuid import uuid4
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from mephisto.utils.logger_core import get_logger
+
+logger = get_logger(name=__name__)
+
+TRACE_FILE_ENV = "MEPHISTO_TRACE_FILE"
+# Buffered events are written once there are this many, or this many seconds passed
+TRACE_FLUSH_EVENTS = 1000
+TRACE_FLUSH_INTERVAL = 1.0
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar(
+    "mephisto_current_span", default=None
+)
+_span_ids = itertools.count(1)
+
+
+def new_trace_id() -> str:
+    """Return an id for a new trace"""
+    return uuid4().hex[:16]
+
+
+class TraceWriter:
+    """
+    Buffers finished span events and appends them to the trace file. The file
+    is a JSON array that is never closed, which trace viewers accept, so that
+    several runs (or processes) can append to the same file.
+    """
+
+    def __init__(self, trace_file: str):
+        self.trace_file = trace_file
+        self.pid = os.getpid()
+        self._events: List[str] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(trace_file)), exist_ok=True)
+        with open(trace_file, "a") as trace_fp:
+            if trace_fp.tell() == 0:
+                trace_fp.write("[\n")
+
+    def add_event(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self._events.append(line)
+            if (
+                len(self._events) < TRACE_FLUSH_EVENTS
+                and time.monotonic() - self._last_flush < TRACE_FLUSH_INTERVAL
+            ):
+                return
+            events, self._events = self._events, []
+            self._last_flush = time.monotonic()
+            self._write(events)
+
+    def flush(self) -> None:
+        with self._lock:
+            events, self._events = self._events, []
+            self._last_flush = time.monotonic()
+            self._write(events)
+
+    def reset_after_fork(self) -> None:
+        """Drop events buffered by the parent process, which it writes itself"""
+        self.pid = os.getpid()
+        self._events = []
+        self._lock = threading.Lock()
+
+    def _write(self, events: List[str]) -> None:
+        if len(events) == 0:
+            return
+        try:
+            with open(self.trace_file, "a") as trace_fp:
+                trace_fp.write(",\n".join(events) + ",\n")
+        except OSError:
+            logger.exception(f"Could not write traces to {self.trace_file}")
+
+
+_writer: Optional[TraceWriter] = None
+
+
+def configure_tracing(trace_file: Optional[str]) -> None:
+    """Start writing spans to the given file, or stop tracing if None"""
+    global _writer
+    if _writer is not None:
+        _writer.flush()
+    _writer = None if trace_file is None else TraceWriter(trace_file)
+
+
+def tracing_enabled() -> bool:
+    return _writer is not None
+
+
+def flush_traces() -> None:
+    """Write out any buffered spans"""
+    if _writer is not None:
+        _writer.flush()
+
+
+def get_current_span() -> Optional["Span"]:
+    """Return the innermost open span in this context, if any"""
+    return _current_span.get()
+
+
+def get_current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return None if current is None else current.trace_id
+
+
+def _emit(
+    name: str,
+    category: str,
+    start_time: float,
+    end_time: float,
+    trace_id: str,
+    span_id: str,
+    parent_id: Optional[str],
+    attrs: Dict[str, Any],
+) -> None:
+    writer = _writer
+    if writer is None:
+        return
+    args = {"trace_id": trace_id, "span_id": span_id}
+    if parent_id is not None:
+        args["parent_id"] = parent_id
+    args.update(attrs)
+    writer.add_event(
+        {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": int(start_time * 1e6),
+            "dur": max(0, int((end_time - start_time) * 1e6)),
+            "pid": writer.pid,
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+    )
+
+
+def _resolve_parent(
+    parent: Optional["Span"], trace_id: Optional[str]
+) -> "Tuple[Optional[Span], str]":
+    """Default to the current span as parent, unless it's part of another trace"""
+    if parent is None:
+        parent = _current_span.get()
+    if trace_id is None:
+        return parent, parent.trace_id if parent is not None else new_trace_id()
+    if parent is not None and parent.trace_id != trace_id:
+        parent = None
+    return parent, trace_id
+
+
+class Span:
+    """
+    A timed operation within a trace, used as a context manager. Spans opened
+    while another is open (including in tasks and coroutines started from
+    within it) become its children, and share its trace id.
+    """
+
+    __slots__ = (
+        "name",
+        "category",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attrs",
+        "_start",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        category: str = "mephisto",
+        trace_id: Optional[str] = None,
+        parent: Optional["Span"] = None,
+        attrs: Optional[Dict[str, Any]] = None,
+    ):
+        parent, trace_id = _resolve_parent(parent, trace_id)
+        self.name = name
+        self.category = category
+        self.trace_id = trace_id
+        self.span_id = f"{next(_span_ids):x}"
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attrs = {} if attrs is None else attrs
+        self._start = 0.0
+        self._token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> "Span":
+        self._start = time.time()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        end_time = time.time()
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                pass  # Exited from a different context than it was entered in
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _emit(
+            self.name,
+            self.category,
+            self._start,
+            end_time,
+            self.trace_id,
+            self.span_id,
+            self.parent_id,
+            self.attrs,
+        )
+
+
+class _NoopSpan:
+    """Stand-in for Span while tracing is off, keeping the overhead to a call"""
+
+    __slots__ = ()
+    trace_id = None
+    span_id = None
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, category: str = "mephisto", trace_id: Optional[str] = None, **attrs):
+    """
+    Return a context manager timing the enclosed block as a span, such as
+    `with span("validate_onboarding", category="blueprint"): ...`
+    """
+    if _writer is None:
+        return _NOOP_SPAN
+    return Span(name, category=category, trace_id=trace_id, attrs=attrs)
+
+
+def record_span(
+    name: str,
+    start_time: float,
+    end_time: float,
+    category: str = "mephisto",
+    trace_id: Optional[str] = None,
+    parent: Optional[Span] = None,
+    root: bool = False,
+    **attrs,
+) -> None:
+    """
+    Record a span from already known start and end times (from time.time()),
+    such as the router hops timestamped on a packet. Spans are children of the
+    current span unless given a parent, or marked as the root of their trace.
+    """
+    if _writer is None:
+        return
+    if root:
+        parent = None
+        trace_id = new_trace_id() if trace_id is None else trace_id
+    else:
+        parent, trace_id = _resolve_parent(parent, trace_id)
+    _emit(
+        name,
+        category,
+        start_time,
+        end_time,
+        trace_id,
+        f"{next(_span_ids):x}",
+        None if parent is None else parent.span_id,
+        attrs,
+    )
+
+
+def _reset_after_fork() -> None:
+    if _writer is not None:
+        _writer.reset_after_fork()
+
+
+atexit.register(flush_traces)
+os.register_at_fork(after_in_child=_reset_after_fork)
+if os.environ.get(TRACE_FILE_ENV):
+    configure_tracing(os.environ[TRACE_FILE_ENV])
@@ -39,6 +39,10 @@ const CONNECTION_STATUS = {
   DISCONNECTED_SERVER: "disconnected_server",
 };
 
+// Websocket subprotocol negotiating the packet encoding. Browsers only
+// speak JSON, msgpack is used between the routers and the python server
+const SUBPROTOCOL_JSON = "mephisto-json";
+
 /* ================= Local Constants ================= */
 
 const SEND_THREAD_REFRESH = 100;
@@ -136,6 +140,8 @@ function useMephistoSocket({
   const queue = React.useRef(new PriorityQueue());
   const callbacks = React.useRef();
   const used_update_ids = React.useRef([]);
+  // Highest router sequence number received, acked so the router only replays the rest
+  const last_router_seq = React.useRef(0);
 
   React.useEffect(() => {
     callbacks.current = {
@@ -280,7 +286,7 @@ function useMephistoSocket({
     let socketProtocol = browserUrl.protocol == "https:" ? "wss://" : "ws://";
     let socketUrl =
       socketProtocol + browserUrl.hostname + ":" + browserUrl.port;
-    socket.current = new WebSocket(socketUrl);
+    socket.current = new WebSocket(socketUrl, [SUBPROTOCOL_JSON]);
 
     // TODO if socket setup fails here, see if 404 or timeout, then check
     // other reasonable domain. If that succeeds, assume the server died.
@@ -293,9 +299,13 @@ function useMephistoSocket({
       log("Server connected.", 2);
 
       /* sendAlive */
-      callbacks.current.enqueuePacket(PACKET_TYPE_ALIVE, {}, () => {
-        onConnectionStatusChange(CONNECTION_STATUS.CONNECTED);
-      });
+      callbacks.current.enqueuePacket(
+        PACKET_TYPE_ALIVE,
+        { last_router_seq: last_router_seq.current },
+        () => {
+          onConnectionStatusChange(CONNECTION_STATUS.CONNECTED);
+        }
+      );
 
       window.setTimeout(() => {
         if (socket.current.readyState !== 1 && !state.socket_terminated) {
@@ -329,6 +339,14 @@ function useMephistoSocket({
   }
 
   function parseSocketMessage(packet) {
+    if (packet.router_seq !== undefined) {
+      if (packet.router_seq <= last_router_seq.current) {
+        // Skip this message, the router replayed one we already have
+        log("Skipping replayed router_seq " + packet.router_seq, 3);
+        return;
+      }
+      last_router_seq.current = packet.router_seq;
+    }
     if (packet.packet_type == PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE) {
       let c_used_update_ids = used_update_ids.current;
 
@@ -408,6 +426,7 @@ function useMephistoSocket({
         packet_type: PACKET_TYPE_HEARTBEAT,
         subject_id: state.agentId,
         client_timestamp: pythonTime(),
+        data: { last_router_seq: last_router_seq.current },
       },
     });
     setState({
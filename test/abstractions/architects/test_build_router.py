@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import shutil
+import os
+import tempfile
+
+from unittest.mock import patch
+
+from mephisto.abstractions.architects.router.build_router import (
+    build_router,
+    TASK_CONFIG_PATH,
+)
+from mephisto.abstractions.blueprints.mock.mock_task_builder import MockTaskBuilder
+from mephisto.abstractions.databases.local_database import LocalMephistoDB
+from mephisto.data_model.task_run import TaskRun
+from mephisto.utils.testing import get_test_task_run
+
+
+class BuildRouterCacheTests(unittest.TestCase):
+    """
+    Ensure that the router build cache reuses unchanged builds and
+    rebuilds when the task bundle changes
+    """
+
+    def setUp(self) -> None:
+        self.data_dir = tempfile.mkdtemp()
+        database_path = os.path.join(self.data_dir, "mephisto.db")
+        self.db = LocalMephistoDB(database_path)
+        self.task_run = TaskRun.get(self.db, get_test_task_run(self.db))
+        self.cache_dir = os.path.join(self.data_dir, "router_cache")
+
+    def tearDown(self) -> None:
+        self.db.shutdown()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def _build(self, build_name: str) -> str:
+        build_dir = os.path.join(self.data_dir, build_name)
+        os.makedirs(build_dir)
+        return build_router(build_dir, self.task_run, version="flask", cache_dir=self.cache_dir)
+
+    def test_unchanged_router_is_reused(self) -> None:
+        """Two builds of the same task share a single cache entry"""
+        first_router = self._build("first")
+        second_router = self._build("second")
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        for router_dir in [first_router, second_router]:
+            self.assertTrue(os.path.exists(os.path.join(router_dir, TASK_CONFIG_PATH)))
+            self.assertTrue(os.path.exists(os.path.join(router_dir, MockTaskBuilder.BUILT_FILE)))
+
+        first_app = os.stat(os.path.join(first_router, "app.py"))
+        second_app = os.stat(os.path.join(second_router, "app.py"))
+        self.assertEqual(first_app.st_ino, second_app.st_ino, "Build was not hardlinked")
+
+        # Removing a build must leave the cache intact
+        shutil.rmtree(first_router)
+        self.assertTrue(os.path.exists(os.path.join(second_router, "app.py")))
+
+    def test_changed_bundle_is_rebuilt(self) -> None:
+        """Changing the built task files produces a new cache entry"""
+        self._build("first")
+        original_message = MockTaskBuilder.BUILT_MESSAGE
+        MockTaskBuilder.BUILT_MESSAGE = "rebuilt!"
+        try:
+            router_dir = self._build("second")
+        finally:
+            MockTaskBuilder.BUILT_MESSAGE = original_message
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        with open(os.path.join(router_dir, MockTaskBuilder.BUILT_FILE)) as built_file:
+            self.assertEqual(built_file.read(), "rebuilt!")
+
+    def test_known_inputs_skip_building(self) -> None:
+        """Builders that list their inputs are looked up without building"""
+        input_path = os.path.join(self.data_dir, "bundle.js")
+        with open(input_path, "w") as input_file:
+            input_file.write("first")
+        build_calls = []
+        original_build = MockTaskBuilder.build_in_dir
+
+        def counting_build(builder, build_dir):
+            build_calls.append(build_dir)
+            original_build(builder, build_dir)
+
+        with patch.object(MockTaskBuilder, "get_build_inputs", lambda builder: [input_path]):
+            with patch.object(MockTaskBuilder, "build_in_dir", counting_build):
+                self._build("first")
+                router_dir = self._build("second")
+                self.assertEqual(len(build_calls), 1)
+                self.assertTrue(os.path.exists(os.path.join(router_dir, TASK_CONFIG_PATH)))
+
+                with open(input_path, "w") as input_file:
+                    input_file.write("second")
+                self._build("third")
+        self.assertEqual(len(build_calls), 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_uncached_build(self) -> None:
+        """Disabling the cache builds directly into the build dir"""
+        build_dir = os.path.join(self.data_dir, "uncached")
+        os.makedirs(build_dir)
+        router_dir = build_router(
+            build_dir,
+            self.task_run,
+            version="flask",
+            use_cache=False,
+            cache_dir=self.cache_dir,
+        )
+        self.assertTrue(os.path.exists(os.path.join(router_dir, MockTaskBuilder.BUILT_FILE)))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
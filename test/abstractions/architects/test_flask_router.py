@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import base64
+import json
+import os
+
+from typing import Any, Dict, List, Optional
+
+import gevent.socket  # type: ignore
+from geventwebsocket import Resource, WebSocketServer  # type: ignore
+
+import mephisto.abstractions.architects.router.flask.mephisto_flask_blueprint as flask_router
+from mephisto.abstractions.architects.router.flask.mephisto_flask_blueprint import (
+    BackendHashRing,
+    MephistoRouter,
+    MephistoWebSocketHandler,
+    DEFAULT_BACKEND_ID,
+    REPLAY_BUFFER_SIZE,
+    SYSTEM_CHANNEL_ID,
+    PACKET_TYPE_ALIVE,
+    PACKET_TYPE_AGENT_DETAILS,
+    PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE,
+    PACKET_TYPE_HEARTBEAT,
+    PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE,
+    PACKET_TYPE_REQUEST_STATUSES,
+    PACKET_TYPE_RETURN_STATUSES,
+    PACKET_TYPE_UPDATE_STATUS,
+    SUBPROTOCOL_JSON,
+    SUBPROTOCOL_MSGPACK,
+)
+
+
+class FakeClient:
+    def __init__(self, ws: "FakeSocket"):
+        self.ws = ws
+
+
+class FakeHandler:
+    def __init__(self, ws: "FakeSocket"):
+        self.active_client = FakeClient(ws)
+
+
+class FakeSocket:
+    """Records what the router sends, in place of a gevent websocket"""
+
+    def __init__(self):
+        self.closed = False
+        self.environ: Dict[str, str] = {}
+        self.handler = FakeHandler(self)
+        self.sent: List[Dict[str, Any]] = []
+
+    def send(self, message: str) -> None:
+        self.sent.append(json.loads(message))
+
+
+class TestBackendHashRing(unittest.TestCase):
+    """Unit testing for the consistent hash ring of router backends"""
+
+    def test_keys_spread_across_backends(self):
+        ring = BackendHashRing()
+        self.assertIsNone(ring.get("agent"))
+        for backend_id in ["a", "b", "c", "d"]:
+            ring.add(backend_id)
+        counts: Dict[str, int] = {}
+        for idx in range(2000):
+            backend_id = ring.get(f"agent_{idx}")
+            counts[backend_id] = counts.get(backend_id, 0) + 1
+        self.assertEqual(sorted(counts.keys()), ["a", "b", "c", "d"])
+        for count in counts.values():
+            self.assertGreater(count, 2000 * 0.1)
+
+    def test_membership_changes_only_move_nearby_keys(self):
+        """Ensure a joining backend only takes keys, and leaving returns them"""
+        ring = BackendHashRing()
+        ring.add("a")
+        ring.add("b")
+        keys = [f"agent_{idx}" for idx in range(1000)]
+        before = {key: ring.get(key) for key in keys}
+        ring.add("c")
+        during = {key: ring.get(key) for key in keys}
+        moved = [key for key in keys if before[key] != during[key]]
+        self.assertGreater(len(moved), 0)
+        self.assertTrue(all(during[key] == "c" for key in moved))
+        ring.remove("c")
+        self.assertEqual({key: ring.get(key) for key in keys}, before)
+
+
+class RouterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        flask_router.mephisto_router_app = None
+        flask_router.mephisto_router_state = None
+
+    def connect(self, alive_data: Optional[Dict[str, Any]] = None) -> MephistoRouter:
+        """Open a socket to the router, as a backend if given alive data"""
+        router = MephistoRouter(FakeSocket())
+        router.on_open()
+        if alive_data is not None:
+            self.send(router, PACKET_TYPE_ALIVE, SYSTEM_CHANNEL_ID, alive_data)
+        return router
+
+    def send(self, router: MephistoRouter, packet_type: str, subject_id: str, data=None):
+        packet = {
+            "packet_type": packet_type,
+            "subject_id": subject_id,
+            "data": {} if data is None else data,
+            "server_timestamp": 0,
+        }
+        router.on_message(json.dumps(packet))
+
+    def get_statuses(self, backend: MephistoRouter) -> Dict[str, str]:
+        self.send(backend, PACKET_TYPE_REQUEST_STATUSES, SYSTEM_CHANNEL_ID, {"since_seq": 0})
+        response = backend.ws.sent[-1]
+        self.assertEqual(response["packet_type"], PACKET_TYPE_RETURN_STATUSES)
+        return response["data"]["statuses"]
+
+
+class TestMephistoRouterBackends(RouterTestCase):
+    """Unit testing for routing agents across several Mephisto backends"""
+
+    def test_single_backend_without_id(self):
+        """Ensure backends that don't send an id still receive everything"""
+        backend = self.connect(alive_data={})
+        state = backend.mephisto_state
+        self.assertEqual(list(state.backend_sockets.keys()), [DEFAULT_BACKEND_ID])
+
+        agent = self.connect()
+        self.send(agent, PACKET_TYPE_ALIVE, "agent_1")
+        self.send(agent, PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE, "agent_1", {"text": "hi"})
+        self.assertEqual(backend.ws.sent[-1]["data"], {"text": "hi"})
+        self.assertIn("agent_1", self.get_statuses(backend))
+
+    def test_agents_routed_to_their_backend(self):
+        """Ensure agents stick to the backend that registered them"""
+        first_backend = self.connect(alive_data={"backend_id": "first"})
+        second_backend = self.connect(alive_data={"backend_id": "second"})
+        state = first_backend.mephisto_state
+        ring_backend = state.backend_ring.get("agent_1")
+        other_backend = first_backend if ring_backend == "second" else second_backend
+        other_backend_id = "first" if ring_backend == "second" else "second"
+
+        # The backend the ring doesn't pick registers the agent, and keeps it
+        self.send(
+            other_backend,
+            PACKET_TYPE_AGENT_DETAILS,
+            "local_channel_1_0",  # Agent details are addressed to the requesting channel
+            {"request_id": "request_1", "agent_id": "agent_1"},
+        )
+        self.assertEqual(state.agent_id_to_backend["agent_1"], other_backend_id)
+        agent = self.connect()
+        self.send(agent, PACKET_TYPE_ALIVE, "agent_1")
+        self.send(agent, PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE, "agent_1", {"text": "hi"})
+        self.assertEqual(other_backend.ws.sent[-1]["subject_id"], "agent_1")
+
+        # Status requests only cover each backend's own agents
+        self.send(other_backend, PACKET_TYPE_UPDATE_STATUS, "agent_2", {"status": "waiting"})
+        self.assertEqual(
+            sorted(self.get_statuses(other_backend).keys()), ["agent_1", "agent_2"]
+        )
+        ring_backend_socket = first_backend if other_backend is second_backend else second_backend
+        self.assertEqual(self.get_statuses(ring_backend_socket), {})
+
+        # Once the registering backend leaves, its agents move along the ring
+        other_backend.on_close("closed")
+        self.assertNotIn(other_backend_id, state.backend_sockets)
+        self.send(agent, PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE, "agent_1", {"text": "again"})
+        self.assertEqual(ring_backend_socket.ws.sent[-1]["data"], {"text": "again"})
+
+
+class TestMephistoRouterReplay(RouterTestCase):
+    """Unit testing for replaying client-bound packets to reconnecting agents"""
+
+    def setUp(self):
+        super().setUp()
+        self.backend = self.connect(alive_data={})
+
+    def send_update(self, idx: int) -> None:
+        self.send(self.backend, PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE, "agent_1", {"idx": idx})
+
+    def get_updates(self, agent: MephistoRouter) -> List[Dict[str, Any]]:
+        return [
+            packet
+            for packet in agent.ws.sent
+            if packet["packet_type"] == PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE
+        ]
+
+    def test_unacked_packets_replayed_on_reconnect(self):
+        """Ensure only packets after the agent's ack are replayed, in order"""
+        agent = self.connect()
+        self.send(agent, PACKET_TYPE_ALIVE, "agent_1", {"last_router_seq": 0})
+        for idx in range(3):
+            self.send_update(idx)
+        seqs = [packet["router_seq"] for packet in self.get_updates(agent)]
+        self.assertEqual(seqs, sorted(seqs))
+
+        # The agent got the first update before losing the connection
+        self.send(agent, PACKET_TYPE_HEARTBEAT, "agent_1", {"last_router_seq": seqs[0]})
+        agent.ws.closed = True
+        agent.on_close("closed")
+        self.send_update(3)
+
+        reconnected = self.connect()
+        self.send(reconnected, PACKET_TYPE_ALIVE, "agent_1", {"last_router_seq": seqs[0]})
+        replayed = self.get_updates(reconnected)
+        self.assertEqual([packet["data"]["idx"] for packet in replayed], [1, 2, 3])
+        self.assertEqual([packet["router_seq"] for packet in replayed][:2], seqs[1:])
+
+    def test_clients_without_acks_only_get_unsent(self):
+        """Ensure older clients get queued packets once, as before"""
+        self.send_update(0)
+        agent = self.connect()
+        self.send(agent, PACKET_TYPE_ALIVE, "agent_1")
+        self.send_update(1)
+        self.assertEqual([packet["data"]["idx"] for packet in self.get_updates(agent)], [0, 1])
+
+        reconnected = self.connect()
+        self.send(reconnected, PACKET_TYPE_ALIVE, "agent_1")
+        self.assertEqual(self.get_updates(reconnected), [])
+
+    def test_replay_buffer_is_bounded(self):
+        for idx in range(REPLAY_BUFFER_SIZE + 10):
+            self.send_update(idx)
+        state = self.backend.mephisto_state.agent_id_to_agent["agent_1"]
+        self.assertEqual(len(state.replay_buffer), REPLAY_BUFFER_SIZE)
+        self.assertEqual(state.dropped_packets, 10)
+
+        agent = self.connect()
+        self.send(agent, PACKET_TYPE_ALIVE, "agent_1", {"last_router_seq": 0})
+        self.assertEqual(self.get_updates(agent)[0]["data"]["idx"], 10)
+
+    def test_restarted_router_continues_sequence(self):
+        """Ensure an agent that saw a previous router's packets doesn't skip new ones"""
+        agent = self.connect()
+        self.send(agent, PACKET_TYPE_ALIVE, "agent_1", {"last_router_seq": 50})
+        self.send_update(0)
+        self.assertEqual(self.get_updates(agent)[0]["router_seq"], 51)
+
+
+class TestMephistoRouterHandshake(unittest.TestCase):
+    """Unit testing for negotiating the packet encoding during the handshake"""
+
+    def setUp(self):
+        flask_router.mephisto_router_app = None
+        flask_router.mephisto_router_state = None
+        self.server = WebSocketServer(
+            ("127.0.0.1", 0),
+            Resource([("^/.*", MephistoRouter)]),
+            handler_class=MephistoWebSocketHandler,
+        )
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def handshake(self, protocols: List[str]) -> Dict[str, str]:
+        """Open a websocket offering the given protocols, returning the response headers"""
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (
+            "GET / HTTP/1.1\r\n"
+            f"Host: 127.0.0.1:{self.server.server_port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            f"Sec-WebSocket-Protocol: {', '.join(protocols)}\r\n\r\n"
+        )
+        sock = gevent.socket.create_connection(("127.0.0.1", self.server.server_port))
+        try:
+            sock.settimeout(5)
+            sock.sendall(request.encode())
+            response = b""
+            while b"\r\n\r\n" not in response:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+        finally:
+            sock.close()
+        status_line, *header_lines = response.split(b"\r\n\r\n")[0].decode().split("\r\n")
+        self.assertIn("101", status_line)
+        headers = {}
+        for line in header_lines:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+    def test_json_only_clients_get_json(self):
+        headers = self.handshake([SUBPROTOCOL_JSON])
+        self.assertEqual(headers.get("sec-websocket-protocol"), SUBPROTOCOL_JSON)
+
+    def test_msgpack_chosen_when_offered(self):
+        headers = self.handshake([SUBPROTOCOL_MSGPACK, SUBPROTOCOL_JSON])
+        expected = SUBPROTOCOL_MSGPACK if flask_router.MSGPACK_INSTALLED else SUBPROTOCOL_JSON
+        self.assertEqual(headers.get("sec-websocket-protocol"), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import shutil
+import os
+import socket
+import tempfile
+import requests
+
+from mephisto.abstractions.architects.router.shared_router import (
+    SharedRouterException,
+    register_task_run,
+    router_host_is_alive,
+    shutdown_router_host,
+    unregister_task_run,
+)
+
+# Stand-in for a built router's server.js, exposing the same interface
+# as the node router without needing its node_modules
+FAKE_ROUTER_SERVER = """
+const http = require("http");
+const loaded_at = Date.now() + "-" + Math.random();
+const server = http.createServer(function (req, res) {
+  res.end(JSON.stringify({ router_dir: __dirname, loaded_at: loaded_at }));
+});
+server.listen(process.env.PORT);
+function shutdown_router(callback) {
+  server.close(callback);
+}
+module.exports = { server: server, shutdown_router: shutdown_router };
+"""
+
+
+def get_free_port() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return str(sock.getsockname()[1])
+
+
+@unittest.skipIf(shutil.which("node") is None, "Node is not installed")
+class TestSharedRouter(unittest.TestCase):
+    """Unit testing for registering task runs with the shared router host"""
+
+    def setUp(self):
+        self.router_root = tempfile.mkdtemp()
+        self.host_port = get_free_port()
+
+    def tearDown(self):
+        shutdown_router_host(self.host_port)
+        shutil.rmtree(self.router_root, ignore_errors=True)
+
+    def make_router_dir(self, name: str) -> str:
+        router_dir = os.path.join(self.router_root, name)
+        os.makedirs(router_dir)
+        with open(os.path.join(router_dir, "server.js"), "w") as server_file:
+            server_file.write(FAKE_ROUTER_SERVER)
+        return router_dir
+
+    def get_router_response(self, port: str) -> dict:
+        return requests.get(f"http://127.0.0.1:{port}/", timeout=5).json()
+
+    def test_runs_share_router_host(self):
+        """Ensure several runs are served by one host, each on its own port"""
+        first_dir, second_dir = self.make_router_dir("1"), self.make_router_dir("2")
+        first_port, second_port = get_free_port(), get_free_port()
+        self.assertFalse(router_host_is_alive(self.host_port))
+
+        register_task_run("1", first_dir, first_port, self.host_port)
+        self.assertTrue(router_host_is_alive(self.host_port))
+        register_task_run("2", second_dir, second_port, self.host_port)
+        self.assertEqual(self.get_router_response(first_port)["router_dir"], first_dir)
+        self.assertEqual(self.get_router_response(second_port)["router_dir"], second_dir)
+        host_status = requests.get(f"http://127.0.0.1:{self.host_port}/is_alive").json()
+        self.assertEqual(sorted(host_status["task_run_ids"]), ["1", "2"])
+
+        with self.assertRaises(SharedRouterException):
+            register_task_run("1", first_dir, first_port, self.host_port)
+
+        self.assertTrue(unregister_task_run("1", self.host_port))
+        self.assertFalse(unregister_task_run("1", self.host_port))
+        with self.assertRaises(requests.ConnectionError):
+            self.get_router_response(first_port)
+        self.assertEqual(self.get_router_response(second_port)["router_dir"], second_dir)
+
+    def test_reregistered_router_is_reloaded(self):
+        """Ensure a router directory registered again gets fresh state"""
+        router_dir = self.make_router_dir("1")
+        port = get_free_port()
+        register_task_run("1", router_dir, port, self.host_port)
+        first_load = self.get_router_response(port)["loaded_at"]
+        unregister_task_run("1", self.host_port)
+        register_task_run("1", router_dir, port, self.host_port)
+        self.assertNotEqual(self.get_router_response(port)["loaded_at"], first_load)
+
+    def test_port_in_use_fails_registration(self):
+        """Ensure a router that can't listen is reported, and leaves the host usable"""
+        with socket.socket() as sock:
+            sock.bind(("0.0.0.0", 0))
+            sock.listen()
+            taken_port = str(sock.getsockname()[1])
+            with self.assertRaises(SharedRouterException):
+                register_task_run("1", self.make_router_dir("1"), taken_port, self.host_port)
+        port = get_free_port()
+        register_task_run("1", self.make_router_dir("2"), port, self.host_port)
+        self.assertIn("router_dir", self.get_router_response(port))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import tempfile
+import os
+import shutil
+
+from mephisto.abstractions.databases.local_database import LocalMephistoDB
+from mephisto.abstractions.blueprints.mixins.use_gold_unit import (
+    GoldQualificationCounters,
+    UseGoldUnit,
+    get_gold_factory,
+    get_gold_counters,
+    permute_gold_index,
+)
+from mephisto.data_model.worker import Worker
+
+
+class TestGoldFactory(unittest.TestCase):
+    """Unit testing for the gold distribution helpers of UseGoldUnit"""
+
+    def setUp(self) -> None:
+        self.data_dir = tempfile.mkdtemp()
+        database_path = os.path.join(self.data_dir, "mephisto.db")
+        self.db = LocalMephistoDB(database_path)
+
+    def tearDown(self) -> None:
+        self.db.shutdown()
+        shutil.rmtree(self.data_dir)
+
+    def make_worker(self, worker_name: str) -> Worker:
+        worker_id = self.db.new_worker(worker_name, "mock")
+        return Worker.get(self.db, worker_id)
+
+    def test_permutation(self) -> None:
+        """Ensure each key gives a full permutation, and keys differ"""
+        for num_golds in [1, 2, 3, 7, 64, 1000]:
+            ordering = [permute_gold_index(pos, num_golds, "key") for pos in range(num_golds)]
+            self.assertEqual(sorted(ordering), list(range(num_golds)))
+        first = [permute_gold_index(pos, 100, "a") for pos in range(100)]
+        second = [permute_gold_index(pos, 100, "b") for pos in range(100)]
+        self.assertNotEqual(first, second)
+
+    def test_draws_without_replacement(self) -> None:
+        """Ensure workers see every gold once before any repeat"""
+        golds = [{"gold": idx} for idx in range(10)]
+        factory = get_gold_factory(golds, seed=0)
+        worker = self.make_worker("worker_1")
+        first_pass = [factory(worker)["gold"] for _ in range(10)]
+        second_pass = [factory(worker)["gold"] for _ in range(10)]
+        self.assertEqual(sorted(first_pass), list(range(10)))
+        self.assertEqual(sorted(second_pass), list(range(10)))
+        self.assertNotEqual(first_pass, second_pass, "Golds not reshuffled between passes")
+
+        # Orderings are per-worker, and reproducible for the same seed
+        other_worker = self.make_worker("worker_2")
+        other_pass = [factory(other_worker)["gold"] for _ in range(10)]
+        self.assertNotEqual(first_pass, other_pass)
+        fresh_factory = get_gold_factory(golds, seed=0)
+        self.assertEqual([fresh_factory(worker)["gold"] for _ in range(10)], first_pass)
+
+        # Without a seed, each factory orders golds differently
+        orderings = set()
+        for _ in range(3):
+            unseeded_factory = get_gold_factory(golds)
+            orderings.add(tuple(unseeded_factory(worker)["gold"] for _ in range(10)))
+        self.assertGreater(len(orderings), 1)
+
+    def test_persisted_cursor(self) -> None:
+        """Ensure persisted cursors continue across new factories"""
+        golds = [{"gold": idx} for idx in range(10)]
+        worker = self.make_worker("worker_1")
+        factory = get_gold_factory(golds, cursor_qualification="test-gold-cursor")
+        seen = [factory(worker)["gold"] for _ in range(4)]
+        self.assertEqual(worker.get_granted_qualification("test-gold-cursor").value, 4)
+
+        restarted_factory = get_gold_factory(golds, cursor_qualification="test-gold-cursor")
+        seen += [restarted_factory(worker)["gold"] for _ in range(6)]
+        self.assertEqual(sorted(seen), list(range(10)))
+
+    def test_gold_counters(self) -> None:
+        """Ensure counters read once, update in memory, and write back"""
+        worker = self.make_worker("worker_1")
+        counters = get_gold_counters(self.db, "test-gold")
+        self.assertIs(get_gold_counters(self.db, "test-gold"), counters)
+        worker.grant_qualification("test-gold-correct-golds", 2, skip_crowd=True)
+        self.assertEqual(counters.get(worker), (0, 2, 0))
+
+        counters.flush_interval = 60
+        counters.increment(worker, completed=1, incorrect=1)
+        self.assertEqual(counters.get(worker), (1, 2, 1))
+        self.assertIsNone(worker.get_granted_qualification("test-gold-wrong-golds"))
+
+        counters.flush()
+        for qual_name, value in [
+            ("test-gold-completed-count", 1),
+            ("test-gold-correct-golds", 2),
+            ("test-gold-wrong-golds", 1),
+        ]:
+            self.assertEqual(UseGoldUnit.get_current_qual_or_default(worker, qual_name), value)
+
+    def test_gold_counters_share_qualifications(self) -> None:
+        """Ensure counters of separate processes add to, not overwrite, each other"""
+        worker = self.make_worker("worker_1")
+        first = GoldQualificationCounters(self.db, "test-gold", flush_interval=60)
+        second = GoldQualificationCounters(self.db, "test-gold", flush_interval=60)
+        worker.grant_qualification("test-gold-completed-count", 5, skip_crowd=True)
+        self.assertEqual(first.get(worker), (5, 0, 0))
+        self.assertEqual(second.get(worker), (5, 0, 0))
+
+        first.increment(worker, completed=2)
+        second.increment(worker, completed=1, correct=1)
+        first.flush()
+        second.flush()
+        self.assertEqual(
+            UseGoldUnit.get_current_qual_or_default(worker, "test-gold-completed-count"), 8
+        )
+        self.assertEqual(second.get(worker), (8, 1, 0))
+        first.increment(worker, completed=1)
+        first.flush()
+        self.assertEqual(first.get(worker), (9, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,8 +9,14 @@ import shutil
 import os
 import tempfile
 
+from mephisto.abstractions.database import MephistoDB
 from mephisto.abstractions.test.data_model_database_tester import BaseDatabaseTests
-from mephisto.abstractions.databases.local_database import LocalMephistoDB
+from mephisto.abstractions.databases.local_database import (
+    LocalMephistoDB,
+    build_select_query,
+)
+from mephisto.data_model.agent import Agent
+from mephisto.utils.testing import get_test_agent
 
 
 class TestLocalMephistoDB(BaseDatabaseTests):
@@ -35,5 +41,60 @@ class TestLocalMephistoDB(BaseDatabaseTests):
     # TODO(#97) are there any other unit tests we'd like to have?
 
 
+class TestLocalMephistoDBQueryPlans(unittest.TestCase):
+    """
+    Ensure the find queries used on hot paths during live runs are served
+    from indexes, rather than scanning their tables
+    """
+
+    # (table, selected columns, filtered columns, whether the index should cover the query)
+    INDEXED_QUERIES = [
+        ("units", ("*",), ("assignment_id",), False),
+        ("units", ("*",), ("task_run_id",), False),
+        ("units", ("*",), ("task_run_id", "status"), False),
+        ("units", ("unit_id",), ("task_run_id", "worker_id", "status"), True),
+        ("units", ("status",), ("task_id", "worker_id"), True),
+        ("agents", ("*",), ("unit_id",), False),
+        ("agents", ("*",), ("worker_id", "status"), False),
+        ("agents", ("*",), ("task_run_id",), False),
+        ("onboarding_agents", ("*",), ("worker_id", "task_run_id"), False),
+        ("onboarding_agents", ("*",), ("task_run_id",), False),
+        ("granted_qualifications", ("*",), ("qualification_id", "worker_id"), False),
+        ("granted_qualifications", ("*",), ("worker_id",), False),
+        ("granted_qualifications", ("worker_id",), ("qualification_id", "value"), True),
+        ("assignments", ("*",), ("task_run_id",), False),
+        ("task_runs", ("*",), ("task_id",), False),
+    ]
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        database_path = os.path.join(self.data_dir, "mephisto.db")
+        self.db = LocalMephistoDB(database_path)
+
+    def tearDown(self):
+        self.db.shutdown()
+        shutil.rmtree(self.data_dir)
+
+    def test_find_queries_use_indexes(self) -> None:
+        conn = self.db._get_connection()
+        for table, columns, filters, covering in self.INDEXED_QUERIES:
+            query = build_select_query(table, columns, filters)
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", (1,) * len(filters)).fetchall()
+            details = " ".join(row["detail"] for row in plan)
+            self.assertNotIn(f"SCAN {table}", details, f"{query} scans {table}: {details}")
+            self.assertIn("USING", details, f"{query} does not use an index: {details}")
+            if covering:
+                self.assertIn("COVERING INDEX", details, f"{query} not covered: {details}")
+
+    def test_default_find_unit_fields_matches_query(self) -> None:
+        """Ensure the base projection over found Units matches selecting the columns"""
+        agent = Agent.get(self.db, get_test_agent(self.db))
+        fields = ["unit_id", "status", "worker_id", "task_run_id"]
+        for filters in [{}, {"worker_id": agent.worker_id}, {"status": "nonexistent"}]:
+            expected = [dict(row) for row in self.db.find_unit_fields(fields, **filters)]
+            projected = MephistoDB._find_unit_fields(self.db, fields, **filters)
+            self.assertEqual(projected, expected)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import shutil
+import os
+import sqlite3
+import tempfile
+
+from mephisto.abstractions.database import MephistoDBException
+from mephisto.abstractions.databases.local_database import LocalMephistoDB, MIGRATIONS
+from mephisto.abstractions.databases.migrations import (
+    Migration,
+    get_schema_version,
+    run_migrations,
+)
+
+
+class TestMigrations(unittest.TestCase):
+    """Unit testing for the versioned schema migrations of the LocalMephistoDB"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.database_path = os.path.join(self.data_dir, "mephisto.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def get_index_names(self, conn: sqlite3.Connection):
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+        return {row[0] for row in rows}
+
+    def test_new_database_at_latest_version(self) -> None:
+        db = LocalMephistoDB(self.database_path)
+        conn = db._get_connection()
+        self.assertEqual(get_schema_version(conn), len(MIGRATIONS))
+        self.assertEqual(run_migrations(conn, MIGRATIONS), [], "Migrations re-applied")
+        db.shutdown()
+
+    def test_existing_database_upgraded(self) -> None:
+        """Ensure a database from before a migration receives it on startup"""
+        conn = sqlite3.connect(self.database_path)
+        self.assertEqual(run_migrations(conn, MIGRATIONS, target_version=1), [1])
+        self.assertIn("unit_by_task_by_worker_index", self.get_index_names(conn))
+        conn.close()
+
+        db = LocalMephistoDB(self.database_path)
+        conn = db._get_connection()
+        self.assertEqual(get_schema_version(conn), len(MIGRATIONS))
+        index_names = self.get_index_names(conn)
+        self.assertIn("unit_by_task_by_worker_by_status_index", index_names)
+        self.assertNotIn("unit_by_task_by_worker_index", index_names)
+        db.shutdown()
+
+    def test_failed_migration_rolls_back(self) -> None:
+        """Ensure a failing migration leaves neither its changes nor its version"""
+        conn = sqlite3.connect(self.database_path)
+        migrations = [
+            Migration(1, "Create a table", statements=["CREATE TABLE first (x INTEGER)"]),
+            Migration(
+                2,
+                "Fail partway through",
+                statements=["CREATE TABLE second (x INTEGER)", "NOT VALID SQL"],
+                indexes=["CREATE INDEX IF NOT EXISTS first_x_index ON first(x)"],
+            ),
+        ]
+        with self.assertRaises(MephistoDBException):
+            run_migrations(conn, migrations)
+        self.assertEqual(get_schema_version(conn), 1)
+        tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        self.assertEqual([row[0] for row in tables], ["first"])
+
+        # Fixing the migration lets it apply, rebuilding indexes idempotently
+        migrations[1].statements = ["CREATE TABLE second (x INTEGER)"]
+        self.assertEqual(run_migrations(conn, migrations), [2])
+        self.assertIn("first_x_index", self.get_index_names(conn))
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
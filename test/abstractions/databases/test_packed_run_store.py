@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import shutil
+import os
+import tempfile
+
+from mephisto.abstractions.databases.local_database import LocalMephistoDB
+from mephisto.abstractions.databases.packed_run_store import PACKED_RUN_FILE
+from mephisto.data_model.assignment import Assignment, InitializationData
+from mephisto.utils.testing import get_test_assignment
+
+
+class TestPackedRunStore(unittest.TestCase):
+    """Unit testing for packing a run's data files into a single store"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.db = LocalMephistoDB(os.path.join(self.data_dir, "mephisto.db"))
+        self.assignment = Assignment.get(self.db, get_test_assignment(self.db))
+        self.assignment.write_assignment_data(InitializationData(shared={"a": 1}, unit_data=[{}]))
+        self.task_run = self.assignment.get_task_run()
+        self.run_dir = self.task_run.get_run_dir()
+        self.agent_dir = os.path.join(self.assignment.get_data_dir(), "1")
+        self.state_path = os.path.join(self.agent_dir, "agent_data.json")
+        self.db.write_dict(self.state_path, {"outputs": {"answer": 42}})
+        self.upload_path = os.path.join(self.agent_dir, "upload.png")
+        with open(self.upload_path, "wb") as upload_file:
+            upload_file.write(b"png")
+        os.makedirs(os.path.join(self.run_dir, "build"))
+        self.build_path = os.path.join(self.run_dir, "build", "config.json")
+        self.db.write_dict(self.build_path, {})
+
+    def tearDown(self):
+        self.db.shutdown()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_packed_files_read_transparently(self):
+        self.assertEqual(self.db.pack_task_run(self.task_run.db_id), 2)
+        self.assertTrue(os.path.exists(os.path.join(self.run_dir, PACKED_RUN_FILE)))
+        self.assertFalse(os.path.exists(self.state_path))
+        # Files that aren't packed, and the build dir, are left alone
+        self.assertTrue(os.path.exists(self.upload_path))
+        self.assertTrue(os.path.exists(self.build_path))
+
+        self.assertTrue(self.db.key_exists(self.state_path))
+        self.assertFalse(self.db.key_exists(os.path.join(self.agent_dir, "missing.json")))
+        self.assertEqual(self.db.read_dict(self.state_path), {"outputs": {"answer": 42}})
+        assignment = Assignment.get(self.db, self.assignment.db_id)
+        self.assertEqual(
+            assignment.get_assignment_data(),
+            InitializationData(shared={"a": 1}, unit_data=[{}]),
+        )
+        with self.assertRaises(FileNotFoundError):
+            self.db.read_text(os.path.join(self.agent_dir, "missing.json"))
+
+    def test_empty_dirs_removed_and_writes_go_to_store(self):
+        os.unlink(self.upload_path)
+        self.db.pack_task_run(self.task_run.db_id)
+        self.assertFalse(os.path.exists(self.assignment.get_data_dir()))
+
+        self.db.write_dict(self.state_path, {"outputs": {"answer": 43}})
+        self.assertFalse(os.path.exists(self.agent_dir))
+        self.assertEqual(self.db.read_dict(self.state_path), {"outputs": {"answer": 43}})
+
+        self.assertEqual(self.db.unpack_task_run(self.task_run.db_id), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.run_dir, PACKED_RUN_FILE)))
+        with open(self.state_path) as state_file:
+            self.assertEqual(state_file.read(), '{"outputs": {"answer": 43}}')
+
+    def test_repacking_takes_in_new_files(self):
+        self.db.pack_task_run(self.task_run.db_id)
+        other_path = os.path.join(self.agent_dir, "agent_meta.json")
+        self.db.write_dict(other_path, {"task_start": 1})
+        self.assertTrue(os.path.exists(other_path))  # The upload keeps the dir around
+        self.assertEqual(self.db.pack_task_run(self.task_run.db_id), 1)
+        self.assertEqual(self.db.read_dict(other_path), {"task_start": 1})
+        self.assertEqual(self.db.read_dict(self.state_path), {"outputs": {"answer": 42}})
+
+
+if __name__ == "__main__":
+    unittest.main()
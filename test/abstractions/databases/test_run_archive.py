@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import shutil
+import os
+import tempfile
+import threading
+
+from mephisto.abstractions.databases.local_database import LocalMephistoDB
+from mephisto.abstractions.databases.run_archive import MAX_OPEN_ARCHIVES, RUN_ARCHIVE_FILE
+from mephisto.abstractions.database import MephistoDBException, EntryDoesNotExistException
+from mephisto.data_model.agent import Agent
+from mephisto.data_model.constants.assignment_state import AssignmentState
+from mephisto.data_model.task_run import TaskRun
+from mephisto.data_model.unit import Unit
+from mephisto.utils.testing import get_test_agent
+
+
+class TestRunArchive(unittest.TestCase):
+    """Unit testing for archiving the rows of completed runs out of the live tables"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.db = LocalMephistoDB(os.path.join(self.data_dir, "mephisto.db"))
+        self.agent_id = get_test_agent(self.db)
+        self.agent = Agent.get(self.db, self.agent_id)
+        self.unit_id = self.agent.unit_id
+        self.task_run_id = self.agent.task_run_id
+        # A second run of the same task that stays live
+        task_run = TaskRun.get(self.db, self.task_run_id)
+        live_run_id = self.db.new_task_run(
+            task_run.task_id, task_run.requester_id, task_run.param_string, "mock", "mock"
+        )
+        assignment_id = self.db.new_assignment(
+            task_run.task_id, live_run_id, task_run.requester_id, "mock", "mock"
+        )
+        self.live_unit_id = self.db.new_unit(
+            task_run.task_id,
+            live_run_id,
+            task_run.requester_id,
+            assignment_id,
+            0,
+            1.0,
+            "mock",
+            "mock",
+        )
+        self.db.update_task_run(self.task_run_id, is_completed=True)
+
+    def tearDown(self):
+        self.db.shutdown()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def _count_live_rows(self, table_name: str) -> int:
+        c = self.db._get_connection().cursor()
+        c.row_factory = None
+        c.execute(f"SELECT COUNT(*) FROM {table_name} WHERE task_run_id = ?", (self.task_run_id,))
+        return c.fetchone()[0]
+
+    def test_archived_rows_still_found(self):
+        self.db.archive_task_run(self.task_run_id)
+        self.assertTrue(self.db.is_task_run_archived(self.task_run_id))
+        run_dir = TaskRun.get(self.db, self.task_run_id).get_run_dir()
+        self.assertTrue(os.path.exists(os.path.join(run_dir, RUN_ARCHIVE_FILE)))
+        for table_name in ["assignments", "units", "agents"]:
+            self.assertEqual(self._count_live_rows(table_name), 0)
+
+        self.assertEqual(Unit.get(self.db, self.unit_id).agent_id, self.agent_id)
+        self.assertEqual(Agent.get(self.db, self.agent_id).worker_id, self.agent.worker_id)
+        units = self.db.find_units(task_run_id=self.task_run_id)
+        self.assertEqual([unit.db_id for unit in units], [self.unit_id])
+        agents = self.db.find_agents(worker_id=self.agent.worker_id)
+        self.assertEqual([agent.db_id for agent in agents], [self.agent_id])
+        rows = self.db.find_unit_fields(
+            ["unit_id", "status"], task_id=self.agent.task_id, worker_id=self.agent.worker_id
+        )
+        self.assertEqual([row["unit_id"] for row in rows], [self.unit_id])
+        # Rows of live runs aren't affected
+        all_units = self.db.find_units()
+        self.assertEqual(
+            sorted(unit.db_id for unit in all_units), sorted([self.unit_id, self.live_unit_id])
+        )
+        with self.assertRaises(EntryDoesNotExistException):
+            Unit.get(self.db, "9999")
+
+    def test_archived_rows_updated(self):
+        self.db.archive_task_run(self.task_run_id)
+        self.db.update_agent(self.agent_id, status="approved")
+        self.db.update_unit(self.unit_id, status=AssignmentState.ACCEPTED)
+        self.assertEqual(self.db.get_agent(self.agent_id)["status"], "approved")
+        self.assertEqual(self.db.get_unit(self.unit_id)["status"], AssignmentState.ACCEPTED)
+        self.assertEqual(self._count_live_rows("agents"), 0)
+
+    def test_unarchive_restores_rows(self):
+        self.db.archive_task_run(self.task_run_id)
+        self.db.update_agent(self.agent_id, status="approved")
+        self.db.unarchive_task_run(self.task_run_id)
+        self.assertFalse(self.db.is_task_run_archived(self.task_run_id))
+        run_dir = TaskRun.get(self.db, self.task_run_id).get_run_dir()
+        self.assertFalse(os.path.exists(os.path.join(run_dir, RUN_ARCHIVE_FILE)))
+        self.assertEqual(self._count_live_rows("units"), 1)
+        self.assertEqual(self._count_live_rows("agents"), 1)
+        self.assertEqual(self.db.get_agent(self.agent_id)["status"], "approved")
+
+    def test_only_completed_runs_archived(self):
+        live_run_id = Unit.get(self.db, self.live_unit_id).task_run_id
+        with self.assertRaises(MephistoDBException):
+            self.db.archive_task_run(live_run_id)
+        self.assertEqual(self.db.archive_completed_task_runs(min_age_days=1), [])
+        self.assertEqual(self.db.archive_completed_task_runs(), [self.task_run_id])
+        self.assertEqual(self.db.archive_completed_task_runs(), [])
+
+    def test_concurrent_queries_across_evicted_archives(self):
+        """Ensure archives evicted by one thread stay usable by others until released"""
+        task_run = TaskRun.get(self.db, self.task_run_id)
+        unit_ids = [self.unit_id]
+        for _ in range(MAX_OPEN_ARCHIVES + 8):
+            task_run_id = self.db.new_task_run(
+                task_run.task_id, task_run.requester_id, task_run.param_string, "mock", "mock"
+            )
+            assignment_id = self.db.new_assignment(
+                task_run.task_id, task_run_id, task_run.requester_id, "mock", "mock"
+            )
+            unit_ids.append(
+                self.db.new_unit(
+                    task_run.task_id,
+                    task_run_id,
+                    task_run.requester_id,
+                    assignment_id,
+                    0,
+                    1.0,
+                    "mock",
+                    "mock",
+                )
+            )
+            self.db.update_task_run(task_run_id, is_completed=True)
+        archived = self.db.archive_completed_task_runs()
+        self.assertEqual(len(archived), MAX_OPEN_ARCHIVES + 9)
+
+        # Held archives survive being evicted by a query reaching every archive
+        held_run = self.db._get_archived_runs()[archived[0]]
+        with self.db._use_archive(held_run) as archive:
+            self.db.find_units()
+            self.assertNotIn(held_run.task_run_id, self.db._open_archives)
+            self.assertEqual(len(archive.select("SELECT * FROM units", ())), 1)
+
+        errors = []
+        expected_units = sorted(unit_ids + [self.live_unit_id])
+
+        def find_all_units():
+            try:
+                for _ in range(5):
+                    found = sorted(unit.db_id for unit in self.db.find_units())
+                    if found != expected_units:
+                        errors.append(f"Found {len(found)} units")
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                self.db.shutdown()
+
+        threads = [threading.Thread(target=find_all_units) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from typing import Any, Dict, List, Tuple
+
+from mephisto.abstractions.databases.local_database import LocalMephistoDB
+from mephisto.operations.agent_state_persister import AgentStatePersister
+
+
+class RecordingDB:
+    """Stand-in db that records the dicts written to it, and on which threads"""
+
+    def __init__(self):
+        self.writes: List[Tuple[str, Dict[str, Any]]] = []
+        self.threads = set()
+
+    def write_dict(self, path_key: str, target_dict: Dict[str, Any]) -> None:
+        self.writes.append((path_key, dict(target_dict)))
+        self.threads.add(threading.current_thread().name)
+
+
+class TestAgentStatePersister(unittest.TestCase):
+    """Unit testing for write-behind saving of agent states"""
+
+    def setUp(self):
+        self.db = RecordingDB()
+        self.persister = AgentStatePersister(self.db, window=0.1)
+
+    def tearDown(self):
+        self.persister.shutdown()
+
+    def test_coalesces_saves_within_window(self):
+        for idx in range(10):
+            self.persister.write_dict("agent_1/state.json", {"idx": idx})
+        self.persister.write_dict("agent_2/state.json", {"idx": 0})
+        self.assertEqual(self.db.writes, [])
+
+        deadline = time.monotonic() + 5
+        while len(self.db.writes) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(
+            sorted(self.db.writes),
+            [("agent_1/state.json", {"idx": 9}), ("agent_2/state.json", {"idx": 0})],
+        )
+        self.assertEqual(self.db.threads, {"agent-state-persister"})
+        self.assertEqual(self.persister.pending_count(), 0)
+
+    def test_flush_writes_pending_immediately(self):
+        self.persister.write_dict("agent_1/state.json", {"idx": 0})
+        self.persister.write_dict("agent_1/state.json", {"idx": 1})
+        self.persister.flush()
+        self.assertEqual(self.db.writes, [("agent_1/state.json", {"idx": 1})])
+        self.persister.flush()
+        self.assertEqual(len(self.db.writes), 1)
+
+    def test_saves_snapshot_of_dict(self):
+        """Ensure changes made to a dict after saving it aren't written"""
+        state = {"messages": [{"idx": 0}]}
+        self.persister.write_dict("agent_1/state.json", state)
+        state["messages"].append({"idx": 1})
+        state["done"] = True
+        self.persister.flush()
+        self.assertEqual(self.db.writes, [("agent_1/state.json", {"messages": [{"idx": 0}]})])
+
+    def test_flush_only_given_prefix(self):
+        """Ensure flushing one agent's saves leaves other agents' saves pending"""
+        self.persister.write_dict("agent_1/state.json", {"idx": 0})
+        self.persister.write_dict("agent_10/state.json", {"idx": 0})
+        self.persister.flush(path_prefix="agent_1/")
+        self.assertEqual(self.db.writes, [("agent_1/state.json", {"idx": 0})])
+        self.assertEqual(self.persister.pending_count(), 1)
+
+    def test_request_flush_writes_without_waiting_for_window(self):
+        """Ensure a requested flush is written by the background thread right away"""
+        self.persister.shutdown()
+        self.persister = AgentStatePersister(self.db, window=60)
+        self.persister.write_dict("agent_1/state.json", {"idx": 0})
+        self.persister.request_flush()
+        deadline = time.monotonic() + 5
+        while len(self.db.writes) < 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.db.writes, [("agent_1/state.json", {"idx": 0})])
+        self.assertEqual(self.db.threads, {"agent-state-persister"})
+
+    def test_shutdown_flushes_then_writes_through(self):
+        self.persister.write_dict("agent_1/state.json", {"idx": 0})
+        self.persister.shutdown()
+        self.assertEqual(self.db.writes, [("agent_1/state.json", {"idx": 0})])
+        self.persister.write_dict("agent_1/state.json", {"idx": 1})
+        self.assertEqual(self.db.writes[-1], ("agent_1/state.json", {"idx": 1}))
+
+    def test_local_db_writes_atomically(self):
+        """Ensure written files replace the old one whole, leaving no temp files"""
+        data_dir = tempfile.mkdtemp()
+        db = LocalMephistoDB(database_path=os.path.join(data_dir, "mephisto.db"))
+        try:
+            path_key = os.path.join(data_dir, "agent_1", "state.json")
+            db.write_dict(path_key, {"idx": 0})
+            db.write_dict(path_key, {"idx": 1})
+            self.assertEqual(db.read_dict(path_key), {"idx": 1})
+            with self.assertRaises(TypeError):
+                db.write_dict(path_key, {"unserializable": object()})
+            self.assertEqual(db.read_dict(path_key), {"idx": 1})
+            self.assertEqual(os.listdir(os.path.dirname(path_key)), ["state.json"])
+        finally:
+            db.shutdown()
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
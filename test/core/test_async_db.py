@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import asyncio
+import threading
+
+from typing import Any, List, Tuple
+
+from mephisto.operations.async_db import AsyncMephistoDB
+
+
+class CountingDB:
+    """Stand-in db that records the calls made to it, and on which threads"""
+
+    def __init__(self):
+        self.calls: List[Tuple[str, Any]] = []
+        self.threads = set()
+
+    def find_workers(self, worker_name=None):
+        self.calls.append(("find_workers", worker_name))
+        self.threads.add(threading.current_thread().name)
+        return [worker_name]
+
+    def update_agent(self, agent_id, status=None):
+        self.calls.append(("update_agent", agent_id))
+        self.threads.add(threading.current_thread().name)
+
+    def get_unit(self, unit_id):
+        raise KeyError(unit_id)
+
+
+class TestAsyncMephistoDB(unittest.TestCase):
+    def setUp(self):
+        self.db = CountingDB()
+        self.async_db = AsyncMephistoDB(self.db)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.async_db.shutdown()
+        self.loop.close()
+
+    def test_batches_and_coalesces_calls(self) -> None:
+        """Ensure calls in one tick share a trip, and identical reads run once"""
+
+        async def make_calls():
+            results = await asyncio.gather(
+                self.async_db.find_workers(worker_name="a"),
+                self.async_db.find_workers(worker_name="a"),
+                self.async_db.find_workers(worker_name="b"),
+                self.async_db.update_agent("1", status="done"),
+                self.async_db.update_agent("1", status="done"),
+                self.async_db.run(self.db.find_workers, worker_name="c"),
+            )
+            return results
+
+        results = self.loop.run_until_complete(make_calls())
+        self.assertEqual(results[:3], [["a"], ["a"], ["b"]])
+        self.assertIsNot(results[0], results[1], "Shared results should be copied")
+        self.assertEqual(
+            self.db.calls,
+            [
+                ("find_workers", "a"),
+                ("find_workers", "b"),
+                ("update_agent", "1"),
+                ("update_agent", "1"),
+                ("find_workers", "c"),
+            ],
+        )
+        self.assertEqual(len(self.db.threads), 1)
+        self.assertTrue(self.db.threads.pop().startswith("MephistoDB-async"))
+        self.assertEqual(self.async_db.queue_depth(), 0)
+
+    def test_errors_raised_to_caller(self) -> None:
+        """Ensure exceptions from db calls reach each awaiting caller"""
+
+        async def make_calls():
+            return await asyncio.gather(
+                self.async_db.get_unit("1"),
+                self.async_db.find_workers(worker_name="a"),
+                return_exceptions=True,
+            )
+
+        error, workers = self.loop.run_until_complete(make_calls())
+        self.assertIsInstance(error, KeyError)
+        self.assertEqual(workers, ["a"])
+        self.assertEqual(self.async_db.queue_depth(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,12 +10,15 @@ import shutil
 import os
 import tempfile
 import time
+import threading
 import asyncio
+from unittest import mock
 
 from typing import List, Callable
 
 from mephisto.abstractions.blueprint import AgentState
 from mephisto.abstractions.blueprints.mock.mock_task_runner import MockTaskRunner
+from mephisto.abstractions._subcomponents.task_runner import RunningUnit
 from mephisto.abstractions.databases.local_database import LocalMephistoDB
 from mephisto.abstractions.databases.local_singleton_database import MephistoSingletonDB
 from mephisto.operations.task_launcher import TaskLauncher, SCREENING_UNIT_INDEX
@@ -25,10 +28,30 @@ from mephisto.abstractions.blueprints.mixins.screen_task_required import (
 from mephisto.utils.testing import get_test_task_run
 from mephisto.data_model.assignment import InitializationData
 from mephisto.data_model.worker import Worker
+from mephisto.data_model.agent import Agent, select_live_updates, select_live_updates_async
+from mephisto.data_model.exceptions import AgentDisconnectedError
 from mephisto.data_model.task_run import TaskRun
-from mephisto.operations.datatypes import LiveTaskRun, LoopWrapper
-from mephisto.operations.client_io_handler import ClientIOHandler
+from mephisto.operations.datatypes import (
+    LiveTaskRun,
+    LoopWrapper,
+    LiveUpdateBuffer,
+    LIVE_UPDATE_OVERFLOW_DROP_NEWEST,
+    LIVE_UPDATE_OVERFLOW_BLOCK,
+)
+from mephisto.operations.client_io_handler import (
+    ClientIOHandler,
+    MAX_SEEN_UPDATE_IDS_PER_AGENT,
+    FULL_STATUS_SYNC_INTERVAL,
+)
+from mephisto.data_model.packet import (
+    Packet,
+    PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE,
+    PACKET_TYPE_RETURN_STATUSES,
+    PACKET_TYPE_SUBMIT_UNIT,
+)
+from mephisto.abstractions._subcomponents.channel import Channel
 from mephisto.operations.worker_pool import WorkerPool
+from mephisto.operations.async_db import AsyncMephistoDB
 
 from mephisto.abstractions.architects.mock_architect import (
     MockArchitect,
@@ -124,7 +147,9 @@ class BaseTestLiveRuns:
 
     def assert_server_subbed_in_time(self, server, timeout: int = 5) -> None:
         start_time = time.time()
-        while (len(server.subs) == 0) and time.time() - start_time < timeout:
+        while (
+            len(server.subs) == 0 or server.last_alive_packet is None
+        ) and time.time() - start_time < timeout:
             time.sleep(0.3)
         self.assertEqual(
             len(self.architect.server.subs),
@@ -229,6 +254,294 @@ class BaseTestLiveRuns:
         channel.close()
         self.assertTrue(channel.is_closed())
 
+    def test_channel_open_timeout(self):
+        """Ensure channels that never open fail registration after the timeout"""
+
+        class NeverOpenChannel(Channel):
+            def is_closed(self):
+                return self.closed
+
+            def close(self):
+                self.closed = True
+
+            def is_alive(self):
+                return False
+
+            def open(self):
+                self.closed = False
+
+            def enqueue_send(self, packet):
+                return False
+
+        client_io = ClientIOHandler(self.db, channel_open_timeout=0.5)
+        channel = NeverOpenChannel(
+            "never_open",
+            client_io._on_channel_open,
+            client_io._on_catastrophic_disconnect,
+            client_io._on_message,
+        )
+        start_time = time.time()
+        with self.assertRaises(ConnectionRefusedError):
+            client_io._register_channel(channel)
+        self.assertLess(time.time() - start_time, 5)
+        self.assertTrue(channel.is_closed())
+
+    def test_live_update_dedup_is_bounded_per_agent(self):
+        """Ensure duplicate live updates are dropped without unbounded growth"""
+        client_io = ClientIOHandler(self.db)
+
+        def make_update(agent_id, update_id):
+            return Packet(
+                packet_type=PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE,
+                subject_id=agent_id,
+                data={"update_id": update_id},
+            )
+
+        with mock.patch.object(client_io, "get_live_run"), mock.patch.object(
+            client_io, "_on_live_update"
+        ) as on_live_update:
+            client_io._on_message(make_update("agent_1", "update_1"), "channel")
+            client_io._on_message(make_update("agent_1", "update_1"), "channel")
+            client_io._on_message(make_update("agent_2", "update_1"), "channel")
+            self.assertEqual(on_live_update.call_count, 2)
+
+            for idx in range(MAX_SEEN_UPDATE_IDS_PER_AGENT * 2):
+                client_io._on_message(make_update("agent_1", f"extra_{idx}"), "channel")
+            self.assertEqual(
+                len(client_io.seen_update_ids["agent_1"]), MAX_SEEN_UPDATE_IDS_PER_AGENT
+            )
+
+        client_io.release_agent("agent_1")
+        self.assertNotIn("agent_1", client_io.seen_update_ids)
+        self.assertIn("agent_2", client_io.seen_update_ids)
+
+    def test_held_live_updates_are_handled_before_submit(self):
+        """Ensure packets wait behind their agent's live updates held by backpressure"""
+        client_io = ClientIOHandler(self.db)
+        pending_actions = LiveUpdateBuffer(capacity=1, overflow=LIVE_UPDATE_OVERFLOW_BLOCK)
+        handled: List[str] = []
+        on_live_update = client_io._on_live_update
+
+        def record_live_update(packet, channel_id):
+            handled.append(packet.data["text"])
+            on_live_update(packet, channel_id)
+
+        packets = [
+            Packet(
+                packet_type=PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE,
+                subject_id="agent_1",
+                data={"text": text},
+            )
+            for text in ["update_1", "update_2"]
+        ]
+        packets.append(Packet(packet_type=PACKET_TYPE_SUBMIT_UNIT, subject_id="agent_1", data={}))
+        packets.append(
+            Packet(
+                packet_type=PACKET_TYPE_RETURN_STATUSES,
+                subject_id="mephisto",
+                data={"status_seq": 1, "statuses": {"agent_1": "disconnect"}},
+            )
+        )
+
+        async def deliver_then_consume():
+            tasks = []
+            for packet in packets:
+                tasks.append(
+                    asyncio.ensure_future(client_io._handle_in_agent_order(packet, "channel"))
+                )
+                await asyncio.sleep(0.05)
+            # update_2 is held until the agent reads update_1, as are the others
+            self.assertEqual(handled, ["update_1"])
+            self.assertEqual(pending_actions.get_nowait(), {"text": "update_1"})
+            await asyncio.gather(*tasks)
+
+        with mock.patch.object(client_io, "get_live_run") as get_live_run, mock.patch.object(
+            client_io, "log_metrics_for_packet"
+        ), mock.patch.object(
+            client_io, "_on_live_update", side_effect=record_live_update
+        ), mock.patch.object(
+            client_io, "_on_submit_unit", side_effect=lambda *args: handled.append("submit")
+        ):
+            worker_pool = get_live_run.return_value.worker_pool
+            worker_pool.get_agent_for_id.return_value = mock.Mock(
+                pending_actions=pending_actions
+            )
+            worker_pool.handle_updated_agent_status.side_effect = lambda statuses: handled.append(
+                "status"
+            )
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(deliver_then_consume())
+            finally:
+                loop.close()
+
+        self.assertEqual(handled, ["update_1", "update_2", "submit", "status"])
+        self.assertEqual(pending_actions.get_nowait(), {"text": "update_2"})
+        self.assertEqual(client_io._held_agent_packets, {})
+
+    def test_status_pings_request_deltas(self):
+        """Ensure status pings only ask for and process changed statuses"""
+        client_io = ClientIOHandler(self.db)
+        sent_packets: List[Packet] = []
+        channel = mock.Mock()
+        channel.enqueue_send.side_effect = sent_packets.append
+        client_io.channels["channel"] = channel
+
+        with mock.patch.object(client_io, "get_live_run") as get_live_run:
+            handle_status = get_live_run.return_value.worker_pool.handle_updated_agent_status
+            # The first ping is a full sync
+            client_io._request_status_update()
+            self.assertEqual(sent_packets[-1].data, {"since_seq": 0})
+            client_io._on_message(
+                Packet(
+                    packet_type=PACKET_TYPE_RETURN_STATUSES,
+                    subject_id="mephisto",
+                    data={"statuses": {"agent_1": AgentState.STATUS_IN_TASK}, "status_seq": 4},
+                ),
+                "channel",
+            )
+            handle_status.assert_called_with({"agent_1": AgentState.STATUS_IN_TASK})
+
+            # Later pings only ask for changes since the acknowledged sequence
+            client_io._request_status_update()
+            self.assertEqual(sent_packets[-1].data, {"since_seq": 4})
+
+            # Routers without delta support still return the full map
+            legacy_map = {"agent_1": AgentState.STATUS_DISCONNECT}
+            client_io._on_message(
+                Packet(
+                    packet_type=PACKET_TYPE_RETURN_STATUSES,
+                    subject_id="mephisto",
+                    data=legacy_map,
+                ),
+                "channel",
+            )
+            handle_status.assert_called_with(legacy_map)
+
+        for _ in range(FULL_STATUS_SYNC_INTERVAL - 2):
+            client_io._request_status_update()
+        self.assertEqual(sent_packets[-1].data, {"since_seq": 4})
+        client_io._request_status_update()
+        self.assertEqual(sent_packets[-1].data, {"since_seq": 0})
+
+    def test_select_live_updates(self):
+        """Ensure agents can be waited on together, from threads and the loop"""
+        units = self.task_run.get_units()
+        agents = []
+        for idx in range(2):
+            worker = self.make_registered_worker(f"MOCK_WORKER_{idx}")
+            agent_id = self.db.new_agent(
+                worker.db_id,
+                units[idx].db_id,
+                units[idx].task_id,
+                units[idx].task_run_id,
+                units[idx].assignment_id,
+                units[idx].task_type,
+                units[idx].provider_type,
+            )
+            agents.append(Agent.get(self.db, agent_id))
+        first_agent, second_agent = agents
+
+        self.assertEqual(select_live_updates(agents, timeout=0.1), [])
+
+        def send_update(agent, text):
+            agent.pending_actions.put({"text": text})
+
+        threading.Timer(0.2, send_update, args=(second_agent, "hello")).start()
+        start_time = time.time()
+        self.assertEqual(select_live_updates(agents, timeout=5), [second_agent])
+        self.assertLess(time.time() - start_time, 1, "Selector did not wake on update")
+        self.assertEqual(second_agent.get_live_update(), {"text": "hello"})
+        self.assertFalse(second_agent.has_live_update.is_set())
+
+        async def select_then_read():
+            ready = await select_live_updates_async(agents, timeout=5)
+            return ready, await ready[0].get_live_update_async(timeout=1)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.call_later(0.2, send_update, first_agent, "there")
+            ready, update = loop.run_until_complete(select_then_read())
+        finally:
+            loop.close()
+        self.assertEqual(ready, [first_agent])
+        self.assertEqual(update, {"text": "there"})
+
+        # Disconnects release the selector, and raise from the agent
+        first_agent.update_status(AgentState.STATUS_DISCONNECT)
+        self.assertEqual(select_live_updates(agents, timeout=5), [first_agent])
+        with self.assertRaises(AgentDisconnectedError):
+            first_agent.get_live_update(timeout=1)
+
+    def test_observe_all_serializes_once(self):
+        """Ensure updates observed by several agents share one serialized payload"""
+        units = self.task_run.get_units()
+        agents = []
+        for idx in range(2):
+            worker = self.make_registered_worker(f"MOCK_WORKER_{idx}")
+            agent_id = self.db.new_agent(
+                worker.db_id,
+                units[idx].db_id,
+                units[idx].task_id,
+                units[idx].task_run_id,
+                units[idx].assignment_id,
+                units[idx].task_type,
+                units[idx].provider_type,
+            )
+            agent = Agent.get(self.db, agent_id)
+            agent._associated_live_run = mock.Mock(client_io=self.client_io, state_persister=None)
+            agents.append(agent)
+
+        channel = mock.Mock()
+        with mock.patch.object(self.client_io, "_get_channel_for_agent", return_value=channel):
+            Agent.observe_all(agents, {"task_data": {"task_done": True}})
+        sent = [call.args[0] for call in channel.enqueue_send.call_args_list]
+        self.assertEqual([packet.subject_id for packet in sent], [a.get_agent_id() for a in agents])
+        self.assertIs(sent[0]._encoded_data, sent[1]._encoded_data)
+        self.assertEqual(sent[0].data["task_data"], {"task_done": True})
+        for agent in agents:
+            observed = agent.datastore.agent_data[agent.db_id]["observed"]
+            self.assertEqual(observed[-1]["update_id"], sent[0].data["update_id"])
+
+    def test_await_submit_async_reads_status_off_loop(self):
+        """Ensure async submit waits don't read the agent's status on the event loop"""
+        unit = self.task_run.get_units()[0]
+        worker = self.make_registered_worker("MOCK_WORKER")
+        agent_id = self.db.new_agent(
+            worker.db_id,
+            unit.db_id,
+            unit.task_id,
+            unit.task_run_id,
+            unit.assignment_id,
+            unit.task_type,
+            unit.provider_type,
+        )
+        agent = Agent.get(self.db, agent_id)
+        async_db = AsyncMephistoDB(self.db)
+        agent._associated_live_run = mock.Mock(
+            client_io=self.client_io,
+            state_persister=None,
+            worker_pool=mock.Mock(async_db=async_db),
+        )
+        status_threads = []
+        get_status = agent.get_status
+
+        def recording_get_status():
+            status_threads.append(threading.current_thread())
+            return get_status()
+
+        async def submit_later():
+            asyncio.get_running_loop().call_later(0.1, agent.did_submit.set)
+            return await agent.await_submit_async(timeout=5)
+
+        try:
+            with mock.patch.object(agent, "get_status", side_effect=recording_get_status):
+                self.assertTrue(asyncio.run(submit_later()))
+        finally:
+            async_db.shutdown()
+        self.assertEqual(len(status_threads), 2)
+        self.assertNotIn(threading.main_thread(), status_threads)
+
     def test_register_concurrent_run(self):
         """Test registering and running a run that requires multiple workers"""
         # Handle baseline setup
@@ -334,6 +647,103 @@ class BaseTestLiveRuns:
         live_run.shutdown()
         self.assertTrue(channel.is_closed)
 
+    def test_register_run_with_async_runner(self):
+        """Test that async run_unit methods run on the loop rather than in threads"""
+
+        class AsyncMockTaskRunner(MockTaskRunner):
+            async def run_unit(self, unit, agent):
+                self.tracked_tasks[unit.db_id] = unit
+                await agent.await_submit_async(self.args.task.submission_timeout)
+                del self.tracked_tasks[unit.db_id]
+
+        args = MockBlueprint.ArgsClass()
+        args.timeout_time = 5
+        args.is_concurrent = False
+        config = OmegaConf.structured(MephistoConfig(blueprint=args))
+        task_runner = AsyncMockTaskRunner(self.task_run, config, EMPTY_STATE)
+        blueprint = self.task_run.get_blueprint()
+        live_run = self.get_mock_run(blueprint, task_runner)
+        self.live_run = live_run
+        live_run.client_io.launch_channels()
+        channel = list(live_run.client_io.channels.values())[0]
+        self.assert_server_subbed_in_time(self.architect.server)
+
+        self.architect.server.register_mock_agent("MOCK_WORKER", "FAKE_ASSIGNMENT")
+        self.await_channel_requests(live_run)
+        self.assertEqual(len(task_runner.running_units), 1, "Ready task was not launched")
+        running_unit = list(task_runner.running_units.values())[0]
+        self.assertTrue(running_unit.is_async)
+        self.assertTrue(
+            self._run_loop_until(live_run, lambda: len(task_runner.tracked_tasks) == 1, 1),
+            "Async run_unit was not started",
+        )
+        runner_threads = [t for t in threading.enumerate() if t.name.startswith("TaskRunner-")]
+        self.assertEqual(runner_threads, [], "Async runner should not use pool threads")
+
+        agent_id = running_unit.agent.db_id
+        self.architect.server.submit_mock_unit(agent_id, {"completed": True})
+        self.await_channel_requests(live_run)
+        self.assertTrue(
+            self._run_loop_until(live_run, lambda: len(task_runner.running_units) == 0, 1),
+            "Did not complete task in time",
+        )
+
+        live_run.shutdown()
+        self.assertTrue(channel.is_closed())
+
+    def test_blocking_run_count_is_thread_safe(self):
+        """Test that blocking runs submitted from many threads are all released"""
+        args = MockBlueprint.ArgsClass()
+        config = OmegaConf.structured(MephistoConfig(blueprint=args))
+        task_runner = MockTaskRunner(self.task_run, config, EMPTY_STATE)
+        futures = []
+        futures_lock = threading.Lock()
+
+        def submit_runs():
+            for _ in range(200):
+                future = task_runner._run_in_pool(lambda: None)
+                with futures_lock:
+                    futures.append(future)
+
+        threads = [threading.Thread(target=submit_runs) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(len(futures), 1600)
+        self.assertEqual(task_runner._blocking_runs, 0)
+        task_runner.shutdown()
+
+    def test_async_runs_shut_down_from_their_loop_can_be_awaited(self):
+        """Test that shutting down on the loop leaves async runs to be awaited there"""
+        args = MockBlueprint.ArgsClass()
+        config = OmegaConf.structured(MephistoConfig(blueprint=args))
+        task_runner = MockTaskRunner(self.task_run, config, EMPTY_STATE)
+        loop = asyncio.new_event_loop()
+        loop_wrap = LoopWrapper(loop)
+        finished = []
+
+        async def finish_run():
+            await asyncio.sleep(0.1)
+            finished.append(True)
+
+        async def shutdown_then_wait():
+            future = task_runner._run_on_loop(loop_wrap, finish_run())
+            task_runner.running_units["1"] = RunningUnit(
+                unit=mock.Mock(), agent=mock.Mock(), future=future, is_async=True
+            )
+            task_runner.shutdown()
+            self.assertEqual(finished, [])
+            await task_runner.wait_for_async_runs_exit()
+            self.assertEqual(finished, [True])
+
+        try:
+            loop.run_until_complete(shutdown_then_wait())
+        finally:
+            loop.close()
+
     def test_register_run(self):
         """Test registering and running a task run asynchronously"""
         # Handle baseline setup
@@ -1031,6 +1441,61 @@ class BaseTestLiveRuns:
     # TODO(#97) handle testing for disconnecting in and out of tasks
 
 
+class TestLiveUpdateBuffer(unittest.TestCase):
+    def test_overflow_policies(self) -> None:
+        """Ensure full buffers drop the right updates and count them"""
+        buffer = LiveUpdateBuffer(capacity=2)
+        self.assertIsNone(buffer.get_nowait())
+        self.assertFalse(buffer.has_items.is_set())
+        self.assertTrue(buffer.put(1))
+        self.assertTrue(buffer.has_items.is_set())
+        self.assertTrue(buffer.put(2))
+        self.assertFalse(buffer.put(3))
+        self.assertEqual([buffer.get_nowait(), buffer.get_nowait()], [2, 3])
+        self.assertFalse(buffer.has_items.is_set())
+        self.assertEqual(buffer.dropped, 1)
+        self.assertEqual(buffer.max_depth, 2)
+
+        buffer.set_limits(2, LIVE_UPDATE_OVERFLOW_DROP_NEWEST)
+        for item in [1, 2, 3]:
+            buffer.put(item)
+        self.assertEqual([buffer.get_nowait(), buffer.get_nowait()], [1, 2])
+        self.assertEqual(buffer.dropped, 2)
+
+        # An empty read must not clear an event set for another reason
+        buffer.has_items.set()
+        self.assertIsNone(buffer.get_nowait())
+        self.assertTrue(buffer.has_items.is_set())
+
+    def test_backpressure(self) -> None:
+        """Ensure blocked producers resume in order once there is room"""
+        buffer = LiveUpdateBuffer(capacity=1, overflow=LIVE_UPDATE_OVERFLOW_BLOCK)
+        buffer.put(0)
+
+        async def produce(item):
+            if await buffer.wait_for_space_async(timeout=5):
+                buffer.put(item)
+
+        async def run_producers():
+            self.assertFalse(await buffer.wait_for_space_async(timeout=0.05))
+            producers = [asyncio.ensure_future(produce(item)) for item in [1, 2]]
+            consumed = []
+            while len(consumed) < 3:
+                await asyncio.sleep(0.01)
+                item = buffer.get_nowait()
+                if item is not None:
+                    consumed.append(item)
+            await asyncio.gather(*producers)
+            return consumed
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(run_producers()), [0, 1, 2])
+        finally:
+            loop.close()
+        self.assertEqual(buffer.dropped, 0)
+
+
 class TestLiveRunsLocal(BaseTestLiveRuns, unittest.TestCase):
     DB_CLASS = LocalMephistoDB
 
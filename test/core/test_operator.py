@@ -105,7 +105,7 @@ class OperatorBaseTest(object):
 
     def assert_sandbox_worker_created(self, worker_name, timeout=2) -> None:
         self.assertTrue(  # type: ignore
-            self.operator._run_loop_until(
+            self.operator.run_loop_until(
                 lambda: len(self.db.find_workers(worker_name=worker_name + "_sandbox")) > 0,
                 timeout,
             ),
@@ -114,7 +114,7 @@ class OperatorBaseTest(object):
 
     def assert_agent_created(self, agent_num, timeout=2) -> str:
         self.assertTrue(  # type: ignore
-            self.operator._run_loop_until(
+            self.operator.run_loop_until(
                 lambda: len(self.db.find_agents()) == agent_num,
                 timeout,
             ),
@@ -127,7 +127,7 @@ class OperatorBaseTest(object):
 
     def await_channel_requests(self, tracked_run, timeout=2) -> None:
         self.assertTrue(  # type: ignore
-            self.operator._run_loop_until(
+            self.operator.run_loop_until(
                 lambda: len(tracked_run.client_io.request_id_to_channel_id) == 0,
                 timeout,
             ),
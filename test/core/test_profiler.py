@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import signal
+import subprocess
+import sys
+import time
+
+from mephisto.operations.profiler import (
+    PROFILE_SIGNAL,
+    SamplingProfiler,
+    clear_profile_ready,
+    get_profile_ready_file,
+    get_profile_request_file,
+    mark_profile_ready,
+    pop_profile_request,
+    request_profile,
+)
+
+
+def blocking_callback():
+    time.sleep(0.5)
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    """Unit testing for the operator's sampling profiler"""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(
+            target=self.loop.run_forever, name="test-event-loop", daemon=True
+        )
+        self.loop_thread.start()
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_profile_samples_threads_and_flags_slow_callbacks(self):
+        profiler = SamplingProfiler(
+            self.loop, output_dir=self.output_dir, slow_callback_threshold=0.1
+        )
+        self.assertTrue(profiler.start(duration=5))
+        self.assertFalse(profiler.start(duration=5))
+        time.sleep(0.1)  # Let the watchdog find the loop's thread
+        self.loop.call_soon_threadsafe(blocking_callback)
+        time.sleep(0.7)
+        profiler.stop()
+        self.assertFalse(profiler.is_running())
+
+        with open(profiler.last_profile_path) as profile_file:
+            lines = profile_file.read().splitlines()
+        self.assertGreater(len(lines), 0)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+        self.assertTrue(any(line.startswith("test-event-loop;") for line in lines))
+        self.assertTrue(any("blocking_callback" in line for line in lines))
+
+        self.assertEqual(len(profiler.slow_callbacks), 1)
+        self.assertIn("blocking_callback", profiler.slow_callbacks[0])
+        slow_files = [name for name in os.listdir(self.output_dir) if "slow_callbacks" in name]
+        self.assertEqual(len(slow_files), 1)
+
+    @unittest.skipIf(PROFILE_SIGNAL is None, "Platform has no profile signal")
+    def test_profile_request_reaches_process(self):
+        """Ensure a profile request signals the process, which can read its options"""
+        received = threading.Event()
+        old_handler = signal.signal(PROFILE_SIGNAL, lambda sig, frame: received.set())
+        mark_profile_ready()
+        try:
+            request_profile(os.getpid(), duration=2)
+            self.assertTrue(received.wait(5))
+        finally:
+            clear_profile_ready()
+            signal.signal(PROFILE_SIGNAL, old_handler)
+        self.assertEqual(pop_profile_request(), {"duration": 2})
+        self.assertFalse(os.path.exists(get_profile_request_file(os.getpid())))
+        self.assertEqual(pop_profile_request(), {})
+
+    @unittest.skipIf(PROFILE_SIGNAL is None, "Platform has no profile signal")
+    def test_profile_request_needs_ready_operator(self):
+        """Ensure processes that haven't marked themselves ready aren't signaled"""
+        received = threading.Event()
+        old_handler = signal.signal(PROFILE_SIGNAL, lambda sig, frame: received.set())
+        try:
+            with self.assertRaises(ProcessLookupError):
+                request_profile(os.getpid(), duration=2)
+            self.assertFalse(received.wait(0.5))
+        finally:
+            signal.signal(PROFILE_SIGNAL, old_handler)
+        self.assertFalse(os.path.exists(get_profile_request_file(os.getpid())))
+
+    @unittest.skipIf(PROFILE_SIGNAL is None, "Platform has no profile signal")
+    def test_profile_request_to_missing_process_is_removed(self):
+        """Ensure a request that can't be delivered doesn't leave its files behind"""
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        # As left by an operator that exited without removing its handler
+        ready_path = get_profile_ready_file(exited.pid)
+        os.makedirs(os.path.dirname(ready_path), exist_ok=True)
+        with open(ready_path, "w") as ready_file:
+            ready_file.write("0")
+        with self.assertRaises(ProcessLookupError):
+            request_profile(exited.pid, duration=2)
+        self.assertFalse(os.path.exists(get_profile_request_file(exited.pid)))
+        self.assertFalse(os.path.exists(get_profile_ready_file(exited.pid)))
+
+
+if __name__ == "__main__":
+    unittest.main()
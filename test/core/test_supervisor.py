@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import unittest
+import shutil
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from mephisto.utils.testing import get_test_requester
+from mephisto.data_model.constants.assignment_state import AssignmentState
+from mephisto.abstractions.databases.local_database import LocalMephistoDB
+from mephisto.operations.supervisor import OperatorSupervisor
+from mephisto.abstractions.architects.mock_architect import MockArchitectArgs
+from mephisto.operations.hydra_config import MephistoConfig
+from mephisto.abstractions.providers.mock.mock_provider import MockProviderArgs
+from mephisto.abstractions.blueprints.mock.mock_blueprint import MockBlueprintArgs
+from mephisto.data_model.task_run import TaskRunArgs
+from omegaconf import OmegaConf
+
+TIMEOUT_TIME = 30
+
+
+class TestOperatorSupervisor(unittest.TestCase):
+    """
+    Unit testing for running task runs across several operator processes
+    """
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        database_path = os.path.join(self.data_dir, "mephisto.db")
+        self.db = LocalMephistoDB(database_path)
+        self.requester_name, _req_id = get_test_requester(self.db)
+
+    def tearDown(self):
+        self.db.shutdown()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def get_config(self, port: int):
+        config = MephistoConfig(
+            blueprint=MockBlueprintArgs(num_assignments=1, is_concurrent=False),
+            provider=MockProviderArgs(requester_name=self.requester_name),
+            architect=MockArchitectArgs(should_run_server=True, port=str(port)),
+            task=TaskRunArgs(
+                task_title="title",
+                task_description="This is a description",
+                task_reward=0.3,
+                task_tags="1,2,3",
+                submission_timeout=5,
+                no_submission_patience=1,  # Expire in a second
+            ),
+        )
+        return OmegaConf.structured(config)
+
+    def test_runs_assigned_to_least_loaded_worker(self):
+        supervisor = OperatorSupervisor(self.db, num_workers=2)
+        assigned = [supervisor.launch_task_run(self.get_config(3000 + idx)) for idx in range(3)]
+        self.assertEqual(assigned, [0, 1, 0])
+        supervisor.shutdown()
+
+    @patch("mephisto.operations.operator.RUN_STATUS_POLL_TIME", 1)
+    def test_runs_complete_across_workers(self):
+        """Ensure runs launch and shut down in separate operator processes"""
+        supervisor = OperatorSupervisor(self.db, num_workers=2)
+        supervisor.launch_task_run(self.get_config(3010))
+        supervisor.launch_task_run(self.get_config(3011))
+
+        start_time = time.time()
+        supervisor.wait_for_runs_then_shutdown(skip_input=True)
+        self.assertLess(time.time() - start_time, TIMEOUT_TIME, "Runs not shut down in time")
+
+        pids = {worker.process.pid for worker in supervisor.workers}
+        self.assertEqual(len(pids), 2, "Runs should be on separate processes")
+        self.assertNotIn(os.getpid(), pids)
+        for worker in supervisor.workers:
+            self.assertEqual(worker.process.exitcode, 0)
+            self.assertEqual(len(worker.task_run_ids), 1)
+        self.assertEqual(supervisor.get_failed_launches(), [])
+        self.assertEqual(supervisor.get_running_task_runs(), {})
+
+        # Both runs were created in, and expired through, the shared database
+        task_runs = self.db.find_task_runs()
+        self.assertEqual(len(task_runs), 2)
+        for task_run in task_runs:
+            unit = task_run.get_assignments()[0].get_units()[0]
+            self.assertEqual(unit.get_status(), AssignmentState.EXPIRED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import shutil
+import os
+import tempfile
+
+from mephisto.data_model.packet import (
+    PACKET_TYPE_REGISTER_AGENT,
+    PACKET_TYPE_SUBMIT_ONBOARDING,
+    PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE,
+    PACKET_TYPE_SUBMIT_UNIT,
+)
+from mephisto.scripts.benchmarks.load_test import (
+    LoadTestConfig,
+    run_load_test,
+    save_baseline,
+    load_baseline,
+    is_same_load,
+    compare_to_baseline,
+)
+
+
+class TestLoadTest(unittest.TestCase):
+    """
+    Run a small synthetic load through a mock task run, to ensure the
+    benchmark can drive workers end to end and report on them
+    """
+
+    def setUp(self) -> None:
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_load_test_with_onboarding(self) -> None:
+        """Every simulated worker onboards, chats and submits"""
+        config = LoadTestConfig(
+            num_workers=4,
+            concurrency=2,
+            live_updates=2,
+            use_onboarding=True,
+            port=3050,
+            timeout=30,
+        )
+        results = run_load_test(config)
+
+        self.assertFalse(results["timed_out"])
+        self.assertEqual(results["agents_completed"], 4)
+        self.assertEqual(results["agents_failed"], {})
+        self.assertGreater(results["agents_per_second"], 0)
+        self.assertGreater(results["db_calls_per_unit"], 0)
+        self.assertEqual(results["db_calls"]["new_agent"], 4)
+        latency = results["latency_ms"]
+        self.assertEqual(latency[PACKET_TYPE_REGISTER_AGENT]["count"], 4)
+        self.assertEqual(latency[PACKET_TYPE_SUBMIT_ONBOARDING]["count"], 4)
+        self.assertEqual(latency[PACKET_TYPE_MEPHISTO_BOUND_LIVE_UPDATE]["count"], 8)
+        self.assertEqual(latency[PACKET_TYPE_SUBMIT_UNIT]["count"], 4)
+        for stats in latency.values():
+            self.assertLessEqual(stats["p50"], stats["p99"])
+
+        # Results round trip as a baseline, and compare as unchanged to themselves
+        baseline_path = os.path.join(self.data_dir, "benchmarks", "baseline.json")
+        self.assertIsNone(load_baseline(baseline_path))
+        save_baseline(results, baseline_path)
+        baseline = load_baseline(baseline_path)
+        self.assertTrue(is_same_load(results, baseline))
+        for change in compare_to_baseline(results, baseline).values():
+            self.assertEqual(change, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,20 @@
 # LICENSE file in the root directory of this source tree.
 
 from mephisto.data_model.constants.assignment_state import AssignmentState
+from mephisto.data_model.packet import (
+    Packet,
+    PACKET_ENCODING_JSON,
+    PACKET_ENCODING_MSGPACK,
+    PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE,
+    MSGPACK_INSTALLED,
+)
+from mephisto.data_model.task_run import (
+    MAX_COMPILED_CONFIGS,
+    TaskRunArgs,
+    TaskRunConfig,
+    _compiled_configs,
+)
+import json
 import unittest
 
 
@@ -39,6 +53,68 @@ class TestDataModel(unittest.TestCase):
                     f"{a_state} attributes, not in {found_vals}",
                 )
 
+    def _make_world_packet(self) -> Packet:
+        return Packet(
+            packet_type=PACKET_TYPE_CLIENT_BOUND_LIVE_UPDATE,
+            subject_id="agent_1",
+            data={"text": "hello", "task_data": {"turns": list(range(10))}},
+            client_timestamp=1.5,
+        )
+
+    def test_packet_json_wire_roundtrip(self):
+        """Test that JSON-encoded packets match the sendable dict"""
+        packet = self._make_world_packet()
+        message = packet.to_wire(PACKET_ENCODING_JSON)
+        self.assertIsInstance(message, str)
+        self.assertEqual(json.loads(message), packet.to_sendable_dict())
+        self.assertEqual(Packet.from_wire(message).to_sendable_dict(), packet.to_sendable_dict())
+
+    @unittest.skipIf(not MSGPACK_INSTALLED, "msgpack is not installed")
+    def test_packet_msgpack_wire_roundtrip(self):
+        """Test that msgpack-encoded packets decode to the same packet"""
+        packet = self._make_world_packet()
+        message = packet.to_wire(PACKET_ENCODING_MSGPACK)
+        self.assertIsInstance(message, bytes)
+        self.assertEqual(Packet.from_wire(message).to_sendable_dict(), packet.to_sendable_dict())
+
+    def test_packet_fan_out_shares_encoded_data(self):
+        """Test that copies for other subjects reuse the serialized payload"""
+        packet = self._make_world_packet()
+        packet.to_wire(PACKET_ENCODING_JSON)
+        other_packet = packet.copy_for_subject("agent_2")
+        self.assertIs(other_packet._encoded_data, packet._encoded_data)
+        decoded = Packet.from_wire(other_packet.to_wire(PACKET_ENCODING_JSON))
+        self.assertEqual(decoded.subject_id, "agent_2")
+        self.assertEqual(decoded.data, packet.data)
+
+    def test_task_run_config_compiles_scheduling_args(self):
+        """Test that scheduling args are plain values, defaulting where unset"""
+        param_string = json.dumps({"task": {"allowed_concurrent": 2, "submission_timeout": "???"}})
+        config = TaskRunConfig.compile(param_string)
+        self.assertEqual(config.allowed_concurrent, 2)
+        self.assertEqual(config.submission_timeout, TaskRunArgs.submission_timeout)
+        self.assertEqual(config.no_submission_patience, TaskRunArgs.no_submission_patience)
+        self.assertEqual(TaskRunConfig.compile("not json").params, {})
+
+    def test_task_run_config_shared_per_run(self):
+        """Test that a run's config is compiled once, unless its params differ"""
+        param_string = json.dumps({"task": {"allowed_concurrent": 1}})
+        config = TaskRunConfig.get("test_shared_run", param_string)
+        self.assertIs(TaskRunConfig.get("test_shared_run", param_string), config)
+        other_params = json.dumps({"task": {"allowed_concurrent": 3}})
+        other_config = TaskRunConfig.get("test_shared_run", other_params)
+        self.assertEqual(other_config.allowed_concurrent, 3)
+
+    def test_task_run_configs_bounded(self):
+        """Test that compiled configs of the least recently used runs are dropped"""
+        param_string = json.dumps({"task": {"allowed_concurrent": 1}})
+        first_config = TaskRunConfig.get("test_bounded_run_0", param_string)
+        for idx in range(1, MAX_COMPILED_CONFIGS + 1):
+            TaskRunConfig.get(f"test_bounded_run_{idx}", param_string)
+        self.assertEqual(len(_compiled_configs), MAX_COMPILED_CONFIGS)
+        self.assertNotIn("test_bounded_run_0", _compiled_configs)
+        self.assertIsNot(TaskRunConfig.get("test_bounded_run_0", param_string), first_config)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+from typing import Any, Dict, List
+
+from mephisto.data_model.packet import Packet, PACKET_TYPE_REGISTER_AGENT
+from mephisto.operations.async_db import AsyncMephistoDB
+from mephisto.utils import tracing
+from mephisto.utils.tracing import configure_tracing, flush_traces, record_span, span
+
+
+class FakeDB:
+    def find_workers(self, worker_name=None):
+        return [worker_name]
+
+
+class TestTracing(unittest.TestCase):
+    """Unit testing for span tracing and its trace file output"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.trace_file = os.path.join(self.data_dir, "traces", "trace.json")
+        configure_tracing(self.trace_file)
+
+    def tearDown(self):
+        configure_tracing(None)
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def read_spans(self) -> Dict[str, Dict[str, Any]]:
+        """Parse the unterminated trace array, returning events by name"""
+        flush_traces()
+        with open(self.trace_file) as trace_fp:
+            contents = trace_fp.read()
+        events: List[Dict[str, Any]] = json.loads(contents.rstrip().rstrip(",") + "]")
+        for event in events:
+            self.assertEqual(event["ph"], "X")
+            self.assertGreaterEqual(event["dur"], 0)
+        return {event["name"]: event for event in events}
+
+    def test_disabled_tracing_is_noop(self):
+        configure_tracing(None)
+        with span("outer") as outer:
+            self.assertIsNone(outer.trace_id)
+        record_span("hop", 0, 1)
+        self.assertIsNone(tracing.get_current_span())
+
+    def test_nested_spans_share_trace(self):
+        with span("outer", category="test", packet_type="alive") as outer:
+            with span("inner"):
+                pass
+            record_span("hop", 1.0, 1.5)
+        with span("other", trace_id="my_trace"):
+            record_span("root_hop", 1.0, 2.0, root=True)
+        spans = self.read_spans()
+        outer_args = spans["outer"]["args"]
+        self.assertEqual(outer_args["trace_id"], outer.trace_id)
+        self.assertEqual(outer_args["packet_type"], "alive")
+        self.assertNotIn("parent_id", outer_args)
+        for name in ["inner", "hop"]:
+            self.assertEqual(spans[name]["args"]["trace_id"], outer.trace_id)
+            self.assertEqual(spans[name]["args"]["parent_id"], outer_args["span_id"])
+        self.assertEqual(spans["hop"]["ts"], 1000000)
+        self.assertEqual(spans["hop"]["dur"], 500000)
+        self.assertEqual(spans["other"]["args"]["trace_id"], "my_trace")
+        self.assertNotIn("parent_id", spans["root_hop"]["args"])
+
+    def test_spans_follow_tasks_and_db_calls(self):
+        """Ensure async work started within a span, and its DB calls, join its trace"""
+        async_db = AsyncMephistoDB(FakeDB())
+
+        async def child_task():
+            with span("child"):
+                return await async_db.find_workers(worker_name="a")
+
+        async def run_request():
+            with span("request") as request_span:
+                await asyncio.ensure_future(child_task())
+            return request_span
+
+        loop = asyncio.new_event_loop()
+        try:
+            request_span = loop.run_until_complete(run_request())
+        finally:
+            async_db.shutdown()
+            loop.close()
+        spans = self.read_spans()
+        child_args = spans["child"]["args"]
+        self.assertEqual(child_args["parent_id"], request_span.span_id)
+        for name in ["db_queue", "FakeDB.find_workers"]:
+            self.assertEqual(spans[name]["cat"], "db")
+            self.assertEqual(spans[name]["args"]["trace_id"], request_span.trace_id)
+            self.assertEqual(spans[name]["args"]["parent_id"], child_args["span_id"])
+
+    def test_packet_carries_trace_id(self):
+        packet = Packet(PACKET_TYPE_REGISTER_AGENT, "agent_1", trace_id="my_trace")
+        self.assertEqual(Packet.from_wire(packet.to_wire()).trace_id, "my_trace")
+        self.assertEqual(packet.copy_for_subject("agent_2").trace_id, "my_trace")
+        untraced = Packet(PACKET_TYPE_REGISTER_AGENT, "agent_1")
+        self.assertNotIn("trace_id", json.loads(untraced.to_wire()))
+
+
+if __name__ == "__main__":
+    unittest.main()